@@ -0,0 +1,346 @@
+"""
+Бенчмарк публичных функций database.py.
+
+Наполняет временную базу (benchmarks/seed.py) до нужного масштаба и
+замеряет каждую публичную функцию: выборки, топы, случайные записи,
+создание, изменение и удаление. Результаты пишутся в JSON и сравниваются
+с сохраненным базовым прогоном того же масштаба: функции, ставшие
+медленнее порога, выводятся как регрессии (код выхода 1).
+
+Использование:
+    python -m benchmarks.bench_database --scale 1000
+    python -m benchmarks.bench_database --scale 100000 --repeat 5 --output results.json
+    python -m benchmarks.bench_database --scale 1000 --save-baseline
+"""
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import database
+from benchmarks import seed as seeding
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+# Во сколько раз время может вырасти, прежде чем это считается регрессией.
+# Сравнивается минимальное время: оно меньше всего зависит от фоновой нагрузки
+DEFAULT_THRESHOLD = 1.5
+# Замеры быстрее этого (мс) не сравниваются - в них больше шума, чем сигнала
+NOISE_FLOOR_MS = 0.1
+
+
+class State:
+    """Данные о наполненной базе, нужные для аргументов функций."""
+
+    def __init__(self, counts: Dict[str, int], rng_seed: int = 7):
+        self.counts = counts
+        self.rng = random.Random(rng_seed)
+
+    def random_id(self, table: str) -> int:
+        return self.rng.randint(1, self.counts[table])
+
+
+class Case:
+    """
+    Один замер.
+
+    setup(state) готовит аргументы (не входит в замер), run(*args) - замеряемый вызов.
+    """
+
+    def __init__(self, name: str, run: Callable, setup: Optional[Callable[[State], tuple]] = None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda state: ())
+
+
+def _created(create: Callable[[], int]) -> Callable[[State], tuple]:
+    """setup, создающий запись для последующего удаления."""
+    return lambda state: (create(),)
+
+
+def _invite(state: State, tenant_id: Optional[int]) -> tuple:
+    """setup приглашения: (код, новый пользователь)."""
+    code = f"bench{state.rng.random()}"
+    database.create_invite(code, tenant_id, 1, 2**31)
+    return code, state.rng.randint(10**9, 2 * 10**9)
+
+
+CASES: List[Case] = [
+    # Фильмы
+    Case("get_movie_categories", database.get_movie_categories),
+    Case("get_movies", database.get_movies),
+    Case("get_movies(watched=0)", lambda: database.get_movies(watched=0)),
+    Case("get_movies(watched=0, category_id)", lambda: database.get_movies(watched=0, category_id=1)),
+    Case("get_movie_by_id", database.get_movie_by_id, lambda s: (s.random_id("movies"),)),
+    Case("get_random_movie", database.get_random_movie),
+    Case("get_movies_top", database.get_movies_top),
+    Case("get_movies_top(user_id)", lambda: database.get_movies_top(user_id=seeding.SEED_USERS[0])),
+    Case("create_movie_category", database.create_movie_category,
+         lambda s: (f"Категория {s.rng.random()}",)),
+    Case("create_movie", lambda: database.create_movie("Бенчмарк", None, 1)),
+    Case("update_movie", lambda movie_id: database.update_movie(movie_id, title="Новое название"),
+         lambda s: (s.random_id("movies"),)),
+    Case("mark_movie_watched", database.mark_movie_watched, lambda s: (s.random_id("movies"),)),
+    Case("set_movie_rating", lambda movie_id: database.set_movie_rating(movie_id, seeding.SEED_USERS[0], 8),
+         lambda s: (s.random_id("movies"),)),
+    Case("delete_movie", database.delete_movie, _created(lambda: database.create_movie("Удалить", None, 1))),
+    # Оценки
+    Case("get_ratings", lambda movie_id: database.get_ratings("movies", movie_id),
+         lambda s: (s.random_id("movies"),)),
+    Case("get_all_ratings", lambda: database.get_all_ratings("movies")),
+    Case("rebuild_ratings", database.rebuild_ratings),
+    # Активности
+    Case("get_activities", database.get_activities),
+    Case("get_activities(status)", lambda: database.get_activities(status="planned")),
+    Case("get_activity_by_id", database.get_activity_by_id, lambda s: (s.random_id("activities"),)),
+    Case("create_activity", lambda: database.create_activity("Бенчмарк", None)),
+    Case("update_activity", lambda item_id: database.update_activity(item_id, title="Новое название"),
+         lambda s: (s.random_id("activities"),)),
+    Case("mark_activity_done", database.mark_activity_done, lambda s: (s.random_id("activities"),)),
+    Case("delete_activity", database.delete_activity, _created(lambda: database.create_activity("Удалить", None))),
+    # Поездки
+    Case("get_trip_categories", database.get_trip_categories),
+    Case("get_trips", database.get_trips),
+    Case("get_trips(category_id, visited=0)", lambda: database.get_trips(category_id=1, visited=0)),
+    Case("get_trip_by_id", database.get_trip_by_id, lambda s: (s.random_id("trips"),)),
+    Case("create_trip_category", database.create_trip_category, lambda s: (f"Категория {s.rng.random()}",)),
+    Case("create_trip", lambda: database.create_trip("Бенчмарк", None, 1)),
+    Case("update_trip", lambda item_id: database.update_trip(item_id, title="Новое название"),
+         lambda s: (s.random_id("trips"),)),
+    Case("mark_trip_visited", database.mark_trip_visited, lambda s: (s.random_id("trips"),)),
+    Case("delete_trip", database.delete_trip, _created(lambda: database.create_trip("Удалить", None, 1))),
+    # Тренды TikTok
+    Case("get_tiktok_trends", database.get_tiktok_trends),
+    Case("get_tiktok_trends(status)", lambda: database.get_tiktok_trends(status="todo")),
+    Case("get_tiktok_trend_by_id", database.get_tiktok_trend_by_id, lambda s: (s.random_id("tiktok_trends"),)),
+    Case("create_tiktok_trend", lambda: database.create_tiktok_trend("Бенчмарк", "file_id")),
+    Case("mark_tiktok_trend_done", database.mark_tiktok_trend_done, lambda s: (s.random_id("tiktok_trends"),)),
+    Case("delete_tiktok_trend", database.delete_tiktok_trend,
+         _created(lambda: database.create_tiktok_trend("Удалить"))),
+    Case("get_tiktok_trend_by_video", database.get_tiktok_trend_by_video,
+         lambda s: (f"AgADq{s.random_id('tiktok_trends') - 1:08d}",)),
+    Case("get_tiktok_videos", database.get_tiktok_videos),
+    # Расписания
+    Case("create_schedule", lambda due_at: database.create_schedule("reminder", due_at, 1, "activities", 1),
+         lambda s: (s.rng.randint(0, 10**9),)),
+    Case("get_schedules", database.get_schedules),
+    Case("get_due_schedules", database.get_due_schedules, lambda s: (s.rng.randint(0, 10**9),)),
+    Case("get_schedule_buckets", database.get_schedule_buckets, lambda s: (60,)),
+    Case("reschedule", database.reschedule, lambda s: (1, s.rng.randint(0, 10**9))),
+    Case("delete_schedule", database.delete_schedule,
+         lambda s: (database.create_schedule("reminder", 0, 1, "activities", 1),)),
+    Case("get_digest_section", database.get_digest_section, lambda s: ("movies", 5)),
+    # Кеш медиа
+    Case("get_cached_media", database.get_cached_media, lambda s: (f"AgADq{s.random_id('tiktok_trends') - 1:08d}",)),
+    Case("cache_media", lambda unique_id: database.cache_media(unique_id, "file_id", 10, 1000),
+         lambda s: (f"AgADb{s.rng.random()}",)),
+    # Фотографии
+    Case("get_photo_categories", database.get_photo_categories),
+    Case("get_photo_category_by_id", database.get_photo_category_by_id, lambda s: (1,)),
+    Case("create_photo_category", database.create_photo_category, lambda s: (f"Альбом {s.rng.random()}",)),
+    Case("update_photo_category", lambda item_id: database.update_photo_category(item_id, description="Описание"),
+         lambda s: (1,)),
+    Case("delete_photo_category", database.delete_photo_category,
+         lambda s: (database.create_photo_category(f"Удалить {s.rng.random()}"),)),
+    Case("add_photo", lambda unique_id: database.add_photo(1, "file_id", unique_id),
+         lambda s: (f"AQADb{s.rng.random()}",)),
+    Case("count_photos", database.count_photos, lambda s: (1,)),
+    Case("get_photos", database.get_photos, lambda s: (1,)),
+    # Последние страницы самого большого альбома: с OFFSET это был бы
+    # пропуск почти всех его строк
+    Case("get_photos(after_id)", lambda after_id: database.get_photos(1, after_id=after_id),
+         lambda s: (s.counts["photos"] - 20,)),
+    Case("get_photos(before_id)", lambda before_id: database.get_photos(1, before_id=before_id),
+         lambda s: (s.counts["photos"],)),
+    # Игры
+    Case("get_games", database.get_games),
+    Case("get_games(status)", lambda: database.get_games(status="pending")),
+    Case("get_games(status, genre)", lambda: database.get_games(status="pending", genre="RPG")),
+    Case("get_game_by_id", database.get_game_by_id, lambda s: (s.random_id("games"),)),
+    Case("get_random_game", database.get_random_game),
+    Case("get_game_genres", database.get_game_genres),
+    Case("get_games_top", database.get_games_top),
+    Case("get_games_top(user_id)", lambda: database.get_games_top(user_id=seeding.SEED_USERS[1])),
+    Case("create_game", lambda: database.create_game("Бенчмарк", None, "RPG")),
+    Case("update_game", lambda item_id: database.update_game(item_id, title="Новое название"),
+         lambda s: (s.random_id("games"),)),
+    Case("mark_game_done", database.mark_game_done, lambda s: (s.random_id("games"),)),
+    Case("set_game_rating", lambda item_id: database.set_game_rating(item_id, seeding.SEED_USERS[1], 7),
+         lambda s: (s.random_id("games"),)),
+    Case("delete_game", database.delete_game, _created(lambda: database.create_game("Удалить"))),
+    # Sexual
+    Case("get_sexual_items", database.get_sexual_items),
+    Case("get_sexual_item_by_id", database.get_sexual_item_by_id, lambda s: (s.random_id("sexual"),)),
+    Case("create_sexual_item", lambda: database.create_sexual_item("Бенчмарк")),
+    Case("update_sexual_item", lambda item_id: database.update_sexual_item(item_id, title="Новое название"),
+         lambda s: (s.random_id("sexual"),)),
+    Case("delete_sexual_item", database.delete_sexual_item, _created(lambda: database.create_sexual_item("Удалить"))),
+    # Массовая загрузка: 100 фильмов с оценками и 100 игр
+    Case("import_items", database.import_items, lambda s: ([
+        {"table": table, "title": f"Импорт {i}", "note": None, "group": group, "done": i % 2,
+         "ratings": {seeding.SEED_USERS[0]: i % 10 + 1}}
+        for i in range(100) for table, group in (("movies", "Фильм"), ("games", "RPG"))
+    ],)),
+    # Тенанты
+    Case("get_tenant_ids", database.get_tenant_ids),
+    Case("get_member_tenant", database.get_member_tenant, lambda s: (seeding.SEED_USERS[0],)),
+    Case("get_tenant_members", database.get_tenant_members, lambda s: (database.DEFAULT_TENANT,)),
+    Case("create_invite", lambda code: database.create_invite(code, database.DEFAULT_TENANT, 1, 2**31),
+         lambda s: (f"bench{s.rng.random()}",)),
+    Case("get_invite", lambda code, user_id: database.get_invite(code), lambda s: _invite(s, database.DEFAULT_TENANT)),
+    Case("accept_invite", lambda code, user_id: database.accept_invite(code, user_id, "Бенчмарк", 0),
+         lambda s: _invite(s, None)),
+]
+
+
+def run_case(case: Case, state: State, repeat: int) -> Dict[str, float]:
+    """Замеряет вызов repeat раз (после одного прогревочного)."""
+    case.run(*case.setup(state))
+    timings = []
+    for _ in range(repeat):
+        args = case.setup(state)
+        started = time.perf_counter()
+        case.run(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 4),
+        "min_ms": round(min(timings), 4),
+        "max_ms": round(max(timings), 4),
+        "runs": repeat,
+    }
+
+
+def run(scale: int, repeat: int, only: Optional[str] = None, db_path: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Наполняет временную базу и прогоняет все замеры.
+
+    Args:
+        scale: Масштаб наполнения (число фильмов)
+        repeat: Сколько раз замерять каждую функцию
+        only: Подстрока имени - замерять только подходящие функции
+        db_path: Готовая база (копируется) вместо наполнения
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="forus_bench_"))
+    saved_db_path = database.DB_PATH
+    database.DB_PATH = workdir / "bench.db"
+    try:
+        if db_path is not None:
+            shutil.copy(db_path, database.DB_PATH)
+            database.init_database()
+            conn = database.get_connection()
+            counts = {
+                table: conn.execute(f"SELECT COALESCE(MAX(id), 1) FROM {table}").fetchone()[0]
+                for table in ("movies", "games", "trips", "activities", "tiktok_trends", "sexual")
+            }
+            conn.close()
+        else:
+            database.init_database()
+            counts = seeding.seed(scale)
+
+        state = State(counts)
+        results = {}
+        for case in CASES:
+            if only and only not in case.name:
+                continue
+            results[case.name] = run_case(case, state, repeat)
+        return {
+            "meta": {
+                "scale": scale,
+                "repeat": repeat,
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "machine": platform.machine(),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            },
+            "results": results,
+        }
+    finally:
+        database.DB_PATH = saved_db_path
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Функции, минимальное время которых выросло больше чем в threshold раз."""
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or max(result["min_ms"], base["min_ms"]) < NOISE_FLOOR_MS:
+            continue
+        ratio = result["min_ms"] / max(base["min_ms"], 1e-9)
+        if ratio > threshold:
+            regressions.append(
+                f"{name}: {base['min_ms']:.3f} мс -> {result['min_ms']:.3f} мс (x{ratio:.2f})"
+            )
+    return regressions
+
+
+def load_baseline(path: Path, scale: int) -> Optional[Dict[str, Any]]:
+    """Базовый прогон для масштаба scale (файл хранит прогоны по масштабам)."""
+    if not path.exists():
+        return None
+    baselines = json.loads(path.read_text(encoding="utf-8"))
+    return baselines.get(str(scale))
+
+
+def save_baseline(path: Path, report: Dict[str, Any]) -> None:
+    baselines = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    baselines[str(report["meta"]["scale"])] = report
+    path.write_text(json.dumps(baselines, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    print(f"Масштаб: {report['meta']['scale']}, повторов: {report['meta']['repeat']}")
+    print(f"{'функция':<38} {'медиана, мс':>12} {'мин, мс':>10} {'база мин, мс':>13}")
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name) if baseline else None
+        base_text = f"{base['min_ms']:13.3f}" if base else f"{'-':>13}"
+        print(f"{name:<38} {result['median_ms']:12.3f} {result['min_ms']:10.3f} {base_text}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк функций database.py")
+    parser.add_argument("--scale", type=int, default=1000, help="масштаб наполнения (число фильмов)")
+    parser.add_argument("--repeat", type=int, default=20, help="замеров на функцию")
+    parser.add_argument("--only", help="замерять только функции, содержащие подстроку")
+    parser.add_argument("--db", type=Path, help="готовая база вместо наполнения (копируется)")
+    parser.add_argument("--output", type=Path, help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="файл базовых прогонов")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимый рост минимального времени (1.5 = +50%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать прогон как базовый")
+    args = parser.parse_args()
+
+    report = run(args.scale, args.repeat, args.only, args.db)
+    baseline = load_baseline(args.baseline, args.scale)
+    print_report(report, baseline)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    if args.save_baseline:
+        save_baseline(args.baseline, report)
+        print(f"\nБазовый прогон сохранен в {args.baseline}")
+        return
+
+    if baseline is None:
+        print(f"\nБазового прогона для масштаба {args.scale} нет (--save-baseline, чтобы создать)")
+        return
+    regressions = compare(report, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ Регрессии (медленнее базы больше чем в {args.threshold} раза):")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n✅ Регрессий нет")
+
+
+if __name__ == '__main__':
+    main()
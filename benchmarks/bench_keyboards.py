@@ -0,0 +1,144 @@
+"""
+Бенчмарк фабрик клавиатур (keyboards.keyboard_factory).
+
+Прогоняет типичный поток апдейтов (открытие меню разделов, подменю
+с категориями и жанрами, клавиатура оценки, кнопки "Назад") и сравнивает
+фабрики с кешем и без него (исходная функция, __wrapped__):
+- время на апдейт
+- выделенная память на апдейт (tracemalloc): сколько байт и блоков
+  уходит на новые InlineKeyboardButton/InlineKeyboardMarkup
+- сколько стоит сброс кеша после изменения категории
+
+База - временная, засевается benchmarks.seed.
+
+Использование:
+    python -m benchmarks.bench_keyboards
+    python -m benchmarks.bench_keyboards --updates 20000 --items 1000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import database
+import keyboards
+from benchmarks.seed import seed
+from handlers import activities, games, movies, photos, sexual, tiktok, trips
+
+# (фабрика, аргументы) - клавиатуры, которые бот строит на апдейт
+Call = Tuple[Callable, tuple]
+
+
+def make_calls() -> List[Call]:
+    """Набор клавиатур в пропорциях, близких к реальному потоку апдейтов."""
+    return [
+        (movies.movies_menu_keyboard, ()),
+        (movies.movies_pending_keyboard, ()),
+        (movies.movies_watched_keyboard, ()),
+        (movies.movies_top_keyboard, (("User1", "User2"),)),
+        (movies.movie_category_keyboard, ()),
+        (games.games_menu_keyboard, ()),
+        (games.games_pending_keyboard, ()),
+        (games.games_top_keyboard, (("User1", "User2"),)),
+        (activities.activities_menu_keyboard, ()),
+        (tiktok.tiktok_menu_keyboard, ()),
+        (photos.photos_menu_keyboard, ()),
+        (sexual.sexual_menu_keyboard, ()),
+        (trips.trips_menu_keyboard, ()),
+        (trips.trip_category_keyboard, ()),
+        (keyboards.main_menu_inline_keyboard, ()),
+        (keyboards.rating_keyboard, ("rate_movie", 1, 1)),
+        (keyboards.back_button, ("movies_menu",)),
+        (keyboards.back_button, ("games_menu",)),
+    ]
+
+
+def run_updates(calls: List[Call], updates: int, cached: bool, rng_seed: int = 42) -> Dict[str, float]:
+    """Строит по одной клавиатуре на апдейт; замер времени и памяти."""
+    rng = random.Random(rng_seed)
+    sequence = [rng.choice(calls) for _ in range(updates)]
+    if not cached:
+        sequence = [(factory.__wrapped__, args) for factory, args in sequence]
+
+    # Прогрев: первое построение каждой клавиатуры в кеш не входит в замер
+    for factory, args in calls:
+        factory(*args)
+
+    started = time.perf_counter()
+    for factory, args in sequence:
+        factory(*args)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [factory(*args) for factory, args in sequence]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in diff)
+    blocks = sum(stat.count_diff for stat in diff)
+    # Сам список kept - не выделения фабрик
+    list_overhead = kept.__sizeof__()
+
+    return {
+        "us_per_update": round(elapsed / updates * 1e6, 3),
+        "bytes_per_update": round(max(size - list_overhead, 0) / updates, 1),
+        "blocks_per_update": round(max(blocks - 1, 0) / updates, 2),
+    }
+
+
+def invalidation_cost(repeat: int = 1000) -> float:
+    """Среднее время (мкс) первого построения меню после изменения категорий."""
+    timings = []
+    for i in range(repeat):
+        keyboards._on_change("movie_categories", i, "update")
+        started = time.perf_counter()
+        movies.movies_pending_keyboard()
+        timings.append(time.perf_counter() - started)
+    return round(sum(timings) / repeat * 1e6, 2)
+
+
+def run(updates: int, items: int) -> Dict[str, Dict[str, float]]:
+    saved_db_path = database.DB_PATH
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_PATH = Path(tmp) / "bench.db"
+            database.init_database()
+            seed(items)
+            calls = make_calls()
+            results = {
+                "uncached": run_updates(calls, updates, cached=False),
+                "cached": run_updates(calls, updates, cached=True),
+            }
+            results["invalidation"] = {"us_per_rebuild": invalidation_cost()}
+    finally:
+        database.DB_PATH = saved_db_path
+    return results
+
+
+def print_report(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'режим':<10} {'мкс/апдейт':>11} {'байт/апдейт':>12} {'блоков/апдейт':>14}")
+    for mode in ("uncached", "cached"):
+        stats = results[mode]
+        print(f"{mode:<10} {stats['us_per_update']:>11} {stats['bytes_per_update']:>12} "
+              f"{stats['blocks_per_update']:>14}")
+    uncached, cached = results["uncached"], results["cached"]
+    print(f"\nВремя: x{uncached['us_per_update'] / max(cached['us_per_update'], 1e-9):.1f}, "
+          f"память: {uncached['bytes_per_update'] - cached['bytes_per_update']:.0f} байт на апдейт меньше")
+    print(f"Перестроение меню после изменения категорий: {results['invalidation']['us_per_rebuild']} мкс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк фабрик клавиатур")
+    parser.add_argument("--updates", type=int, default=10000, help="апдейтов в прогоне")
+    parser.add_argument("--items", type=int, default=200, help="записей в каждой таблице при засеве")
+    args = parser.parse_args()
+    print_report(run(args.updates, args.items))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Бенчмарк сборки текста экранов (screens.py).
+
+Замеряет отрисовку списков и карточек на 1000 записях (sqlite3.Row, как
+их отдает database.py) и сравнивает с прежней склейкой через += в цикле:
+- список целиком и превью из 10 строк
+- список с экранированием HTML
+- карточка с длинной заметкой и разбиение на страницы по 4096 символов
+
+Использование:
+    python -m benchmarks.bench_screens
+    python -m benchmarks.bench_screens --items 10000 --repeat 50
+"""
+
+import argparse
+import random
+import sqlite3
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from telegram.constants import ParseMode
+
+import screens
+from benchmarks.seed import WORDS
+
+DETAIL_HEADER = screens.Template("🎬 {title}\n\n")
+DETAIL_NOTE = screens.Template("📝 {note}\n\n")
+DETAIL_CATEGORY = screens.Template("📁 Категория: {category_title}\n")
+
+
+def make_rows(count: int, note_length: int = 200, rng_seed: int = 42) -> List[sqlite3.Row]:
+    """Записи фильмов в том виде, в каком их отдает database.get_movies()."""
+    rng = random.Random(rng_seed)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE movies (id INTEGER, title TEXT, note TEXT, category_title TEXT, "
+                 "user1_rating INTEGER, user2_rating INTEGER)")
+    conn.executemany("INSERT INTO movies VALUES (?, ?, ?, ?, ?, ?)", (
+        (i, f"{rng.choice(WORDS)} <{rng.choice(WORDS).lower()}> & {i}",
+         " ".join(rng.choice(WORDS) for _ in range(note_length // 6)),
+         "Фильм", rng.randint(1, 10), rng.randint(1, 10))
+        for i in range(count)
+    ))
+    rows = conn.execute("SELECT * FROM movies").fetchall()
+    conn.close()
+    return rows
+
+
+def legacy_list(rows: List[sqlite3.Row], limit: int) -> str:
+    """Прежняя сборка списка в обработчиках."""
+    text = f"📋 Ожидающие просмотра ({len(rows)}):\n\n"
+    for i, movie in enumerate(rows[:limit], 1):
+        text += f"{i}. {movie['title']}\n"
+    if len(rows) > limit:
+        text += f"\n... и еще {len(rows) - limit}"
+    return text
+
+
+def legacy_detail(movie: sqlite3.Row) -> str:
+    """Прежняя сборка карточки в обработчиках."""
+    text = f"🎬 {movie['title']}\n\n"
+    if movie['note']:
+        text += f"📝 {movie['note']}\n\n"
+    text += f"📁 Категория: {movie['category_title']}\n"
+    return text
+
+
+def screens_detail(movie: sqlite3.Row, parse_mode=None) -> str:
+    return screens.render_detail([
+        DETAIL_HEADER.render(movie, parse_mode=parse_mode),
+        DETAIL_NOTE.render(movie, parse_mode=parse_mode) if movie['note'] else None,
+        DETAIL_CATEGORY.render(movie, parse_mode=parse_mode),
+    ])
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": round(statistics.median(timings), 4), "min_ms": round(min(timings), 4)}
+
+
+def run(items: int, repeat: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Прогоняет замеры.
+
+    Returns:
+        {случай: {"legacy": замер, "screens": замер}}; legacy отсутствует,
+        если прежнего аналога нет
+    """
+    rows = make_rows(items)
+    long_note = make_rows(1, note_length=20000)[0]
+
+    cases = {
+        f"list_{items}_all": {
+            "legacy": lambda: legacy_list(rows, len(rows)),
+            "screens": lambda: screens.render_list(
+                "📋 Ожидающие просмотра", rows, screens.NUMBERED_TITLE, limit=None
+            ),
+        },
+        f"list_{items}_preview": {
+            "legacy": lambda: legacy_list(rows, screens.LIST_PREVIEW),
+            "screens": lambda: screens.render_list("📋 Ожидающие просмотра", rows, screens.NUMBERED_TITLE),
+        },
+        f"list_{items}_all_html": {
+            "screens": lambda: "\n".join(screens.NUMBERED_TITLE.render_lines(rows, parse_mode=ParseMode.HTML)),
+        },
+        f"detail_x{items}": {
+            "legacy": lambda: [legacy_detail(row) for row in rows],
+            "screens": lambda: [screens_detail(row) for row in rows],
+        },
+        "detail_long_note_split": {
+            "screens": lambda: screens.split_pages(screens_detail(long_note)),
+        },
+        "list_all_split": {
+            "screens": lambda: screens.split_pages(
+                screens.render_list("📋 Ожидающие просмотра", rows, screens.NUMBERED_TITLE, limit=None)
+            ),
+        },
+    }
+    return {name: {kind: measure(func, repeat) for kind, func in variants.items()}
+            for name, variants in cases.items()}
+
+
+def print_report(results: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    print(f"{'случай':<28} {'screens, мс':>12} {'+=, мс':>10} {'отношение':>10}")
+    for name, variants in results.items():
+        new = variants["screens"]["median_ms"]
+        old = variants.get("legacy", {}).get("median_ms")
+        old_text = f"{old:10.3f}" if old is not None else f"{'-':>10}"
+        ratio_text = f"{old / new:10.2f}" if old else f"{'-':>10}"
+        print(f"{name:<28} {new:12.3f} {old_text} {ratio_text}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк сборки текста экранов")
+    parser.add_argument("--items", type=int, default=1000, help="записей в списке")
+    parser.add_argument("--repeat", type=int, default=20, help="замеров на случай")
+    args = parser.parse_args()
+    print_report(run(args.items, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
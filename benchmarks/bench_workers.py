@@ -0,0 +1,263 @@
+"""
+Бенчмарк режима нескольких процессов (workers.py): рост пропускной
+способности с числом рабочих.
+
+Стенд: временная база в режиме шардов (DB_SHARDED=1), TENANTS тенантов по
+2 участника со своими фильмами и играми (tools/loadgen.seed_database) и
+фейковый Bot API (tools/fake_bot_api.py) в отдельном процессе, чтобы он сам
+не стал узким местом. Бенчмарк играет роль фронта: поток сценариев
+tools/loadgen (меню, добавление, оценки) всех тенантов вперемешку раздается
+рабочим через WorkerPool.submit без пауз. Время - от первого переданного
+апдейта до отчета рабочего о последнем; каждый прогон - на свежей копии
+базы.
+
+Рост ограничен числом ядер: рабочих больше, чем os.cpu_count(), запускать
+бессмысленно (это видно в отчете).
+
+Использование:
+    python -m benchmarks.bench_workers
+    python -m benchmarks.bench_workers --workers 1,2,4,8 --updates 5000 --tenants 16
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from telegram import Update
+
+import config
+import database
+import workers
+from tools import loadgen
+from tools.fake_bot_api import FakeBotApi
+
+# Пользователи config.json стенда (тенант 1; в потоке апдейтов не участвуют)
+CONFIG_USERS = {900001: "Бенчмарк 1", 900002: "Бенчмарк 2"}
+# Первый user_id участников тенантов стенда
+FIRST_MEMBER = 200000
+# Сколько ждать готовности рабочих (секунды)
+STARTUP_TIMEOUT = 60.0
+# Сколько ждать очередного обработанного апдейта (секунды)
+UPDATE_TIMEOUT = 60.0
+
+# Участники тенанта и ссылки сценариев на его данные
+TenantSeed = Tuple[List[int], Dict[str, List[int]]]
+
+
+# ============================================
+# СТЕНД
+# ============================================
+
+@contextlib.contextmanager
+def _environment(values: Mapping[str, str]) -> Iterator[None]:
+    """Переменные окружения для рабочих процессов (они наследуют окружение при запуске)."""
+    saved = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def prepare_database(db_path: Path, tenants: int) -> List[TenantSeed]:
+    """Основная база и шарды: tenants тенантов по 2 участника с данными сценариев."""
+    saved = (database.DB_PATH, database.SHARDED)
+    database.DB_PATH, database.SHARDED = db_path, True
+    now = int(time.time())
+    seeds: List[TenantSeed] = []
+    try:
+        database.init_database()
+        for i in range(tenants):
+            first, second = FIRST_MEMBER + 2 * i, FIRST_MEMBER + 2 * i + 1
+            database.create_invite(f"bench{i}a", None, first, now + 3600)
+            tenant_id = database.accept_invite(f"bench{i}a", first, f"Участник {first}", now)
+            database.create_invite(f"bench{i}b", tenant_id, first, now + 3600)
+            database.accept_invite(f"bench{i}b", second, f"Участник {second}", now)
+            with database.tenant_scope(tenant_id):
+                seeds.append(([first, second], loadgen.seed_database()))
+    finally:
+        database.close_shards()
+        database.DB_PATH, database.SHARDED = saved
+    return seeds
+
+
+def build_updates(seeds: Sequence[TenantSeed], total: int, flows: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Сценарии всех тенантов вперемешку (как апдейты разных чатов в getUpdates)."""
+    flows = flows or list(loadgen.FLOWS)
+    per_tenant = -(-total // len(seeds))
+    streams = []
+    for members, seed in seeds:
+        users = [loadgen.VirtualUser(user_id, itertools.count(1)) for user_id in members]
+        streams.append(loadgen.build_stream(users, flows, seed, per_tenant))
+    mixed = [update for group in itertools.zip_longest(*streams) for update in group if update is not None]
+    mixed = mixed[:total]
+    for update_id, update in enumerate(mixed, 1):
+        update["update_id"] = update_id
+        if "callback_query" in update:
+            update["callback_query"]["id"] = str(update_id)
+    return mixed
+
+
+def _serve_fake_api(address: Any) -> None:
+    """Точка входа процесса фейкового Bot API: сообщает адрес и работает до завершения."""
+    import asyncio
+
+    async def serve() -> None:
+        api = FakeBotApi()
+        await api.start()
+        address.put(api.base_url)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+# ============================================
+# ЗАМЕР
+# ============================================
+
+def _next_report(report: Any, timeout: float) -> int:
+    try:
+        return report.get(timeout=timeout)
+    except queue.Empty:
+        raise RuntimeError(f"Рабочие не ответили за {timeout:.0f} с") from None
+
+
+def measure(worker_count: int, stream: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Один прогон: worker_count рабочих обрабатывают stream. База и окружение - уже готовы."""
+    context = multiprocessing.get_context("spawn")
+    report = context.Queue()
+    pool = workers.WorkerPool(worker_count, report)
+    pool.start()
+    try:
+        ready = 0
+        while ready < worker_count:
+            if _next_report(report, STARTUP_TIMEOUT) == 0:
+                ready += 1
+        updates = [Update.de_json(data, None) for data in stream]
+
+        started = time.perf_counter()
+        for update in updates:
+            pool.submit(update)
+        done = 0
+        while done < len(updates):
+            if _next_report(report, UPDATE_TIMEOUT) != 0:
+                done += 1
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.stop()
+
+    return {
+        "workers": worker_count,
+        "updates": len(stream),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(stream) / elapsed, 1) if elapsed else 0.0,
+        "per_worker": list(pool.submitted),
+    }
+
+
+def run(worker_counts: Sequence[int] = (1, 2, 4), total: int = 2000, tenants: int = 8) -> Dict[str, Any]:
+    """
+    Прогоны для каждого числа рабочих на одном и том же потоке апдейтов.
+
+    Returns:
+        Отчет: ядра, прогоны и ускорение относительно первого прогона
+    """
+    context = multiprocessing.get_context("spawn")
+    address = context.Queue()
+    api = context.Process(target=_serve_fake_api, args=(address,), name="forus-fake-api", daemon=True)
+    api.start()
+    saved_snapshot = config.swap(config.make_snapshot(CONFIG_USERS))
+    try:
+        base_url = address.get(timeout=STARTUP_TIMEOUT)
+        with tempfile.TemporaryDirectory() as tmp:
+            template = Path(tmp) / "template"
+            template.mkdir()
+            config_path = Path(tmp) / "config.json"
+            config_path.write_text(json.dumps(
+                {"users": [{"id": user_id, "name": name} for user_id, name in CONFIG_USERS.items()]},
+                ensure_ascii=False
+            ), encoding="utf-8")
+            seeds = prepare_database(template / "multilists.db", tenants)
+            stream = build_updates(seeds, total)
+
+            runs = []
+            for worker_count in worker_counts:
+                run_dir = Path(tmp) / f"run{worker_count}"
+                shutil.copytree(template, run_dir)
+                environment = {
+                    "BOT_TOKEN": "123456:BENCH",
+                    "BOT_API_URL": base_url,
+                    "CONFIG_PATH": str(config_path),
+                    "DB_PATH": str(run_dir / "multilists.db"),
+                    "DB_SHARDED": "1",
+                    "NOTIFY_WINDOW": "0",
+                    "LOG_LEVEL": "WARNING",
+                    "PYTHONWARNINGS": "ignore",
+                }
+                # Выбор рабочего ищет тенант участника в базе фронта
+                saved_path = database.DB_PATH
+                database.DB_PATH = template / "multilists.db"
+                workers._member_tenants.clear()
+                try:
+                    with _environment(environment):
+                        runs.append(measure(worker_count, stream))
+                finally:
+                    database.DB_PATH = saved_path
+                    workers._member_tenants.clear()
+    finally:
+        config.swap(saved_snapshot)
+        api.terminate()
+        api.join()
+
+    first = runs[0]["updates_per_s"] if runs else 0.0
+    for result in runs:
+        result["speedup"] = round(result["updates_per_s"] / first, 2) if first else 0.0
+    return {"cpu_count": os.cpu_count(), "tenants": tenants, "runs": runs}
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Ядер: {report['cpu_count']}, тенантов: {report['tenants']}\n")
+    print(f"  {'рабочих':>8}  {'апдейтов/с':>11}  {'ускорение':>9}  апдейтов по рабочим")
+    for result in report["runs"]:
+        print(f"  {result['workers']:>8}  {result['updates_per_s']:>11}  "
+              f"{result['speedup']:>8}x  {result['per_worker']}")
+    cpus = report["cpu_count"] or 1
+    if any(result["workers"] > cpus for result in report["runs"]):
+        print(f"\n⚠️ Рабочих больше, чем ядер ({cpus}): прирост на этой машине ограничен")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пропускная способность режима --workers")
+    parser.add_argument("--workers", default="1,2,4", help="числа рабочих через запятую")
+    parser.add_argument("--updates", type=int, default=2000, help="апдейтов в прогоне")
+    parser.add_argument("--tenants", type=int, default=8, help="тенантов (пар) в базе")
+    parser.add_argument("--json", type=Path, help="сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    counts = [int(value) for value in args.workers.split(",") if value.strip()]
+    if not counts or min(counts) < 1:
+        parser.error("--workers: нужны положительные числа")
+    if args.tenants < 1:
+        parser.error("--tenants: нужен хотя бы один тенант")
+
+    report = run(counts, args.updates, args.tenants)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == '__main__':
+    main()
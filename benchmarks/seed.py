@@ -0,0 +1,210 @@
+"""
+Наполнение базы реалистичными данными для бенчмарков.
+
+Масштаб (--scale) - число фильмов; остальные разделы наполняются
+пропорционально: игр столько же, поездок и активностей - половина,
+трендов - четверть, фотографий в альбомах - столько же, сколько фильмов.
+Примерно половина фильмов и игр просмотрена/пройдена и оценена
+пользователями SEED_USERS, категории и жанры распределены неравномерно,
+как в жизни.
+
+Запись идет напрямую через executemany одной транзакцией, поэтому
+миллион записей создается за секунды (create_* открывают соединение
+на каждую запись и для этого не годятся).
+
+Использование:
+    python -m benchmarks.seed --scale 100000 --db data/bench.db
+"""
+
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import database
+
+MOVIE_CATEGORIES = ["Фильм", "Сериал", "Мультик", "Документальный", "Аниме", "Короткометражка"]
+TRIP_CATEGORIES = ["Пешком", "Поездки", "Места в Херцег-Нови", "Горы", "Море", "Города"]
+GENRES = ["RPG", "Shooter", "Strategy", "Puzzle", "Racing", "Simulator", "Platformer", "Horror", "Co-op", "Indie"]
+WORDS = [
+    "Тайна", "Город", "Ночь", "Лето", "Дорога", "Остров", "Звезда", "Тень", "Север", "Песня",
+    "Сад", "Ветер", "Море", "Свет", "Мост", "Граница", "Огонь", "Лес", "Снег", "Путь",
+]
+
+# Пользователи, чьи оценки попадают в таблицу ratings
+SEED_USERS = (100001, 100002)
+
+BATCH = 10000
+
+
+def _title(rng: random.Random, number: int) -> str:
+    return f"{rng.choice(WORDS)} {rng.choice(WORDS).lower()} {number}"
+
+
+def _note(rng: random.Random) -> str:
+    return rng.choice([None, None, "Посоветовали друзья", "Посмотреть на выходных", "Есть на Кинопоиске"])
+
+
+def _weighted_index(rng: random.Random, size: int) -> int:
+    """Неравномерное распределение: первые категории встречаются чаще."""
+    return min(size - 1, int(rng.paretovariate(1.5)) - 1)
+
+
+def _ratings(rng: random.Random, done: bool) -> List[Tuple[int, int]]:
+    """Оценки записи [(user_id, score)]: первый пользователь оценивает всегда, остальные - не всегда."""
+    if not done:
+        return []
+    return [
+        (user_id, rng.randint(1, 10)) for n, user_id in enumerate(SEED_USERS)
+        if n == 0 or rng.random() < 0.85
+    ]
+
+
+def _totals(scores: Sequence[Tuple[int, int]]) -> Tuple:
+    """rating_sum, rating_count, rating_avg записи."""
+    total = sum(score for _, score in scores)
+    return total, len(scores), total / len(scores) if scores else None
+
+
+def _insert_ratings(cursor, table: str, scores: List[List[Tuple[int, int]]]) -> None:
+    """Оценки только что вставленных записей table (scores - по порядку вставки)."""
+    ids = [row["id"] for row in cursor.execute(f"SELECT id FROM {table} ORDER BY id DESC LIMIT ?", (len(scores),))]
+    _executemany(cursor, "INSERT INTO ratings (item_type, item_id, user_id, score) VALUES (?, ?, ?, ?)", (
+        (table, item_id, user_id, score)
+        for item_id, item_scores in zip(reversed(ids), scores)
+        for user_id, score in item_scores
+    ))
+
+
+def _executemany(cursor, query: str, rows: Iterator[tuple]) -> None:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            cursor.executemany(query, batch)
+            batch = []
+    if batch:
+        cursor.executemany(query, batch)
+
+
+def seed(scale: int, rng_seed: int = 42) -> Dict[str, int]:
+    """
+    Наполняет базу database.DB_PATH (таблицы должны быть созданы init_database).
+
+    Returns:
+        Число созданных записей по таблицам
+    """
+    rng = random.Random(rng_seed)
+    counts = {
+        "movies": scale,
+        "games": scale,
+        "trips": max(1, scale // 2),
+        "activities": max(1, scale // 2),
+        "tiktok_trends": max(1, scale // 4),
+        "sexual": max(1, min(scale // 10, 1000)),
+        "photo_categories": max(1, min(scale // 100, 500)),
+        "photos": scale,
+    }
+
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany("INSERT OR IGNORE INTO movie_categories (title) VALUES (?)", [(t,) for t in MOVIE_CATEGORIES])
+        cursor.executemany("INSERT OR IGNORE INTO trip_categories (title) VALUES (?)", [(t,) for t in TRIP_CATEGORIES])
+        movie_categories = [row["id"] for row in cursor.execute("SELECT id FROM movie_categories ORDER BY id")]
+        trip_categories = [row["id"] for row in cursor.execute("SELECT id FROM trip_categories ORDER BY id")]
+
+        movie_scores = []
+
+        def movies():
+            for i in range(counts["movies"]):
+                watched = rng.random() < 0.5
+                scores = _ratings(rng, watched)
+                movie_scores.append(scores)
+                category = movie_categories[_weighted_index(rng, len(movie_categories))]
+                yield (_title(rng, i), _note(rng), category, int(watched)) + _totals(scores)
+
+        _executemany(cursor, """
+            INSERT INTO movies (title, note, category_id, watched, rating_sum, rating_count, rating_avg)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, movies())
+        _insert_ratings(cursor, "movies", movie_scores)
+
+        game_scores = []
+
+        def games():
+            for i in range(counts["games"]):
+                done = rng.random() < 0.5
+                scores = _ratings(rng, done)
+                game_scores.append(scores)
+                genre = GENRES[_weighted_index(rng, len(GENRES))] if rng.random() < 0.9 else None
+                yield (_title(rng, i), _note(rng), genre, "done" if done else "pending") + _totals(scores)
+
+        _executemany(cursor, """
+            INSERT INTO games (title, note, genre, status, rating_sum, rating_count, rating_avg)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, games())
+        _insert_ratings(cursor, "games", game_scores)
+
+        _executemany(cursor, "INSERT INTO trips (title, note, category_id, visited) VALUES (?, ?, ?, ?)", (
+            (_title(rng, i), _note(rng), trip_categories[_weighted_index(rng, len(trip_categories))],
+             int(rng.random() < 0.3))
+            for i in range(counts["trips"])
+        ))
+        _executemany(cursor, "INSERT INTO activities (title, note, status) VALUES (?, ?, ?)", (
+            (_title(rng, i), _note(rng), "done" if rng.random() < 0.4 else "planned")
+            for i in range(counts["activities"])
+        ))
+        _executemany(cursor, """
+            INSERT INTO tiktok_trends (title, video_file_id, video_unique_id, status) VALUES (?, ?, ?, ?)
+        """, (
+            (_title(rng, i), f"BAACAgIAAxkBAAI{i:08d}", f"AgADq{i:08d}", "done" if rng.random() < 0.5 else "todo")
+            for i in range(counts["tiktok_trends"])
+        ))
+        _executemany(cursor, """
+            INSERT INTO media_cache (file_unique_id, file_id, duration, file_size) VALUES (?, ?, ?, ?)
+        """, (
+            (f"AgADq{i:08d}", f"BAACAgIAAxkBAAI{i:08d}", rng.randint(5, 60), rng.randint(10**5, 10**7))
+            for i in range(counts["tiktok_trends"])
+        ))
+        _executemany(cursor, "INSERT INTO sexual (title, link, description) VALUES (?, ?, ?)", (
+            (_title(rng, i), None, _note(rng)) for i in range(counts["sexual"])
+        ))
+        _executemany(cursor, "INSERT OR IGNORE INTO photo_categories (title, link, description) VALUES (?, ?, ?)", (
+            (f"Альбом {i}", f"https://example.com/album/{i}", None) for i in range(counts["photo_categories"])
+        ))
+        photo_categories = [row["id"] for row in cursor.execute("SELECT id FROM photo_categories ORDER BY id")]
+        # Первые альбомы - самые большие (тысячи фото при большом масштабе)
+        _executemany(cursor, "INSERT INTO photos (category_id, file_id, file_unique_id) VALUES (?, ?, ?)", (
+            (photo_categories[_weighted_index(rng, len(photo_categories))], f"AgACAgIAAxkBAAI{i:08d}", f"AQADp{i:08d}")
+            for i in range(counts["photos"])
+        ))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Наполнение базы данными для бенчмарков")
+    parser.add_argument("--scale", type=int, default=1000, help="число фильмов (остальное пропорционально)")
+    parser.add_argument("--db", type=Path, default=Path("data/bench.db"), help="файл базы")
+    parser.add_argument("--seed", type=int, default=42, help="зерно генератора случайных чисел")
+    args = parser.parse_args()
+
+    database.DB_PATH = args.db
+    database.init_database()
+    started = time.perf_counter()
+    counts = seed(args.scale, args.seed)
+    elapsed = time.perf_counter() - started
+    print(f"База {args.db} наполнена за {elapsed:.1f} с:")
+    for table, count in counts.items():
+        print(f"  {table:<18} {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,43 +2,54 @@
 Главный файл бота - инициализация и регистрация всех обработчиков.
 """
 
+import argparse
 import logging
 import os
+from typing import List, Optional
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 
+import callbacks
 import config
 import database
-from keyboards import main_menu_reply_keyboard, main_menu_inline_keyboard
+import jobs
+import metrics
+import middleware
+import notifications
+import profiler
+import recorder
+import render
+import scheduler
+import tenants
+import tracing
+from keyboards import SECTIONS, main_menu_reply_keyboard, main_menu_inline_keyboard
+from instrumentation import InstrumentedRequest
+from persistence import SQLitePersistence
 
 # Загружаем переменные окружения из .env
 load_dotenv()
 
 # Настройка логирования
+# trace_id - идентификатор апдейта, который проставляет конвейер middleware
+middleware.install_log_trace_id()
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
+    level=os.getenv('LOG_LEVEL', 'INFO')
 )
 logger = logging.getLogger(__name__)
 
-
-def check_authorization(func):
-    """Декоратор для проверки авторизации пользователя."""
-    async def wrapper(update: Update, context):
-        user_id = update.effective_user.id
-        if not config.is_authorized_user(user_id):
-            await update.message.reply_text("❌ У вас нет доступа к этому боту.")
-            return
-        return await func(update, context)
-    return wrapper
+# Адрес Bot API (по умолчанию api.telegram.org) - например, локальный
+# Bot API сервер; переменную окружения наследуют процессы workers.py
+BOT_API_URL = os.getenv('BOT_API_URL')
 
 
 async def start(update: Update, context) -> None:
     """Обработчик команды /start."""
     user_id = update.effective_user.id
     
-    if not config.is_authorized_user(user_id):
+    # Повторная проверка: конвейер middleware уже отбросил чужих (AuthMiddleware)
+    if tenants.tenant_of(user_id) is None:
         await update.message.reply_text("❌ У вас нет доступа к этому боту.")
         return
     
@@ -53,7 +64,7 @@ async def main_menu_handler(update: Update, context) -> None:
     """Обработчик главного меню (reply keyboard)."""
     user_id = update.effective_user.id
     
-    if not config.is_authorized_user(user_id):
+    if tenants.tenant_of(user_id) is None:
         await update.message.reply_text("❌ У вас нет доступа к этому боту.")
         return
     
@@ -89,27 +100,18 @@ async def main_menu_callback(update: Update, context) -> None:
     await query.answer()
     
     user_id = update.effective_user.id
-    if not config.is_authorized_user(user_id):
-        await query.edit_message_text("❌ У вас нет доступа к этому боту.")
+    if tenants.tenant_of(user_id) is None:
+        await render.edit_screen(update, "❌ У вас нет доступа к этому боту.")
         return
     
-    if query.data == "main_menu":
+    callback = callbacks.decode(query.data)
+    if callback.route == "main_menu":
         text = "🏠 Главное меню\n\nВыберите раздел:"
-        try:
-            await query.edit_message_text(
-                text,
-                reply_markup=main_menu_inline_keyboard()
-            )
-        except Exception as e:
-            # Если сообщение не может быть отредактировано, отправляем новое
-            await query.message.reply_text(
-                text,
-                reply_markup=main_menu_inline_keyboard()
-            )
+        await render.edit_screen(update, text, reply_markup=main_menu_inline_keyboard())
     
-    # Обработка выбора раздела через callback
-    elif query.data.startswith("section_"):
-        section = query.data.replace("section_", "")
+    # Обработка выбора раздела через callback (аргумент - номер раздела в SECTIONS)
+    elif callback.route == "section":
+        section = SECTIONS[callback.args[0]]
         
         if section == "Фильмы":
             from handlers.movies import movies_menu
@@ -134,8 +136,142 @@ async def main_menu_callback(update: Update, context) -> None:
             await sexual_menu(update, context)
 
 
+async def stale_callback(update: Update, context) -> None:
+    """Кнопка, которую не удалось разобрать (старое сообщение): предлагаем главное меню."""
+    query = update.callback_query
+    await query.answer("Кнопка устарела")
+    text = "⌛ Эта кнопка устарела\n\n🏠 Главное меню\n\nВыберите раздел:"
+    await render.edit_screen(update, text, reply_markup=main_menu_inline_keyboard())
+
+
+async def post_init(application: Application) -> None:
+    """Запускает фоновые службы в event loop бота (после инициализации приложения)."""
+    # config.json перечитывается без перезапуска
+    config.start_watching()
+    if metrics.METRICS_PORT:
+        await metrics.start(int(metrics.METRICS_PORT))
+    if tracing.enabled():
+        tracing.start()
+    if recorder.enabled():
+        recorder.start()
+    # Напоминания и дайджесты из базы - в JobQueue
+    scheduler.start(application)
+    notifications.start(application)
+
+
+async def post_stop(application: Application) -> None:
+    """Досылает накопленное, пока бот еще может отправлять сообщения."""
+    await notifications.stop()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Останавливает фоновые службы."""
+    config.stop_watching()
+    if metrics.METRICS_PORT:
+        await metrics.stop()
+    if tracing.enabled():
+        tracing.stop()
+    if recorder.enabled():
+        recorder.stop()
+    await jobs.stop()
+    database.close_shards()
+
+
+def build_application(bot_token: str, base_url: Optional[str] = None, job_queue: bool = True) -> Application:
+    """
+    Создает приложение бота со всеми обработчиками.
+    
+    Args:
+        bot_token: Токен бота
+        base_url: Адрес Bot API (по умолчанию api.telegram.org).
+                  Нагрузочный стенд подставляет адрес локального фейкового сервера
+        job_queue: False - без JobQueue (рабочие процессы workers.py, кроме первого:
+                   таймеры расписаний должны быть в одном процессе)
+    
+    Returns:
+        Готовое к запуску Application
+    """
+    # SQLitePersistence - user_data и состояния диалогов переживают перезапуск
+    # InstrumentedRequest - замеры вызовов Bot API для метрик
+    builder = (
+        Application.builder()
+        .token(bot_token)
+        .persistence(SQLitePersistence())
+        .request(InstrumentedRequest())
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    if not job_queue:
+        builder = builder.job_queue(None)
+    application = builder.build()
+    logger.info("Приложение бота создано")
+    
+    # Конвейер middleware: авторизация, дубликаты, замеры, ошибки (группы -1 и 101)
+    pipeline = middleware.default_pipeline()
+    if metrics.METRICS_PORT:
+        metrics.install(pipeline)
+    if recorder.enabled():
+        recorder.install(pipeline)
+    pipeline.register(application)
+    
+    # Регистрируем обработчики главного меню (высокий приоритет)
+    # Текстовый обработчик реагирует только на кнопки разделов, иначе он
+    # перехватывал бы ввод в диалогах добавления (та же группа 0)
+    # /start join_<код> (приглашение в тенант) - раньше обычного /start
+    tenants.register(application)
+    application.add_handler(CommandHandler("start", start), group=0)
+    profiler.register(application, pipeline)
+    scheduler.register(application)
+    application.add_handler(MessageHandler(filters.Text(SECTIONS), main_menu_handler), group=0)
+    application.add_handler(
+        CallbackQueryHandler(main_menu_callback, pattern=callbacks.pattern("main_menu", "section")), group=0
+    )
+    logger.info("Обработчики главного меню зарегистрированы")
+    
+    # Импортируем и регистрируем обработчики разделов
+    from handlers import movies, activities, trips, tiktok, photos, games, sexual, inline, data
+    
+    # /stats, /export, /import - раньше диалогов разделов
+    data.register_handlers(application)
+    movies.register_handlers(application)
+    activities.register_handlers(application)
+    trips.register_handlers(application)
+    tiktok.register_handlers(application)
+    photos.register_handlers(application)
+    games.register_handlers(application)
+    sexual.register_handlers(application)
+    inline.register_handlers(application)
+    # Последним в группе 0: кнопки, которые не разбирает ни один обработчик
+    application.add_handler(CallbackQueryHandler(stale_callback, pattern=callbacks.is_stale), group=0)
+    render.register(application)
+    logger.info("Обработчики разделов зарегистрированы")
+    
+    # Трассировка оборачивает уже зарегистрированные обработчики
+    if tracing.enabled():
+        tracing.install(pipeline, application)
+    
+    return application
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Флаги запуска: число рабочих процессов и webhook вместо polling."""
+    parser = argparse.ArgumentParser(description="ForUs бот")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv('BOT_WORKERS', '1')),
+        help="рабочих процессов (больше 1 - фронт и рабочие, см. workers.py)"
+    )
+    parser.add_argument("--webhook-url", help="внешний адрес для webhook (по умолчанию - polling)")
+    parser.add_argument("--port", type=int, default=8443, help="порт webhook")
+    return parser.parse_args(argv)
+
+
 def main() -> None:
     """Главная функция - запуск бота."""
+    args = parse_args()
+    
     # Загружаем конфигурацию
     try:
         config.load_config()
@@ -162,50 +298,31 @@ def main() -> None:
     
     logger.info("BOT_TOKEN загружен успешно")
     
-    try:
-        application = Application.builder().token(bot_token).build()
-        logger.info("Приложение бота создано")
-    except Exception as e:
-        logger.error(f"Ошибка создания приложения: {e}")
-        import traceback
-        traceback.print_exc()
+    # Несколько процессов: этот принимает апдейты, рабочие - обрабатывают
+    if args.workers > 1:
+        import workers
+        workers.run_front(bot_token, args.workers, args.webhook_url, args.port)
         return
     
-    # Регистрируем обработчики главного меню (высокий приоритет)
     try:
-        application.add_handler(CommandHandler("start", start), group=0)
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu_handler), group=0)
-        application.add_handler(CallbackQueryHandler(main_menu_callback, pattern="^(main_menu|section_.+)$"), group=0)
-        logger.info("Обработчики главного меню зарегистрированы")
+        application = build_application(bot_token, base_url=BOT_API_URL)
     except Exception as e:
-        logger.error(f"Ошибка регистрации обработчиков главного меню: {e}")
-        import traceback
-        traceback.print_exc()
-        return
-    
-    # Импортируем и регистрируем обработчики разделов
-    try:
-        from handlers import movies, activities, trips, tiktok, photos, games, sexual
-        logger.info("Обработчики разделов импортированы")
-        
-        movies.register_handlers(application)
-        activities.register_handlers(application)
-        trips.register_handlers(application)
-        tiktok.register_handlers(application)
-        photos.register_handlers(application)
-        games.register_handlers(application)
-        sexual.register_handlers(application)
-        logger.info("Обработчики разделов зарегистрированы")
-    except Exception as e:
-        logger.error(f"Ошибка регистрации обработчиков разделов: {e}")
+        logger.error(f"Ошибка создания приложения: {e}")
         import traceback
         traceback.print_exc()
         return
     
     # Запускаем бота
     try:
-        logger.info("Бот запущен, начинаем polling...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if args.webhook_url:
+            logger.info("Бот запущен, принимаем webhook...")
+            application.run_webhook(
+                listen="0.0.0.0", port=args.port, url_path=bot_token,
+                webhook_url=f"{args.webhook_url}/{bot_token}", allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            logger.info("Бот запущен, начинаем polling...")
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         import traceback
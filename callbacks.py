@@ -0,0 +1,251 @@
+"""
+Кодек callback_data кнопок.
+
+Telegram принимает в callback_data не больше 64 байт, а кириллица занимает
+по два байта на символ. Поэтому кнопки несут не читаемые строки вида
+"games_pending_genre_<жанр>", а короткий код:
+- маршрут (movie, rate_movie, games_pending_genre...) - его номер в ROUTES
+  в base62, 1-2 символа
+- целые аргументы (id, номер пользователя, оценка) - тоже base62, через ":"
+- прочие аргументы (жанр) хранятся на сервере в таблице PAYLOADS (LRU),
+  в кнопку попадает "~" и ключ - хеш значения. Ключ не зависит от запуска:
+  после перезапуска бота таблица заполняется снова при построении клавиатур
+
+Пример: encode("rate_movie", 125, 1, 8) -> "l:21:1:8".
+
+Запомненная клавиатура (keyboards.keyboard_factory) хранит значения своих
+кнопок (payloads) и при каждой выдаче возвращает их в PAYLOADS (keep):
+свежепоказанное меню не ссылается на вытесненные чужим трафиком значения.
+
+Разбор (decode) запоминается, поэтому проверка маршрута в каждом
+CallbackQueryHandler - один поиск в словаре, без split("_") и регулярных
+выражений. Кнопки, которые не удается разобрать (сообщения до обновления
+бота, вытесненные из таблицы значения), считаются устаревшими (is_stale).
+
+ROUTES только дополняются в конец: номер маршрута - часть уже отправленных кнопок.
+
+API:
+- ROUTES - известные маршруты
+- Callback(route, args) - разобранная кнопка
+- encode(route, *args) - callback_data кнопки
+- decode(data) - Callback или None
+- pattern(*routes) - проверка для CallbackQueryHandler(pattern=...)
+- is_stale(data) - кнопка не разбирается
+- route_of(data) - имя маршрута (для логов и метрик)
+- payloads(markup) - значения из PAYLOADS, на которые ссылаются кнопки
+- keep(entries) - вернуть значения в PAYLOADS (отметить как свежие)
+"""
+
+import functools
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from telegram.constants import InlineKeyboardButtonLimit
+
+logger = logging.getLogger(__name__)
+
+MAX_DATA_LENGTH = InlineKeyboardButtonLimit.MAX_CALLBACK_DATA
+# Сколько значений-аргументов хранить на сервере
+PAYLOAD_TABLE_SIZE = 4096
+# Сколько разобранных callback_data помнить
+DECODE_CACHE_SIZE = 4096
+
+_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_DIGITS = {char: value for value, char in enumerate(_ALPHABET)}
+_SEPARATOR = ":"
+_PAYLOAD_MARK = "~"
+
+ROUTES: Tuple[str, ...] = (
+    # Главное меню
+    "main_menu", "section", "cancel",
+    # Фильмы
+    "movies_menu", "movies_pending", "movies_pending_all", "movies_pending_cat",
+    "movie", "movie_page", "movie_watched", "movie_edit", "movie_delete",
+    "movies_watched", "movies_watched_all", "movies_top", "movies_top_all", "movies_top_user",
+    "movies_random", "movies_add", "movie_cat", "movie_cat_new", "rate_movie", "rate_movie_cancel",
+    # Активности
+    "activities_menu", "activities_planned", "activities_done", "activities_add",
+    "activity", "activity_page", "activity_done", "activity_edit", "activity_delete",
+    # Поездки
+    "trips_menu", "trips_cat", "trips_add", "trip", "trip_page", "trip_visited", "trip_edit",
+    "trip_delete", "trip_cat", "trip_cat_new",
+    # TikTok
+    "tiktok_menu", "tiktok_todo", "tiktok_done", "tiktok_add",
+    "tiktok", "tiktok_page", "tiktok_done_item", "tiktok_delete",
+    # Фотографии
+    "photos_menu", "photos_list", "photos_add",
+    "photo_cat", "photo_cat_page", "photo_cat_edit", "photo_cat_delete",
+    # Игры
+    "games_menu", "games_pending", "games_pending_all", "games_pending_genre",
+    "game", "game_page", "game_done", "game_edit", "game_delete",
+    "games_done", "games_done_all", "games_top", "games_top_all", "games_top_user",
+    "games_random", "games_add", "rate_game", "rate_game_cancel",
+    # Sexual
+    "sexual_menu", "sexual_list", "sexual_add",
+    "sexual", "sexual_page", "sexual_edit", "sexual_delete",
+    # Добавленные позже
+    "tiktok_watch_all",
+    "photo_album", "photo_album_prev", "photo_upload",
+    "activity_remind",
+    "job_cancel",
+)
+
+
+def _to_base62(number: int) -> str:
+    if number < 0:
+        raise ValueError(f"Отрицательные числа не кодируются: {number}")
+    if number == 0:
+        return _ALPHABET[0]
+    digits = []
+    while number:
+        number, rest = divmod(number, 62)
+        digits.append(_ALPHABET[rest])
+    return "".join(reversed(digits))
+
+
+def _from_base62(text: str) -> int:
+    number = 0
+    for char in text:
+        number = number * 62 + _DIGITS[char]
+    return number
+
+
+# Маршрут -> код и обратно
+_TOKENS: Dict[str, str] = {route: _to_base62(index) for index, route in enumerate(ROUTES)}
+_ROUTES_BY_TOKEN: Dict[str, str] = {token: route for route, token in _TOKENS.items()}
+
+# Ключ -> значение аргумента (LRU)
+PAYLOADS: "OrderedDict[str, Any]" = OrderedDict()
+
+
+class Callback(NamedTuple):
+    """Разобранная кнопка: маршрут и аргументы."""
+    route: str
+    args: Tuple[Any, ...]
+
+
+def _payload_key(value: Any) -> str:
+    digest = hashlib.blake2b(f"{type(value).__name__}:{value}".encode(), digest_size=6).digest()
+    return _to_base62(int.from_bytes(digest, "big"))
+
+
+def _store(key: str, value: Any) -> None:
+    if key in PAYLOADS:
+        PAYLOADS.move_to_end(key)
+    else:
+        PAYLOADS[key] = value
+        if len(PAYLOADS) > PAYLOAD_TABLE_SIZE:
+            PAYLOADS.popitem(last=False)
+
+
+def _store_payload(value: Any) -> str:
+    key = _payload_key(value)
+    _store(key, value)
+    return key
+
+
+def _encode_arg(value: Any) -> str:
+    # bool - тоже int, но True/False лучше хранить как есть
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return _to_base62(value)
+    return _PAYLOAD_MARK + _store_payload(value)
+
+
+def encode(route: str, *args: Any) -> str:
+    """
+    callback_data кнопки маршрута route.
+
+    Args:
+        route: Имя маршрута из ROUTES
+        *args: Аргументы (неотрицательные int кодируются в кнопке,
+               остальные - хешируемые значения - хранятся в PAYLOADS)
+
+    Raises:
+        KeyError: Неизвестный маршрут
+        ValueError: Результат длиннее 64 байт
+    """
+    data = _SEPARATOR.join((_TOKENS[route], *map(_encode_arg, args)))
+    if len(data) > MAX_DATA_LENGTH:
+        raise ValueError(f"callback_data длиннее {MAX_DATA_LENGTH} байт: {route} {args!r}")
+    return data
+
+
+def _decode_arg(text: str) -> Any:
+    if text.startswith(_PAYLOAD_MARK):
+        return PAYLOADS[text[1:]]
+    return _from_base62(text)
+
+
+@functools.lru_cache(maxsize=DECODE_CACHE_SIZE)
+def _decode(data: str) -> Callback:
+    """Разбор callback_data; KeyError - не разбирается (такой результат не запоминается)."""
+    token, *args = data.split(_SEPARATOR)
+    return Callback(_ROUTES_BY_TOKEN[token], tuple(map(_decode_arg, args)))
+
+
+def decode(data: Optional[str]) -> Optional[Callback]:
+    """Разбирает callback_data; None - кнопка устарела или не от этого бота."""
+    if not data:
+        return None
+    try:
+        return _decode(data)
+    except KeyError:
+        return None
+
+
+def is_stale(data: Any) -> bool:
+    """Кнопка не разбирается (для обработчика устаревших кнопок)."""
+    return isinstance(data, str) and decode(data) is None
+
+
+def route_of(data: Optional[str]) -> Optional[str]:
+    """Имя маршрута кнопки или None."""
+    callback = decode(data)
+    return callback.route if callback else None
+
+
+def payloads(markup: Any) -> Tuple[Tuple[str, Any], ...]:
+    """
+    Значения из PAYLOADS, на которые ссылаются кнопки клавиатуры: (ключ, значение).
+
+    Вызывается сразу после построения клавиатуры, пока значения в таблице.
+    """
+    entries = []
+    for row in getattr(markup, "inline_keyboard", ()):
+        for button in row:
+            if not isinstance(button.callback_data, str):
+                continue
+            for arg in button.callback_data.split(_SEPARATOR)[1:]:
+                key = arg[1:]
+                if arg.startswith(_PAYLOAD_MARK) and key in PAYLOADS:
+                    entries.append((key, PAYLOADS[key]))
+    return tuple(entries)
+
+
+def keep(entries: Iterable[Tuple[str, Any]]) -> None:
+    """Возвращает значения payloads() в PAYLOADS (вытесненные - заново) как свежие."""
+    for key, value in entries:
+        _store(key, value)
+
+
+def pattern(*routes: str) -> Callable[[Any], bool]:
+    """
+    Проверка для CallbackQueryHandler(pattern=...): кнопка ведет на один из маршрутов.
+
+    Raises:
+        KeyError: Неизвестный маршрут (опечатка видна при регистрации обработчиков)
+    """
+    for route in routes:
+        if route not in _TOKENS:
+            raise KeyError(f"Неизвестный маршрут кнопки: {route}")
+    accepted = frozenset(routes)
+
+    def check(data: Any) -> bool:
+        if not isinstance(data, str):
+            return False
+        callback = decode(data)
+        return callback is not None and callback.route in accepted
+
+    return check
@@ -3,40 +3,164 @@
 
 Загружает:
 - Токен бота из переменной окружения BOT_TOKEN (.env файл)
-- Список авторизованных пользователей из config.json
+- Список авторизованных пользователей из config.json (путь - CONFIG_PATH)
+
+Пользователи хранятся в неизменяемом снимке (Snapshot): кроме самих
+пользователей в нем заранее посчитан индекс user_id -> номер пользователя
+(1, 2, ... - порядок в config.json; номер - это кнопки оценок и топов) ->
+имя. Обработчики спрашивают config.slot_name(1), а не перебирают список
+пользователей на каждом экране.
+
+config.json перечитывается без перезапуска: фоновая задача (start_watching)
+раз в CONFIG_POLL_SECONDS сверяет время изменения и размер файла и, если
+файл изменился и прошел проверку, подменяет снимок целиком одним
+присваиванием. Некорректный файл не применяется - бот продолжает работать
+с прежним снимком, ошибка пишется в лог.
 
 API:
 - load_config() - загружает и валидирует конфигурацию
+- snapshot() - текущий снимок (Snapshot)
+- make_snapshot(users, admins) - снимок из словаря пользователей
+- swap(snapshot) - подменить снимок (возвращает прежний)
+- reload_if_changed() - перечитать config.json, если он изменился
+- start_watching() / stop_watching() - фоновая проверка config.json
 - is_authorized_user(user_id) - проверяет, авторизован ли пользователь
+- is_admin(user_id) - может ли пользователь выполнять служебные команды
+- get_user_name(user_id) - имя пользователя
+- user_slot(user_id) - номер пользователя (1, 2, ...)
+- slot_name(slot) - имя пользователя с номером slot
+- slot_user(slot) - Telegram ID пользователя с номером slot
 """
 
-import os
+import asyncio
 import json
+import logging
+import os
 from pathlib import Path
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterable, Mapping, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
+CONFIG_PATH = Path(os.getenv('CONFIG_PATH', 'config.json'))
+# Как часто проверять, не изменился ли config.json (секунды)
+CONFIG_POLL_SECONDS = float(os.getenv('CONFIG_POLL_SECONDS', '5'))
 
 # Глобальные переменные для хранения конфигурации
 BOT_TOKEN: Optional[str] = None
-AUTHORIZED_USERS: Dict[int, str] = {}  # {user_id: name}
+
+# Версия файла: (время изменения в нс, размер)
+FileVersion = Tuple[int, int]
+
+
+class Snapshot(NamedTuple):
+    """Неизменяемый снимок config.json."""
+    users: Mapping[int, str]        # {user_id: name} в порядке config.json
+    admins: FrozenSet[int]          # пользователи с "admin": true (пусто - админы все)
+    slots: Mapping[int, int]        # {user_id: номер пользователя с 1}
+    names: Tuple[str, ...]          # имена по номеру пользователя (names[0] - пользователь 1)
+    ids: Tuple[int, ...]            # user_id по номеру пользователя (ids[0] - пользователь 1)
+    version: Optional[FileVersion]  # версия config.json, из которой собран снимок
+
+
+def make_snapshot(
+    users: Mapping[int, str],
+    admins: Iterable[int] = (),
+    version: Optional[FileVersion] = None
+) -> Snapshot:
+    """Снимок из словаря пользователей {user_id: name} (порядок задает номера)."""
+    users = dict(users)
+    return Snapshot(
+        users=MappingProxyType(users),
+        admins=frozenset(admins),
+        slots=MappingProxyType({user_id: slot for slot, user_id in enumerate(users, 1)}),
+        names=tuple(users.values()),
+        ids=tuple(users),
+        version=version,
+    )
+
+
+# Текущий снимок. Подменяется целиком (swap), поэтому читатель всегда
+# видит согласованные пользователей, админов и индекс номеров
+_snapshot: Snapshot = make_snapshot({})
+_watch_task: Optional[asyncio.Task] = None
+# Версия файла, которую уже пытались применить и не смогли (чтобы не писать ошибку каждый опрос)
+_rejected_version: Optional[FileVersion] = None
+
+
+def _parse_config(config_data: Any, version: Optional[FileVersion] = None) -> Snapshot:
+    """
+    Проверяет содержимое config.json и собирает снимок.
+
+    Raises:
+        ValueError: Некорректная структура или меньше 2 пользователей
+    """
+    if not isinstance(config_data, dict) or 'users' not in config_data:
+        raise ValueError("config.json должен содержать ключ 'users'")
+
+    users = config_data['users']
+    if not isinstance(users, list):
+        raise ValueError("'users' в config.json должен быть списком")
+
+    if len(users) < 2:
+        raise ValueError("В config.json должно быть минимум 2 пользователя")
+
+    authorized: Dict[int, str] = {}
+    admins = set()
+    for user in users:
+        if not isinstance(user, dict) or 'id' not in user or 'name' not in user:
+            raise ValueError("Каждый пользователь должен иметь 'id' и 'name'")
+
+        user_id = int(user['id'])
+        if user_id in authorized:
+            raise ValueError(f"Пользователь {user_id} указан в config.json дважды")
+        authorized[user_id] = str(user['name'])
+        if user.get('admin'):
+            admins.add(user_id)
+
+    return make_snapshot(authorized, admins, version)
+
+
+def _file_version(path: Path) -> FileVersion:
+    stat = path.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _read_config(path: Path) -> Snapshot:
+    version = _file_version(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        config_data = json.load(f)
+    return _parse_config(config_data, version)
+
+
+def snapshot() -> Snapshot:
+    """Текущий снимок конфигурации."""
+    return _snapshot
+
+
+def swap(new: Snapshot) -> Snapshot:
+    """Подменяет снимок целиком; возвращает прежний."""
+    global _snapshot
+    old, _snapshot = _snapshot, new
+    return old
 
 
 def load_config() -> None:
     """
     Загружает конфигурацию из .env и config.json.
-    
+
     Процесс:
     1. Загружает BOT_TOKEN из переменной окружения BOT_TOKEN
     2. Загружает пользователей из config.json
     3. Валидирует, что минимум 2 пользователя
-    
+
     Вызывает исключение, если:
     - BOT_TOKEN не найден
     - config.json не найден или некорректен
     - Меньше 2 пользователей
     """
-    global BOT_TOKEN, AUTHORIZED_USERS
-    
+    global BOT_TOKEN
+
     # 1. Загрузка токена из переменной окружения
     # python-telegram-bot использует переменные окружения для токена
     BOT_TOKEN = os.getenv('BOT_TOKEN')
@@ -45,72 +169,139 @@ def load_config() -> None:
             "BOT_TOKEN не найден в переменных окружения. "
             "Создайте файл .env с переменной BOT_TOKEN=your_token_here"
         )
-    
+
     # 2. Загрузка пользователей из config.json
-    config_path = Path('config.json')
-    if not config_path.exists():
+    if not CONFIG_PATH.exists():
         raise FileNotFoundError(
             f"Файл config.json не найден. "
             f"Создайте файл config.json с форматом:\n"
             f'{{"users": [{{"id": 123456789, "name": "User1"}}, {{"id": 987654321, "name": "User2"}}]}}'
         )
-    
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config_data = json.load(f)
-    
-    # 3. Валидация структуры config.json
-    if 'users' not in config_data:
-        raise ValueError("config.json должен содержать ключ 'users'")
-    
-    users = config_data['users']
-    if not isinstance(users, list):
-        raise ValueError("'users' в config.json должен быть списком")
-    
-    if len(users) < 2:
-        raise ValueError("В config.json должно быть минимум 2 пользователя")
-    
-    # 4. Заполнение словаря авторизованных пользователей
-    AUTHORIZED_USERS = {}
-    for user in users:
-        if 'id' not in user or 'name' not in user:
-            raise ValueError("Каждый пользователь должен иметь 'id' и 'name'")
-        
-        user_id = int(user['id'])
-        user_name = str(user['name'])
-        AUTHORIZED_USERS[user_id] = user_name
-    
-    print(f"✅ Конфигурация загружена: {len(AUTHORIZED_USERS)} пользователей")
+
+    # 3. Валидация и замена снимка
+    swap(_read_config(CONFIG_PATH))
+
+    print(f"✅ Конфигурация загружена: {len(_snapshot.users)} пользователей")
+
+
+def reload_if_changed() -> bool:
+    """
+    Перечитывает config.json, если изменились время изменения или размер.
+
+    Returns:
+        True, если применен новый снимок
+    """
+    global _rejected_version
+    try:
+        version = _file_version(CONFIG_PATH)
+    except OSError as e:
+        logger.debug(f"config.json недоступен: {e}")
+        return False
+    if version in (_snapshot.version, _rejected_version):
+        return False
+
+    try:
+        new = _read_config(CONFIG_PATH)
+    except (OSError, ValueError, TypeError) as e:
+        # json.JSONDecodeError - тоже ValueError
+        _rejected_version = version
+        logger.error(f"❌ config.json не применен, работаем с прежней конфигурацией: {e}")
+        return False
+
+    _rejected_version = None
+    old = swap(new)
+    logger.info(f"config.json перечитан: пользователей {len(old.users)} -> {len(new.users)}")
+    return True
+
+
+async def _watch() -> None:
+    while True:
+        await asyncio.sleep(CONFIG_POLL_SECONDS)
+        reload_if_changed()
+
+
+def start_watching() -> None:
+    """Запускает фоновую проверку config.json (в event loop бота)."""
+    global _watch_task
+    if _watch_task is None:
+        _watch_task = asyncio.create_task(_watch())
+
+
+def stop_watching() -> None:
+    """Останавливает фоновую проверку config.json."""
+    global _watch_task
+    if _watch_task is not None:
+        _watch_task.cancel()
+        _watch_task = None
 
 
 def is_authorized_user(user_id: int) -> bool:
     """
     Проверяет, авторизован ли пользователь.
-    
+
     Args:
         user_id: Telegram ID пользователя
-        
+
     Returns:
         True если пользователь авторизован, False иначе
-        
+
     API:
         - user_id берется из update.effective_user.id в обработчиках
-        - Используется для проверки доступа во всех обработчиках
+        - Используется конвейером middleware (AuthMiddleware) для проверки доступа
     """
-    return user_id in AUTHORIZED_USERS
+    return user_id in _snapshot.users
+
+
+def is_admin(user_id: int) -> bool:
+    """
+    Проверяет, может ли пользователь выполнять служебные команды (/profile).
+
+    Если ни у кого в config.json нет "admin": true, админами считаются
+    все авторизованные пользователи.
+    """
+    current = _snapshot
+    if user_id not in current.users:
+        return False
+    return not current.admins or user_id in current.admins
 
 
 def get_user_name(user_id: int) -> Optional[str]:
     """
     Получает имя пользователя по его ID.
-    
+
     Args:
         user_id: Telegram ID пользователя
-        
+
     Returns:
         Имя пользователя или None если не найден
-        
+
     Используется:
-        - В топах для отображения имен пользователей
+        - В уведомлениях для имени автора изменений
     """
-    return AUTHORIZED_USERS.get(user_id)
+    return _snapshot.users.get(user_id)
+
+
+def user_slot(user_id: int) -> Optional[int]:
+    """Номер пользователя (1, 2, ... - порядок в config.json) или None."""
+    return _snapshot.slots.get(user_id)
+
+
+def slot_name(slot: int) -> str:
+    """
+    Имя пользователя с номером slot.
+
+    Используется:
+        - В оценках и топах - без перебора списка пользователей
+    """
+    names = _snapshot.names
+    if 1 <= slot <= len(names):
+        return names[slot - 1]
+    return f"Пользователь {slot}"
+
 
+def slot_user(slot: int) -> Optional[int]:
+    """Telegram ID пользователя с номером slot или None (номер из кнопки устарел)."""
+    ids = _snapshot.ids
+    if 1 <= slot <= len(ids):
+        return ids[slot - 1]
+    return None
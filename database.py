@@ -2,12 +2,38 @@
 Модуль для работы с базой данных SQLite.
 
 База данных: data/multilists.db
+
+Данные разделов принадлежат тенанту - паре или группе пользователей. Все
+запросы к разделам ограничены текущим тенантом (current_tenant): его
+выставляет middleware на время апдейта, фоновые задачи - tenant_scope().
+
+Режим шардов (DB_SHARDED=1): данные разделов каждого тенанта, кроме
+DEFAULT_TENANT, хранятся в своем файле data/tenants/<id>.db, поэтому запись
+разных тенантов не ждет одну блокировку SQLite. Открытые шарды держит LRU
+на DB_SHARD_CONNECTIONS соединений; схема шарда создается и обновляется
+при его первом открытии (PRAGMA user_version < SCHEMA_VERSION). Кеш медиа
+(media_cache) хранится в шарде рядом с фото и видео тенанта. Общие данные -
+тенанты, расписания, состояние бота - остаются в основной базе
+(get_main_connection). Шарды обслуживает tools/shards.py.
+
+Одновременные изменения: у фильмов, игр, активностей и поездок есть версия
+строки (version). Кнопки карточки несут версию, которую видел пользователь;
+update_*, mark_*, set_*_rating и delete_* с version изменяют запись только
+если ее с тех пор не изменил партнер, и иначе возвращают False.
 """
 
 import sqlite3
 import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
 from pathlib import Path
-from typing import Optional, List
+from typing import Any, Callable, Dict, Iterator, Optional, List, Tuple
+
+import config
 
 # Настройка логирования
 # logging.getLogger(__name__) - получает логгер с именем текущего модуля
@@ -17,12 +43,290 @@ logger = logging.getLogger(__name__)
 # Путь к базе данных
 # Path('data/multilists.db') - создает объект Path для работы с путями
 # Это современный способ работы с путями в Python (вместо os.path)
-DB_PATH = Path('data/multilists.db')
+# Переменная окружения DB_PATH - другой файл (ее наследуют процессы workers.py)
+DB_PATH = Path(os.getenv('DB_PATH', 'data/multilists.db'))
+
+# Режим шардов: файл на тенанта в каталоге SHARDS_DIR рядом с основной базой
+SHARDED = os.getenv('DB_SHARDED', '0') == '1'
+SHARDS_DIR = 'tenants'
+# Сколько соединений с шардами держать открытыми (LRU)
+SHARD_CONNECTIONS = int(os.getenv('DB_SHARD_CONNECTIONS', '32'))
+# Версия схемы (PRAGMA user_version): шард с меньшей версией при открытии
+# проходит _create_schema. Увеличивать при каждом изменении схемы
+SCHEMA_VERSION = 2
+
+# Наблюдатели SQL-запросов (метрики, трассировка).
+# Каждый вызывается как hook(function_name, seconds) после cursor.execute(),
+# где function_name - имя функции этого модуля, выполнившей запрос.
+# Пока список пуст, запросы не замеряются.
+STATEMENT_HOOKS: List[Callable[[str, float], None]] = []
+
+# Наблюдатели изменений записей (поисковый индекс и т.п.).
+# Каждый вызывается как hook(table, item_id, action) после commit,
+# где action - "create", "update", "done" (частный случай "update":
+# запись отмечена просмотренной/посещенной/выполненной) или "delete";
+# после init_database() приходит hook("database", 0, "init"), после
+# массовой загрузки (import_items) - hook(table, 0, "import").
+CHANGE_HOOKS: List[Callable[[str, int, str], None]] = []
+
+# Тенант пользователей из config.json; ему же принадлежат данные прежних версий
+DEFAULT_TENANT = 1
+# Тенант апдейта, у автора которого тенанта нет (переход по приглашению):
+# данных у него нет, запросы к разделам возвращают пустые списки
+NO_TENANT = 0
+
+_tenant: ContextVar[int] = ContextVar("tenant", default=DEFAULT_TENANT)
+
+# Категории по умолчанию - у каждого тенанта свои
+DEFAULT_MOVIE_CATEGORIES = ["Фильм", "Сериал", "Мультик"]
+DEFAULT_TRIP_CATEGORIES = ["Пешком", "Поездки", "Места в Херцег-Нови"]
+DEFAULT_PHOTO_CATEGORIES = ["for all", "not for all"]
+
+# Таблицы с данными тенантов (колонка tenant_id)
+TENANT_TABLES = (
+    "movie_categories", "movies", "activities", "trip_categories", "trips", "tiktok_trends",
+    "photo_categories", "photos", "games", "sexual", "schedules",
+)
+# Индексы таблиц тенантов: списки разделов, фильтры и топы
+TENANT_INDEXES = {
+    "idx_movies_tenant": "movies(tenant_id, watched, category_id)",
+    "idx_movies_top": "movies(tenant_id, watched, rating_avg)",
+    "idx_activities_tenant": "activities(tenant_id, status)",
+    "idx_trips_tenant": "trips(tenant_id, category_id, visited)",
+    "idx_tiktok_trends_tenant": "tiktok_trends(tenant_id, status)",
+    "idx_tiktok_trends_video": "tiktok_trends(tenant_id, video_unique_id)",
+    "idx_photos_category": "photos(tenant_id, category_id, id)",
+    "idx_games_tenant": "games(tenant_id, status, genre)",
+    "idx_games_top": "games(tenant_id, status, rating_avg)",
+    "idx_sexual_tenant": "sexual(tenant_id, id)",
+    "idx_schedules_tenant": "schedules(tenant_id, kind, due_at)",
+}
+
+# Таблицы, записи которых оценивают (item_type в таблице ratings)
+RATED_TABLES = ("movies", "games")
+# Таблицы с версией строки (колонка version): ее увеличивает каждое изменение
+# записи - update_*, mark_*, set_*_rating (кеш карточек details.py). Эти же
+# функции и delete_* принимают version - изменение только неизменившейся записи
+# (_version_check)
+VERSIONED_TABLES = ("movies", "games", "activities", "trips")
+# Колонки оценок прежней версии (номер - порядок пользователя в config.json)
+LEGACY_RATING_COLUMNS = ("user1_rating", "user2_rating")
+
+
+class _TimedCursor(sqlite3.Cursor):
+    """Курсор, который сообщает наблюдателям длительность каждого запроса."""
+
+    def execute(self, sql, parameters=()):
+        if not STATEMENT_HOOKS:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _notify_statement(sys._getframe(1).f_code.co_name, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not STATEMENT_HOOKS:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _notify_statement(sys._getframe(1).f_code.co_name, time.perf_counter() - started)
+
+
+class _Connection(sqlite3.Connection):
+    """Соединение, курсоры которого по умолчанию - _TimedCursor."""
+
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+
+class _ShardConnection(_Connection):
+    """
+    Соединение с шардом из LRU открытых шардов.
+
+    close() в функциях модуля не закрывает его, а только откатывает
+    незавершенную транзакцию - соединение остается в LRU для следующего запроса.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def release(self) -> None:
+        """Закрывает соединение на самом деле (вытеснено из LRU)."""
+        super().close()
+
+
+# Путь шарда -> открытое соединение (LRU, не больше SHARD_CONNECTIONS)
+_shards: "OrderedDict[Path, _ShardConnection]" = OrderedDict()
+
+
+def _notify_statement(function_name: str, seconds: float) -> None:
+    """Передает замер запроса наблюдателям, не давая им сломать сам запрос."""
+    for hook in STATEMENT_HOOKS:
+        try:
+            hook(function_name, seconds)
+        except Exception as e:
+            logger.debug(f"Ошибка наблюдателя SQL-запросов: {e}")
+
+
+def _notify_change(table: str, item_id: int, action: str) -> None:
+    """Сообщает наблюдателям об изменении записи (после commit)."""
+    for hook in CHANGE_HOOKS:
+        try:
+            hook(table, item_id, action)
+        except Exception as e:
+            logger.warning(f"Ошибка наблюдателя изменений {table}: {e}")
+
+
+def _version_check(version: Optional[int]) -> Tuple[str, tuple]:
+    """
+    Условие compare-and-swap для записей VERSIONED_TABLES.
+
+    Изменение с version применяется, только если запись с тех пор не
+    менялась (UPDATE/DELETE ... WHERE id = ? AND version = ?): иначе строк
+    не затронуто, и функция возвращает False - обработчик показывает
+    свежее состояние записи вместо того, чтобы затереть чужое изменение.
+    version=None - изменение без проверки.
+    """
+    if version is None:
+        return "", ()
+    return " AND version = ?", (version,)
+
+
+def current_tenant() -> int:
+    """Тенант, к данным которого относятся запросы (DEFAULT_TENANT вне апдейтов)."""
+    return _tenant.get()
+
+
+def set_tenant(tenant_id: int) -> Token:
+    """Выставляет тенант текущего контекста (апдейта); возвращает токен для сброса."""
+    return _tenant.set(tenant_id)
+
+
+@contextmanager
+def tenant_scope(tenant_id: int) -> Iterator[None]:
+    """Выполняет блок от имени тенанта (фоновые задачи, тесты)."""
+    token = _tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
+    """Добавляет колонку в таблицу, созданную прежней версией бота (если колонки еще нет)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"В таблицу {table} добавлена колонка {column}")
+
+
+def _detach_legacy_table(cursor: sqlite3.Cursor, table: str) -> Optional[str]:
+    """
+    Убирает с дороги таблицу категорий прежней версии (без tenant_id, UNIQUE по title).
+
+    Таблица переименовывается в {table}_legacy, ссылки на нее из других таблиц
+    не переписываются (legacy_alter_table), и новая таблица с тем же именем
+    их подхватывает. Записи переносит _copy_legacy_table.
+
+    Returns:
+        Имя переименованной таблицы или None, если переносить нечего
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = {row[1] for row in cursor.fetchall()}
+    if not columns or "tenant_id" in columns:
+        return None
+    legacy = f"{table}_legacy"
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    cursor.execute("PRAGMA legacy_alter_table = OFF")
+    return legacy
+
+
+def _copy_legacy_table(cursor: sqlite3.Cursor, table: str, legacy: Optional[str]) -> None:
+    """Переносит записи из таблицы прежней версии (с прежними id) и удаляет ее."""
+    if legacy is None:
+        return
+    cursor.execute(f"PRAGMA table_info({legacy})")
+    columns = ", ".join(row[1] for row in cursor.fetchall())
+    cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}")
+    cursor.execute(f"DROP TABLE {legacy}")
+    logger.info(f"Таблица {table} пересоздана с tenant_id")
+
+
+def _insert_default_categories(cursor: sqlite3.Cursor, tenant_id: int) -> None:
+    """Категории по умолчанию для тенанта (уже существующие пропускаются)."""
+    for table, titles in (
+        ("movie_categories", DEFAULT_MOVIE_CATEGORIES),
+        ("trip_categories", DEFAULT_TRIP_CATEGORIES),
+        ("photo_categories", DEFAULT_PHOTO_CATEGORIES),
+    ):
+        cursor.executemany(
+            f"INSERT OR IGNORE INTO {table} (tenant_id, title) VALUES (?, ?)",
+            [(tenant_id, title) for title in titles]
+        )
+
+
+def _update_rating_totals(cursor: sqlite3.Cursor, table: str, where: str = "", params: tuple = ()) -> None:
+    """Пересчитывает rating_sum/rating_count/rating_avg записей table по таблице ratings."""
+    cursor.execute(f"""
+        UPDATE {table} SET (rating_sum, rating_count, rating_avg) = (
+            SELECT COALESCE(SUM(score), 0), COUNT(*), AVG(score)
+            FROM ratings WHERE item_type = ? AND item_id = {table}.id
+        ) {where}
+    """, (table, *params))
+
+
+def _migrate_ratings(cursor: sqlite3.Cursor, table: str) -> None:
+    """
+    Переносит оценки из колонок user1_rating/user2_rating прежней версии в ratings.
+
+    Номер пользователя в колонке - его порядок в config.json, поэтому перенос
+    ждет загруженной конфигурации: без нее колонки остаются до следующего запуска.
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    columns = [c for c in LEGACY_RATING_COLUMNS if c in existing]
+    if not columns:
+        return
+    user_ids = config.snapshot().ids
+    if len(user_ids) < len(columns):
+        logger.warning(f"Оценки {table} не перенесены: конфигурация пользователей не загружена")
+        return
+
+    for slot, column in enumerate(columns):
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO ratings (item_type, item_id, user_id, score)
+            SELECT ?, id, ?, {column} FROM {table} WHERE {column} IS NOT NULL
+        """, (table, user_ids[slot]))
+    _update_rating_totals(cursor, table)
+    # DROP COLUMN - с SQLite 3.35; в старых версиях колонки просто не используются
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        for column in columns:
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+    logger.info(f"Оценки {table} перенесены в таблицу ratings")
 
 
 def get_connection() -> sqlite3.Connection:
     """
-    Функция 1: Создает и возвращает соединение с базой данных.
+    Соединение с базой данных текущего тенанта (для запросов к разделам).
+
+    Обычно это основная база (get_main_connection). В режиме шардов
+    (SHARDED) тенант, кроме DEFAULT_TENANT и NO_TENANT, получает соединение
+    со своим шардом из LRU; его close() возвращает соединение в LRU.
+    """
+    tenant_id = current_tenant()
+    if SHARDED and tenant_id not in (DEFAULT_TENANT, NO_TENANT):
+        return _shard_connection(tenant_id)
+    return get_main_connection()
+
+
+def get_main_connection() -> sqlite3.Connection:
+    """
+    Функция 1: Создает и возвращает соединение с основной базой данных.
     
     Пошаговое объяснение:
     
@@ -54,7 +358,8 @@ def get_connection() -> sqlite3.Connection:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     
     # Шаг 2: Подключаемся к базе данных
-    conn = sqlite3.connect(DB_PATH)
+    # factory=_Connection - курсоры этого соединения замеряют запросы (см. STATEMENT_HOOKS)
+    conn = sqlite3.connect(DB_PATH, factory=_Connection)
     
     # Шаг 3: Настраиваем формат результатов запросов
     conn.row_factory = sqlite3.Row
@@ -62,15 +367,70 @@ def get_connection() -> sqlite3.Connection:
     return conn
 
 
+def shard_path(tenant_id: int) -> Path:
+    """Файл шарда тенанта: data/tenants/<id>.db (рядом с основной базой)."""
+    return DB_PATH.parent / SHARDS_DIR / f"{tenant_id}.db"
+
+
+def _open_shard(path: Path, tenant_id: int) -> _ShardConnection:
+    """Открывает шард; новый или устаревший шард сразу получает текущую схему."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, factory=_ShardConnection)
+    conn.row_factory = sqlite3.Row
+    try:
+        # WAL: чтение и резервное копирование (tools/shards.py) не блокируют запись
+        conn.execute("PRAGMA journal_mode = WAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            _create_schema(conn, tenant_id)
+            logger.info(f"Шард тенанта {tenant_id} приведен к схеме {SCHEMA_VERSION}: {path}")
+    except sqlite3.Error:
+        conn.release()
+        raise
+    return conn
+
+
+def _shard_connection(tenant_id: int) -> _ShardConnection:
+    """Соединение с шардом тенанта из LRU (открывает шард и вытесняет самый давний)."""
+    path = shard_path(tenant_id)
+    conn = _shards.get(path)
+    if conn is not None:
+        _shards.move_to_end(path)
+        return conn
+    conn = _open_shard(path, tenant_id)
+    _shards[path] = conn
+    while len(_shards) > SHARD_CONNECTIONS:
+        _, idle = _shards.popitem(last=False)
+        idle.release()
+    return conn
+
+
+def close_shards() -> None:
+    """Закрывает все открытые соединения с шардами (остановка бота, смена базы)."""
+    while _shards:
+        _, conn = _shards.popitem()
+        conn.release()
+
+
 def init_database() -> None:
     """
-    Функция 2: Инициализирует базу данных - создает все необходимые таблицы.
+    Инициализирует основную базу: создает таблицы и переносит данные прежних версий.
+
+    Шарды тенантов (SHARDED) инициализируются сами при первом открытии.
+    """
+    _create_schema(get_main_connection())
+    # Наблюдатели сбрасывают все, что помнили о данных: база могла смениться
+    _notify_change("database", 0, "init")
+
+
+def _create_schema(conn: sqlite3.Connection, tenant_id: int = DEFAULT_TENANT) -> None:
+    """
+    Функция 2: Создает все необходимые таблицы (основной базы или шарда).
     
     Общая структура функции:
     
-    Шаг 1: conn = get_connection()
-        - Вызываем нашу функцию get_connection() для получения соединения
-        - Теперь у нас есть активное соединение с БД
+    Шаг 1: conn - соединение с основной базой (init_database) или шардом
+        (_open_shard); tenant_id - тенант, для которого создаются категории
+        по умолчанию. Схема у основной базы и шардов одна
     
     Шаг 2: cursor = conn.cursor()
         - cursor() - создает курсор для выполнения SQL-запросов
@@ -87,12 +447,9 @@ def init_database() -> None:
         - Без commit() изменения не сохранятся (транзакция не завершится)
     
     Шаг 5: conn.close()
-        - close() - закрывает соединение с БД
+        - close() - закрывает соединение с БД (соединение шарда возвращается в LRU)
         - Важно всегда закрывать соединения, чтобы освободить ресурсы
     """
-    # Шаг 1: Получаем соединение с БД
-    conn = get_connection()
-    
     # Шаг 2: Создаем курсор для выполнения SQL-запросов
     cursor = conn.cursor()
     
@@ -113,38 +470,35 @@ def init_database() -> None:
         #   * AUTOINCREMENT - автоматически увеличивается при каждой новой записи
         #   Пример: первая запись id=1, вторая id=2, и т.д.
         #
-        # - title TEXT NOT NULL UNIQUE
+        # - tenant_id INTEGER - тенант (пара или группа), которому принадлежит запись;
+        #   есть во всех таблицах разделов и стоит первым во всех их индексах
+        #
+        # - title TEXT NOT NULL
         #   * TEXT - текстовое поле
         #   * NOT NULL - обязательно для заполнения (не может быть пустым)
-        #   * UNIQUE - значение должно быть уникальным (не может быть двух одинаковых)
         #   Пример: "Фильм", "Сериал", "Мультик"
         #
         # - created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         #   * TIMESTAMP - дата и время
         #   * DEFAULT CURRENT_TIMESTAMP - автоматически ставит текущую дату/время при создании записи
+        #
+        # - UNIQUE (tenant_id, title) - название уникально в пределах тенанта
+        #   (у разных пар могут быть одинаковые категории)
         
+        legacy = _detach_legacy_table(cursor, "movie_categories")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS movie_categories (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                tenant_id INTEGER NOT NULL DEFAULT 1,
+                title TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (tenant_id, title)
             )
         """)
+        _copy_legacy_table(cursor, "movie_categories", legacy)
         
-        # Вставляем дефолтные категории (если их еще нет):
-        # - default_movie_categories - список названий категорий
-        # - for category in ... - перебираем каждую категорию
-        # - INSERT OR IGNORE - вставляем запись, но игнорируем ошибку если она уже есть
-        #   (благодаря UNIQUE в title)
-        # - VALUES (?) - параметризованный запрос (защита от SQL-инъекций)
-        # - (category,) - передаем значение (запятая нужна для tuple из одного элемента)
-        
-        default_movie_categories = ["Фильм", "Сериал", "Мультик"]
-        for category in default_movie_categories:
-            cursor.execute(
-                "INSERT OR IGNORE INTO movie_categories (title) VALUES (?)",
-                (category,)
-            )
+        # Дефолтные категории (всех трех разделов) вставляются ниже,
+        # после создания таблиц - _insert_default_categories()
         
         # ============================================
         # ТАБЛИЦА 2: movies (фильмы)
@@ -155,9 +509,10 @@ def init_database() -> None:
         # - title TEXT NOT NULL - название фильма (обязательно)
         # - note TEXT - примечание (опционально, может быть NULL)
         # - category_id INTEGER NOT NULL - ID категории из таблицы movie_categories
-        # - user1_rating INTEGER - оценка первого пользователя (1-10, может быть NULL)
-        # - user2_rating INTEGER - оценка второго пользователя (1-10, может быть NULL)
         # - watched INTEGER DEFAULT 0 - флаг просмотра (0=не просмотрен, 1=просмотрен)
+        # - rating_sum, rating_count, rating_avg - сумма, число и среднее оценок
+        #   из таблицы ratings; поддерживаются при каждой оценке, поэтому топ
+        #   не пересчитывает средние по всем фильмам
         # - created_at - дата создания
         
         # FOREIGN KEY (category_id) REFERENCES movie_categories(id)
@@ -176,10 +531,13 @@ def init_database() -> None:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 title TEXT NOT NULL,
                 note TEXT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
                 category_id INTEGER NOT NULL,
-                user1_rating INTEGER,
-                user2_rating INTEGER,
                 watched INTEGER DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                rating_avg REAL,
+                version INTEGER NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (category_id) REFERENCES movie_categories(id)
             )
@@ -195,9 +553,11 @@ def init_database() -> None:
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS activities (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
                 title TEXT NOT NULL,
                 note TEXT,
                 status TEXT NOT NULL DEFAULT 'planned',
+                version INTEGER NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
@@ -207,21 +567,17 @@ def init_database() -> None:
         # ============================================
         # Аналогично movie_categories - список категорий для поездок
         
+        legacy = _detach_legacy_table(cursor, "trip_categories")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS trip_categories (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                tenant_id INTEGER NOT NULL DEFAULT 1,
+                title TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (tenant_id, title)
             )
         """)
-        
-        # Дефолтные категории поездок
-        default_trip_categories = ["Пешком", "Поездки", "Места в Херцег-Нови"]
-        for category in default_trip_categories:
-            cursor.execute(
-                "INSERT OR IGNORE INTO trip_categories (title) VALUES (?)",
-                (category,)
-            )
+        _copy_legacy_table(cursor, "trip_categories", legacy)
         
         # ============================================
         # ТАБЛИЦА 5: trips (поездки)
@@ -232,10 +588,12 @@ def init_database() -> None:
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS trips (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
                 title TEXT NOT NULL,
                 note TEXT,
                 category_id INTEGER NOT NULL,
                 visited INTEGER DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (category_id) REFERENCES trip_categories(id)
             )
@@ -246,17 +604,22 @@ def init_database() -> None:
         # ============================================
         # - video_file_id TEXT - ID видео файла в Telegram (для отправки видео)
         #   * Telegram хранит файлы по file_id, можно переиспользовать
+        # - video_unique_id TEXT - file_unique_id видео (ключ в media_cache):
+        #   одинаков для одного файла у всех ботов, по нему ищутся повторы
         # - status - 'todo' (надо снять) или 'done' (снято)
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS tiktok_trends (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
                 title TEXT NOT NULL,
                 video_file_id TEXT,
+                video_unique_id TEXT,
                 status TEXT NOT NULL DEFAULT 'todo',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        _add_column(cursor, "tiktok_trends", "video_unique_id", "TEXT")
         
         # ============================================
         # ТАБЛИЦА 7: photo_categories (категории фотографий)
@@ -264,44 +627,38 @@ def init_database() -> None:
         # - link TEXT - ссылка на альбом/папку с фотографиями
         # - description TEXT - описание категории
         
+        legacy = _detach_legacy_table(cursor, "photo_categories")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS photo_categories (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL UNIQUE,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
+                title TEXT NOT NULL,
                 link TEXT,
-                description TEXT
+                description TEXT,
+                UNIQUE (tenant_id, title)
             )
         """)
-        
-        # Дефолтные категории фотографий
-        # - Используем tuple для передачи нескольких значений
-        # - None означает, что поле будет пустым (NULL в БД)
-        default_photo_categories = [
-            ("for all", None, None),
-            ("not for all", None, None)
-        ]
-        for title, link, desc in default_photo_categories:
-            cursor.execute(
-                "INSERT OR IGNORE INTO photo_categories (title, link, description) VALUES (?, ?, ?)",
-                (title, link, desc)
-            )
+        _copy_legacy_table(cursor, "photo_categories", legacy)
         
         # ============================================
         # ТАБЛИЦА 8: games (игры)
         # ============================================
         # - genre TEXT - жанр игры (опционально, может быть NULL)
         # - status - 'pending' (ожидающие) или 'done' (пройденные)
-        # - user1_rating, user2_rating - оценки двух пользователей (как в movies)
+        # - rating_sum, rating_count, rating_avg - агрегаты оценок (как в movies)
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS games (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
                 title TEXT NOT NULL,
                 note TEXT,
                 genre TEXT,
                 status TEXT NOT NULL DEFAULT 'pending',
-                user1_rating INTEGER,
-                user2_rating INTEGER,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                rating_avg REAL,
+                version INTEGER NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
@@ -314,12 +671,201 @@ def init_database() -> None:
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS sexual (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
                 title TEXT NOT NULL,
                 link TEXT,
                 description TEXT
             )
         """)
         
+        # ============================================
+        # ТАБЛИЦЫ 10-13: состояние бота (persistence.py)
+        # ============================================
+        # Данные context.user_data / chat_data / bot_data и состояния
+        # ConversationHandler, чтобы перезапуск не прерывал диалоги.
+        # - data - pickle (BLOB; строки JSON прежних версий тоже читаются)
+        # - state - JSON
+        # - key в ptb_conversations - JSON-список (chat_id, user_id)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ptb_user_data (
+                user_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ptb_chat_data (
+                chat_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ptb_bot_data (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                data TEXT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ptb_conversations (
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                PRIMARY KEY (name, key)
+            )
+        """)
+
+        # ============================================
+        # ТАБЛИЦА 14: media_cache (загруженные в Telegram файлы)
+        # ============================================
+        # - file_unique_id - постоянный ID файла (не годится для отправки)
+        # - file_id - ID для повторной отправки без загрузки
+        # - duration (секунды), file_size (байты) - из Telegram, для списков
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS media_cache (
+                file_unique_id TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                duration INTEGER,
+                file_size INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # ============================================
+        # ТАБЛИЦА 15: photos (фотографии в категориях)
+        # ============================================
+        # - category_id - категория из photo_categories
+        # - file_id / file_unique_id - фото хранится в Telegram, у нас только ID
+        # - UNIQUE (category_id, file_unique_id) - одно фото в категории один раз
+        # - индекс (tenant_id, category_id, id) - страницы альбома выбираются
+        #   по нему без OFFSET (см. get_photos)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS photos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
+                category_id INTEGER NOT NULL,
+                file_id TEXT NOT NULL,
+                file_unique_id TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (category_id, file_unique_id),
+                FOREIGN KEY (category_id) REFERENCES photo_categories(id)
+            )
+        """)
+
+        # ============================================
+        # ТАБЛИЦА 16: schedules (напоминания и дайджесты, scheduler.py)
+        # ============================================
+        # - kind - 'digest' (дайджест) или 'reminder' (напоминание о записи)
+        # - chat_id - куда отправлять (NULL - всем пользователям)
+        # - item_table / item_id - запись, о которой напоминание
+        # - due_at - unix-время следующего срабатывания
+        # - repeat_seconds - период повтора (NULL - сработать один раз)
+        # - индекс по due_at - выборка наступивших расписаний (планировщик
+        #   один на все тенанты, поэтому этот индекс начинается не с tenant_id)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schedules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id INTEGER NOT NULL DEFAULT 1,
+                kind TEXT NOT NULL,
+                chat_id INTEGER,
+                item_table TEXT,
+                item_id INTEGER,
+                due_at INTEGER NOT NULL,
+                repeat_seconds INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_due ON schedules(due_at)")
+
+        # ============================================
+        # ТАБЛИЦА 17: ratings (оценки пользователей)
+        # ============================================
+        # - item_type - таблица записи ('movies' или 'games', см. RATED_TABLES)
+        # - item_id - ID записи, user_id - Telegram ID оценившего
+        # - одна оценка пользователя на запись (PRIMARY KEY), повторная - заменяет
+        # - индекс (item_type, user_id, score) - личный топ без сортировки
+        # Прежние колонки user1_rating/user2_rating переносятся сюда (_migrate_ratings)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ratings (
+                item_type TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                score INTEGER NOT NULL,
+                rated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (item_type, item_id, user_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(item_type, user_id, score)")
+        for table in RATED_TABLES:
+            _add_column(cursor, table, "rating_sum", "INTEGER NOT NULL DEFAULT 0")
+            _add_column(cursor, table, "rating_count", "INTEGER NOT NULL DEFAULT 0")
+            _add_column(cursor, table, "rating_avg", "REAL")
+            _migrate_ratings(cursor, table)
+
+        # Версия строки (VERSIONED_TABLES) - в таблицах прежних версий начинается с 0
+        for table in VERSIONED_TABLES:
+            _add_column(cursor, table, "version", "INTEGER NOT NULL DEFAULT 0")
+
+        # ============================================
+        # ТАБЛИЦЫ 18-20: тенанты (пары и группы, tenants.py)
+        # ============================================
+        # - tenants - тенант 1 (DEFAULT_TENANT) - пользователи из config.json
+        # - tenant_members - остальные участники; пользователь состоит в одном
+        #   тенанте (PRIMARY KEY user_id - поиск тенанта автора апдейта)
+        # - invites - коды приглашений из ссылок t.me/<бот>?start=join_<код>;
+        #   tenant_id NULL - приглашение создать новый тенант
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tenants (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute(
+            "INSERT OR IGNORE INTO tenants (id, title) VALUES (?, ?)", (DEFAULT_TENANT, "Основной")
+        )
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tenant_members (
+                user_id INTEGER PRIMARY KEY,
+                tenant_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (tenant_id) REFERENCES tenants(id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tenant_members ON tenant_members(tenant_id, joined_at)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS invites (
+                code TEXT PRIMARY KEY,
+                tenant_id INTEGER,
+                created_by INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        _insert_default_categories(cursor, tenant_id)
+
+        # ============================================
+        # ИНДЕКСЫ: tenant_id - первая колонка каждого индекса разделов
+        # ============================================
+        # Запрос тенанта читает только его часть индекса, поэтому время
+        # запроса не растет с числом тенантов. Таблицы прежних версий
+        # получают tenant_id = DEFAULT_TENANT, их индексы пересоздаются.
+
+        for table in TENANT_TABLES:
+            _add_column(cursor, table, "tenant_id", f"INTEGER NOT NULL DEFAULT {DEFAULT_TENANT}")
+        for name, definition in TENANT_INDEXES.items():
+            cursor.execute(f"PRAGMA index_info({name})")
+            columns = [row[2] for row in cursor.fetchall()]
+            if columns and columns[0] != "tenant_id":
+                # Индекс прежней версии с тем же именем
+                cursor.execute(f"DROP INDEX {name}")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
         # ============================================
         # СОХРАНЕНИЕ ИЗМЕНЕНИЙ
         # ============================================
@@ -327,6 +873,9 @@ def init_database() -> None:
         # Без commit() все изменения будут потеряны при закрытии соединения
         # Это называется "транзакция" - либо все изменения сохраняются, либо ничего
         
+        # Версия схемы - по ней шард при открытии понимает, нужна ли миграция
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
         conn.commit()
         logger.info("✅ База данных инициализирована успешно")
         
@@ -354,6 +903,88 @@ def init_database() -> None:
         conn.close()
 
 
+# ============================================
+# ОЦЕНКИ (фильмы и игры)
+# ============================================
+
+def _set_rating(table: str, item_id: int, user_id: int, score: int, version: Optional[int] = None) -> bool:
+    """Сохраняет оценку и в той же транзакции пересчитывает агрегаты записи (False - версия не совпала)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    # Новая версия записи - первой: она же проверяет, что запись своего
+    # тенанта и не изменилась, и до commit не дает записать оценку другим
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"UPDATE {table} SET version = version + 1 WHERE id = ? AND tenant_id = ?{check}",
+        (item_id, current_tenant(), *check_params)
+    )
+    if not cursor.rowcount:
+        conn.rollback()
+        conn.close()
+        return False
+    cursor.execute("""
+        INSERT INTO ratings (item_type, item_id, user_id, score) VALUES (?, ?, ?, ?)
+        ON CONFLICT (item_type, item_id, user_id)
+        DO UPDATE SET score = excluded.score, rated_at = CURRENT_TIMESTAMP
+    """, (table, item_id, user_id, score))
+    # Агрегат одной записи - сумма по ее оценкам (по первичному ключу ratings)
+    _update_rating_totals(cursor, table, "WHERE id = ?", (item_id,))
+    conn.commit()
+    conn.close()
+    _notify_change(table, item_id, "update")
+    return True
+
+
+def _delete_ratings(cursor: sqlite3.Cursor, table: str, item_id: int) -> None:
+    cursor.execute("DELETE FROM ratings WHERE item_type = ? AND item_id = ?", (table, item_id))
+
+
+def get_ratings(item_type: str, item_id: int) -> List[sqlite3.Row]:
+    """Оценки записи текущего тенанта: user_id, score - в порядке выставления."""
+    if item_type not in RATED_TABLES:
+        raise KeyError(f"Оценки для таблицы {item_type} не поддерживаются")
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT r.user_id, r.score FROM ratings r
+        JOIN {item_type} i ON i.id = r.item_id AND i.tenant_id = ?
+        WHERE r.item_type = ? AND r.item_id = ?
+        ORDER BY r.rated_at, r.user_id
+    """, (current_tenant(), item_type, item_id))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def get_all_ratings(item_type: str) -> List[sqlite3.Row]:
+    """Все оценки записей item_type текущего тенанта: item_id, user_id, score (статистика, экспорт)."""
+    if item_type not in RATED_TABLES:
+        raise KeyError(f"Оценки для таблицы {item_type} не поддерживаются")
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT r.item_id, r.user_id, r.score FROM ratings r
+        JOIN {item_type} i ON i.id = r.item_id AND i.tenant_id = ?
+        WHERE r.item_type = ?
+        ORDER BY r.item_id, r.rated_at, r.user_id
+    """, (current_tenant(), item_type))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def rebuild_ratings() -> None:
+    """Пересчитывает агрегаты оценок записей текущего тенанта (после массовой загрузки в ratings)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    for table in RATED_TABLES:
+        # Только свои записи: время не растет с числом тенантов
+        _update_rating_totals(cursor, table, "WHERE tenant_id = ?", (current_tenant(),))
+    conn.commit()
+    conn.close()
+    _notify_change("ratings", 0, "update")
+
+
 # ============================================
 # CRUD ОПЕРАЦИИ ДЛЯ РАЗДЕЛА "ФИЛЬМЫ"
 # ============================================
@@ -362,7 +993,7 @@ def get_movie_categories() -> List[sqlite3.Row]:
     """Получить все категории фильмов."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM movie_categories ORDER BY title")
+    cursor.execute("SELECT * FROM movie_categories WHERE tenant_id = ? ORDER BY title", (current_tenant(),))
     result = cursor.fetchall()
     conn.close()
     return result
@@ -372,10 +1003,11 @@ def create_movie_category(title: str) -> int:
     """Создать новую категорию фильмов. Возвращает ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO movie_categories (title) VALUES (?)", (title,))
+    cursor.execute("INSERT INTO movie_categories (tenant_id, title) VALUES (?, ?)", (current_tenant(), title))
     conn.commit()
     category_id = cursor.lastrowid
     conn.close()
+    _notify_change("movie_categories", category_id, "create")
     return category_id
 
 
@@ -385,8 +1017,8 @@ def get_movies(watched: Optional[int] = None, category_id: Optional[int] = None)
     cursor = conn.cursor()
     
     query = "SELECT m.*, mc.title as category_title FROM movies m JOIN movie_categories mc ON m.category_id = mc.id"
-    conditions = []
-    params = []
+    conditions = ["m.tenant_id = ?"]
+    params = [current_tenant()]
     
     if watched is not None:
         conditions.append("m.watched = ?")
@@ -396,9 +1028,7 @@ def get_movies(watched: Optional[int] = None, category_id: Optional[int] = None)
         conditions.append("m.category_id = ?")
         params.append(category_id)
     
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-    
+    query += " WHERE " + " AND ".join(conditions)
     query += " ORDER BY m.created_at DESC"
     cursor.execute(query, params)
     result = cursor.fetchall()
@@ -414,8 +1044,8 @@ def get_movie_by_id(movie_id: int) -> Optional[sqlite3.Row]:
         SELECT m.*, mc.title as category_title 
         FROM movies m 
         JOIN movie_categories mc ON m.category_id = mc.id 
-        WHERE m.id = ?
-    """, (movie_id,))
+        WHERE m.id = ? AND m.tenant_id = ?
+    """, (movie_id, current_tenant()))
     result = cursor.fetchone()
     conn.close()
     return result
@@ -426,17 +1056,23 @@ def create_movie(title: str, note: Optional[str], category_id: int) -> int:
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO movies (title, note, category_id) VALUES (?, ?, ?)",
-        (title, note, category_id)
+        "INSERT INTO movies (tenant_id, title, note, category_id) VALUES (?, ?, ?, ?)",
+        (current_tenant(), title, note, category_id)
     )
     conn.commit()
     movie_id = cursor.lastrowid
     conn.close()
+    _notify_change("movies", movie_id, "create")
     return movie_id
 
 
-def update_movie(movie_id: int, title: Optional[str] = None, note: Optional[str] = None) -> None:
-    """Обновить фильм."""
+def update_movie(
+    movie_id: int,
+    title: Optional[str] = None,
+    note: Optional[str] = None,
+    version: Optional[int] = None
+) -> bool:
+    """Обновить фильм (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
     updates = []
@@ -450,40 +1086,66 @@ def update_movie(movie_id: int, title: Optional[str] = None, note: Optional[str]
         updates.append("note = ?")
         params.append(note)
     
-    if updates:
-        params.append(movie_id)
-        cursor.execute(f"UPDATE movies SET {', '.join(updates)} WHERE id = ?", params)
-        conn.commit()
+    if not updates:
+        conn.close()
+        return True
     
+    check, check_params = _version_check(version)
+    params += [movie_id, current_tenant(), *check_params]
+    cursor.execute(
+        f"UPDATE movies SET {', '.join(updates)}, version = version + 1 WHERE id = ? AND tenant_id = ?{check}", params
+    )
+    applied = cursor.rowcount > 0
+    conn.commit()
     conn.close()
+    if applied:
+        _notify_change("movies", movie_id, "update")
+    return applied
 
 
-def mark_movie_watched(movie_id: int) -> None:
-    """Отметить фильм как просмотренный."""
+def mark_movie_watched(movie_id: int, version: Optional[int] = None) -> bool:
+    """Отметить фильм как просмотренный (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("UPDATE movies SET watched = 1 WHERE id = ?", (movie_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"UPDATE movies SET watched = 1, version = version + 1 WHERE id = ? AND tenant_id = ?{check}",
+        (movie_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("movies", movie_id, "done")
+    return applied
 
 
-def set_movie_rating(movie_id: int, user_num: int, rating: int) -> None:
-    """Установить оценку фильма. user_num: 1 или 2."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    column = f"user{user_num}_rating"
-    cursor.execute(f"UPDATE movies SET {column} = ? WHERE id = ?", (rating, movie_id))
-    conn.commit()
-    conn.close()
+def set_movie_rating(movie_id: int, user_id: int, rating: int, version: Optional[int] = None) -> bool:
+    """
+    Установить оценку фильма от пользователя user_id (повторная оценка заменяет прежнюю).
+
+    Returns:
+        False - версия не совпала или записи нет
+    """
+    return _set_rating("movies", movie_id, user_id, rating, version)
 
 
-def delete_movie(movie_id: int) -> None:
-    """Удалить фильм."""
+def delete_movie(movie_id: int, version: Optional[int] = None) -> bool:
+    """Удалить фильм (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM movies WHERE id = ?", (movie_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"DELETE FROM movies WHERE id = ? AND tenant_id = ?{check}", (movie_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
+    if applied:
+        _delete_ratings(cursor, "movies", movie_id)
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("movies", movie_id, "delete")
+    return applied
 
 
 def get_random_movie(exclude_series: bool = True) -> Optional[sqlite3.Row]:
@@ -496,50 +1158,57 @@ def get_random_movie(exclude_series: bool = True) -> Optional[sqlite3.Row]:
             SELECT m.*, mc.title as category_title 
             FROM movies m 
             JOIN movie_categories mc ON m.category_id = mc.id 
-            WHERE m.watched = 0 AND mc.title != 'Сериал'
+            WHERE m.tenant_id = ? AND m.watched = 0 AND mc.title != 'Сериал'
             ORDER BY RANDOM()
             LIMIT 1
-        """)
+        """, (current_tenant(),))
     else:
         cursor.execute("""
             SELECT m.*, mc.title as category_title 
             FROM movies m 
             JOIN movie_categories mc ON m.category_id = mc.id 
-            WHERE m.watched = 0
+            WHERE m.tenant_id = ? AND m.watched = 0
             ORDER BY RANDOM()
             LIMIT 1
-        """)
+        """, (current_tenant(),))
     
     result = cursor.fetchone()
     conn.close()
     return result
 
 
-def get_movies_top(limit: int = 10, user_num: Optional[int] = None) -> List[sqlite3.Row]:
-    """Получить топ фильмов. user_num: 1, 2 или None (общий топ по среднему)."""
+def get_movies_top(limit: int = 10, user_id: Optional[int] = None, min_votes: int = 1) -> List[sqlite3.Row]:
+    """
+    Получить топ просмотренных фильмов.
+
+    Args:
+        user_id: Личный топ пользователя (поле rating); None - общий топ
+                 по средней оценке (поле avg_rating)
+        min_votes: Для общего топа - сколько оценок нужно фильму
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    if user_num:
-        column = f"user{user_num}_rating"
-        cursor.execute(f"""
-            SELECT m.*, mc.title as category_title, m.{column} as rating
-            FROM movies m 
+    if user_id is not None:
+        cursor.execute("""
+            SELECT m.*, mc.title as category_title, r.score as rating
+            FROM ratings r
+            JOIN movies m ON m.id = r.item_id
             JOIN movie_categories mc ON m.category_id = mc.id 
-            WHERE m.watched = 1 AND m.{column} IS NOT NULL
-            ORDER BY m.{column} DESC
+            WHERE r.item_type = 'movies' AND r.user_id = ? AND m.tenant_id = ? AND m.watched = 1
+            ORDER BY r.score DESC
             LIMIT ?
-        """, (limit,))
+        """, (user_id, current_tenant(), limit))
     else:
+        # Средние уже посчитаны (rating_avg): индекс idx_movies_top отдает их по порядку
         cursor.execute("""
-            SELECT m.*, mc.title as category_title,
-                   (COALESCE(m.user1_rating, 0) + COALESCE(m.user2_rating, 0)) / 2.0 as avg_rating
+            SELECT m.*, mc.title as category_title, m.rating_avg as avg_rating
             FROM movies m 
             JOIN movie_categories mc ON m.category_id = mc.id 
-            WHERE m.watched = 1 AND m.user1_rating IS NOT NULL AND m.user2_rating IS NOT NULL
-            ORDER BY avg_rating DESC
+            WHERE m.tenant_id = ? AND m.watched = 1 AND m.rating_count >= ?
+            ORDER BY m.rating_avg DESC
             LIMIT ?
-        """, (limit,))
+        """, (current_tenant(), max(min_votes, 1), limit))
     
     result = cursor.fetchall()
     conn.close()
@@ -556,9 +1225,12 @@ def get_activities(status: Optional[str] = None) -> List[sqlite3.Row]:
     cursor = conn.cursor()
     
     if status:
-        cursor.execute("SELECT * FROM activities WHERE status = ? ORDER BY created_at DESC", (status,))
+        cursor.execute(
+            "SELECT * FROM activities WHERE tenant_id = ? AND status = ? ORDER BY created_at DESC",
+            (current_tenant(), status)
+        )
     else:
-        cursor.execute("SELECT * FROM activities ORDER BY created_at DESC")
+        cursor.execute("SELECT * FROM activities WHERE tenant_id = ? ORDER BY created_at DESC", (current_tenant(),))
     
     result = cursor.fetchall()
     conn.close()
@@ -569,7 +1241,7 @@ def get_activity_by_id(activity_id: int) -> Optional[sqlite3.Row]:
     """Получить активность по ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM activities WHERE id = ?", (activity_id,))
+    cursor.execute("SELECT * FROM activities WHERE id = ? AND tenant_id = ?", (activity_id, current_tenant()))
     result = cursor.fetchone()
     conn.close()
     return result
@@ -579,15 +1251,23 @@ def create_activity(title: str, note: Optional[str]) -> int:
     """Создать активность. Возвращает ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO activities (title, note) VALUES (?, ?)", (title, note))
+    cursor.execute(
+        "INSERT INTO activities (tenant_id, title, note) VALUES (?, ?, ?)", (current_tenant(), title, note)
+    )
     conn.commit()
     activity_id = cursor.lastrowid
     conn.close()
+    _notify_change("activities", activity_id, "create")
     return activity_id
 
 
-def update_activity(activity_id: int, title: Optional[str] = None, note: Optional[str] = None) -> None:
-    """Обновить активность."""
+def update_activity(
+    activity_id: int,
+    title: Optional[str] = None,
+    note: Optional[str] = None,
+    version: Optional[int] = None
+) -> bool:
+    """Обновить активность (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
     updates = []
@@ -601,30 +1281,54 @@ def update_activity(activity_id: int, title: Optional[str] = None, note: Optiona
         updates.append("note = ?")
         params.append(note)
     
-    if updates:
-        params.append(activity_id)
-        cursor.execute(f"UPDATE activities SET {', '.join(updates)} WHERE id = ?", params)
-        conn.commit()
+    if not updates:
+        conn.close()
+        return True
     
+    check, check_params = _version_check(version)
+    params += [activity_id, current_tenant(), *check_params]
+    cursor.execute(
+        f"UPDATE activities SET {', '.join(updates)}, version = version + 1 WHERE id = ? AND tenant_id = ?{check}", params
+    )
+    applied = cursor.rowcount > 0
+    conn.commit()
     conn.close()
+    if applied:
+        _notify_change("activities", activity_id, "update")
+    return applied
 
 
-def mark_activity_done(activity_id: int) -> None:
-    """Отметить активность как выполненную."""
+def mark_activity_done(activity_id: int, version: Optional[int] = None) -> bool:
+    """Отметить активность как выполненную (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("UPDATE activities SET status = 'done' WHERE id = ?", (activity_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"UPDATE activities SET status = 'done', version = version + 1 WHERE id = ? AND tenant_id = ?{check}",
+        (activity_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("activities", activity_id, "done")
+    return applied
 
 
-def delete_activity(activity_id: int) -> None:
-    """Удалить активность."""
+def delete_activity(activity_id: int, version: Optional[int] = None) -> bool:
+    """Удалить активность (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM activities WHERE id = ?", (activity_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"DELETE FROM activities WHERE id = ? AND tenant_id = ?{check}", (activity_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("activities", activity_id, "delete")
+    return applied
 
 
 # ============================================
@@ -635,7 +1339,7 @@ def get_trip_categories() -> List[sqlite3.Row]:
     """Получить все категории поездок."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM trip_categories ORDER BY title")
+    cursor.execute("SELECT * FROM trip_categories WHERE tenant_id = ? ORDER BY title", (current_tenant(),))
     result = cursor.fetchall()
     conn.close()
     return result
@@ -645,10 +1349,11 @@ def create_trip_category(title: str) -> int:
     """Создать новую категорию поездок. Возвращает ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO trip_categories (title) VALUES (?)", (title,))
+    cursor.execute("INSERT INTO trip_categories (tenant_id, title) VALUES (?, ?)", (current_tenant(), title))
     conn.commit()
     category_id = cursor.lastrowid
     conn.close()
+    _notify_change("trip_categories", category_id, "create")
     return category_id
 
 
@@ -658,8 +1363,8 @@ def get_trips(category_id: Optional[int] = None, visited: Optional[int] = None)
     cursor = conn.cursor()
     
     query = "SELECT t.*, tc.title as category_title FROM trips t JOIN trip_categories tc ON t.category_id = tc.id"
-    conditions = []
-    params = []
+    conditions = ["t.tenant_id = ?"]
+    params = [current_tenant()]
     
     if category_id is not None:
         conditions.append("t.category_id = ?")
@@ -669,9 +1374,7 @@ def get_trips(category_id: Optional[int] = None, visited: Optional[int] = None)
         conditions.append("t.visited = ?")
         params.append(visited)
     
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-    
+    query += " WHERE " + " AND ".join(conditions)
     query += " ORDER BY t.created_at DESC"
     cursor.execute(query, params)
     result = cursor.fetchall()
@@ -687,8 +1390,8 @@ def get_trip_by_id(trip_id: int) -> Optional[sqlite3.Row]:
         SELECT t.*, tc.title as category_title 
         FROM trips t 
         JOIN trip_categories tc ON t.category_id = tc.id 
-        WHERE t.id = ?
-    """, (trip_id,))
+        WHERE t.id = ? AND t.tenant_id = ?
+    """, (trip_id, current_tenant()))
     result = cursor.fetchone()
     conn.close()
     return result
@@ -699,17 +1402,23 @@ def create_trip(title: str, note: Optional[str], category_id: int) -> int:
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO trips (title, note, category_id) VALUES (?, ?, ?)",
-        (title, note, category_id)
+        "INSERT INTO trips (tenant_id, title, note, category_id) VALUES (?, ?, ?, ?)",
+        (current_tenant(), title, note, category_id)
     )
     conn.commit()
     trip_id = cursor.lastrowid
     conn.close()
+    _notify_change("trips", trip_id, "create")
     return trip_id
 
 
-def update_trip(trip_id: int, title: Optional[str] = None, note: Optional[str] = None) -> None:
-    """Обновить поездку."""
+def update_trip(
+    trip_id: int,
+    title: Optional[str] = None,
+    note: Optional[str] = None,
+    version: Optional[int] = None
+) -> bool:
+    """Обновить поездку (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
     updates = []
@@ -723,30 +1432,54 @@ def update_trip(trip_id: int, title: Optional[str] = None, note: Optional[str] =
         updates.append("note = ?")
         params.append(note)
     
-    if updates:
-        params.append(trip_id)
-        cursor.execute(f"UPDATE trips SET {', '.join(updates)} WHERE id = ?", params)
-        conn.commit()
+    if not updates:
+        conn.close()
+        return True
     
+    check, check_params = _version_check(version)
+    params += [trip_id, current_tenant(), *check_params]
+    cursor.execute(
+        f"UPDATE trips SET {', '.join(updates)}, version = version + 1 WHERE id = ? AND tenant_id = ?{check}", params
+    )
+    applied = cursor.rowcount > 0
+    conn.commit()
     conn.close()
+    if applied:
+        _notify_change("trips", trip_id, "update")
+    return applied
 
 
-def mark_trip_visited(trip_id: int) -> None:
-    """Отметить поездку как посещенную."""
+def mark_trip_visited(trip_id: int, version: Optional[int] = None) -> bool:
+    """Отметить поездку как посещенную (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("UPDATE trips SET visited = 1 WHERE id = ?", (trip_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"UPDATE trips SET visited = 1, version = version + 1 WHERE id = ? AND tenant_id = ?{check}",
+        (trip_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("trips", trip_id, "done")
+    return applied
 
 
-def delete_trip(trip_id: int) -> None:
-    """Удалить поездку."""
+def delete_trip(trip_id: int, version: Optional[int] = None) -> bool:
+    """Удалить поездку (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM trips WHERE id = ?", (trip_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"DELETE FROM trips WHERE id = ? AND tenant_id = ?{check}", (trip_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("trips", trip_id, "delete")
+    return applied
 
 
 # ============================================
@@ -759,9 +1492,12 @@ def get_tiktok_trends(status: Optional[str] = None) -> List[sqlite3.Row]:
     cursor = conn.cursor()
     
     if status:
-        cursor.execute("SELECT * FROM tiktok_trends WHERE status = ? ORDER BY created_at DESC", (status,))
+        cursor.execute(
+            "SELECT * FROM tiktok_trends WHERE tenant_id = ? AND status = ? ORDER BY created_at DESC",
+            (current_tenant(), status)
+        )
     else:
-        cursor.execute("SELECT * FROM tiktok_trends ORDER BY created_at DESC")
+        cursor.execute("SELECT * FROM tiktok_trends WHERE tenant_id = ? ORDER BY created_at DESC", (current_tenant(),))
     
     result = cursor.fetchall()
     conn.close()
@@ -772,23 +1508,62 @@ def get_tiktok_trend_by_id(trend_id: int) -> Optional[sqlite3.Row]:
     """Получить тренд TikTok по ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM tiktok_trends WHERE id = ?", (trend_id,))
+    cursor.execute("SELECT * FROM tiktok_trends WHERE id = ? AND tenant_id = ?", (trend_id, current_tenant()))
+    result = cursor.fetchone()
+    conn.close()
+    return result
+
+
+def get_tiktok_trend_by_video(file_unique_id: str) -> Optional[sqlite3.Row]:
+    """Получить тренд, к которому уже прикреплено это видео (по file_unique_id)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM tiktok_trends WHERE tenant_id = ? AND video_unique_id = ? ORDER BY id LIMIT 1",
+        (current_tenant(), file_unique_id)
+    )
     result = cursor.fetchone()
     conn.close()
     return result
 
 
-def create_tiktok_trend(title: str, video_file_id: Optional[str] = None) -> int:
+def get_tiktok_videos(status: str = 'todo') -> List[sqlite3.Row]:
+    """
+    Видео трендов со статусом status для отправки: id, title, file_id, file_unique_id.
+
+    file_id берется из media_cache (последний известный), иначе - из тренда.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT t.id, t.title, COALESCE(m.file_id, t.video_file_id) AS file_id,
+               t.video_unique_id AS file_unique_id
+        FROM tiktok_trends t
+        LEFT JOIN media_cache m ON m.file_unique_id = t.video_unique_id
+        WHERE t.tenant_id = ? AND t.status = ? AND t.video_file_id IS NOT NULL
+        ORDER BY t.created_at DESC
+    """, (current_tenant(), status))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def create_tiktok_trend(
+    title: str,
+    video_file_id: Optional[str] = None,
+    video_unique_id: Optional[str] = None
+) -> int:
     """Создать тренд TikTok. Возвращает ID."""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO tiktok_trends (title, video_file_id) VALUES (?, ?)",
-        (title, video_file_id)
+        "INSERT INTO tiktok_trends (tenant_id, title, video_file_id, video_unique_id) VALUES (?, ?, ?, ?)",
+        (current_tenant(), title, video_file_id, video_unique_id)
     )
     conn.commit()
     trend_id = cursor.lastrowid
     conn.close()
+    _notify_change("tiktok_trends", trend_id, "create")
     return trend_id
 
 
@@ -796,16 +1571,187 @@ def mark_tiktok_trend_done(trend_id: int) -> None:
     """Отметить тренд TikTok как выполненный."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("UPDATE tiktok_trends SET status = 'done' WHERE id = ?", (trend_id,))
+    cursor.execute("UPDATE tiktok_trends SET status = 'done' WHERE id = ? AND tenant_id = ?", (trend_id, current_tenant()))
     conn.commit()
     conn.close()
+    _notify_change("tiktok_trends", trend_id, "done")
 
 
 def delete_tiktok_trend(trend_id: int) -> None:
     """Удалить тренд TikTok."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM tiktok_trends WHERE id = ?", (trend_id,))
+    cursor.execute("DELETE FROM tiktok_trends WHERE id = ? AND tenant_id = ?", (trend_id, current_tenant()))
+    conn.commit()
+    conn.close()
+    _notify_change("tiktok_trends", trend_id, "delete")
+
+
+# ============================================
+# РАСПИСАНИЯ (напоминания и дайджесты)
+# ============================================
+# Расписания всех тенантов - в основной базе (планировщик один на всех),
+# записи разделов для дайджеста - в базе тенанта
+
+# Разделы дайджеста: таблица -> условие "еще не сделано"
+DIGEST_CONDITIONS = {
+    "movies": "watched = 0",
+    "activities": "status = 'planned'",
+    "games": "status = 'pending'",
+    "trips": "visited = 0",
+    "tiktok_trends": "status = 'todo'",
+}
+
+
+def create_schedule(
+    kind: str,
+    due_at: int,
+    chat_id: Optional[int] = None,
+    item_table: Optional[str] = None,
+    item_id: Optional[int] = None,
+    repeat_seconds: Optional[int] = None
+) -> int:
+    """Создать расписание текущего тенанта. Возвращает ID."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO schedules (tenant_id, kind, chat_id, item_table, item_id, due_at, repeat_seconds)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (current_tenant(), kind, chat_id, item_table, item_id, due_at, repeat_seconds))
+    conn.commit()
+    schedule_id = cursor.lastrowid
+    conn.close()
+    _notify_change("schedules", schedule_id, "create")
+    return schedule_id
+
+
+def get_schedules(kind: Optional[str] = None) -> List[sqlite3.Row]:
+    """Получить расписания тенанта по времени срабатывания. kind: 'digest', 'reminder' или None (все)."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    if kind:
+        cursor.execute(
+            "SELECT * FROM schedules WHERE tenant_id = ? AND kind = ? ORDER BY due_at", (current_tenant(), kind)
+        )
+    else:
+        cursor.execute("SELECT * FROM schedules WHERE tenant_id = ? ORDER BY due_at", (current_tenant(),))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def get_due_schedules(now: int) -> List[sqlite3.Row]:
+    """
+    Получить расписания всех тенантов, время которых наступило (due_at <= now).
+
+    Планировщик один на все тенанты: расписание выполняется от имени
+    своего тенанта (tenant_scope(row['tenant_id'])).
+    """
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM schedules WHERE due_at <= ? ORDER BY due_at, id", (now,))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def get_schedule_buckets(bucket_seconds: int) -> List[int]:
+    """
+    Корзины времени срабатывания: due_at, округленные вверх до bucket_seconds.
+
+    Одна корзина - один таймер планировщика, сколько бы расписаний (всех
+    тенантов) в нее ни попало.
+    """
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT (due_at + ? - 1) / ? * ? AS bucket FROM schedules ORDER BY bucket
+    """, (bucket_seconds, bucket_seconds, bucket_seconds))
+    result = [row['bucket'] for row in cursor.fetchall()]
+    conn.close()
+    return result
+
+
+def reschedule(schedule_id: int, due_at: int) -> None:
+    """Перенести расписание на новое время срабатывания."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE schedules SET due_at = ? WHERE id = ?", (due_at, schedule_id))
+    conn.commit()
+    conn.close()
+    _notify_change("schedules", schedule_id, "update")
+
+
+def delete_schedule(schedule_id: int) -> None:
+    """Удалить расписание."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+    conn.commit()
+    conn.close()
+    _notify_change("schedules", schedule_id, "delete")
+
+
+def get_digest_section(table: str, limit: int) -> List[sqlite3.Row]:
+    """
+    Раздел дайджеста одним запросом: limit случайных несделанных записей.
+
+    Оконная функция COUNT(*) OVER () считается до LIMIT, поэтому в каждой
+    строке есть total - сколько всего несделанных записей в разделе.
+
+    Args:
+        table: Таблица из DIGEST_CONDITIONS
+
+    Returns:
+        До limit записей тенанта (id, title, total); пустой список - в разделе все сделано
+    """
+    condition = DIGEST_CONDITIONS[table]
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT id, title, COUNT(*) OVER () AS total
+        FROM {table}
+        WHERE tenant_id = ? AND {condition}
+        ORDER BY RANDOM()
+        LIMIT ?
+    """, (current_tenant(), limit))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+# ============================================
+# КЕШ МЕДИА (file_id загруженных файлов)
+# ============================================
+# Кеш - в базе данных тенанта (в режиме шардов - в его файле): его читают
+# запросы списков фото и видео через JOIN с photos и tiktok_trends тенанта
+
+def get_cached_media(file_unique_id: str) -> Optional[sqlite3.Row]:
+    """Получить запись кеша медиа по file_unique_id."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM media_cache WHERE file_unique_id = ?", (file_unique_id,))
+    result = cursor.fetchone()
+    conn.close()
+    return result
+
+
+def cache_media(
+    file_unique_id: str,
+    file_id: str,
+    duration: Optional[int] = None,
+    file_size: Optional[int] = None
+) -> None:
+    """Запомнить file_id файла (повторная загрузка того же файла обновляет file_id)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO media_cache (file_unique_id, file_id, duration, file_size) VALUES (?, ?, ?, ?)
+        ON CONFLICT(file_unique_id) DO UPDATE SET
+            file_id = excluded.file_id,
+            duration = COALESCE(excluded.duration, duration),
+            file_size = COALESCE(excluded.file_size, file_size)
+    """, (file_unique_id, file_id, duration, file_size))
     conn.commit()
     conn.close()
 
@@ -818,7 +1764,7 @@ def get_photo_categories() -> List[sqlite3.Row]:
     """Получить все категории фотографий."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM photo_categories ORDER BY title")
+    cursor.execute("SELECT * FROM photo_categories WHERE tenant_id = ? ORDER BY title", (current_tenant(),))
     result = cursor.fetchall()
     conn.close()
     return result
@@ -828,7 +1774,7 @@ def get_photo_category_by_id(category_id: int) -> Optional[sqlite3.Row]:
     """Получить категорию фотографий по ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM photo_categories WHERE id = ?", (category_id,))
+    cursor.execute("SELECT * FROM photo_categories WHERE id = ? AND tenant_id = ?", (category_id, current_tenant()))
     result = cursor.fetchone()
     conn.close()
     return result
@@ -839,12 +1785,13 @@ def create_photo_category(title: str, link: Optional[str] = None, description: O
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO photo_categories (title, link, description) VALUES (?, ?, ?)",
-        (title, link, description)
+        "INSERT INTO photo_categories (tenant_id, title, link, description) VALUES (?, ?, ?, ?)",
+        (current_tenant(), title, link, description)
     )
     conn.commit()
     category_id = cursor.lastrowid
     conn.close()
+    _notify_change("photo_categories", category_id, "create")
     return category_id
 
 
@@ -873,20 +1820,99 @@ def update_photo_category(
         params.append(description)
     
     if updates:
-        params.append(category_id)
-        cursor.execute(f"UPDATE photo_categories SET {', '.join(updates)} WHERE id = ?", params)
+        params += [category_id, current_tenant()]
+        cursor.execute(f"UPDATE photo_categories SET {', '.join(updates)} WHERE id = ? AND tenant_id = ?", params)
         conn.commit()
     
     conn.close()
+    _notify_change("photo_categories", category_id, "update")
 
 
 def delete_photo_category(category_id: int) -> None:
-    """Удалить категорию фотографий."""
+    """Удалить категорию фотографий вместе с её фотографиями."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM photo_categories WHERE id = ?", (category_id,))
+    cursor.execute("DELETE FROM photo_categories WHERE id = ? AND tenant_id = ?", (category_id, current_tenant()))
+    if cursor.rowcount:
+        cursor.execute("DELETE FROM photos WHERE category_id = ?", (category_id,))
     conn.commit()
     conn.close()
+    _notify_change("photo_categories", category_id, "delete")
+
+
+def add_photo(category_id: int, file_id: str, file_unique_id: str) -> Optional[int]:
+    """
+    Добавить фотографию в категорию.
+
+    Returns:
+        ID фотографии или None, если это фото уже есть в категории
+        (или категория чужого тенанта)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT OR IGNORE INTO photos (tenant_id, category_id, file_id, file_unique_id)
+        SELECT tenant_id, id, ?, ? FROM photo_categories WHERE id = ? AND tenant_id = ?
+    """, (file_id, file_unique_id, category_id, current_tenant()))
+    conn.commit()
+    photo_id = cursor.lastrowid if cursor.rowcount else None
+    conn.close()
+    if photo_id is not None:
+        _notify_change("photos", photo_id, "create")
+    return photo_id
+
+
+def get_photos(
+    category_id: int,
+    after_id: int = 0,
+    before_id: Optional[int] = None,
+    limit: int = 10
+) -> List[sqlite3.Row]:
+    """
+    Страница фотографий категории в порядке добавления (keyset-пагинация).
+
+    Следующая страница - after_id = id последней фотографии страницы,
+    предыдущая - before_id = id первой. Запрос сразу находит начало
+    страницы по индексу (tenant_id, category_id, id), а не пропускает строки, как
+    OFFSET, поэтому любая страница альбома из тысяч фото выбирается одинаково быстро.
+
+    Returns:
+        До limit фотографий (id, file_id, file_unique_id) по возрастанию id;
+        file_id берется из кеша медиа, если там есть более свежий
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    select = """
+        SELECT p.id, COALESCE(m.file_id, p.file_id) AS file_id, p.file_unique_id
+        FROM photos p
+        LEFT JOIN media_cache m ON m.file_unique_id = p.file_unique_id
+    """
+    if before_id is not None:
+        cursor.execute(
+            select + "WHERE p.tenant_id = ? AND p.category_id = ? AND p.id < ? ORDER BY p.id DESC LIMIT ?",
+            (current_tenant(), category_id, before_id, limit)
+        )
+        result = cursor.fetchall()[::-1]
+    else:
+        cursor.execute(
+            select + "WHERE p.tenant_id = ? AND p.category_id = ? AND p.id > ? ORDER BY p.id LIMIT ?",
+            (current_tenant(), category_id, after_id, limit)
+        )
+        result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def count_photos(category_id: int) -> int:
+    """Количество фотографий в категории."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT COUNT(*) FROM photos WHERE tenant_id = ? AND category_id = ?", (current_tenant(), category_id)
+    )
+    result = cursor.fetchone()[0]
+    conn.close()
+    return result
 
 
 # ============================================
@@ -899,8 +1925,8 @@ def get_games(status: Optional[str] = None, genre: Optional[str] = None) -> List
     cursor = conn.cursor()
     
     query = "SELECT * FROM games"
-    conditions = []
-    params = []
+    conditions = ["tenant_id = ?"]
+    params = [current_tenant()]
     
     if status:
         conditions.append("status = ?")
@@ -910,9 +1936,7 @@ def get_games(status: Optional[str] = None, genre: Optional[str] = None) -> List
         conditions.append("genre = ?")
         params.append(genre)
     
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-    
+    query += " WHERE " + " AND ".join(conditions)
     query += " ORDER BY created_at DESC"
     cursor.execute(query, params)
     result = cursor.fetchall()
@@ -924,7 +1948,7 @@ def get_game_by_id(game_id: int) -> Optional[sqlite3.Row]:
     """Получить игру по ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM games WHERE id = ?", (game_id,))
+    cursor.execute("SELECT * FROM games WHERE id = ? AND tenant_id = ?", (game_id, current_tenant()))
     result = cursor.fetchone()
     conn.close()
     return result
@@ -935,12 +1959,13 @@ def create_game(title: str, note: Optional[str] = None, genre: Optional[str] = N
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO games (title, note, genre) VALUES (?, ?, ?)",
-        (title, note, genre)
+        "INSERT INTO games (tenant_id, title, note, genre) VALUES (?, ?, ?, ?)",
+        (current_tenant(), title, note, genre)
     )
     conn.commit()
     game_id = cursor.lastrowid
     conn.close()
+    _notify_change("games", game_id, "create")
     return game_id
 
 
@@ -948,9 +1973,10 @@ def update_game(
     game_id: int,
     title: Optional[str] = None,
     note: Optional[str] = None,
-    genre: Optional[str] = None
-) -> None:
-    """Обновить игру."""
+    genre: Optional[str] = None,
+    version: Optional[int] = None
+) -> bool:
+    """Обновить игру (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
     updates = []
@@ -968,40 +1994,66 @@ def update_game(
         updates.append("genre = ?")
         params.append(genre)
     
-    if updates:
-        params.append(game_id)
-        cursor.execute(f"UPDATE games SET {', '.join(updates)} WHERE id = ?", params)
-        conn.commit()
+    if not updates:
+        conn.close()
+        return True
     
+    check, check_params = _version_check(version)
+    params += [game_id, current_tenant(), *check_params]
+    cursor.execute(
+        f"UPDATE games SET {', '.join(updates)}, version = version + 1 WHERE id = ? AND tenant_id = ?{check}", params
+    )
+    applied = cursor.rowcount > 0
+    conn.commit()
     conn.close()
+    if applied:
+        _notify_change("games", game_id, "update")
+    return applied
 
 
-def mark_game_done(game_id: int) -> None:
-    """Отметить игру как пройденную."""
+def mark_game_done(game_id: int, version: Optional[int] = None) -> bool:
+    """Отметить игру как пройденную (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("UPDATE games SET status = 'done' WHERE id = ?", (game_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"UPDATE games SET status = 'done', version = version + 1 WHERE id = ? AND tenant_id = ?{check}",
+        (game_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("games", game_id, "done")
+    return applied
 
 
-def set_game_rating(game_id: int, user_num: int, rating: int) -> None:
-    """Установить оценку игры. user_num: 1 или 2."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    column = f"user{user_num}_rating"
-    cursor.execute(f"UPDATE games SET {column} = ? WHERE id = ?", (rating, game_id))
-    conn.commit()
-    conn.close()
+def set_game_rating(game_id: int, user_id: int, rating: int, version: Optional[int] = None) -> bool:
+    """
+    Установить оценку игры от пользователя user_id (повторная оценка заменяет прежнюю).
 
+    Returns:
+        False - версия не совпала или записи нет
+    """
+    return _set_rating("games", game_id, user_id, rating, version)
 
-def delete_game(game_id: int) -> None:
-    """Удалить игру."""
+
+def delete_game(game_id: int, version: Optional[int] = None) -> bool:
+    """Удалить игру (False - версия не совпала или записи нет)."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM games WHERE id = ?", (game_id,))
+    check, check_params = _version_check(version)
+    cursor.execute(
+        f"DELETE FROM games WHERE id = ? AND tenant_id = ?{check}", (game_id, current_tenant(), *check_params)
+    )
+    applied = cursor.rowcount > 0
+    if applied:
+        _delete_ratings(cursor, "games", game_id)
     conn.commit()
     conn.close()
+    if applied:
+        _notify_change("games", game_id, "delete")
+    return applied
 
 
 def get_random_game() -> Optional[sqlite3.Row]:
@@ -1010,10 +2062,10 @@ def get_random_game() -> Optional[sqlite3.Row]:
     cursor = conn.cursor()
     cursor.execute("""
         SELECT * FROM games 
-        WHERE status = 'pending'
+        WHERE tenant_id = ? AND status = 'pending'
         ORDER BY RANDOM()
         LIMIT 1
-    """)
+    """, (current_tenant(),))
     result = cursor.fetchone()
     conn.close()
     return result
@@ -1023,35 +2075,44 @@ def get_game_genres() -> List[str]:
     """Получить список всех жанров игр."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT genre FROM games WHERE genre IS NOT NULL ORDER BY genre")
+    cursor.execute(
+        "SELECT DISTINCT genre FROM games WHERE tenant_id = ? AND genre IS NOT NULL ORDER BY genre",
+        (current_tenant(),)
+    )
     result = [row['genre'] for row in cursor.fetchall()]
     conn.close()
     return result
 
 
-def get_games_top(limit: int = 10, user_num: Optional[int] = None) -> List[sqlite3.Row]:
-    """Получить топ игр. user_num: 1, 2 или None (общий топ по среднему)."""
+def get_games_top(limit: int = 10, user_id: Optional[int] = None, min_votes: int = 1) -> List[sqlite3.Row]:
+    """
+    Получить топ пройденных игр.
+
+    Args:
+        user_id: Личный топ пользователя (поле rating); None - общий топ
+                 по средней оценке (поле avg_rating)
+        min_votes: Для общего топа - сколько оценок нужно игре
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
-    if user_num:
-        column = f"user{user_num}_rating"
-        cursor.execute(f"""
-            SELECT *, {column} as rating
-            FROM games 
-            WHERE status = 'done' AND {column} IS NOT NULL
-            ORDER BY {column} DESC
+    if user_id is not None:
+        cursor.execute("""
+            SELECT g.*, r.score as rating
+            FROM ratings r
+            JOIN games g ON g.id = r.item_id
+            WHERE r.item_type = 'games' AND r.user_id = ? AND g.tenant_id = ? AND g.status = 'done'
+            ORDER BY r.score DESC
             LIMIT ?
-        """, (limit,))
+        """, (user_id, current_tenant(), limit))
     else:
         cursor.execute("""
-            SELECT *,
-                   (COALESCE(user1_rating, 0) + COALESCE(user2_rating, 0)) / 2.0 as avg_rating
+            SELECT *, rating_avg as avg_rating
             FROM games 
-            WHERE status = 'done' AND user1_rating IS NOT NULL AND user2_rating IS NOT NULL
-            ORDER BY avg_rating DESC
+            WHERE tenant_id = ? AND status = 'done' AND rating_count >= ?
+            ORDER BY rating_avg DESC
             LIMIT ?
-        """, (limit,))
+        """, (current_tenant(), max(min_votes, 1), limit))
     
     result = cursor.fetchall()
     conn.close()
@@ -1066,7 +2127,7 @@ def get_sexual_items() -> List[sqlite3.Row]:
     """Получить все записи sexual."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM sexual ORDER BY id DESC")
+    cursor.execute("SELECT * FROM sexual WHERE tenant_id = ? ORDER BY id DESC", (current_tenant(),))
     result = cursor.fetchall()
     conn.close()
     return result
@@ -1076,7 +2137,7 @@ def get_sexual_item_by_id(item_id: int) -> Optional[sqlite3.Row]:
     """Получить запись sexual по ID."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM sexual WHERE id = ?", (item_id,))
+    cursor.execute("SELECT * FROM sexual WHERE id = ? AND tenant_id = ?", (item_id, current_tenant()))
     result = cursor.fetchone()
     conn.close()
     return result
@@ -1087,12 +2148,13 @@ def create_sexual_item(title: str, link: Optional[str] = None, description: Opti
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO sexual (title, link, description) VALUES (?, ?, ?)",
-        (title, link, description)
+        "INSERT INTO sexual (tenant_id, title, link, description) VALUES (?, ?, ?, ?)",
+        (current_tenant(), title, link, description)
     )
     conn.commit()
     item_id = cursor.lastrowid
     conn.close()
+    _notify_change("sexual", item_id, "create")
     return item_id
 
 
@@ -1121,18 +2183,218 @@ def update_sexual_item(
         params.append(description)
     
     if updates:
-        params.append(item_id)
-        cursor.execute(f"UPDATE sexual SET {', '.join(updates)} WHERE id = ?", params)
+        params += [item_id, current_tenant()]
+        cursor.execute(f"UPDATE sexual SET {', '.join(updates)} WHERE id = ? AND tenant_id = ?", params)
         conn.commit()
     
     conn.close()
+    _notify_change("sexual", item_id, "update")
 
 
 def delete_sexual_item(item_id: int) -> None:
     """Удалить запись sexual."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM sexual WHERE id = ?", (item_id,))
+    cursor.execute("DELETE FROM sexual WHERE id = ? AND tenant_id = ?", (item_id, current_tenant()))
     conn.commit()
     conn.close()
+    _notify_change("sexual", item_id, "delete")
+
+
+# ============================================
+# МАССОВАЯ ЗАГРУЗКА (импорт из CSV, handlers/data.py)
+# ============================================
+
+# Разделы import_items: таблица -> (таблица категорий или None, колонка отметки, значения отметки)
+IMPORT_TABLES = {
+    "movies": ("movie_categories", "watched", (0, 1)),
+    "trips": ("trip_categories", "visited", (0, 1)),
+    "games": (None, "status", ("pending", "done")),
+    "activities": (None, "status", ("planned", "done")),
+}
+
+
+def _import_category(cursor: sqlite3.Cursor, table: str, title: Optional[str], known: Dict[Any, int]) -> int:
+    """ID категории по названию (недостающая создается); пустое название - первая категория раздела."""
+    key = (table, title or None)
+    if key in known:
+        return known[key]
+    tenant_id = current_tenant()
+    if title:
+        cursor.execute(f"INSERT OR IGNORE INTO {table} (tenant_id, title) VALUES (?, ?)", (tenant_id, title))
+        cursor.execute(f"SELECT id FROM {table} WHERE tenant_id = ? AND title = ?", (tenant_id, title))
+        row = cursor.fetchone()
+    else:
+        cursor.execute(f"SELECT id FROM {table} WHERE tenant_id = ? ORDER BY id LIMIT 1", (tenant_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return _import_category(cursor, table, "Без категории", known)
+    known[key] = row['id']
+    return row['id']
 
+
+def import_items(items: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Загрузить записи разделов текущего тенанта одной транзакцией.
+
+    Запись - словарь: table (ключ IMPORT_TABLES), title, note, group
+    (категория фильма/поездки - недостающая создается, пустая - первая
+    категория раздела; жанр игры), done, ratings ({user_id: оценка}, только
+    RATED_TABLES). Наблюдатели получают одно событие "import" на таблицу.
+
+    Returns:
+        {таблица: сколько записей добавлено}
+    """
+    tenant_id = current_tenant()
+    counts: Dict[str, int] = {}
+    first_ids: Dict[str, int] = {}
+    categories: Dict[Any, int] = {}
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        for item in items:
+            table = item['table']
+            category_table, flag, values = IMPORT_TABLES[table]
+            flag_value = values[1] if item.get('done') else values[0]
+            if category_table:
+                group_column = "category_id"
+                group = _import_category(cursor, category_table, item.get('group'), categories)
+            elif table == "games":
+                group_column, group = "genre", item.get('group') or None
+            else:
+                group_column, group = None, None
+            columns = ["tenant_id", "title", "note", flag] + ([group_column] if group_column else [])
+            params = [tenant_id, item['title'], item.get('note') or None, flag_value] + ([group] if group_column else [])
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", params
+            )
+            item_id = cursor.lastrowid
+            first_ids.setdefault(table, item_id)
+            counts[table] = counts.get(table, 0) + 1
+            ratings = item.get('ratings')
+            if ratings and table in RATED_TABLES:
+                cursor.executemany(
+                    "INSERT INTO ratings (item_type, item_id, user_id, score) VALUES (?, ?, ?, ?)",
+                    [(table, item_id, user_id, score) for user_id, score in ratings.items()]
+                )
+        # Агрегаты оценок - только новых записей (id растут: AUTOINCREMENT)
+        for table, first_id in first_ids.items():
+            if table in RATED_TABLES:
+                _update_rating_totals(cursor, table, "WHERE tenant_id = ? AND id >= ?", (tenant_id, first_id))
+        conn.commit()
+    finally:
+        conn.close()
+    for table in {table for table, _ in categories}:
+        _notify_change(table, 0, "import")
+    for table in counts:
+        _notify_change(table, 0, "import")
+    return counts
+
+
+# ============================================
+# ТЕНАНТЫ (пары и группы, tenants.py)
+# ============================================
+# Состав тенантов - в основной базе
+
+def get_tenant_ids() -> List[int]:
+    """Получить ID всех тенантов по порядку создания."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM tenants ORDER BY id")
+    result = [row['id'] for row in cursor.fetchall()]
+    conn.close()
+    return result
+
+
+def get_member_tenant(user_id: int) -> Optional[int]:
+    """Тенант участника из tenant_members или None (пользователи config.json здесь не хранятся)."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT tenant_id FROM tenant_members WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row['tenant_id'] if row else None
+
+
+def get_tenant_members(tenant_id: int) -> List[sqlite3.Row]:
+    """Получить участников тенанта (user_id, name) по порядку вступления."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT user_id, name FROM tenant_members
+        WHERE tenant_id = ?
+        ORDER BY joined_at, rowid
+    """, (tenant_id,))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+
+def create_invite(code: str, tenant_id: Optional[int], created_by: int, expires_at: int) -> None:
+    """
+    Создать приглашение (заодно удаляются просроченные).
+
+    Args:
+        code: Одноразовый код из ссылки
+        tenant_id: Тенант, в который приглашают (None - создать новый тенант)
+        expires_at: Unix-время, после которого код недействителен
+    """
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM invites WHERE expires_at < ?", (int(time.time()),))
+    cursor.execute(
+        "INSERT INTO invites (code, tenant_id, created_by, expires_at) VALUES (?, ?, ?, ?)",
+        (code, tenant_id, created_by, expires_at)
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_invite(code: str) -> Optional[sqlite3.Row]:
+    """Получить приглашение (tenant_id, created_by, expires_at) по коду или None."""
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT tenant_id, created_by, expires_at FROM invites WHERE code = ?", (code,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+
+def accept_invite(code: str, user_id: int, name: str, now: int) -> Optional[int]:
+    """
+    Принять приглашение: код погашается, пользователь становится участником.
+
+    Приглашение без тенанта создает новый тенант с категориями по умолчанию
+    (в режиме шардов их создаст шард при первом открытии).
+    Все это - одна транзакция; из двух одновременных переходов по одной
+    ссылке код достается одному.
+
+    Returns:
+        ID тенанта или None - кода нет или он просрочен
+    """
+    conn = get_main_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT tenant_id, expires_at FROM invites WHERE code = ?", (code,))
+        invite = cursor.fetchone()
+        if invite is None or invite['expires_at'] < now:
+            return None
+        cursor.execute("DELETE FROM invites WHERE code = ?", (code,))
+        if not cursor.rowcount:
+            return None
+
+        tenant_id = invite['tenant_id']
+        if tenant_id is None:
+            cursor.execute("INSERT INTO tenants (title) VALUES (?)", (name,))
+            tenant_id = cursor.lastrowid
+            if not SHARDED:
+                # Шард получит категории при создании (_create_schema)
+                _insert_default_categories(cursor, tenant_id)
+        cursor.execute(
+            "INSERT INTO tenant_members (user_id, tenant_id, name) VALUES (?, ?, ?)", (user_id, tenant_id, name)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    _notify_change("tenant_members", user_id, "create")
+    return tenant_id
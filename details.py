@@ -0,0 +1,161 @@
+"""
+Кеш карточек записей: готовые текст и клавиатура экранов *_detail.
+
+Карточка фильма, игры, поездки или активности - это запрос записи (с JOIN
+категории), для оцененных - еще и запрос оценок, и сборка текста и кнопок.
+Переходы "список -> карточка -> назад -> карточка" открывают одну и ту же
+карточку много раз, поэтому готовая карточка запоминается (LRU из
+DETAIL_CACHE_SIZE) по ключу (база, тенант, таблица, id):
+
+- изменение записи (database.CHANGE_HOOKS) помечает ее карточку устаревшей,
+  удаление - забывает; пока пометки нет, карточка отдается без SQL и сборки
+- устаревшая карточка сверяется с колонкой version записи (ее увеличивает
+  каждое update_*, mark_* и изменение оценки): версия та же - карточка
+  отдается без сборки, иначе собирается заново
+- массовые изменения таблицы (импорт, item_id 0) помечают устаревшими все
+  карточки таблицы - версии переживших их записей не изменились
+- карточка с оценками показывает имена участников: при смене состава
+  тенанта она тоже собирается заново
+- смена базы и пересчет всех оценок (rebuild_ratings) забывают все карточки
+
+Рабочий процесс (workers.py) обслуживает все чаты тенанта, поэтому
+наблюдатель в своем процессе видит все изменения записей тенанта.
+
+API:
+- DETAIL_CACHE_SIZE - сколько карточек помнить
+- Card - (текст, клавиатура)
+- card(table, item_id, load, build) - карточка записи или None (записи нет)
+- cache_info() - попадания, сборки и размер кеша
+- clear() - забыть все карточки
+- CONFLICT_NOTICE - ответ на кнопку устаревшей карточки
+- item_version(args) - id записи и версия из аргументов кнопки карточки
+
+Кнопки карточки несут версию записи, с которой ее собрали: изменение
+проходит, только если запись с тех пор не изменилась (database, version).
+Иначе обработчик отвечает CONFLICT_NOTICE и показывает свежую карточку.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+
+import database
+import tenants
+
+DETAIL_CACHE_SIZE = 512
+CONFLICT_NOTICE = "🔄 Запись уже изменили - вот актуальная"
+
+
+class Card(NamedTuple):
+    """Готовая карточка записи."""
+    text: str
+    reply_markup: InlineKeyboardMarkup
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    checks: int
+    builds: int
+    size: int
+
+
+class _Entry:
+    """Карточка в кеше: версия записи, имена участников, устаревшая ли."""
+
+    __slots__ = ("version", "names", "card", "stale")
+
+    def __init__(self, version: int, names: Tuple[str, ...], card: Card):
+        self.version = version
+        self.names = names
+        self.card = card
+        self.stale = False
+
+
+# (база, тенант, таблица, id записи)
+Key = Tuple[Any, int, str, int]
+
+_cards: "OrderedDict[Key, _Entry]" = OrderedDict()
+# hits - без SQL; checks - запрос записи, версия та же; builds - сборка заново
+_stats: Dict[str, int] = {"hits": 0, "checks": 0, "builds": 0}
+
+
+def _on_change(table: str, item_id: int, action: str) -> None:
+    """Наблюдатель database.CHANGE_HOOKS: помечает карточки изменившихся записей."""
+    if table in ("database", "ratings"):
+        # База сменилась или оценки загружены в обход записей (версии прежние)
+        clear()
+        return
+    if table not in database.VERSIONED_TABLES:
+        return
+    if item_id == 0 or action == "import":
+        for key, entry in _cards.items():
+            if key[2] == table:
+                entry.stale = True
+        return
+    key = (database.DB_PATH, database.current_tenant(), table, item_id)
+    if action == "delete":
+        _cards.pop(key, None)
+    elif key in _cards:
+        _cards[key].stale = True
+
+
+database.CHANGE_HOOKS.append(_on_change)
+
+
+def card(table: str, item_id: int, load: Callable[[int], Any], build: Callable[[Any], Card]) -> Optional[Card]:
+    """
+    Карточка записи текущего тенанта.
+
+    Args:
+        table: Таблица раздела (database.VERSIONED_TABLES)
+        item_id: ID записи
+        load: Загрузка записи по id (database.get_*_by_id); запись - с колонкой version
+        build: Сборка карточки из записи
+
+    Returns:
+        Card или None, если записи нет
+    """
+    key = (database.DB_PATH, database.current_tenant(), table, item_id)
+    names = tenants.names()
+    entry = _cards.get(key)
+    if entry is not None and not entry.stale and entry.names == names:
+        _cards.move_to_end(key)
+        _stats["hits"] += 1
+        return entry.card
+
+    row = load(item_id)
+    if row is None:
+        _cards.pop(key, None)
+        return None
+    if entry is not None and entry.version == row['version'] and entry.names == names:
+        entry.stale = False
+        _cards.move_to_end(key)
+        _stats["checks"] += 1
+        return entry.card
+
+    entry = _Entry(row['version'], names, build(row))
+    _cards[key] = entry
+    _cards.move_to_end(key)
+    if len(_cards) > DETAIL_CACHE_SIZE:
+        _cards.popitem(last=False)
+    _stats["builds"] += 1
+    return entry.card
+
+
+def item_version(args: Tuple[Any, ...]) -> Tuple[int, Optional[int]]:
+    """
+    ID записи и версия из аргументов кнопки (item_id, version).
+
+    У кнопок, отправленных до появления версий, версии нет - None
+    (изменение без проверки).
+    """
+    return args[0], args[1] if len(args) > 1 else None
+
+
+def cache_info() -> CacheInfo:
+    return CacheInfo(_stats["hits"], _stats["checks"], _stats["builds"], len(_cards))
+
+
+def clear() -> None:
+    _cards.clear()
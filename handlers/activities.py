@@ -1,30 +1,54 @@
 """
 Обработчики для раздела "Активности".
+
+О планируемой активности можно попросить напомнить (scheduler.add_reminder):
+напоминание придет в чат через REMINDER_DELAY.
 """
 
+import time
+from typing import Optional
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler, filters
 import database
-from keyboards import list_keyboard, back_button, main_menu_button
+import callbacks
+import details
+import render
+import scheduler
+import screens
+from keyboards import keyboard_factory, list_keyboard, back_button, main_menu_button
 
 ACTIVITY_TITLE, ACTIVITY_NOTE = range(2)
 EDIT_ACTIVITY_TITLE, EDIT_ACTIVITY_NOTE = range(2, 4)
 
+# Через сколько секунд напомнить об активности
+REMINDER_DELAY = 24 * 3600
 
-async def activities_menu(update: Update, context) -> None:
-    """Меню раздела активности."""
+# Шаблоны экранов
+DETAIL_HEADER = screens.Template("📝 {title}\n\n")
+DETAIL_NOTE = screens.Template("📄 {note}\n\n")
+
+
+@keyboard_factory()
+def activities_menu_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню раздела активности."""
     keyboard = [
-        [InlineKeyboardButton("📋 Планируемые", callback_data="activities_planned")],
-        [InlineKeyboardButton("✅ Выполненные", callback_data="activities_done")],
-        [InlineKeyboardButton("➕ Добавить активность", callback_data="activities_add")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        [InlineKeyboardButton("📋 Планируемые", callback_data=callbacks.encode("activities_planned"))],
+        [InlineKeyboardButton("✅ Выполненные", callback_data=callbacks.encode("activities_done"))],
+        [InlineKeyboardButton("➕ Добавить активность", callback_data=callbacks.encode("activities_add"))],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def activities_menu(update: Update, context) -> None:
+    """Меню раздела активности."""
+    reply_markup = activities_menu_keyboard()
     
     if update.message:
         await update.message.reply_text("📝 Раздел: Активности\n\nВыберите действие:", reply_markup=reply_markup)
     else:
-        await update.callback_query.edit_message_text("📝 Раздел: Активности\n\nВыберите действие:", reply_markup=reply_markup)
+        await render.edit_screen(update, "📝 Раздел: Активности\n\nВыберите действие:", reply_markup=reply_markup)
 
 
 async def activities_planned_list(update: Update, context) -> None:
@@ -34,26 +58,19 @@ async def activities_planned_list(update: Update, context) -> None:
     
     activities = database.get_activities(status='planned')
     
+    text = screens.render_list("📋 Планируемые", activities, screens.NUMBERED_TITLE)
     if not activities:
-        text = "📋 Список пуст"
         keyboard = back_button("activities_menu")
     else:
-        text = f"📋 Планируемые ({len(activities)}):\n\n"
-        for i, activity in enumerate(activities[:10], 1):
-            text += f"{i}. {activity['title']}\n"
-        
-        if len(activities) > 10:
-            text += f"\n... и еще {len(activities) - 10}"
-        
         keyboard = list_keyboard(
             activities,
             page=0,
             items_per_page=10,
-            callback_prefix="activity_",
-            back_callback="activities_menu"
+            item_route="activity",
+            back_route="activities_menu"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
 async def activities_done_list(update: Update, context) -> None:
@@ -63,89 +80,115 @@ async def activities_done_list(update: Update, context) -> None:
     
     activities = database.get_activities(status='done')
     
+    text = screens.render_list("✅ Выполненные", activities, screens.NUMBERED_TITLE)
     if not activities:
-        text = "📋 Список пуст"
         keyboard = back_button("activities_menu")
     else:
-        text = f"✅ Выполненные ({len(activities)}):\n\n"
-        for i, activity in enumerate(activities[:10], 1):
-            text += f"{i}. {activity['title']}\n"
-        
-        if len(activities) > 10:
-            text += f"\n... и еще {len(activities) - 10}"
-        
         keyboard = list_keyboard(
             activities,
             page=0,
             items_per_page=10,
-            callback_prefix="activity_",
-            back_callback="activities_menu"
+            item_route="activity",
+            back_route="activities_menu"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
-async def activity_detail(update: Update, context) -> None:
+def activity_text(activity) -> str:
+    """Текст карточки активности (экран раздела и inline-режим)."""
+    return screens.render_detail([
+        DETAIL_HEADER.render(activity),
+        DETAIL_NOTE.render(activity) if activity['note'] else None,
+        "📊 Статус: ✅ Выполнено\n" if activity['status'] == 'done' else "📊 Статус: ⏳ Планируется\n",
+    ])
+
+
+def activity_card(activity) -> details.Card:
+    """Карточка активности: текст и кнопки (запоминается в details)."""
+    activity_id, version = activity['id'], activity['version']
+    keyboard = []
+    if activity['status'] == 'planned':
+        keyboard.append([InlineKeyboardButton("✅ Выполнено", callback_data=callbacks.encode("activity_done", activity_id, version))])
+        keyboard.append([InlineKeyboardButton("⏰ Напомнить завтра", callback_data=callbacks.encode("activity_remind", activity_id))])
+    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=callbacks.encode("activity_edit", activity_id))])
+    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=callbacks.encode("activity_delete", activity_id, version))])
+    
+    back_route = "activities_planned" if activity['status'] == 'planned' else "activities_done"
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode(back_route))])
+    return details.Card(activity_text(activity), InlineKeyboardMarkup(keyboard))
+
+
+async def activity_detail(update: Update, context, activity_id: Optional[int] = None) -> None:
     """Детальный просмотр активности."""
     query = update.callback_query
-    await query.answer()
     
-    activity_id = int(query.data.split("_")[1])
-    activity = database.get_activity_by_id(activity_id)
+    # Вызов из другого обработчика передает id явно (на callback уже ответили)
+    if activity_id is None:
+        await query.answer()
+        activity_id = callbacks.decode(query.data).args[0]
+    card = details.card("activities", activity_id, database.get_activity_by_id, activity_card)
     
-    if not activity:
-        await query.edit_message_text("❌ Активность не найдена")
+    if card is None:
+        await render.edit_screen(update, "❌ Активность не найдена")
         return
     
-    text = f"📝 {activity['title']}\n\n"
-    if activity['note']:
-        text += f"📄 {activity['note']}\n\n"
-    text += f"📊 Статус: {'✅ Выполнено' if activity['status'] == 'done' else '⏳ Планируется'}\n"
-    
-    keyboard = []
-    if activity['status'] == 'planned':
-        keyboard.append([InlineKeyboardButton("✅ Выполнено", callback_data=f"activity_done_{activity_id}")])
-    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=f"activity_edit_{activity_id}")])
-    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=f"activity_delete_{activity_id}")])
-    
-    back_callback = "activities_planned" if activity['status'] == 'planned' else "activities_done"
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=back_callback)])
-    
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await render.edit_screen(update, card.text, reply_markup=card.reply_markup)
+
+
+async def _activity_conflict(update: Update, context, activity_id: int) -> None:
+    """Активность изменили, пока карточка была открыта: показываем актуальную."""
+    await update.callback_query.answer(details.CONFLICT_NOTICE)
+    await activity_detail(update, context, activity_id)
 
 
 async def activity_done(update: Update, context) -> None:
     """Отметить активность как выполненную."""
     query = update.callback_query
-    await query.answer()
     
-    activity_id = int(query.data.split("_")[-1])
-    database.mark_activity_done(activity_id)
+    activity_id, version = details.item_version(callbacks.decode(query.data).args)
+    if not database.mark_activity_done(activity_id, version):
+        await _activity_conflict(update, context, activity_id)
+        return
+    await query.answer()
     
-    await query.edit_message_text("✅ Активность отмечена как выполненная!")
+    await render.edit_screen(update, "✅ Активность отмечена как выполненная!")
     # Обновляем детальный просмотр
-    query.data = f"activity_{activity_id}"
-    await activity_detail(update, context)
+    await activity_detail(update, context, activity_id)
+
+
+async def activity_remind(update: Update, context) -> None:
+    """Напомнить об активности через REMINDER_DELAY."""
+    query = update.callback_query
+    
+    activity_id = callbacks.decode(query.data).args[0]
+    scheduler.add_reminder(
+        context.job_queue, update.effective_chat.id, "activities", activity_id, int(time.time()) + REMINDER_DELAY
+    )
+    await query.answer("⏰ Напомню завтра в это же время")
 
 
 async def activity_delete(update: Update, context) -> None:
     """Удалить активность."""
     query = update.callback_query
-    await query.answer()
     
-    activity_id = int(query.data.split("_")[-1])
+    activity_id, version = details.item_version(callbacks.decode(query.data).args)
     activity = database.get_activity_by_id(activity_id)
     
     if not activity:
-        await query.edit_message_text("❌ Активность не найдена")
+        await query.answer()
+        await render.edit_screen(update, "❌ Активность не найдена")
         return
     
-    database.delete_activity(activity_id)
-    await query.edit_message_text(f"✅ Активность '{activity['title']}' удалена!")
+    if not database.delete_activity(activity_id, version):
+        await _activity_conflict(update, context, activity_id)
+        return
+    await query.answer()
+    await render.edit_screen(update, f"✅ Активность '{activity['title']}' удалена!")
     
     # Возвращаемся в соответствующий список
-    back_callback = "activities_planned" if activity['status'] == 'planned' else "activities_done"
-    if back_callback == "activities_planned":
+    back_route = "activities_planned" if activity['status'] == 'planned' else "activities_done"
+    if back_route == "activities_planned":
         await activities_planned_list(update, context)
     else:
         await activities_done_list(update, context)
@@ -156,7 +199,7 @@ async def activities_add_start(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("➕ Добавление активности\n\nВведите название активности:")
+    await render.edit_screen(update, "➕ Добавление активности\n\nВведите название активности:")
     return ACTIVITY_TITLE
 
 
@@ -194,19 +237,22 @@ async def activities_add_cancel(update: Update, context) -> None:
 def register_handlers(application: Application) -> None:
     """Регистрация обработчиков раздела активности."""
     add_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(activities_add_start, pattern="^activities_add$")],
+        entry_points=[CallbackQueryHandler(activities_add_start, pattern=callbacks.pattern("activities_add"))],
         states={
             ACTIVITY_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, activities_add_title)],
             ACTIVITY_NOTE: [MessageHandler(filters.TEXT, activities_add_note)]
         },
-        fallbacks=[CommandHandler("cancel", activities_add_cancel)]
+        fallbacks=[CommandHandler("cancel", activities_add_cancel)],
+        name="activities_add",
+        persistent=True
     )
     
     application.add_handler(add_conv)
-    application.add_handler(CallbackQueryHandler(activities_menu, pattern="^activities_menu$"))
-    application.add_handler(CallbackQueryHandler(activities_planned_list, pattern="^activities_planned$"))
-    application.add_handler(CallbackQueryHandler(activities_done_list, pattern="^activities_done$"))
-    application.add_handler(CallbackQueryHandler(activity_detail, pattern="^activity_\\d+$"))
-    application.add_handler(CallbackQueryHandler(activity_done, pattern="^activity_done_\\d+$"))
-    application.add_handler(CallbackQueryHandler(activity_delete, pattern="^activity_delete_\\d+$"))
+    application.add_handler(CallbackQueryHandler(activities_menu, pattern=callbacks.pattern("activities_menu")))
+    application.add_handler(CallbackQueryHandler(activities_planned_list, pattern=callbacks.pattern("activities_planned")))
+    application.add_handler(CallbackQueryHandler(activities_done_list, pattern=callbacks.pattern("activities_done")))
+    application.add_handler(CallbackQueryHandler(activity_detail, pattern=callbacks.pattern("activity")))
+    application.add_handler(CallbackQueryHandler(activity_done, pattern=callbacks.pattern("activity_done")))
+    application.add_handler(CallbackQueryHandler(activity_remind, pattern=callbacks.pattern("activity_remind")))
+    application.add_handler(CallbackQueryHandler(activity_delete, pattern=callbacks.pattern("activity_delete")))
 
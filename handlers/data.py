@@ -0,0 +1,177 @@
+"""
+Обработчики статистики, экспорта и импорта списков.
+
+- /stats - статистика по разделам и оценкам
+- /export - CSV всех фильмов, игр, активностей и поездок
+- CSV-файл с подписью /import - загрузка записей (формат - как у /export)
+
+Расчеты выполняются в пуле процессов (jobs.py, задачи - reports.py), поэтому
+обработчики зарегистрированы с block=False: пока задача считается, бот
+отвечает на другие апдейты, в том числе на кнопку отмены. Во время задачи
+в чате висит сообщение о прогрессе с кнопкой "Отменить".
+"""
+
+import logging
+import time
+from typing import Any, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputFile, Message, Update
+from telegram.error import TelegramError
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+
+import callbacks
+import database
+import jobs
+import reports
+import tenants
+
+logger = logging.getLogger(__name__)
+
+# Больше не принимаем: разбор такого файла - уже минуты работы пула
+IMPORT_MAX_BYTES = 2 * 1024 * 1024
+IMPORT_HELP = (
+    "📥 Импорт: отправьте CSV-файл с подписью /import.\n\n"
+    "Колонки: Раздел (Фильмы, Игры, Активности, Поездки), Название, Заметка, "
+    "Категория (жанр для игр), Готово (да/пусто), затем оценки участников по порядку.\n"
+    "Такой файл выгружает /export. Записи с уже существующими названиями пропускаются."
+)
+
+
+def cancel_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    """Кнопка отмены задачи под сообщением о прогрессе."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("✖️ Отменить", callback_data=callbacks.encode("job_cancel", job_id))]])
+
+
+async def _edit(status: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+    try:
+        await status.edit_text(text, reply_markup=reply_markup)
+    except TelegramError as e:
+        # "message is not modified" и удаленное пользователем сообщение - не повод прерывать задачу
+        logger.debug(f"Статус задачи не обновлен: {e}")
+
+
+async def run_job(update: Update, title: str, kind: str, payload: Any) -> Tuple[Optional[Any], Message]:
+    """
+    Выполняет задачу пула, показывая прогресс в чате.
+
+    Returns:
+        (результат или None - задача не выполнена и пользователю уже ответили, сообщение статуса)
+    """
+    status = await update.effective_message.reply_text(f"⏳ {title}...")
+    job: Optional[jobs.Job] = None
+
+    async def show_progress(done: int, total: int, text: str) -> None:
+        line = f"⏳ {title}: {done * 100 // total if total else 0}%"
+        await _edit(status, f"{line}\n{text}" if text else line, cancel_keyboard(job.id))
+
+    try:
+        job = jobs.submit_job(kind, payload, on_progress=show_progress, owner=update.effective_user.id)
+    except jobs.JobQueueFull:
+        await _edit(status, "⏳ Сейчас выполняется слишком много задач. Попробуйте через минуту.")
+        return None, status
+    await _edit(status, f"⏳ {title}...", cancel_keyboard(job.id))
+
+    try:
+        return await job, status
+    except jobs.JobCancelled:
+        await _edit(status, f"✖️ {title}: отменено")
+    except Exception as e:
+        logger.error(f"Ошибка задачи {job.id} ({kind}): {e}")
+        await _edit(status, f"❌ {title}: не удалось выполнить")
+    return None, status
+
+
+async def stats_command(update: Update, context) -> None:
+    """Обработчик /stats: статистика текущего тенанта."""
+    text, status = await run_job(update, "Статистика", "stats", reports.collect_lists())
+    if text is not None:
+        await _edit(status, text)
+
+
+async def export_command(update: Update, context) -> None:
+    """Обработчик /export: CSV-файл со всеми записями."""
+    payload = reports.collect_lists()
+    total = sum(len(items) for items in payload["sections"].values())
+    if not total:
+        await update.message.reply_text("📤 Списки пусты - выгружать нечего.")
+        return
+    data, status = await run_job(update, "Экспорт", "export_csv", payload)
+    if data is None:
+        return
+    filename = f"forus_{time.strftime('%Y-%m-%d')}.csv"
+    await update.message.reply_document(InputFile(data, filename=filename), caption=f"📤 Записей: {total}")
+    await _edit(status, f"✅ Экспорт готов: {total} записей")
+
+
+async def import_help(update: Update, context) -> None:
+    """Обработчик /import без файла: формат импорта."""
+    await update.message.reply_text(IMPORT_HELP)
+
+
+async def import_document(update: Update, context) -> None:
+    """Обработчик CSV-файла с подписью /import."""
+    document = update.message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text(f"❌ Файл больше {IMPORT_MAX_BYTES // 1024 // 1024} МБ - разбейте его на части.")
+        return
+    file = await document.get_file()
+    data = bytes(await file.download_as_bytearray())
+
+    existing = {
+        table: [item['title'] for item in items]
+        for table, items in reports.collect_lists()["sections"].items()
+    }
+    payload = {"data": data, "members": len(tenants.members()), "existing": existing}
+    parsed, status = await run_job(update, "Импорт", "import_csv", payload)
+    if parsed is None:
+        return
+
+    items = parsed["items"]
+    for item in items:
+        item["ratings"] = {
+            user_id: score for user_id, score in
+            ((tenants.slot_user(slot), score) for slot, score in item["ratings"].items())
+            if user_id is not None
+        }
+    counts = database.import_items(items) if items else {}
+
+    lines = [f"✅ Импорт: добавлено {len(items)}"]
+    for table in reports.EXPORT_SECTIONS:
+        if counts.get(table):
+            lines.append(f"{reports.SECTION_ICONS[table]} {reports.SECTION_TITLES[table]}: {counts[table]}")
+    if parsed["skipped"]:
+        lines.append(f"Пропущено (уже есть): {parsed['skipped']}")
+    if parsed["error_count"]:
+        lines.append(f"\n⚠️ Строк с ошибками: {parsed['error_count']}")
+        lines.extend(f"строка {line}: {problem}" for line, problem in parsed["errors"][:5])
+    await _edit(status, "\n".join(lines))
+    logger.info(f"Импорт от {update.effective_user.id}: {counts}, ошибок {parsed['error_count']}")
+
+
+async def job_cancel(update: Update, context) -> None:
+    """Кнопка "Отменить" под прогрессом задачи."""
+    query = update.callback_query
+    job_id = callbacks.decode(query.data).args[0]
+    job = jobs.get_job(job_id)
+    if job is None:
+        await query.answer("Задача уже завершилась")
+        return
+    if job.owner != update.effective_user.id:
+        await query.answer("Отменить может только тот, кто запустил задачу")
+        return
+    job.cancel()
+    await query.answer("Отменяю...")
+
+
+def register_handlers(application: Application) -> None:
+    """Регистрирует /stats, /export, /import и отмену задач."""
+    application.add_handler(CommandHandler("stats", stats_command, block=False), group=0)
+    application.add_handler(CommandHandler("export", export_command, block=False), group=0)
+    application.add_handler(CommandHandler("import", import_help), group=0)
+    application.add_handler(
+        MessageHandler(
+            filters.Document.FileExtension("csv") & filters.CaptionRegex(r"^/import\b"), import_document, block=False
+        ),
+        group=0
+    )
+    application.add_handler(CallbackQueryHandler(job_cancel, pattern=callbacks.pattern("job_cancel")), group=0)
@@ -2,52 +2,85 @@
 Обработчики для раздела "Игры".
 """
 
+from typing import Optional, Tuple
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler, filters
 import database
-import config
-from keyboards import list_keyboard, back_button, rating_keyboard
+import callbacks
+import details
+import render
+import screens
+import tenants
+from keyboards import keyboard_factory, list_keyboard, back_button, rating_keyboard
 
 GAME_TITLE, GAME_NOTE, GAME_GENRE = range(3)
 EDIT_GAME_TITLE, EDIT_GAME_NOTE, EDIT_GAME_GENRE = range(3, 6)
 RATING_GAME_USER1, RATING_GAME_USER2 = range(6, 8)
 
+# Шаблоны экранов
+PENDING_GENRE_LINE = screens.Template("{n}. {title} ({genre})")
+DETAIL_HEADER = screens.Template("🎮 {title}\n\n")
+DETAIL_NOTE = screens.Template("📝 {note}\n\n")
+DETAIL_GENRE = screens.Template("📁 Жанр: {genre}\n")
+DONE_LINE = screens.Template("{n}. {title} - {avg:.1f}/10")
+TOP_LINE = screens.Template("{n}. {title} - {rating:.1f}/10")
 
-async def games_menu(update: Update, context) -> None:
-    """Меню раздела игры."""
+
+@keyboard_factory()
+def games_menu_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню раздела игры."""
     keyboard = [
-        [InlineKeyboardButton("📋 Ожидающие", callback_data="games_pending")],
-        [InlineKeyboardButton("✅ Пройденные", callback_data="games_done")],
-        [InlineKeyboardButton("🏆 Топ-10", callback_data="games_top")],
-        [InlineKeyboardButton("🎲 Случайная игра", callback_data="games_random")],
-        [InlineKeyboardButton("➕ Добавить игру", callback_data="games_add")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        [InlineKeyboardButton("📋 Ожидающие", callback_data=callbacks.encode("games_pending"))],
+        [InlineKeyboardButton("✅ Пройденные", callback_data=callbacks.encode("games_done"))],
+        [InlineKeyboardButton("🏆 Топ-10", callback_data=callbacks.encode("games_top"))],
+        [InlineKeyboardButton("🎲 Случайная игра", callback_data=callbacks.encode("games_random"))],
+        [InlineKeyboardButton("➕ Добавить игру", callback_data=callbacks.encode("games_add"))],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def games_menu(update: Update, context) -> None:
+    """Меню раздела игры."""
+    reply_markup = games_menu_keyboard()
     
     if update.message:
         await update.message.reply_text("🎮 Раздел: Игры\n\nВыберите действие:", reply_markup=reply_markup)
     else:
-        await update.callback_query.edit_message_text("🎮 Раздел: Игры\n\nВыберите действие:", reply_markup=reply_markup)
+        await render.edit_screen(update, "🎮 Раздел: Игры\n\nВыберите действие:", reply_markup=reply_markup)
 
 
-async def games_pending_menu(update: Update, context) -> None:
-    """Подменю ожидающих игр."""
-    query = update.callback_query
-    await query.answer()
-    
+@keyboard_factory("games")
+def games_pending_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора жанра ожидающих игр."""
     genres = database.get_game_genres()
     keyboard = [
-        [InlineKeyboardButton("📋 Общий список", callback_data="games_pending_all")]
+        [InlineKeyboardButton("📋 Общий список", callback_data=callbacks.encode("games_pending_all"))]
     ]
     
     for genre in genres:
-        keyboard.append([InlineKeyboardButton(f"📁 {genre}", callback_data=f"games_pending_genre_{genre}")])
+        keyboard.append([InlineKeyboardButton(f"📁 {genre}", callback_data=callbacks.encode("games_pending_genre", genre))])
+    
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("games_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def games_pending_menu(update: Update, context) -> None:
+    """Подменю ожидающих игр."""
+    query = update.callback_query
+    await query.answer()
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="games_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = games_pending_keyboard()
     
-    await query.edit_message_text("📋 Ожидающие игры\n\nВыберите фильтр:", reply_markup=reply_markup)
+    await render.edit_screen(update, "📋 Ожидающие игры\n\nВыберите фильтр:", reply_markup=reply_markup)
+
+
+def _pending_line(n: int, game) -> str:
+    """Строка списка ожидающих: жанр в скобках, если указан."""
+    if game['genre']:
+        return PENDING_GENRE_LINE.render(game, n=n)
+    return screens.NUMBERED_TITLE.render(game, n=n)
 
 
 async def games_pending_list(update: Update, context) -> None:
@@ -55,78 +88,87 @@ async def games_pending_list(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    data = query.data
-    if data == "games_pending_all":
+    callback = callbacks.decode(query.data)
+    if callback.route == "games_pending_all":
         games = database.get_games(status='pending')
         genre = None
     else:
-        genre = data.split("_")[-1]
+        genre = callback.args[0]
         games = database.get_games(status='pending', genre=genre)
     
+    text = screens.render_list("📋 Ожидающие игры", games, _pending_line)
     if not games:
-        text = "📋 Список пуст"
         keyboard = back_button("games_pending")
     else:
-        text = f"📋 Ожидающие игры ({len(games)}):\n\n"
-        for i, game in enumerate(games[:10], 1):
-            text += f"{i}. {game['title']}"
-            if game['genre']:
-                text += f" ({game['genre']})"
-            text += "\n"
-        
-        if len(games) > 10:
-            text += f"\n... и еще {len(games) - 10}"
-        
         keyboard = list_keyboard(
             games,
             page=0,
             items_per_page=10,
-            callback_prefix="game_",
-            back_callback="games_pending"
+            item_route="game",
+            back_route="games_pending"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
-async def game_detail(update: Update, context) -> None:
-    """Детальный просмотр игры."""
-    query = update.callback_query
-    await query.answer()
-    
-    game_id = int(query.data.split("_")[1])
-    game = database.get_game_by_id(game_id)
-    
-    if not game:
-        await query.edit_message_text("❌ Игра не найдена")
-        return
-    
-    text = f"🎮 {game['title']}\n\n"
-    if game['note']:
-        text += f"📝 {game['note']}\n\n"
-    if game['genre']:
-        text += f"📁 Жанр: {game['genre']}\n"
-    
+def game_text(game) -> str:
+    """Текст карточки игры (экран раздела и inline-режим)."""
+    parts = [
+        DETAIL_HEADER.render(game),
+        DETAIL_NOTE.render(game) if game['note'] else None,
+        DETAIL_GENRE.render(game) if game['genre'] else None,
+    ]
     if game['status'] == 'done':
-        text += f"✅ Пройдена\n"
-        if game['user1_rating']:
-            user1_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[0]) or "Пользователь 1"
-            text += f"⭐ {user1_name}: {game['user1_rating']}/10\n"
-        if game['user2_rating']:
-            user2_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[1]) if len(config.AUTHORIZED_USERS) > 1 else "Пользователь 2"
-            text += f"⭐ {user2_name}: {game['user2_rating']}/10\n"
+        parts.append("✅ Пройдена\n")
+        if game['rating_count']:
+            for row in database.get_ratings("games", game['id']):
+                name = tenants.member_name(row['user_id']) or "Пользователь"
+                parts.append(screens.RATING_LINE.render(name=name, rating=row['score']))
     else:
-        text += "⏳ Ожидает прохождения\n"
-    
+        parts.append("⏳ Ожидает прохождения\n")
+    return screens.render_detail(parts)
+
+
+def game_card(game) -> details.Card:
+    """Карточка игры: текст и кнопки (запоминается в details)."""
+    game_id, version = game['id'], game['version']
     keyboard = []
     if game['status'] == 'pending':
-        keyboard.append([InlineKeyboardButton("✅ Пройдено", callback_data=f"game_done_{game_id}")])
-    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=f"game_edit_{game_id}")])
-    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=f"game_delete_{game_id}")])
+        keyboard.append([InlineKeyboardButton("✅ Пройдено", callback_data=callbacks.encode("game_done", game_id, version))])
+    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=callbacks.encode("game_edit", game_id))])
+    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=callbacks.encode("game_delete", game_id, version))])
     
-    back_callback = "games_pending" if game['status'] == 'pending' else "games_done"
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=back_callback)])
+    back_route = "games_pending" if game['status'] == 'pending' else "games_done"
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode(back_route))])
+    return details.Card(game_text(game), InlineKeyboardMarkup(keyboard))
+
+
+async def game_detail(update: Update, context, game_id: Optional[int] = None) -> None:
+    """Детальный просмотр игры."""
+    query = update.callback_query
+    
+    # Вызов из другого обработчика передает id явно (на callback уже ответили)
+    if game_id is None:
+        await query.answer()
+        game_id = callbacks.decode(query.data).args[0]
+    card = details.card("games", game_id, database.get_game_by_id, game_card)
+    
+    if card is None:
+        await render.edit_screen(update, "❌ Игра не найдена")
+        return
     
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await render.edit_screen(update, card.text, reply_markup=card.reply_markup)
+
+
+@keyboard_factory()
+def games_done_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню пройденных игр."""
+    keyboard = [
+        [InlineKeyboardButton("📋 Общий список", callback_data=callbacks.encode("games_done_all"))],
+        [InlineKeyboardButton("🏆 Топ-10", callback_data=callbacks.encode("games_top"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("games_menu"))]
+    ]
+    return InlineKeyboardMarkup(keyboard)
 
 
 async def games_done_menu(update: Update, context) -> None:
@@ -134,14 +176,16 @@ async def games_done_menu(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("📋 Общий список", callback_data="games_done_all")],
-        [InlineKeyboardButton("🏆 Топ-10", callback_data="games_top")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="games_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = games_done_keyboard()
     
-    await query.edit_message_text("✅ Пройденные игры\n\nВыберите действие:", reply_markup=reply_markup)
+    await render.edit_screen(update, "✅ Пройденные игры\n\nВыберите действие:", reply_markup=reply_markup)
+
+
+def _done_line(n: int, game) -> str:
+    """Строка списка пройденных: средняя оценка, если оценили все."""
+    if game['rating_count'] and game['rating_count'] >= len(tenants.members()):
+        return DONE_LINE.render(game, n=n, avg=game['rating_avg'])
+    return screens.NUMBERED_TITLE.render(game, n=n)
 
 
 async def games_done_list(update: Update, context) -> None:
@@ -151,30 +195,29 @@ async def games_done_list(update: Update, context) -> None:
     
     games = database.get_games(status='done')
     
+    text = screens.render_list("✅ Пройденные игры", games, _done_line)
     if not games:
-        text = "📋 Список пуст"
         keyboard = back_button("games_done")
     else:
-        text = f"✅ Пройденные игры ({len(games)}):\n\n"
-        for i, game in enumerate(games[:10], 1):
-            rating_text = ""
-            if game['user1_rating'] and game['user2_rating']:
-                avg = (game['user1_rating'] + game['user2_rating']) / 2
-                rating_text = f" - {avg:.1f}/10"
-            text += f"{i}. {game['title']}{rating_text}\n"
-        
-        if len(games) > 10:
-            text += f"\n... и еще {len(games) - 10}"
-        
         keyboard = list_keyboard(
             games,
             page=0,
             items_per_page=10,
-            callback_prefix="game_",
-            back_callback="games_done"
+            item_route="game",
+            back_route="games_done"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
+
+
+@keyboard_factory()
+def games_top_keyboard(names: Tuple[str, ...]) -> InlineKeyboardMarkup:
+    """Клавиатура выбора топа: общий и личный для каждого пользователя."""
+    keyboard = [[InlineKeyboardButton("🏆 Общий топ", callback_data=callbacks.encode("games_top_all"))]]
+    for slot, name in enumerate(names, 1):
+        keyboard.append([InlineKeyboardButton(f"⭐ {name}", callback_data=callbacks.encode("games_top_user", slot))])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("games_menu"))])
+    return InlineKeyboardMarkup(keyboard)
 
 
 async def games_top_menu(update: Update, context) -> None:
@@ -182,19 +225,15 @@ async def games_top_menu(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    user_ids = list(config.AUTHORIZED_USERS.keys())
-    user1_name = config.get_user_name(user_ids[0]) or "Пользователь 1"
-    user2_name = config.get_user_name(user_ids[1]) if len(user_ids) > 1 else "Пользователь 2"
-    
-    keyboard = [
-        [InlineKeyboardButton("🏆 Общий топ", callback_data="games_top_all")],
-        [InlineKeyboardButton(f"⭐ {user1_name}", callback_data="games_top_user1")],
-        [InlineKeyboardButton(f"⭐ {user2_name}", callback_data="games_top_user2")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="games_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = games_top_keyboard(tenants.names())
     
-    await query.edit_message_text("🏆 Топ-10 игр\n\nВыберите топ:", reply_markup=reply_markup)
+    await render.edit_screen(update, "🏆 Топ-10 игр\n\nВыберите топ:", reply_markup=reply_markup)
+
+
+def _top_line(n: int, game) -> str:
+    """Строка топа: общий топ отдает avg_rating, личный - rating."""
+    rating = game['avg_rating'] if 'avg_rating' in game.keys() else game['rating']
+    return TOP_LINE.render(game, n=n, rating=rating)
 
 
 async def games_top_show(update: Update, context) -> None:
@@ -202,34 +241,21 @@ async def games_top_show(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    data = query.data
-    if data == "games_top_all":
-        games = database.get_games_top(limit=10, user_num=None)
+    callback = callbacks.decode(query.data)
+    if callback.route == "games_top_all":
+        # Общий топ - записи, которые оценили все пользователи
+        games = database.get_games_top(limit=10, min_votes=len(tenants.members()))
         title = "🏆 Общий топ-10:"
-    elif data == "games_top_user1":
-        games = database.get_games_top(limit=10, user_num=1)
-        user1_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[0]) or "Пользователь 1"
-        title = f"⭐ Топ-10 {user1_name}:"
     else:
-        games = database.get_games_top(limit=10, user_num=2)
-        user_ids = list(config.AUTHORIZED_USERS.keys())
-        user2_name = config.get_user_name(user_ids[1]) if len(user_ids) > 1 else "Пользователь 2"
-        title = f"⭐ Топ-10 {user2_name}:"
+        slot = callback.args[0]
+        user_id = tenants.slot_user(slot)
+        games = database.get_games_top(limit=10, user_id=user_id) if user_id is not None else []
+        title = f"⭐ Топ-10 {tenants.slot_name(slot)}:"
     
-    if not games:
-        text = "📋 Топ пуст"
-    else:
-        text = f"{title}\n\n"
-        for i, game in enumerate(games, 1):
-            # Проверяем наличие ключа в Row объекте
-            if 'avg_rating' in dict(game):
-                rating = game['avg_rating']
-            else:
-                rating = game['rating']
-            text += f"{i}. {game['title']} - {rating:.1f}/10\n"
+    text = screens.render_list(title, games, _top_line, empty_text="📋 Топ пуст", limit=None, show_count=False)
     
     keyboard = back_button("games_top")
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
 async def games_random(update: Update, context) -> None:
@@ -240,30 +266,34 @@ async def games_random(update: Update, context) -> None:
     game = database.get_random_game()
     
     if not game:
-        await query.edit_message_text("❌ Нет доступных игр")
+        await render.edit_screen(update, "❌ Нет доступных игр")
         return
     
-    query.data = f"game_{game['id']}"
-    await game_detail(update, context)
+    await game_detail(update, context, game['id'])
+
+
+async def _game_conflict(update: Update, context, game_id: int) -> None:
+    """Игру изменили, пока карточка была открыта: показываем актуальную."""
+    await update.callback_query.answer(details.CONFLICT_NOTICE)
+    await game_detail(update, context, game_id)
 
 
 async def game_done(update: Update, context) -> None:
     """Отметить игру как пройденную."""
     query = update.callback_query
-    await query.answer()
-    
-    game_id = int(query.data.split("_")[-1])
-    database.mark_game_done(game_id)
     
-    # Начинаем процесс оценки
-    context.user_data['rating_game_id'] = game_id
-    context.user_data['rating_user'] = 1
+    game_id, version = details.item_version(callbacks.decode(query.data).args)
+    if not database.mark_game_done(game_id, version):
+        await _game_conflict(update, context, game_id)
+        return
+    await query.answer()
     
-    user1_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[0]) or "Пользователь 1"
-    keyboard = rating_keyboard("rate_game_", game_id, 1)
+    # Начинаем процесс оценки: шаг и версия игры - в кнопках
+    version = None if version is None else version + 1
+    keyboard = rating_keyboard("rate_game", game_id, 1, version)
     
-    await query.edit_message_text(
-        f"⭐ Оцените игру ({user1_name}):",
+    await render.edit_screen(update, 
+        f"⭐ Оцените игру ({tenants.slot_name(1)}):",
         reply_markup=keyboard
     )
 
@@ -271,52 +301,59 @@ async def game_done(update: Update, context) -> None:
 async def game_rating(update: Update, context) -> None:
     """Обработка оценки игры."""
     query = update.callback_query
-    await query.answer()
     
-    if "cancel" in query.data:
-        await query.edit_message_text("❌ Оценка отменена")
+    callback = callbacks.decode(query.data)
+    if callback.route == "rate_game_cancel":
+        await query.answer()
+        await render.edit_screen(update, "❌ Оценка отменена")
         return
     
-    parts = query.data.split("_")
-    game_id = int(parts[2])
-    user_num = int(parts[3].replace("user", ""))
-    rating = int(parts[4])
-    
-    database.set_game_rating(game_id, user_num, rating)
-    
-    # Проверяем, нужно ли оценить второму пользователю
-    user_ids = list(config.AUTHORIZED_USERS.keys())
-    if len(user_ids) > 1 and user_num == 1:
-        user2_name = config.get_user_name(user_ids[1]) or "Пользователь 2"
-        context.user_data['rating_user'] = 2
-        keyboard = rating_keyboard("rate_game_", game_id, 2)
-        await query.edit_message_text(
-            f"⭐ Оцените игру ({user2_name}):",
+    game_id, user_num, rating = callback.args[:3]
+    version = callback.args[3] if len(callback.args) > 3 else None
+    
+    user_id = tenants.slot_user(user_num)
+    if user_id is None:
+        await query.answer()
+        await render.edit_screen(update, "❌ Пользователь не найден")
+        return
+    if not database.set_game_rating(game_id, user_id, rating, version):
+        await _game_conflict(update, context, game_id)
+        return
+    await query.answer()
+    
+    # Проверяем, нужно ли оценить следующему пользователю
+    if user_num < len(tenants.members()):
+        version = None if version is None else version + 1
+        keyboard = rating_keyboard("rate_game", game_id, user_num + 1, version)
+        await render.edit_screen(update, 
+            f"⭐ Оцените игру ({tenants.slot_name(user_num + 1)}):",
             reply_markup=keyboard
         )
     else:
-        await query.edit_message_text("✅ Оценка сохранена!")
-        query.data = f"game_{game_id}"
-        await game_detail(update, context)
+        await render.edit_screen(update, "✅ Оценка сохранена!")
+        await game_detail(update, context, game_id)
 
 
 async def game_delete(update: Update, context) -> None:
     """Удалить игру."""
     query = update.callback_query
-    await query.answer()
     
-    game_id = int(query.data.split("_")[-1])
+    game_id, version = details.item_version(callbacks.decode(query.data).args)
     game = database.get_game_by_id(game_id)
     
     if not game:
-        await query.edit_message_text("❌ Игра не найдена")
+        await query.answer()
+        await render.edit_screen(update, "❌ Игра не найдена")
         return
     
-    database.delete_game(game_id)
-    await query.edit_message_text(f"✅ Игра '{game['title']}' удалена!")
+    if not database.delete_game(game_id, version):
+        await _game_conflict(update, context, game_id)
+        return
+    await query.answer()
+    await render.edit_screen(update, f"✅ Игра '{game['title']}' удалена!")
     
-    back_callback = "games_pending" if game['status'] == 'pending' else "games_done"
-    if back_callback == "games_pending":
+    back_route = "games_pending" if game['status'] == 'pending' else "games_done"
+    if back_route == "games_pending":
         await games_pending_list(update, context)
     else:
         await games_done_list(update, context)
@@ -327,7 +364,7 @@ async def games_add_start(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("➕ Добавление игры\n\nВведите название игры:")
+    await render.edit_screen(update, "➕ Добавление игры\n\nВведите название игры:")
     return GAME_TITLE
 
 
@@ -374,26 +411,28 @@ async def games_add_cancel(update: Update, context) -> None:
 def register_handlers(application: Application) -> None:
     """Регистрация обработчиков раздела игры."""
     add_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(games_add_start, pattern="^games_add$")],
+        entry_points=[CallbackQueryHandler(games_add_start, pattern=callbacks.pattern("games_add"))],
         states={
             GAME_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, games_add_title)],
             GAME_NOTE: [MessageHandler(filters.TEXT, games_add_note)],
             GAME_GENRE: [MessageHandler(filters.TEXT, games_add_genre)]
         },
-        fallbacks=[CommandHandler("cancel", games_add_cancel)]
+        fallbacks=[CommandHandler("cancel", games_add_cancel)],
+        name="games_add",
+        persistent=True
     )
     
     application.add_handler(add_conv)
-    application.add_handler(CallbackQueryHandler(games_menu, pattern="^games_menu$"))
-    application.add_handler(CallbackQueryHandler(games_pending_menu, pattern="^games_pending$"))
-    application.add_handler(CallbackQueryHandler(games_pending_list, pattern="^games_pending_(all|genre_.+)$"))
-    application.add_handler(CallbackQueryHandler(game_detail, pattern="^game_\\d+$"))
-    application.add_handler(CallbackQueryHandler(games_done_menu, pattern="^games_done$"))
-    application.add_handler(CallbackQueryHandler(games_done_list, pattern="^games_done_all$"))
-    application.add_handler(CallbackQueryHandler(games_top_menu, pattern="^games_top$"))
-    application.add_handler(CallbackQueryHandler(games_top_show, pattern="^games_top_(all|user[12])$"))
-    application.add_handler(CallbackQueryHandler(games_random, pattern="^games_random$"))
-    application.add_handler(CallbackQueryHandler(game_done, pattern="^game_done_\\d+$"))
-    application.add_handler(CallbackQueryHandler(game_rating, pattern="^rate_game_"))
-    application.add_handler(CallbackQueryHandler(game_delete, pattern="^game_delete_\\d+$"))
+    application.add_handler(CallbackQueryHandler(games_menu, pattern=callbacks.pattern("games_menu")))
+    application.add_handler(CallbackQueryHandler(games_pending_menu, pattern=callbacks.pattern("games_pending")))
+    application.add_handler(CallbackQueryHandler(games_pending_list, pattern=callbacks.pattern("games_pending_all", "games_pending_genre")))
+    application.add_handler(CallbackQueryHandler(game_detail, pattern=callbacks.pattern("game")))
+    application.add_handler(CallbackQueryHandler(games_done_menu, pattern=callbacks.pattern("games_done")))
+    application.add_handler(CallbackQueryHandler(games_done_list, pattern=callbacks.pattern("games_done_all")))
+    application.add_handler(CallbackQueryHandler(games_top_menu, pattern=callbacks.pattern("games_top")))
+    application.add_handler(CallbackQueryHandler(games_top_show, pattern=callbacks.pattern("games_top_all", "games_top_user")))
+    application.add_handler(CallbackQueryHandler(games_random, pattern=callbacks.pattern("games_random")))
+    application.add_handler(CallbackQueryHandler(game_done, pattern=callbacks.pattern("game_done")))
+    application.add_handler(CallbackQueryHandler(game_rating, pattern=callbacks.pattern("rate_game", "rate_game_cancel")))
+    application.add_handler(CallbackQueryHandler(game_delete, pattern=callbacks.pattern("game_delete")))
 
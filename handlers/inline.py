@@ -0,0 +1,73 @@
+"""
+Inline-режим: @ForUsBot <текст> ищет фильмы, игры, поездки и активности
+по началу слов названия и отправляет карточку выбранной записи в любой чат.
+
+Поиск идет по индексу тенанта в памяти (search_index.py), без запросов к базе.
+Результаты отдаются страницами по RESULTS_PER_PAGE (next_offset),
+Telegram кеширует ответ на CACHE_TIME секунд для каждого пользователя
+(is_personal - списки доступны только авторизованным пользователям).
+"""
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.ext import Application, InlineQueryHandler
+
+import screens
+import search_index
+from handlers.activities import activity_text
+from handlers.games import game_text
+from handlers.movies import movie_text
+from handlers.trips import trip_text
+
+# Результатов на страницу (Telegram принимает не больше 50)
+RESULTS_PER_PAGE = 20
+# Сколько секунд Telegram может отдавать ответ из своего кеша.
+# Небольшое значение - чтобы новые записи появлялись в поиске почти сразу
+CACHE_TIME = 10
+
+# Таблица -> (значок и раздел, функция текста карточки, функция статуса)
+CARDS = {
+    "movies": ("🎬 Фильмы", movie_text,
+               lambda row: "✅ Просмотрен" if row['watched'] else "⏳ Ожидает просмотра"),
+    "games": ("🎮 Игры", game_text,
+              lambda row: "✅ Пройдена" if row['status'] == 'done' else "⏳ Ожидает прохождения"),
+    "trips": ("✈️ Поездки", trip_text,
+              lambda row: "✅ Посещено" if row['visited'] else "⏳ Не посещено"),
+    "activities": ("📝 Активности", activity_text,
+                   lambda row: "✅ Выполнено" if row['status'] == 'done' else "⏳ Планируется"),
+}
+
+
+def build_result(entry: search_index.Entry) -> InlineQueryResultArticle:
+    """Результат inline-запроса для записи индекса."""
+    section, card_text, status = CARDS[entry.table]
+    text = screens.truncate(card_text(entry.row), screens.MAX_MESSAGE_LENGTH)
+    return InlineQueryResultArticle(
+        id=f"{entry.table}_{entry.item_id}",
+        title=entry.row['title'],
+        description=f"{section} · {status(entry.row)}",
+        input_message_content=InputTextMessageContent(text, parse_mode=screens.PARSE_MODE),
+    )
+
+
+async def inline_search(update: Update, context) -> None:
+    """Ответ на inline-запрос: страница результатов поиска."""
+    query = update.inline_query
+    offset = int(query.offset) if query.offset.isdigit() else 0
+
+    entries, total = search_index.index().search(query.query, limit=offset + RESULTS_PER_PAGE)
+    page = entries[offset:]
+    next_offset = str(offset + RESULTS_PER_PAGE) if offset + RESULTS_PER_PAGE < total else ""
+
+    await query.answer(
+        [build_result(entry) for entry in page],
+        cache_time=CACHE_TIME,
+        is_personal=True,
+        next_offset=next_offset,
+    )
+
+
+def register_handlers(application: Application) -> None:
+    """Регистрация inline-режима: индекс тенанта по умолчанию строится сразу, остальные - при поиске."""
+    search_index.build()
+    search_index.install()
+    application.add_handler(InlineQueryHandler(inline_search))
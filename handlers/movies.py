@@ -2,11 +2,17 @@
 Обработчики для раздела "Фильмы".
 """
 
+from typing import Optional, Tuple
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler, filters
 import database
-import config
-from keyboards import list_keyboard, back_button, main_menu_button, rating_keyboard
+import callbacks
+import details
+import render
+import screens
+import tenants
+from keyboards import keyboard_factory, list_keyboard, back_button, main_menu_button, rating_keyboard
 
 
 # Состояния для ConversationHandler
@@ -14,41 +20,60 @@ MOVIE_TITLE, MOVIE_NOTE, MOVIE_CATEGORY = range(3)
 EDIT_MOVIE_TITLE, EDIT_MOVIE_NOTE = range(3, 5)
 RATING_USER1, RATING_USER2 = range(5, 7)
 
+# Шаблоны экранов
+DETAIL_HEADER = screens.Template("🎬 {title}\n\n")
+DETAIL_NOTE = screens.Template("📝 {note}\n\n")
+DETAIL_CATEGORY = screens.Template("📁 Категория: {category_title}\n")
+WATCHED_LINE = screens.Template("{n}. {title} - {avg:.1f}/10")
+TOP_LINE = screens.Template("{n}. {title} - {rating:.1f}/10")
 
-async def movies_menu(update: Update, context) -> None:
-    """Меню раздела фильмы."""
+
+@keyboard_factory()
+def movies_menu_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню раздела фильмы."""
     keyboard = [
-        [InlineKeyboardButton("📋 Ожидающие просмотра", callback_data="movies_pending")],
-        [InlineKeyboardButton("✅ Просмотренные", callback_data="movies_watched")],
-        [InlineKeyboardButton("🎲 Случайный фильм", callback_data="movies_random")],
-        [InlineKeyboardButton("➕ Добавить фильм", callback_data="movies_add")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        [InlineKeyboardButton("📋 Ожидающие просмотра", callback_data=callbacks.encode("movies_pending"))],
+        [InlineKeyboardButton("✅ Просмотренные", callback_data=callbacks.encode("movies_watched"))],
+        [InlineKeyboardButton("🎲 Случайный фильм", callback_data=callbacks.encode("movies_random"))],
+        [InlineKeyboardButton("➕ Добавить фильм", callback_data=callbacks.encode("movies_add"))],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def movies_menu(update: Update, context) -> None:
+    """Меню раздела фильмы."""
+    reply_markup = movies_menu_keyboard()
     
     if update.message:
         await update.message.reply_text("🎬 Раздел: Фильмы\n\nВыберите действие:", reply_markup=reply_markup)
     else:
-        await update.callback_query.edit_message_text("🎬 Раздел: Фильмы\n\nВыберите действие:", reply_markup=reply_markup)
+        await render.edit_screen(update, "🎬 Раздел: Фильмы\n\nВыберите действие:", reply_markup=reply_markup)
 
 
-async def movies_pending_menu(update: Update, context) -> None:
-    """Подменю ожидающих фильмов."""
-    query = update.callback_query
-    await query.answer()
-    
+@keyboard_factory("movie_categories")
+def movies_pending_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора категории ожидающих фильмов."""
     categories = database.get_movie_categories()
     keyboard = [
-        [InlineKeyboardButton("📋 Общий список", callback_data="movies_pending_all")]
+        [InlineKeyboardButton("📋 Общий список", callback_data=callbacks.encode("movies_pending_all"))]
     ]
     
     for cat in categories:
-        keyboard.append([InlineKeyboardButton(f"📁 {cat['title']}", callback_data=f"movies_pending_cat_{cat['id']}")])
+        keyboard.append([InlineKeyboardButton(f"📁 {cat['title']}", callback_data=callbacks.encode("movies_pending_cat", cat['id']))])
+    
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("movies_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def movies_pending_menu(update: Update, context) -> None:
+    """Подменю ожидающих фильмов."""
+    query = update.callback_query
+    await query.answer()
     
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="movies_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = movies_pending_keyboard()
     
-    await query.edit_message_text("📋 Ожидающие просмотра\n\nВыберите категорию:", reply_markup=reply_markup)
+    await render.edit_screen(update, "📋 Ожидающие просмотра\n\nВыберите категорию:", reply_markup=reply_markup)
 
 
 async def movies_pending_list(update: Update, context) -> None:
@@ -56,72 +81,85 @@ async def movies_pending_list(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    data = query.data
-    if data == "movies_pending_all":
+    callback = callbacks.decode(query.data)
+    if callback.route == "movies_pending_all":
         movies = database.get_movies(watched=0)
         category_id = None
     else:
-        category_id = int(data.split("_")[-1])
+        category_id = callback.args[0]
         movies = database.get_movies(watched=0, category_id=category_id)
     
+    text = screens.render_list("📋 Ожидающие просмотра", movies, screens.NUMBERED_TITLE)
     if not movies:
-        text = "📋 Список пуст"
         keyboard = back_button("movies_pending")
     else:
-        text = f"📋 Ожидающие просмотра ({len(movies)}):\n\n"
-        for i, movie in enumerate(movies[:10], 1):
-            text += f"{i}. {movie['title']}\n"
-        
-        if len(movies) > 10:
-            text += f"\n... и еще {len(movies) - 10}"
-        
         keyboard = list_keyboard(
             movies,
             page=0,
             items_per_page=10,
-            callback_prefix="movie_",
-            back_callback="movies_pending"
+            item_route="movie",
+            back_route="movies_pending"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
+
+
+def movie_text(movie) -> str:
+    """Текст карточки фильма (экран раздела и inline-режим)."""
+    parts = [
+        DETAIL_HEADER.render(movie),
+        DETAIL_NOTE.render(movie) if movie['note'] else None,
+        DETAIL_CATEGORY.render(movie),
+    ]
+    if movie['watched']:
+        parts.append("✅ Просмотрен\n")
+        if movie['rating_count']:
+            for row in database.get_ratings("movies", movie['id']):
+                name = tenants.member_name(row['user_id']) or "Пользователь"
+                parts.append(screens.RATING_LINE.render(name=name, rating=row['score']))
+    else:
+        parts.append("⏳ Ожидает просмотра\n")
+    return screens.render_detail(parts)
+
+
+def movie_card(movie) -> details.Card:
+    """Карточка фильма: текст и кнопки (запоминается в details)."""
+    movie_id, version = movie['id'], movie['version']
+    keyboard = []
+    if not movie['watched']:
+        keyboard.append([InlineKeyboardButton("✅ Просмотрен", callback_data=callbacks.encode("movie_watched", movie_id, version))])
+    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=callbacks.encode("movie_edit", movie_id))])
+    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=callbacks.encode("movie_delete", movie_id, version))])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("movies_pending"))])
+    return details.Card(movie_text(movie), InlineKeyboardMarkup(keyboard))
 
 
-async def movie_detail(update: Update, context) -> None:
+async def movie_detail(update: Update, context, movie_id: Optional[int] = None) -> None:
     """Детальный просмотр фильма."""
     query = update.callback_query
-    await query.answer()
     
-    movie_id = int(query.data.split("_")[1])
-    movie = database.get_movie_by_id(movie_id)
+    # Вызов из другого обработчика передает id явно (на callback уже ответили)
+    if movie_id is None:
+        await query.answer()
+        movie_id = callbacks.decode(query.data).args[0]
+    card = details.card("movies", movie_id, database.get_movie_by_id, movie_card)
     
-    if not movie:
-        await query.edit_message_text("❌ Фильм не найден")
+    if card is None:
+        await render.edit_screen(update, "❌ Фильм не найден")
         return
     
-    text = f"🎬 {movie['title']}\n\n"
-    if movie['note']:
-        text += f"📝 {movie['note']}\n\n"
-    text += f"📁 Категория: {movie['category_title']}\n"
-    
-    if movie['watched']:
-        text += f"✅ Просмотрен\n"
-        if movie['user1_rating']:
-            user1_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[0]) or "Пользователь 1"
-            text += f"⭐ {user1_name}: {movie['user1_rating']}/10\n"
-        if movie['user2_rating']:
-            user2_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[1]) or "Пользователь 2"
-            text += f"⭐ {user2_name}: {movie['user2_rating']}/10\n"
-    else:
-        text += "⏳ Ожидает просмотра\n"
-    
-    keyboard = []
-    if not movie['watched']:
-        keyboard.append([InlineKeyboardButton("✅ Просмотрен", callback_data=f"movie_watched_{movie_id}")])
-    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=f"movie_edit_{movie_id}")])
-    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=f"movie_delete_{movie_id}")])
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="movies_pending")])
-    
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await render.edit_screen(update, card.text, reply_markup=card.reply_markup)
+
+
+@keyboard_factory()
+def movies_watched_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню просмотренных фильмов."""
+    keyboard = [
+        [InlineKeyboardButton("📋 Общий список", callback_data=callbacks.encode("movies_watched_all"))],
+        [InlineKeyboardButton("🏆 Топ-10", callback_data=callbacks.encode("movies_top"))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("movies_menu"))]
+    ]
+    return InlineKeyboardMarkup(keyboard)
 
 
 async def movies_watched_menu(update: Update, context) -> None:
@@ -129,14 +167,16 @@ async def movies_watched_menu(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    keyboard = [
-        [InlineKeyboardButton("📋 Общий список", callback_data="movies_watched_all")],
-        [InlineKeyboardButton("🏆 Топ-10", callback_data="movies_top")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="movies_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = movies_watched_keyboard()
     
-    await query.edit_message_text("✅ Просмотренные\n\nВыберите действие:", reply_markup=reply_markup)
+    await render.edit_screen(update, "✅ Просмотренные\n\nВыберите действие:", reply_markup=reply_markup)
+
+
+def _watched_line(n: int, movie) -> str:
+    """Строка списка просмотренных: средняя оценка, если оценили все."""
+    if movie['rating_count'] and movie['rating_count'] >= len(tenants.members()):
+        return WATCHED_LINE.render(movie, n=n, avg=movie['rating_avg'])
+    return screens.NUMBERED_TITLE.render(movie, n=n)
 
 
 async def movies_watched_list(update: Update, context) -> None:
@@ -146,30 +186,29 @@ async def movies_watched_list(update: Update, context) -> None:
     
     movies = database.get_movies(watched=1)
     
+    text = screens.render_list("✅ Просмотренные", movies, _watched_line)
     if not movies:
-        text = "📋 Список пуст"
         keyboard = back_button("movies_watched")
     else:
-        text = f"✅ Просмотренные ({len(movies)}):\n\n"
-        for i, movie in enumerate(movies[:10], 1):
-            rating_text = ""
-            if movie['user1_rating'] and movie['user2_rating']:
-                avg = (movie['user1_rating'] + movie['user2_rating']) / 2
-                rating_text = f" - {avg:.1f}/10"
-            text += f"{i}. {movie['title']}{rating_text}\n"
-        
-        if len(movies) > 10:
-            text += f"\n... и еще {len(movies) - 10}"
-        
         keyboard = list_keyboard(
             movies,
             page=0,
             items_per_page=10,
-            callback_prefix="movie_",
-            back_callback="movies_watched"
+            item_route="movie",
+            back_route="movies_watched"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
+
+
+@keyboard_factory()
+def movies_top_keyboard(names: Tuple[str, ...]) -> InlineKeyboardMarkup:
+    """Клавиатура выбора топа: общий и личный для каждого пользователя."""
+    keyboard = [[InlineKeyboardButton("🏆 Общий топ", callback_data=callbacks.encode("movies_top_all"))]]
+    for slot, name in enumerate(names, 1):
+        keyboard.append([InlineKeyboardButton(f"⭐ {name}", callback_data=callbacks.encode("movies_top_user", slot))])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("movies_watched"))])
+    return InlineKeyboardMarkup(keyboard)
 
 
 async def movies_top_menu(update: Update, context) -> None:
@@ -177,19 +216,15 @@ async def movies_top_menu(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    user_ids = list(config.AUTHORIZED_USERS.keys())
-    user1_name = config.get_user_name(user_ids[0]) or "Пользователь 1"
-    user2_name = config.get_user_name(user_ids[1]) if len(user_ids) > 1 else "Пользователь 2"
+    reply_markup = movies_top_keyboard(tenants.names())
     
-    keyboard = [
-        [InlineKeyboardButton("🏆 Общий топ", callback_data="movies_top_all")],
-        [InlineKeyboardButton(f"⭐ {user1_name}", callback_data="movies_top_user1")],
-        [InlineKeyboardButton(f"⭐ {user2_name}", callback_data="movies_top_user2")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="movies_watched")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text("🏆 Топ-10 фильмов\n\nВыберите топ:", reply_markup=reply_markup)
+    await render.edit_screen(update, "🏆 Топ-10 фильмов\n\nВыберите топ:", reply_markup=reply_markup)
+
+
+def _top_line(n: int, movie) -> str:
+    """Строка топа: общий топ отдает avg_rating, личный - rating."""
+    rating = movie['avg_rating'] if 'avg_rating' in movie.keys() else movie['rating']
+    return TOP_LINE.render(movie, n=n, rating=rating)
 
 
 async def movies_top_show(update: Update, context) -> None:
@@ -197,34 +232,21 @@ async def movies_top_show(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    data = query.data
-    if data == "movies_top_all":
-        movies = database.get_movies_top(limit=10, user_num=None)
+    callback = callbacks.decode(query.data)
+    if callback.route == "movies_top_all":
+        # Общий топ - записи, которые оценили все пользователи
+        movies = database.get_movies_top(limit=10, min_votes=len(tenants.members()))
         title = "🏆 Общий топ-10:"
-    elif data == "movies_top_user1":
-        movies = database.get_movies_top(limit=10, user_num=1)
-        user1_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[0]) or "Пользователь 1"
-        title = f"⭐ Топ-10 {user1_name}:"
     else:
-        movies = database.get_movies_top(limit=10, user_num=2)
-        user_ids = list(config.AUTHORIZED_USERS.keys())
-        user2_name = config.get_user_name(user_ids[1]) if len(user_ids) > 1 else "Пользователь 2"
-        title = f"⭐ Топ-10 {user2_name}:"
+        slot = callback.args[0]
+        user_id = tenants.slot_user(slot)
+        movies = database.get_movies_top(limit=10, user_id=user_id) if user_id is not None else []
+        title = f"⭐ Топ-10 {tenants.slot_name(slot)}:"
     
-    if not movies:
-        text = "📋 Топ пуст"
-    else:
-        text = f"{title}\n\n"
-        for i, movie in enumerate(movies, 1):
-            # Проверяем наличие ключа в Row объекте
-            if 'avg_rating' in dict(movie):
-                rating = movie['avg_rating']
-            else:
-                rating = movie['rating']
-            text += f"{i}. {movie['title']} - {rating:.1f}/10\n"
+    text = screens.render_list(title, movies, _top_line, empty_text="📋 Топ пуст", limit=None, show_count=False)
     
     keyboard = back_button("movies_top")
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
 async def movies_random(update: Update, context) -> None:
@@ -235,13 +257,12 @@ async def movies_random(update: Update, context) -> None:
     movie = database.get_random_movie(exclude_series=True)
     
     if not movie:
-        await query.edit_message_text("❌ Нет доступных фильмов")
+        await render.edit_screen(update, "❌ Нет доступных фильмов")
         return
     
     # Используем функцию детального просмотра
     context.user_data['current_movie_id'] = movie['id']
-    query.data = f"movie_{movie['id']}"
-    await movie_detail(update, context)
+    await movie_detail(update, context, movie['id'])
 
 
 async def movies_add_start(update: Update, context) -> None:
@@ -249,7 +270,7 @@ async def movies_add_start(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("➕ Добавление фильма\n\nВведите название фильма:")
+    await render.edit_screen(update, "➕ Добавление фильма\n\nВведите название фильма:")
     return MOVIE_TITLE
 
 
@@ -265,22 +286,27 @@ async def movies_add_title(update: Update, context) -> None:
     return MOVIE_NOTE
 
 
+@keyboard_factory("movie_categories")
+def movie_category_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора категории нового фильма."""
+    categories = database.get_movie_categories()
+    keyboard = []
+    for cat in categories:
+        keyboard.append([InlineKeyboardButton(cat['title'], callback_data=callbacks.encode("movie_cat", cat['id']))])
+    keyboard.append([InlineKeyboardButton("➕ Создать новую категорию", callback_data=callbacks.encode("movie_cat_new"))])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=callbacks.encode("movies_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
 async def movies_add_note(update: Update, context) -> None:
     """Обработка примечания фильма."""
     note = update.message.text.strip() if update.message.text != "/skip" else None
     context.user_data['movie_note'] = note
     
     # Показываем категории
-    categories = database.get_movie_categories()
-    keyboard = []
-    for cat in categories:
-        keyboard.append([InlineKeyboardButton(cat['title'], callback_data=f"movie_cat_{cat['id']}")])
-    keyboard.append([InlineKeyboardButton("➕ Создать новую категорию", callback_data="movie_cat_new")])
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="movies_menu")])
-    
     await update.message.reply_text(
         "📁 Выберите категорию:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=movie_category_keyboard()
     )
     return MOVIE_CATEGORY
 
@@ -290,18 +316,19 @@ async def movies_add_category(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    if query.data == "movie_cat_new":
-        await query.edit_message_text("📁 Введите название новой категории:")
+    callback = callbacks.decode(query.data)
+    if callback.route == "movie_cat_new":
+        await render.edit_screen(update, "📁 Введите название новой категории:")
         context.user_data['movie_waiting_new_category'] = True
         return MOVIE_CATEGORY
     
-    category_id = int(query.data.split("_")[-1])
+    category_id = callback.args[0]
     title = context.user_data['movie_title']
     note = context.user_data.get('movie_note')
     
     movie_id = database.create_movie(title, note, category_id)
     
-    await query.edit_message_text(f"✅ Фильм '{title}' добавлен!")
+    await render.edit_screen(update, f"✅ Фильм '{title}' добавлен!")
     await movies_menu(update, context)
     return ConversationHandler.END
 
@@ -336,23 +363,29 @@ async def movies_add_cancel(update: Update, context) -> None:
     return ConversationHandler.END
 
 
+async def _movie_conflict(update: Update, context, movie_id: int) -> None:
+    """Фильм изменили, пока карточка была открыта: показываем актуальную."""
+    await update.callback_query.answer(details.CONFLICT_NOTICE)
+    await movie_detail(update, context, movie_id)
+
+
 async def movie_watched(update: Update, context) -> None:
     """Отметить фильм как просмотренный."""
     query = update.callback_query
-    await query.answer()
     
-    movie_id = int(query.data.split("_")[-1])
-    database.mark_movie_watched(movie_id)
-    
-    # Начинаем процесс оценки
-    context.user_data['rating_movie_id'] = movie_id
-    context.user_data['rating_user'] = 1
+    movie_id, version = details.item_version(callbacks.decode(query.data).args)
+    if not database.mark_movie_watched(movie_id, version):
+        await _movie_conflict(update, context, movie_id)
+        return
+    await query.answer()
     
-    user1_name = config.get_user_name(list(config.AUTHORIZED_USERS.keys())[0]) or "Пользователь 1"
-    keyboard = rating_keyboard("rate_movie_", movie_id, 1)
+    # Начинаем процесс оценки: шаг (чья оценка) и версия фильма - в кнопках,
+    # оценка не запишется поверх изменений партнера
+    version = None if version is None else version + 1
+    keyboard = rating_keyboard("rate_movie", movie_id, 1, version)
     
-    await query.edit_message_text(
-        f"⭐ Оцените фильм ({user1_name}):",
+    await render.edit_screen(update, 
+        f"⭐ Оцените фильм ({tenants.slot_name(1)}):",
         reply_markup=keyboard
     )
 
@@ -360,62 +393,68 @@ async def movie_watched(update: Update, context) -> None:
 async def movie_rating(update: Update, context) -> None:
     """Обработка оценки фильма."""
     query = update.callback_query
-    await query.answer()
     
-    if "cancel" in query.data:
-        await query.edit_message_text("❌ Оценка отменена")
+    callback = callbacks.decode(query.data)
+    if callback.route == "rate_movie_cancel":
+        await query.answer()
+        await render.edit_screen(update, "❌ Оценка отменена")
         return
     
-    parts = query.data.split("_")
-    movie_id = int(parts[2])
-    user_num = int(parts[3].replace("user", ""))
-    rating = int(parts[4])
-    
-    database.set_movie_rating(movie_id, user_num, rating)
-    
-    # Проверяем, нужно ли оценить второму пользователю
-    user_ids = list(config.AUTHORIZED_USERS.keys())
-    if len(user_ids) > 1 and user_num == 1:
-        user2_name = config.get_user_name(user_ids[1]) or "Пользователь 2"
-        context.user_data['rating_user'] = 2
-        keyboard = rating_keyboard("rate_movie_", movie_id, 2)
-        await query.edit_message_text(
-            f"⭐ Оцените фильм ({user2_name}):",
+    movie_id, user_num, rating = callback.args[:3]
+    version = callback.args[3] if len(callback.args) > 3 else None
+    
+    user_id = tenants.slot_user(user_num)
+    if user_id is None:
+        await query.answer()
+        await render.edit_screen(update, "❌ Пользователь не найден")
+        return
+    if not database.set_movie_rating(movie_id, user_id, rating, version):
+        await _movie_conflict(update, context, movie_id)
+        return
+    await query.answer()
+    
+    # Проверяем, нужно ли оценить следующему пользователю
+    if user_num < len(tenants.members()):
+        version = None if version is None else version + 1
+        keyboard = rating_keyboard("rate_movie", movie_id, user_num + 1, version)
+        await render.edit_screen(update, 
+            f"⭐ Оцените фильм ({tenants.slot_name(user_num + 1)}):",
             reply_markup=keyboard
         )
     else:
-        await query.edit_message_text("✅ Оценка сохранена!")
+        await render.edit_screen(update, "✅ Оценка сохранена!")
         # Показываем детальный просмотр
-        query.data = f"movie_{movie_id}"
-        await movie_detail(update, context)
+        await movie_detail(update, context, movie_id)
 
 
 def register_handlers(application: Application) -> None:
     """Регистрация обработчиков раздела фильмы."""
     # ConversationHandler для добавления фильма
     add_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(movies_add_start, pattern="^movies_add$")],
+        entry_points=[CallbackQueryHandler(movies_add_start, pattern=callbacks.pattern("movies_add"))],
         states={
             MOVIE_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, movies_add_title)],
             MOVIE_NOTE: [MessageHandler(filters.TEXT, movies_add_note)],
             MOVIE_CATEGORY: [
-                CallbackQueryHandler(movies_add_category, pattern="^movie_cat_\\d+$"),
+                CallbackQueryHandler(movies_add_category, pattern=callbacks.pattern("movie_cat", "movie_cat_new")),
                 MessageHandler(filters.TEXT, movies_add_new_category)
             ]
         },
-        fallbacks=[CommandHandler("cancel", movies_add_cancel)]
+        fallbacks=[CommandHandler("cancel", movies_add_cancel)],
+        name="movies_add",
+        persistent=True
     )
     
     application.add_handler(add_conv)
-    application.add_handler(CallbackQueryHandler(movies_menu, pattern="^movies_menu$"))
-    application.add_handler(CallbackQueryHandler(movies_pending_menu, pattern="^movies_pending$"))
-    application.add_handler(CallbackQueryHandler(movies_pending_list, pattern="^movies_pending_(all|cat_\\d+)$"))
-    application.add_handler(CallbackQueryHandler(movie_detail, pattern="^movie_\\d+$"))
-    application.add_handler(CallbackQueryHandler(movies_watched_menu, pattern="^movies_watched$"))
-    application.add_handler(CallbackQueryHandler(movies_watched_list, pattern="^movies_watched_all$"))
-    application.add_handler(CallbackQueryHandler(movies_top_menu, pattern="^movies_top$"))
-    application.add_handler(CallbackQueryHandler(movies_top_show, pattern="^movies_top_(all|user[12])$"))
-    application.add_handler(CallbackQueryHandler(movies_random, pattern="^movies_random$"))
-    application.add_handler(CallbackQueryHandler(movie_watched, pattern="^movie_watched_\\d+$"))
-    application.add_handler(CallbackQueryHandler(movie_rating, pattern="^rate_movie_"))
+    application.add_handler(CallbackQueryHandler(movies_menu, pattern=callbacks.pattern("movies_menu")))
+    application.add_handler(CallbackQueryHandler(movies_pending_menu, pattern=callbacks.pattern("movies_pending")))
+    application.add_handler(CallbackQueryHandler(movies_pending_list, pattern=callbacks.pattern("movies_pending_all", "movies_pending_cat")))
+    application.add_handler(CallbackQueryHandler(movie_detail, pattern=callbacks.pattern("movie")))
+    application.add_handler(CallbackQueryHandler(movies_watched_menu, pattern=callbacks.pattern("movies_watched")))
+    application.add_handler(CallbackQueryHandler(movies_watched_list, pattern=callbacks.pattern("movies_watched_all")))
+    application.add_handler(CallbackQueryHandler(movies_top_menu, pattern=callbacks.pattern("movies_top")))
+    application.add_handler(CallbackQueryHandler(movies_top_show, pattern=callbacks.pattern("movies_top_all", "movies_top_user")))
+    application.add_handler(CallbackQueryHandler(movies_random, pattern=callbacks.pattern("movies_random")))
+    application.add_handler(CallbackQueryHandler(movie_watched, pattern=callbacks.pattern("movie_watched")))
+    application.add_handler(CallbackQueryHandler(movie_rating, pattern=callbacks.pattern("rate_movie", "rate_movie_cancel")))
 
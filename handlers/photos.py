@@ -1,32 +1,59 @@
 """
 Обработчики для раздела "Фотографии".
+
+В категорию можно загрузить фотографии (в том числе альбомами): хранятся
+только их file_id, повтор того же фото (по file_unique_id) пропускается.
+Просмотр - страницы по ALBUM_PAGE_SIZE фото одним альбомом (sendMediaGroup)
+и сообщение с кнопками листания под ним. Кнопки несут id первой/последней
+фотографии страницы, поэтому страница выбирается по индексу (keyset),
+а не через OFFSET.
 """
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler, filters
 import database
-from keyboards import list_keyboard, back_button
+import callbacks
+import render
+import screens
+from keyboards import keyboard_factory, list_keyboard, back_button
 
 PHOTO_TITLE, PHOTO_LINK, PHOTO_DESC = range(3)
 EDIT_PHOTO_TITLE, EDIT_PHOTO_LINK, EDIT_PHOTO_DESC = range(3, 6)
+PHOTO_UPLOAD = 6
 
+# Фотографий на странице альбома (ограничение Telegram на sendMediaGroup)
+ALBUM_PAGE_SIZE = render.MEDIA_GROUP_SIZE
 
-async def photos_menu(update: Update, context) -> None:
-    """Меню раздела фотографии."""
+# Шаблоны экранов
+DETAIL_HEADER = screens.Template("📸 {title}\n\n")
+DETAIL_LINK = screens.Template("🔗 Ссылка: {link}\n\n")
+DETAIL_DESCRIPTION = screens.Template("📝 {description}\n")
+DETAIL_PHOTOS = screens.Template("🖼 Фотографий: {count}\n")
+ALBUM_HEADER = screens.Template("🖼 {title}: фотографии")
+ALBUM_CONTROLS = screens.Template("🖼 {title}: всего {count} фото")
+
+
+@keyboard_factory("photo_categories")
+def photos_menu_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню раздела фотографии (список - если есть категории)."""
     categories = database.get_photo_categories()
     
     keyboard = []
     if categories:
-        keyboard.append([InlineKeyboardButton("📋 Список категорий", callback_data="photos_list")])
-    keyboard.append([InlineKeyboardButton("➕ Добавить категорию", callback_data="photos_add")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        keyboard.append([InlineKeyboardButton("📋 Список категорий", callback_data=callbacks.encode("photos_list"))])
+    keyboard.append([InlineKeyboardButton("➕ Добавить категорию", callback_data=callbacks.encode("photos_add"))])
+    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def photos_menu(update: Update, context) -> None:
+    """Меню раздела фотографии."""
+    reply_markup = photos_menu_keyboard()
     
     if update.message:
         await update.message.reply_text("📸 Раздел: Фотографии\n\nВыберите действие:", reply_markup=reply_markup)
     else:
-        await update.callback_query.edit_message_text("📸 Раздел: Фотографии\n\nВыберите действие:", reply_markup=reply_markup)
+        await render.edit_screen(update, "📸 Раздел: Фотографии\n\nВыберите действие:", reply_markup=reply_markup)
 
 
 async def photos_list(update: Update, context) -> None:
@@ -36,26 +63,19 @@ async def photos_list(update: Update, context) -> None:
     
     categories = database.get_photo_categories()
     
+    text = screens.render_list("📸 Категории фотографий", categories, screens.NUMBERED_TITLE)
     if not categories:
-        text = "📋 Список пуст"
         keyboard = back_button("photos_menu")
     else:
-        text = f"📸 Категории фотографий ({len(categories)}):\n\n"
-        for i, cat in enumerate(categories[:10], 1):
-            text += f"{i}. {cat['title']}\n"
-        
-        if len(categories) > 10:
-            text += f"\n... и еще {len(categories) - 10}"
-        
         keyboard = list_keyboard(
             categories,
             page=0,
             items_per_page=10,
-            callback_prefix="photo_cat_",
-            back_callback="photos_menu"
+            item_route="photo_cat",
+            back_route="photos_menu"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
 async def photo_category_detail(update: Update, context) -> None:
@@ -63,26 +83,138 @@ async def photo_category_detail(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    category_id = int(query.data.split("_")[-1])
+    category_id = callbacks.decode(query.data).args[0]
     category = database.get_photo_category_by_id(category_id)
     
     if not category:
-        await query.edit_message_text("❌ Категория не найдена")
+        await render.edit_screen(update, "❌ Категория не найдена")
         return
     
-    text = f"📸 {category['title']}\n\n"
-    if category['link']:
-        text += f"🔗 Ссылка: {category['link']}\n\n"
-    if category['description']:
-        text += f"📝 {category['description']}\n"
+    photos_count = database.count_photos(category_id)
+    text = screens.render_detail([
+        DETAIL_HEADER.render(category),
+        DETAIL_LINK.render(category) if category['link'] else None,
+        DETAIL_DESCRIPTION.render(category) if category['description'] else None,
+        DETAIL_PHOTOS.render(count=photos_count) if photos_count else None,
+    ])
     
-    keyboard = [
-        [InlineKeyboardButton("✏️ Редактировать", callback_data=f"photo_cat_edit_{category_id}")],
-        [InlineKeyboardButton("🗑 Удалить", callback_data=f"photo_cat_delete_{category_id}")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="photos_list")]
+    keyboard = []
+    if photos_count:
+        keyboard.append([InlineKeyboardButton("🖼 Смотреть фото", callback_data=callbacks.encode("photo_album", category_id, 0))])
+    keyboard += [
+        [InlineKeyboardButton("📤 Загрузить фото", callback_data=callbacks.encode("photo_upload", category_id))],
+        [InlineKeyboardButton("✏️ Редактировать", callback_data=callbacks.encode("photo_cat_edit", category_id))],
+        [InlineKeyboardButton("🗑 Удалить", callback_data=callbacks.encode("photo_cat_delete", category_id))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("photos_list"))]
     ]
     
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await render.edit_screen(update, text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def photo_album(update: Update, context) -> None:
+    """
+    Страница фотографий категории: альбом и кнопки листания под ним.
+
+    Кнопки: photo_album(category_id, after_id) - страница после фото after_id
+    (0 - первая), photo_album_prev(category_id, before_id) - страница перед фото before_id.
+    """
+    query = update.callback_query
+    await query.answer()
+    
+    callback = callbacks.decode(query.data)
+    category_id, anchor = callback.args
+    category = database.get_photo_category_by_id(category_id)
+    
+    if not category:
+        await render.edit_screen(update, "❌ Категория не найдена")
+        return
+    
+    # Лишняя фотография в выборке показывает, есть ли страница дальше в том же направлении
+    if callback.route == "photo_album_prev":
+        photos = database.get_photos(category_id, before_id=anchor, limit=ALBUM_PAGE_SIZE + 1)
+        has_prev, has_next = len(photos) > ALBUM_PAGE_SIZE, True
+        photos = photos[-ALBUM_PAGE_SIZE:]
+    else:
+        photos = database.get_photos(category_id, after_id=anchor, limit=ALBUM_PAGE_SIZE + 1)
+        has_prev, has_next = anchor > 0, len(photos) > ALBUM_PAGE_SIZE
+        photos = photos[:ALBUM_PAGE_SIZE]
+    
+    if not photos:
+        await render.edit_screen(update, "📭 В категории нет фотографий", reply_markup=back_button("photo_cat", category_id))
+        return
+    
+    nav_buttons = []
+    if has_prev:
+        nav_buttons.append(InlineKeyboardButton("◀️", callback_data=callbacks.encode("photo_album_prev", category_id, photos[0]['id'])))
+    if has_next:
+        nav_buttons.append(InlineKeyboardButton("▶️", callback_data=callbacks.encode("photo_album", category_id, photos[-1]['id'])))
+    keyboard = [nav_buttons] if nav_buttons else []
+    keyboard.append([InlineKeyboardButton("◀️ К категории", callback_data=callbacks.encode("photo_cat", category_id))])
+    
+    # Кнопки переезжают под новый альбом: на прежнем сообщении остается только заголовок
+    await render.edit_screen(update, ALBUM_HEADER.render(category))
+    await render.send_photos(update, [(photo['file_id'], photo['file_unique_id'], None) for photo in photos])
+    await render.send_screen(
+        update,
+        ALBUM_CONTROLS.render(category, count=database.count_photos(category_id)),
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def photo_upload_start(update: Update, context) -> None:
+    """Начало загрузки фотографий в категорию."""
+    query = update.callback_query
+    await query.answer()
+    
+    category_id = callbacks.decode(query.data).args[0]
+    category = database.get_photo_category_by_id(category_id)
+    
+    if not category:
+        await render.edit_screen(update, "❌ Категория не найдена")
+        return ConversationHandler.END
+    
+    context.user_data['photo_upload'] = {'category_id': category_id, 'added': 0, 'duplicates': 0}
+    await render.edit_screen(
+        update,
+        f"📤 Загрузка в категорию '{category['title']}'\n\n"
+        "Отправьте фотографии (можно альбомами). Когда закончите - /done"
+    )
+    return PHOTO_UPLOAD
+
+
+async def photo_upload_add(update: Update, context) -> None:
+    """Обработка одной фотографии (фото из альбома приходят отдельными сообщениями)."""
+    upload = context.user_data['photo_upload']
+    # Самый большой из размеров, которые прислал Telegram
+    photo = update.message.photo[-1]
+    
+    if database.add_photo(upload['category_id'], photo.file_id, photo.file_unique_id) is None:
+        upload['duplicates'] += 1
+    else:
+        database.cache_media(photo.file_unique_id, photo.file_id, file_size=photo.file_size)
+        upload['added'] += 1
+    return PHOTO_UPLOAD
+
+
+async def photo_upload_document(update: Update, context) -> None:
+    """
+    Изображение, отправленное файлом: альбомы отправляются sendMediaGroup с
+    InputMediaPhoto, а file_id документа Telegram как фото не принимает.
+    """
+    await update.message.reply_text("⚠️ Отправьте изображение как фото (со сжатием), а не файлом")
+    return PHOTO_UPLOAD
+
+
+async def photo_upload_done(update: Update, context) -> None:
+    """Завершение загрузки фотографий."""
+    upload = context.user_data.pop('photo_upload', None) or {'added': 0, 'duplicates': 0}
+    
+    text = f"✅ Добавлено фотографий: {upload['added']}"
+    if upload['duplicates']:
+        text += f"\n⚠️ Уже были в категории: {upload['duplicates']}"
+    await update.message.reply_text(text)
+    await photos_menu(update, context)
+    return ConversationHandler.END
 
 
 async def photo_category_delete(update: Update, context) -> None:
@@ -90,15 +222,15 @@ async def photo_category_delete(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    category_id = int(query.data.split("_")[-1])
+    category_id = callbacks.decode(query.data).args[0]
     category = database.get_photo_category_by_id(category_id)
     
     if not category:
-        await query.edit_message_text("❌ Категория не найдена")
+        await render.edit_screen(update, "❌ Категория не найдена")
         return
     
     database.delete_photo_category(category_id)
-    await query.edit_message_text(f"✅ Категория '{category['title']}' удалена!")
+    await render.edit_screen(update, f"✅ Категория '{category['title']}' удалена!")
     await photos_list(update, context)
 
 
@@ -107,7 +239,7 @@ async def photos_add_start(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("➕ Добавление категории\n\nВведите название категории:")
+    await render.edit_screen(update, "➕ Добавление категории\n\nВведите название категории:")
     return PHOTO_TITLE
 
 
@@ -154,18 +286,35 @@ async def photos_add_cancel(update: Update, context) -> None:
 def register_handlers(application: Application) -> None:
     """Регистрация обработчиков раздела фотографии."""
     add_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(photos_add_start, pattern="^photos_add$")],
+        entry_points=[CallbackQueryHandler(photos_add_start, pattern=callbacks.pattern("photos_add"))],
         states={
             PHOTO_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, photos_add_title)],
             PHOTO_LINK: [MessageHandler(filters.TEXT, photos_add_link)],
             PHOTO_DESC: [MessageHandler(filters.TEXT, photos_add_desc)]
         },
-        fallbacks=[CommandHandler("cancel", photos_add_cancel)]
+        fallbacks=[CommandHandler("cancel", photos_add_cancel)],
+        name="photos_add",
+        persistent=True
+    )
+    
+    upload_conv = ConversationHandler(
+        entry_points=[CallbackQueryHandler(photo_upload_start, pattern=callbacks.pattern("photo_upload"))],
+        states={
+            PHOTO_UPLOAD: [
+                MessageHandler(filters.PHOTO, photo_upload_add),
+                MessageHandler(filters.Document.IMAGE, photo_upload_document)
+            ]
+        },
+        fallbacks=[CommandHandler("done", photo_upload_done), CommandHandler("cancel", photo_upload_done)],
+        name="photos_upload",
+        persistent=True
     )
     
     application.add_handler(add_conv)
-    application.add_handler(CallbackQueryHandler(photos_menu, pattern="^photos_menu$"))
-    application.add_handler(CallbackQueryHandler(photos_list, pattern="^photos_list$"))
-    application.add_handler(CallbackQueryHandler(photo_category_detail, pattern="^photo_cat_\\d+$"))
-    application.add_handler(CallbackQueryHandler(photo_category_delete, pattern="^photo_cat_delete_\\d+$"))
+    application.add_handler(upload_conv)
+    application.add_handler(CallbackQueryHandler(photos_menu, pattern=callbacks.pattern("photos_menu")))
+    application.add_handler(CallbackQueryHandler(photos_list, pattern=callbacks.pattern("photos_list")))
+    application.add_handler(CallbackQueryHandler(photo_category_detail, pattern=callbacks.pattern("photo_cat")))
+    application.add_handler(CallbackQueryHandler(photo_category_delete, pattern=callbacks.pattern("photo_cat_delete")))
+    application.add_handler(CallbackQueryHandler(photo_album, pattern=callbacks.pattern("photo_album", "photo_album_prev")))
 
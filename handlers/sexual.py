@@ -3,30 +3,43 @@
 """
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler, filters
 import database
-from keyboards import list_keyboard, back_button
+import callbacks
+import render
+import screens
+from keyboards import keyboard_factory, list_keyboard, back_button
 
 SEXUAL_TITLE, SEXUAL_LINK, SEXUAL_DESC = range(3)
 EDIT_SEXUAL_TITLE, EDIT_SEXUAL_LINK, EDIT_SEXUAL_DESC = range(3, 6)
 
+# Шаблоны экранов
+DETAIL_HEADER = screens.Template("🔞 {title}\n\n")
+DETAIL_LINK = screens.Template("🔗 {link}\n\n")
+DETAIL_DESCRIPTION = screens.Template("📝 {description}\n")
 
-async def sexual_menu(update: Update, context) -> None:
-    """Меню раздела sexual."""
+
+@keyboard_factory("sexual")
+def sexual_menu_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню раздела sexual (список - если есть записи)."""
     items = database.get_sexual_items()
     
     keyboard = []
     if items:
-        keyboard.append([InlineKeyboardButton("📋 Список", callback_data="sexual_list")])
-    keyboard.append([InlineKeyboardButton("➕ Добавить", callback_data="sexual_add")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        keyboard.append([InlineKeyboardButton("📋 Список", callback_data=callbacks.encode("sexual_list"))])
+    keyboard.append([InlineKeyboardButton("➕ Добавить", callback_data=callbacks.encode("sexual_add"))])
+    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def sexual_menu(update: Update, context) -> None:
+    """Меню раздела sexual."""
+    reply_markup = sexual_menu_keyboard()
     
     if update.message:
         await update.message.reply_text("🔞 Раздел: Sexual\n\nВыберите действие:", reply_markup=reply_markup)
     else:
-        await update.callback_query.edit_message_text("🔞 Раздел: Sexual\n\nВыберите действие:", reply_markup=reply_markup)
+        await render.edit_screen(update, "🔞 Раздел: Sexual\n\nВыберите действие:", reply_markup=reply_markup)
 
 
 async def sexual_list(update: Update, context) -> None:
@@ -36,26 +49,19 @@ async def sexual_list(update: Update, context) -> None:
     
     items = database.get_sexual_items()
     
+    text = screens.render_list("🔞 Записи", items, screens.NUMBERED_TITLE)
     if not items:
-        text = "📋 Список пуст"
         keyboard = back_button("sexual_menu")
     else:
-        text = f"🔞 Записи ({len(items)}):\n\n"
-        for i, item in enumerate(items[:10], 1):
-            text += f"{i}. {item['title']}\n"
-        
-        if len(items) > 10:
-            text += f"\n... и еще {len(items) - 10}"
-        
         keyboard = list_keyboard(
             items,
             page=0,
             items_per_page=10,
-            callback_prefix="sexual_",
-            back_callback="sexual_menu"
+            item_route="sexual",
+            back_route="sexual_menu"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
 async def sexual_detail(update: Update, context) -> None:
@@ -63,26 +69,26 @@ async def sexual_detail(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    item_id = int(query.data.split("_")[1])
+    item_id = callbacks.decode(query.data).args[0]
     item = database.get_sexual_item_by_id(item_id)
     
     if not item:
-        await query.edit_message_text("❌ Запись не найдена")
+        await render.edit_screen(update, "❌ Запись не найдена")
         return
     
-    text = f"🔞 {item['title']}\n\n"
-    if item['link']:
-        text += f"🔗 {item['link']}\n\n"
-    if item['description']:
-        text += f"📝 {item['description']}\n"
+    text = screens.render_detail([
+        DETAIL_HEADER.render(item),
+        DETAIL_LINK.render(item) if item['link'] else None,
+        DETAIL_DESCRIPTION.render(item) if item['description'] else None,
+    ])
     
     keyboard = [
-        [InlineKeyboardButton("✏️ Редактировать", callback_data=f"sexual_edit_{item_id}")],
-        [InlineKeyboardButton("🗑 Удалить", callback_data=f"sexual_delete_{item_id}")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="sexual_list")]
+        [InlineKeyboardButton("✏️ Редактировать", callback_data=callbacks.encode("sexual_edit", item_id))],
+        [InlineKeyboardButton("🗑 Удалить", callback_data=callbacks.encode("sexual_delete", item_id))],
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("sexual_list"))]
     ]
     
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await render.edit_screen(update, text, reply_markup=InlineKeyboardMarkup(keyboard))
 
 
 async def sexual_delete(update: Update, context) -> None:
@@ -90,15 +96,15 @@ async def sexual_delete(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    item_id = int(query.data.split("_")[-1])
+    item_id = callbacks.decode(query.data).args[0]
     item = database.get_sexual_item_by_id(item_id)
     
     if not item:
-        await query.edit_message_text("❌ Запись не найдена")
+        await render.edit_screen(update, "❌ Запись не найдена")
         return
     
     database.delete_sexual_item(item_id)
-    await query.edit_message_text(f"✅ Запись '{item['title']}' удалена!")
+    await render.edit_screen(update, f"✅ Запись '{item['title']}' удалена!")
     await sexual_list(update, context)
 
 
@@ -107,7 +113,7 @@ async def sexual_add_start(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("➕ Добавление записи\n\nВведите название:")
+    await render.edit_screen(update, "➕ Добавление записи\n\nВведите название:")
     return SEXUAL_TITLE
 
 
@@ -154,18 +160,20 @@ async def sexual_add_cancel(update: Update, context) -> None:
 def register_handlers(application: Application) -> None:
     """Регистрация обработчиков раздела sexual."""
     add_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(sexual_add_start, pattern="^sexual_add$")],
+        entry_points=[CallbackQueryHandler(sexual_add_start, pattern=callbacks.pattern("sexual_add"))],
         states={
             SEXUAL_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, sexual_add_title)],
             SEXUAL_LINK: [MessageHandler(filters.TEXT, sexual_add_link)],
             SEXUAL_DESC: [MessageHandler(filters.TEXT, sexual_add_desc)]
         },
-        fallbacks=[CommandHandler("cancel", sexual_add_cancel)]
+        fallbacks=[CommandHandler("cancel", sexual_add_cancel)],
+        name="sexual_add",
+        persistent=True
     )
     
     application.add_handler(add_conv)
-    application.add_handler(CallbackQueryHandler(sexual_menu, pattern="^sexual_menu$"))
-    application.add_handler(CallbackQueryHandler(sexual_list, pattern="^sexual_list$"))
-    application.add_handler(CallbackQueryHandler(sexual_detail, pattern="^sexual_\\d+$"))
-    application.add_handler(CallbackQueryHandler(sexual_delete, pattern="^sexual_delete_\\d+$"))
+    application.add_handler(CallbackQueryHandler(sexual_menu, pattern=callbacks.pattern("sexual_menu")))
+    application.add_handler(CallbackQueryHandler(sexual_list, pattern=callbacks.pattern("sexual_list")))
+    application.add_handler(CallbackQueryHandler(sexual_detail, pattern=callbacks.pattern("sexual")))
+    application.add_handler(CallbackQueryHandler(sexual_delete, pattern=callbacks.pattern("sexual_delete")))
 
@@ -1,29 +1,47 @@
 """
 Обработчики для раздела "Тренды TikTok".
+
+Видео трендов отправляются по file_id без повторной загрузки. Загруженные
+видео запоминаются в media_cache по file_unique_id - так при добавлении
+видно, что это видео уже прикреплено к другому тренду. "Смотреть все"
+отправляет видео трендов, которые надо снять, альбомами по 10.
 """
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler, filters
 import database
-from keyboards import list_keyboard, back_button
+import callbacks
+import render
+import screens
+from keyboards import keyboard_factory, list_keyboard, back_button
 
 TIKTOK_TITLE, TIKTOK_VIDEO = range(2)
 
+# Шаблоны экранов
+DETAIL_HEADER = screens.Template("🎵 {title}\n\n")
 
-async def tiktok_menu(update: Update, context) -> None:
-    """Меню раздела TikTok."""
+
+@keyboard_factory()
+def tiktok_menu_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню раздела TikTok."""
     keyboard = [
-        [InlineKeyboardButton("📋 Надо снять", callback_data="tiktok_todo")],
-        [InlineKeyboardButton("✅ Снятые", callback_data="tiktok_done")],
-        [InlineKeyboardButton("➕ Добавить тренд", callback_data="tiktok_add")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        [InlineKeyboardButton("📋 Надо снять", callback_data=callbacks.encode("tiktok_todo"))],
+        [InlineKeyboardButton("✅ Снятые", callback_data=callbacks.encode("tiktok_done"))],
+        [InlineKeyboardButton("▶️ Смотреть все", callback_data=callbacks.encode("tiktok_watch_all"))],
+        [InlineKeyboardButton("➕ Добавить тренд", callback_data=callbacks.encode("tiktok_add"))],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def tiktok_menu(update: Update, context) -> None:
+    """Меню раздела TikTok."""
+    reply_markup = tiktok_menu_keyboard()
     
     if update.message:
         await update.message.reply_text("🎵 Раздел: Тренды TikTok\n\nВыберите действие:", reply_markup=reply_markup)
     else:
-        await update.callback_query.edit_message_text("🎵 Раздел: Тренды TikTok\n\nВыберите действие:", reply_markup=reply_markup)
+        await render.edit_screen(update, "🎵 Раздел: Тренды TikTok\n\nВыберите действие:", reply_markup=reply_markup)
 
 
 async def tiktok_todo_list(update: Update, context) -> None:
@@ -33,26 +51,19 @@ async def tiktok_todo_list(update: Update, context) -> None:
     
     trends = database.get_tiktok_trends(status='todo')
     
+    text = screens.render_list("📋 Надо снять", trends, screens.NUMBERED_TITLE)
     if not trends:
-        text = "📋 Список пуст"
         keyboard = back_button("tiktok_menu")
     else:
-        text = f"📋 Надо снять ({len(trends)}):\n\n"
-        for i, trend in enumerate(trends[:10], 1):
-            text += f"{i}. {trend['title']}\n"
-        
-        if len(trends) > 10:
-            text += f"\n... и еще {len(trends) - 10}"
-        
         keyboard = list_keyboard(
             trends,
             page=0,
             items_per_page=10,
-            callback_prefix="tiktok_",
-            back_callback="tiktok_menu"
+            item_route="tiktok",
+            back_route="tiktok_menu"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
 async def tiktok_done_list(update: Update, context) -> None:
@@ -62,26 +73,19 @@ async def tiktok_done_list(update: Update, context) -> None:
     
     trends = database.get_tiktok_trends(status='done')
     
+    text = screens.render_list("✅ Снятые", trends, screens.NUMBERED_TITLE)
     if not trends:
-        text = "📋 Список пуст"
         keyboard = back_button("tiktok_menu")
     else:
-        text = f"✅ Снятые ({len(trends)}):\n\n"
-        for i, trend in enumerate(trends[:10], 1):
-            text += f"{i}. {trend['title']}\n"
-        
-        if len(trends) > 10:
-            text += f"\n... и еще {len(trends) - 10}"
-        
         keyboard = list_keyboard(
             trends,
             page=0,
             items_per_page=10,
-            callback_prefix="tiktok_",
-            back_callback="tiktok_menu"
+            item_route="tiktok",
+            back_route="tiktok_menu"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
 
 
 async def tiktok_detail(update: Update, context) -> None:
@@ -89,35 +93,46 @@ async def tiktok_detail(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    trend_id = int(query.data.split("_")[1])
+    trend_id = callbacks.decode(query.data).args[0]
     trend = database.get_tiktok_trend_by_id(trend_id)
     
     if not trend:
-        await query.edit_message_text("❌ Тренд не найден")
+        await render.edit_screen(update, "❌ Тренд не найден")
         return
     
-    text = f"🎵 {trend['title']}\n\n"
-    text += f"📊 Статус: {'✅ Снято' if trend['status'] == 'done' else '⏳ Надо снять'}\n"
+    text = screens.render_detail([
+        DETAIL_HEADER.render(trend),
+        "📊 Статус: ✅ Снято\n" if trend['status'] == 'done' else "📊 Статус: ⏳ Надо снять\n",
+    ])
     
     keyboard = []
     if trend['status'] == 'todo':
-        keyboard.append([InlineKeyboardButton("✅ Выполнено", callback_data=f"tiktok_done_{trend_id}")])
-    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=f"tiktok_delete_{trend_id}")])
+        keyboard.append([InlineKeyboardButton("✅ Выполнено", callback_data=callbacks.encode("tiktok_done_item", trend_id))])
+    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=callbacks.encode("tiktok_delete", trend_id))])
+    
+    back_route = "tiktok_todo" if trend['status'] == 'todo' else "tiktok_done"
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode(back_route))])
     
-    back_callback = "tiktok_todo" if trend['status'] == 'todo' else "tiktok_done"
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=back_callback)])
+    await render.edit_screen(update, text, reply_markup=InlineKeyboardMarkup(keyboard))
     
-    try:
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        
-        # Если есть видео, отправляем его отдельным сообщением
-        if trend['video_file_id']:
-            await query.message.reply_video(trend['video_file_id'])
-    except Exception as e:
-        # Если сообщение содержит видео, используем reply_text
-        await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        if trend['video_file_id']:
-            await query.message.reply_video(trend['video_file_id'])
+    # Если есть видео, отправляем его отдельным сообщением после карточки
+    if trend['video_file_id']:
+        await render.send_video(update, trend['video_file_id'], trend['video_unique_id'])
+
+
+async def tiktok_watch_all(update: Update, context) -> None:
+    """Все видео трендов, которые надо снять, альбомами."""
+    query = update.callback_query
+    await query.answer()
+    
+    videos = database.get_tiktok_videos(status='todo')
+    if not videos:
+        await render.edit_screen(update, "🎥 У трендов, которые надо снять, нет видео",
+                                 reply_markup=back_button("tiktok_menu"))
+        return
+    
+    await render.edit_screen(update, f"▶️ Видео трендов ({len(videos)}):", reply_markup=back_button("tiktok_menu"))
+    await render.send_videos(update, [(video['file_id'], video['file_unique_id'], video['title']) for video in videos])
 
 
 async def tiktok_done(update: Update, context) -> None:
@@ -125,13 +140,10 @@ async def tiktok_done(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    trend_id = int(query.data.split("_")[-1])
+    trend_id = callbacks.decode(query.data).args[0]
     database.mark_tiktok_trend_done(trend_id)
     
-    try:
-        await query.edit_message_text("✅ Тренд отмечен как выполненный!")
-    except:
-        await query.message.reply_text("✅ Тренд отмечен как выполненный!")
+    await render.edit_screen(update, "✅ Тренд отмечен как выполненный!")
 
 
 async def tiktok_delete(update: Update, context) -> None:
@@ -139,23 +151,20 @@ async def tiktok_delete(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    trend_id = int(query.data.split("_")[-1])
+    trend_id = callbacks.decode(query.data).args[0]
     trend = database.get_tiktok_trend_by_id(trend_id)
     
     if not trend:
-        await query.edit_message_text("❌ Тренд не найден")
+        await render.edit_screen(update, "❌ Тренд не найден")
         return
     
     database.delete_tiktok_trend(trend_id)
     
-    try:
-        await query.edit_message_text(f"✅ Тренд '{trend['title']}' удален!")
-    except:
-        await query.message.reply_text(f"✅ Тренд '{trend['title']}' удален!")
+    await render.edit_screen(update, f"✅ Тренд '{trend['title']}' удален!")
     
     # Возвращаемся в соответствующий список
-    back_callback = "tiktok_todo" if trend['status'] == 'todo' else "tiktok_done"
-    if back_callback == "tiktok_todo":
+    back_route = "tiktok_todo" if trend['status'] == 'todo' else "tiktok_done"
+    if back_route == "tiktok_todo":
         await tiktok_todo_list(update, context)
     else:
         await tiktok_done_list(update, context)
@@ -166,7 +175,7 @@ async def tiktok_add_start(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("➕ Добавление тренда\n\nВведите название тренда:")
+    await render.edit_screen(update, "➕ Добавление тренда\n\nВведите название тренда:")
     return TIKTOK_TITLE
 
 
@@ -184,15 +193,27 @@ async def tiktok_add_title(update: Update, context) -> None:
 
 async def tiktok_add_video(update: Update, context) -> None:
     """Обработка видео тренда."""
-    video_file_id = None
+    video = None
     
     if update.message.video:
-        video_file_id = update.message.video.file_id
+        video = update.message.video
     elif update.message.document and update.message.document.mime_type and 'video' in update.message.document.mime_type:
-        video_file_id = update.message.document.file_id
+        video = update.message.document
+    
+    video_file_id = video_unique_id = None
+    if video:
+        video_file_id, video_unique_id = video.file_id, video.file_unique_id
+        existing = database.get_tiktok_trend_by_video(video_unique_id)
+        if existing:
+            await update.message.reply_text(
+                f"⚠️ Это видео уже прикреплено к тренду '{existing['title']}'.\n"
+                "Прикрепите другое видео (или отправьте /skip для пропуска):"
+            )
+            return TIKTOK_VIDEO
+        database.cache_media(video_unique_id, video_file_id, getattr(video, 'duration', None), video.file_size)
     
     title = context.user_data['tiktok_title']
-    trend_id = database.create_tiktok_trend(title, video_file_id)
+    trend_id = database.create_tiktok_trend(title, video_file_id, video_unique_id)
     
     await update.message.reply_text(f"✅ Тренд '{title}' добавлен!")
     await tiktok_menu(update, context)
@@ -219,7 +240,7 @@ async def tiktok_add_cancel(update: Update, context) -> None:
 def register_handlers(application: Application) -> None:
     """Регистрация обработчиков раздела TikTok."""
     add_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(tiktok_add_start, pattern="^tiktok_add$")],
+        entry_points=[CallbackQueryHandler(tiktok_add_start, pattern=callbacks.pattern("tiktok_add"))],
         states={
             TIKTOK_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, tiktok_add_title)],
             TIKTOK_VIDEO: [
@@ -227,14 +248,17 @@ def register_handlers(application: Application) -> None:
                 MessageHandler(filters.TEXT & filters.Regex("^/skip$"), tiktok_add_skip)
             ]
         },
-        fallbacks=[CommandHandler("cancel", tiktok_add_cancel)]
+        fallbacks=[CommandHandler("cancel", tiktok_add_cancel)],
+        name="tiktok_add",
+        persistent=True
     )
     
     application.add_handler(add_conv)
-    application.add_handler(CallbackQueryHandler(tiktok_menu, pattern="^tiktok_menu$"))
-    application.add_handler(CallbackQueryHandler(tiktok_todo_list, pattern="^tiktok_todo$"))
-    application.add_handler(CallbackQueryHandler(tiktok_done_list, pattern="^tiktok_done$"))
-    application.add_handler(CallbackQueryHandler(tiktok_detail, pattern="^tiktok_\\d+$"))
-    application.add_handler(CallbackQueryHandler(tiktok_done, pattern="^tiktok_done_\\d+$"))
-    application.add_handler(CallbackQueryHandler(tiktok_delete, pattern="^tiktok_delete_\\d+$"))
+    application.add_handler(CallbackQueryHandler(tiktok_menu, pattern=callbacks.pattern("tiktok_menu")))
+    application.add_handler(CallbackQueryHandler(tiktok_todo_list, pattern=callbacks.pattern("tiktok_todo")))
+    application.add_handler(CallbackQueryHandler(tiktok_done_list, pattern=callbacks.pattern("tiktok_done")))
+    application.add_handler(CallbackQueryHandler(tiktok_detail, pattern=callbacks.pattern("tiktok")))
+    application.add_handler(CallbackQueryHandler(tiktok_watch_all, pattern=callbacks.pattern("tiktok_watch_all")))
+    application.add_handler(CallbackQueryHandler(tiktok_done, pattern=callbacks.pattern("tiktok_done_item")))
+    application.add_handler(CallbackQueryHandler(tiktok_delete, pattern=callbacks.pattern("tiktok_delete")))
 
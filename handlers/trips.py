@@ -2,32 +2,55 @@
 Обработчики для раздела "Поездки".
 """
 
+from typing import Optional
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CallbackQueryHandler, MessageHandler, ConversationHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ConversationHandler, filters
 import database
-from keyboards import list_keyboard, back_button
+import callbacks
+import details
+import render
+import screens
+from keyboards import keyboard_factory, list_keyboard, back_button
 
 TRIP_TITLE, TRIP_NOTE, TRIP_CATEGORY = range(3)
 EDIT_TRIP_TITLE, EDIT_TRIP_NOTE = range(3, 5)
 
+# Шаблоны экранов
+CATEGORY_EMPTY = screens.Template("📋 Категория '{title}' пуста")
+LIST_LINE = screens.Template("{n}. {status} {title}")
+DETAIL_HEADER = screens.Template("✈️ {title}\n\n")
+DETAIL_NOTE = screens.Template("📝 {note}\n\n")
+DETAIL_CATEGORY = screens.Template("📁 Категория: {category_title}\n")
 
-async def trips_menu(update: Update, context) -> None:
-    """Меню раздела поездки."""
+
+@keyboard_factory("trip_categories")
+def trips_menu_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура меню раздела поездки с категориями."""
     categories = database.get_trip_categories()
     
     keyboard = []
     for cat in categories:
-        keyboard.append([InlineKeyboardButton(f"📍 {cat['title']}", callback_data=f"trips_cat_{cat['id']}")])
-    
-    keyboard.append([InlineKeyboardButton("➕ Добавить", callback_data="trips_add")])
-    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")])
+        keyboard.append([InlineKeyboardButton(f"📍 {cat['title']}", callback_data=callbacks.encode("trips_cat", cat['id']))])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    keyboard.append([InlineKeyboardButton("➕ Добавить", callback_data=callbacks.encode("trips_add"))])
+    keyboard.append([InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def trips_menu(update: Update, context) -> None:
+    """Меню раздела поездки."""
+    reply_markup = trips_menu_keyboard()
     
     if update.message:
         await update.message.reply_text("✈️ Раздел: Поездки\n\nВыберите категорию:", reply_markup=reply_markup)
     else:
-        await update.callback_query.edit_message_text("✈️ Раздел: Поездки\n\nВыберите категорию:", reply_markup=reply_markup)
+        await render.edit_screen(update, "✈️ Раздел: Поездки\n\nВыберите категорию:", reply_markup=reply_markup)
+
+
+def _list_line(n: int, trip) -> str:
+    """Строка списка поездок со значком статуса."""
+    return LIST_LINE.render(trip, n=n, status="✅" if trip['visited'] else "⏳")
 
 
 async def trips_category_list(update: Update, context) -> None:
@@ -35,88 +58,104 @@ async def trips_category_list(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    category_id = int(query.data.split("_")[-1])
+    category_id = callbacks.decode(query.data).args[0]
     trips = database.get_trips(category_id=category_id)
     category = next((c for c in database.get_trip_categories() if c['id'] == category_id), None)
     
+    text = screens.render_list(
+        f"📍 {category['title']}", trips, _list_line,
+        empty_text=CATEGORY_EMPTY.render(category)
+    )
     if not trips:
-        text = f"📋 Категория '{category['title']}' пуста"
         keyboard = back_button("trips_menu")
     else:
-        text = f"📍 {category['title']} ({len(trips)}):\n\n"
-        for i, trip in enumerate(trips[:10], 1):
-            status = "✅" if trip['visited'] else "⏳"
-            text += f"{i}. {status} {trip['title']}\n"
-        
-        if len(trips) > 10:
-            text += f"\n... и еще {len(trips) - 10}"
-        
         keyboard = list_keyboard(
             trips,
             page=0,
             items_per_page=10,
-            callback_prefix="trip_",
-            back_callback="trips_menu"
+            item_route="trip",
+            back_route="trips_menu"
         )
     
-    await query.edit_message_text(text, reply_markup=keyboard)
+    await render.edit_screen(update, text, reply_markup=keyboard)
+
+
+def trip_text(trip) -> str:
+    """Текст карточки поездки (экран раздела и inline-режим)."""
+    return screens.render_detail([
+        DETAIL_HEADER.render(trip),
+        DETAIL_NOTE.render(trip) if trip['note'] else None,
+        DETAIL_CATEGORY.render(trip),
+        "📊 Статус: ✅ Посещено\n" if trip['visited'] else "📊 Статус: ⏳ Не посещено\n",
+    ])
+
+
+def trip_card(trip) -> details.Card:
+    """Карточка поездки: текст и кнопки (запоминается в details)."""
+    trip_id, version = trip['id'], trip['version']
+    keyboard = []
+    if not trip['visited']:
+        keyboard.append([InlineKeyboardButton("✅ Посещено", callback_data=callbacks.encode("trip_visited", trip_id, version))])
+    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=callbacks.encode("trip_edit", trip_id))])
+    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=callbacks.encode("trip_delete", trip_id, version))])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("trips_cat", trip['category_id']))])
+    return details.Card(trip_text(trip), InlineKeyboardMarkup(keyboard))
 
 
-async def trip_detail(update: Update, context) -> None:
+async def trip_detail(update: Update, context, trip_id: Optional[int] = None) -> None:
     """Детальный просмотр поездки."""
     query = update.callback_query
-    await query.answer()
     
-    trip_id = int(query.data.split("_")[1])
-    trip = database.get_trip_by_id(trip_id)
+    # Вызов из другого обработчика передает id явно (на callback уже ответили)
+    if trip_id is None:
+        await query.answer()
+        trip_id = callbacks.decode(query.data).args[0]
+    card = details.card("trips", trip_id, database.get_trip_by_id, trip_card)
     
-    if not trip:
-        await query.edit_message_text("❌ Поездка не найдена")
+    if card is None:
+        await render.edit_screen(update, "❌ Поездка не найдена")
         return
     
-    text = f"✈️ {trip['title']}\n\n"
-    if trip['note']:
-        text += f"📝 {trip['note']}\n\n"
-    text += f"📁 Категория: {trip['category_title']}\n"
-    text += f"📊 Статус: {'✅ Посещено' if trip['visited'] else '⏳ Не посещено'}\n"
-    
-    keyboard = []
-    if not trip['visited']:
-        keyboard.append([InlineKeyboardButton("✅ Посещено", callback_data=f"trip_visited_{trip_id}")])
-    keyboard.append([InlineKeyboardButton("✏️ Редактировать", callback_data=f"trip_edit_{trip_id}")])
-    keyboard.append([InlineKeyboardButton("🗑 Удалить", callback_data=f"trip_delete_{trip_id}")])
-    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data=f"trips_cat_{trip['category_id']}")])
-    
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    await render.edit_screen(update, card.text, reply_markup=card.reply_markup)
+
+
+async def _trip_conflict(update: Update, context, trip_id: int) -> None:
+    """Поездку изменили, пока карточка была открыта: показываем актуальную."""
+    await update.callback_query.answer(details.CONFLICT_NOTICE)
+    await trip_detail(update, context, trip_id)
 
 
 async def trip_visited(update: Update, context) -> None:
     """Отметить поездку как посещенную."""
     query = update.callback_query
-    await query.answer()
     
-    trip_id = int(query.data.split("_")[-1])
-    database.mark_trip_visited(trip_id)
+    trip_id, version = details.item_version(callbacks.decode(query.data).args)
+    if not database.mark_trip_visited(trip_id, version):
+        await _trip_conflict(update, context, trip_id)
+        return
+    await query.answer()
     
-    await query.edit_message_text("✅ Поездка отмечена как посещенная!")
-    query.data = f"trip_{trip_id}"
-    await trip_detail(update, context)
+    await render.edit_screen(update, "✅ Поездка отмечена как посещенная!")
+    await trip_detail(update, context, trip_id)
 
 
 async def trip_delete(update: Update, context) -> None:
     """Удалить поездку."""
     query = update.callback_query
-    await query.answer()
     
-    trip_id = int(query.data.split("_")[-1])
+    trip_id, version = details.item_version(callbacks.decode(query.data).args)
     trip = database.get_trip_by_id(trip_id)
     
     if not trip:
-        await query.edit_message_text("❌ Поездка не найдена")
+        await query.answer()
+        await render.edit_screen(update, "❌ Поездка не найдена")
         return
     
-    database.delete_trip(trip_id)
-    await query.edit_message_text(f"✅ Поездка '{trip['title']}' удалена!")
+    if not database.delete_trip(trip_id, version):
+        await _trip_conflict(update, context, trip_id)
+        return
+    await query.answer()
+    await render.edit_screen(update, f"✅ Поездка '{trip['title']}' удалена!")
     await trips_category_list(update, context)
 
 
@@ -125,7 +164,7 @@ async def trips_add_start(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    await query.edit_message_text("➕ Добавление поездки\n\nВведите название поездки:")
+    await render.edit_screen(update, "➕ Добавление поездки\n\nВведите название поездки:")
     return TRIP_TITLE
 
 
@@ -141,21 +180,26 @@ async def trips_add_title(update: Update, context) -> None:
     return TRIP_NOTE
 
 
+@keyboard_factory("trip_categories")
+def trip_category_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора категории новой поездки."""
+    categories = database.get_trip_categories()
+    keyboard = []
+    for cat in categories:
+        keyboard.append([InlineKeyboardButton(cat['title'], callback_data=callbacks.encode("trip_cat", cat['id']))])
+    keyboard.append([InlineKeyboardButton("➕ Создать новую категорию", callback_data=callbacks.encode("trip_cat_new"))])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data=callbacks.encode("trips_menu"))])
+    return InlineKeyboardMarkup(keyboard)
+
+
 async def trips_add_note(update: Update, context) -> None:
     """Обработка примечания поездки."""
     note = update.message.text.strip() if update.message.text != "/skip" else None
     context.user_data['trip_note'] = note
     
-    categories = database.get_trip_categories()
-    keyboard = []
-    for cat in categories:
-        keyboard.append([InlineKeyboardButton(cat['title'], callback_data=f"trip_cat_{cat['id']}")])
-    keyboard.append([InlineKeyboardButton("➕ Создать новую категорию", callback_data="trip_cat_new")])
-    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="trips_menu")])
-    
     await update.message.reply_text(
         "📁 Выберите категорию:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=trip_category_keyboard()
     )
     return TRIP_CATEGORY
 
@@ -165,18 +209,19 @@ async def trips_add_category(update: Update, context) -> None:
     query = update.callback_query
     await query.answer()
     
-    if query.data == "trip_cat_new":
-        await query.edit_message_text("📁 Введите название новой категории:")
+    callback = callbacks.decode(query.data)
+    if callback.route == "trip_cat_new":
+        await render.edit_screen(update, "📁 Введите название новой категории:")
         context.user_data['trip_waiting_new_category'] = True
         return TRIP_CATEGORY
     
-    category_id = int(query.data.split("_")[-1])
+    category_id = callback.args[0]
     title = context.user_data['trip_title']
     note = context.user_data.get('trip_note')
     
     trip_id = database.create_trip(title, note, category_id)
     
-    await query.edit_message_text(f"✅ Поездка '{title}' добавлена!")
+    await render.edit_screen(update, f"✅ Поездка '{title}' добавлена!")
     await trips_menu(update, context)
     return ConversationHandler.END
 
@@ -214,22 +259,24 @@ async def trips_add_cancel(update: Update, context) -> None:
 def register_handlers(application: Application) -> None:
     """Регистрация обработчиков раздела поездки."""
     add_conv = ConversationHandler(
-        entry_points=[CallbackQueryHandler(trips_add_start, pattern="^trips_add$")],
+        entry_points=[CallbackQueryHandler(trips_add_start, pattern=callbacks.pattern("trips_add"))],
         states={
             TRIP_TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, trips_add_title)],
             TRIP_NOTE: [MessageHandler(filters.TEXT, trips_add_note)],
             TRIP_CATEGORY: [
-                CallbackQueryHandler(trips_add_category, pattern="^trip_cat_\\d+$"),
+                CallbackQueryHandler(trips_add_category, pattern=callbacks.pattern("trip_cat", "trip_cat_new")),
                 MessageHandler(filters.TEXT, trips_add_new_category)
             ]
         },
-        fallbacks=[CommandHandler("cancel", trips_add_cancel)]
+        fallbacks=[CommandHandler("cancel", trips_add_cancel)],
+        name="trips_add",
+        persistent=True
     )
     
     application.add_handler(add_conv)
-    application.add_handler(CallbackQueryHandler(trips_menu, pattern="^trips_menu$"))
-    application.add_handler(CallbackQueryHandler(trips_category_list, pattern="^trips_cat_\\d+$"))
-    application.add_handler(CallbackQueryHandler(trip_detail, pattern="^trip_\\d+$"))
-    application.add_handler(CallbackQueryHandler(trip_visited, pattern="^trip_visited_\\d+$"))
-    application.add_handler(CallbackQueryHandler(trip_delete, pattern="^trip_delete_\\d+$"))
+    application.add_handler(CallbackQueryHandler(trips_menu, pattern=callbacks.pattern("trips_menu")))
+    application.add_handler(CallbackQueryHandler(trips_category_list, pattern=callbacks.pattern("trips_cat")))
+    application.add_handler(CallbackQueryHandler(trip_detail, pattern=callbacks.pattern("trip")))
+    application.add_handler(CallbackQueryHandler(trip_visited, pattern=callbacks.pattern("trip_visited")))
+    application.add_handler(CallbackQueryHandler(trip_delete, pattern=callbacks.pattern("trip_delete")))
 
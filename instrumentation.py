@@ -0,0 +1,68 @@
+"""
+Замеры вызовов Telegram Bot API.
+
+InstrumentedRequest - HTTP-клиент python-telegram-bot, который сообщает
+наблюдателям длительность каждого вызова API (sendMessage, editMessageText...).
+Подключается через Application.builder().request(InstrumentedRequest()).
+
+API:
+- API_HOOKS - наблюдатели: hook(method, seconds, ok)
+- FILE_METHOD - метка загрузок файлов (base_file_url)
+- InstrumentedRequest - HTTPXRequest с замерами
+"""
+
+import logging
+import time
+from typing import Callable, List, Optional, Tuple
+
+from telegram.request import HTTPXRequest, RequestData
+
+logger = logging.getLogger(__name__)
+
+# Наблюдатели вызовов API: hook(method, seconds, ok)
+# method - имя метода Bot API (FILE_METHOD для загрузок файлов), ok - False, если запрос завершился исключением
+# или Telegram ответил ошибкой (статус не 2xx)
+API_HOOKS: List[Callable[[str, float, bool], None]] = []
+
+# Загрузки файлов - одна метка: путь файла в метрике дал бы метку на каждый файл
+FILE_METHOD = "file"
+
+
+def api_method(url: str) -> str:
+    """Имя метода Bot API из URL запроса; загрузка файла (.../file/bot<токен>/<путь>) - FILE_METHOD."""
+    name = url.rsplit("/", 1)[-1]
+    if "/file/bot" in url or not name.isalnum():
+        return FILE_METHOD
+    return name
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, замеряющий каждый вызов Bot API."""
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        *args,
+        **kwargs
+    ) -> Tuple[int, bytes]:
+        if not API_HOOKS:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+
+        method_name = api_method(url)
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await super().do_request(url, method, request_data, *args, **kwargs)
+            # Ошибки Telegram (400, 403, 429) приходят ответом, исключение
+            # PTB поднимает позже - ошибкой считается и такой ответ
+            ok = 200 <= result[0] < 300
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in API_HOOKS:
+                try:
+                    hook(method_name, elapsed, ok)
+                except Exception as e:
+                    logger.debug(f"Ошибка наблюдателя вызовов API: {e}")
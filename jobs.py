@@ -0,0 +1,307 @@
+"""
+Тяжелые вычисления (статистика, экспорт и разбор импорта) в пуле процессов.
+
+Обработчики работают в одном event loop: разбор большого CSV или подсчет
+статистики прямо в обработчике останавливает все остальные апдейты. Такие
+задачи выполняет ProcessPoolExecutor из JOB_WORKERS процессов (spawn),
+обработчик только ждет результат:
+
+    job = jobs.submit_job("export_csv", payload, on_progress=show)
+    data = await job
+
+Задача - функция уровня модуля с декоратором @jobs.task("вид"). В процесс
+пула уходят только вид задачи (имя модуля и функции) и payload, поэтому
+payload и результат должны сериализоваться pickle: словари, списки, строки,
+bytes (не sqlite3.Row - записи базы переводятся в словари до отправки).
+Базу задачи не читают: данные собирает обработчик, в пуле - только расчет.
+
+Прогресс: задача вызывает jobs.progress(done, total, text); родитель
+получает его через очередь и вызывает on_progress(done, total, text) не
+чаще раза в PROGRESS_INTERVAL секунд (чтобы не упереться в лимиты
+editMessageText). progress() же проверяет отмену: job.cancel() снимает
+задачу из очереди пула или, если она уже выполняется, помечает ее слот - на
+ближайшем progress() задача прерывается JobCancelled.
+
+Одновременно выполняется и ждет не больше JOB_QUEUE_SIZE задач: следующая
+submit_job получает JobQueueFull, и обработчик просит повторить позже,
+вместо того чтобы копить очередь без конца. Пул запускается при первой
+задаче, останавливается в stop().
+
+Настройки (переменные окружения):
+- JOB_WORKERS - процессов в пуле (по умолчанию 2)
+- JOB_QUEUE_SIZE - задач в работе и в очереди (по умолчанию 8)
+
+API:
+- task(kind) - декоратор: регистрирует функцию задачи
+- submit_job(kind, payload, on_progress=None, owner=None) - Job; await job - результат
+- Job - задача: id, kind, owner, cancel(), done()
+- get_job(job_id) - задача в работе или None
+- progress(done, total, text="") - прогресс из задачи (в процессе пула)
+- JobQueueFull, JobCancelled - очередь заполнена, задача отменена
+- stop() - остановить пул
+"""
+
+import asyncio
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '8'))
+# Как часто передавать прогресс задачи обработчику (секунды)
+PROGRESS_INTERVAL = 1.0
+
+# on_progress(done, total, text)
+ProgressCallback = Callable[[int, int, str], Awaitable[None]]
+
+
+class JobQueueFull(Exception):
+    """В работе уже JOB_QUEUE_SIZE задач."""
+
+
+class JobCancelled(Exception):
+    """Задача отменена (job.cancel())."""
+
+
+# Вид задачи -> (модуль, функция): по ним процесс пула находит функцию
+_TASKS: Dict[str, Tuple[str, str]] = {}
+
+
+def task(kind: str) -> Callable[[Callable[[Any], Any]], Callable[[Any], Any]]:
+    """Декоратор: регистрирует функцию уровня модуля func(payload) как задачу вида kind."""
+    def decorator(function: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        if "<locals>" in function.__qualname__:
+            raise ValueError(f"Задача {kind} должна быть функцией уровня модуля")
+        _TASKS[kind] = (function.__module__, function.__qualname__)
+        return function
+    return decorator
+
+
+# ============================================
+# ПРОЦЕСС ПУЛА
+# ============================================
+
+# Очередь прогресса и слоты отмены (в процессе пула - из initializer)
+_progress_queue: Optional[Any] = None
+_cancelled: Optional[Any] = None
+# Выполняемая задача процесса пула: (id, слот)
+_current: Optional[Tuple[int, int]] = None
+
+
+def _init_worker(progress_queue: Any, cancelled: Any) -> None:
+    global _progress_queue, _cancelled
+    # Ctrl+C останавливает бота, пул завершает stop()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _progress_queue, _cancelled = progress_queue, cancelled
+
+
+def _check_cancelled() -> None:
+    if _current is not None and _cancelled is not None:
+        job_id, slot = _current
+        if _cancelled[slot] == job_id:
+            raise JobCancelled(f"Задача {job_id} отменена")
+
+
+def _run(job_id: int, slot: int, module: str, name: str, payload: Any) -> Any:
+    """Выполняет задачу в процессе пула."""
+    global _current
+    _current = (job_id, slot)
+    try:
+        _check_cancelled()
+        function = getattr(importlib.import_module(module), name)
+        return function(payload)
+    finally:
+        _current = None
+
+
+def progress(done: int, total: int, text: str = "") -> None:
+    """
+    Сообщает прогресс задачи и проверяет отмену (вызывать из функции задачи).
+
+    Raises:
+        JobCancelled: Задачу отменили - функция должна прерваться
+    """
+    _check_cancelled()
+    if _current is not None and _progress_queue is not None:
+        _progress_queue.put((_current[0], done, total, text))
+
+
+# ============================================
+# ПРОЦЕСС БОТА
+# ============================================
+
+class Job:
+    """Задача в пуле; await job - результат (или исключение задачи)."""
+
+    def __init__(self, job_id: int, kind: str, slot: int, future: Any,
+                 on_progress: Optional[ProgressCallback], owner: Optional[int]):
+        self.id = job_id
+        self.kind = kind
+        self.owner = owner
+        self.slot = slot
+        self.on_progress = on_progress
+        self.last_progress = 0.0
+        self._future = future
+        self._wrapped = asyncio.wrap_future(future)
+        self._cancel_requested = False
+
+    def done(self) -> bool:
+        return self._wrapped.done()
+
+    def cancel(self) -> bool:
+        """Отменяет задачу. False - она уже завершилась."""
+        if self.done():
+            return False
+        self._cancel_requested = True
+        # Еще в очереди пула - снимается сразу; уже выполняется - по слоту
+        if not self._future.cancel() and _shared is not None:
+            _shared.cancelled[self.slot] = self.id
+        logger.info(f"Задача {self.id} ({self.kind}) отменена")
+        return True
+
+    async def result(self) -> Any:
+        try:
+            return await self._wrapped
+        except asyncio.CancelledError:
+            if self._cancel_requested:
+                raise JobCancelled(f"Задача {self.id} отменена") from None
+            raise
+
+    def __await__(self):
+        return self.result().__await__()
+
+
+class _Shared:
+    """Пул процессов и общие с ним объекты."""
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.progress_queue = context.Queue()
+        # Слот задачи -> id отмененной задачи (0 - отмены нет)
+        self.cancelled = context.Array('q', JOB_QUEUE_SIZE, lock=False)
+        self.executor = ProcessPoolExecutor(
+            max_workers=JOB_WORKERS, mp_context=context,
+            initializer=_init_worker, initargs=(self.progress_queue, self.cancelled)
+        )
+        self.free_slots: List[int] = list(range(JOB_QUEUE_SIZE))
+        # Очередь прогресса читает поток-демон: он не держит выход из
+        # event loop и процесса, даже если stop() не вызвали
+        self.loop = asyncio.get_running_loop()
+        self.reader = threading.Thread(target=self._read_progress, name="jobs-progress", daemon=True)
+        self.reader.start()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.progress_queue.put(None)
+
+    def _read_progress(self) -> None:
+        while True:
+            message = self.progress_queue.get()
+            if message is None:
+                return
+            try:
+                self.loop.call_soon_threadsafe(_show_progress, *message)
+            except RuntimeError:
+                # event loop уже закрыт
+                return
+
+
+def _show_progress(job_id: int, done: int, total: int, text: str) -> None:
+    """Передает прогресс обработчику задачи (в event loop, не чаще PROGRESS_INTERVAL)."""
+    job = _jobs.get(job_id)
+    if job is None or job.on_progress is None:
+        return
+    now = time.monotonic()
+    if now - job.last_progress < PROGRESS_INTERVAL:
+        return
+    job.last_progress = now
+    asyncio.get_running_loop().create_task(_call_progress(job, done, total, text))
+
+
+async def _call_progress(job: Job, done: int, total: int, text: str) -> None:
+    try:
+        await job.on_progress(done, total, text)
+    except Exception as e:
+        logger.warning(f"Ошибка показа прогресса задачи {job.id}: {e}")
+
+
+_shared: Optional[_Shared] = None
+_jobs: Dict[int, Job] = {}
+_ids = itertools.count(1)
+
+
+def submit_job(
+    kind: str,
+    payload: Any,
+    on_progress: Optional[ProgressCallback] = None,
+    owner: Optional[int] = None
+) -> Job:
+    """
+    Отправляет задачу в пул (запускает пул при первой задаче).
+
+    Args:
+        kind: Вид задачи (@task)
+        payload: Данные задачи (сериализуются pickle)
+        on_progress: async-функция (done, total, text) для прогресса
+        owner: Telegram ID пользователя, запустившего задачу (кто может отменить)
+
+    Raises:
+        KeyError: Неизвестный вид задачи
+        JobQueueFull: В работе уже JOB_QUEUE_SIZE задач
+    """
+    global _shared
+    if kind not in _TASKS:
+        raise KeyError(f"Неизвестная задача: {kind}")
+    if _shared is not None and _shared.loop is not asyncio.get_running_loop():
+        # Пул остался от прежнего event loop (стенд без stop()) - прогресс ему не доставить
+        _shared.close()
+        _shared = None
+    if _shared is None:
+        _shared = _Shared()
+        logger.info(f"Пул задач запущен: {JOB_WORKERS} процессов, очередь {JOB_QUEUE_SIZE}")
+    if not _shared.free_slots:
+        raise JobQueueFull(f"В работе уже {JOB_QUEUE_SIZE} задач")
+
+    slot = _shared.free_slots.pop()
+    _shared.cancelled[slot] = 0
+    job_id = next(_ids)
+    module, name = _TASKS[kind]
+    future = _shared.executor.submit(_run, job_id, slot, module, name, payload)
+    job = Job(job_id, kind, slot, future, on_progress, owner)
+    _jobs[job_id] = job
+    job._wrapped.add_done_callback(lambda _: _finish(job))
+    logger.info(f"Задача {job_id} ({kind}) поставлена в пул")
+    return job
+
+
+def _finish(job: Job) -> None:
+    _jobs.pop(job.id, None)
+    if _shared is not None:
+        _shared.free_slots.append(job.slot)
+
+
+def get_job(job_id: int) -> Optional[Job]:
+    """Задача в работе или None (завершилась или неизвестна)."""
+    return _jobs.get(job_id)
+
+
+async def stop() -> None:
+    """Отменяет незавершенные задачи и останавливает пул."""
+    global _shared
+    if _shared is None:
+        return
+    for job in list(_jobs.values()):
+        job.cancel()
+    _shared.close()
+    _shared = None
+    _jobs.clear()
+    logger.info("Пул задач остановлен")
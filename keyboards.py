@@ -4,10 +4,101 @@
 Два типа клавиатур:
 1. ReplyKeyboardMarkup - постоянная клавиатура внизу экрана
 2. InlineKeyboardMarkup - кнопки под сообщением (для callback queries)
+
+Клавиатуры неизменяемы, поэтому одинаковые не строятся заново: фабрики
+с декоратором @keyboard_factory запоминают результат по аргументам (LRU).
+Клавиатуры, зависящие от данных в базе (категории, жанры), объявляют
+таблицы: database.CHANGE_HOOKS увеличивает версию таблицы тенанта при
+каждом изменении, и версия входит в ключ - старая клавиатура больше не
+отдается. Данные у каждого тенанта свои: текущий тенант тоже входит в ключ,
+а изменение у одного тенанта не сбрасывает клавиатуры остальных.
+
+callback_data кнопок кодируется модулем callbacks: функции принимают
+имена маршрутов ("movies_menu", "movie"), а не готовые строки. Значения
+кнопок, хранящиеся на сервере (callbacks.PAYLOADS), запоминаются вместе с
+клавиатурой и освежаются при каждой ее выдаче (callbacks.keep).
 """
 
+import functools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 from telegram import ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
-from typing import List, Optional, Dict, Any
+
+import callbacks
+import database
+
+# Сколько вариантов одной фабрики помнить по умолчанию
+KEYBOARD_CACHE_SIZE = 256
+
+# (тенант, таблица) -> версия (растет при каждом изменении таблицы у тенанта)
+_table_versions: Dict[Tuple[int, str], int] = {}
+# Растет при init_database(): данные могли измениться в обход CHANGE_HOOKS
+_epoch = 0
+
+
+def _on_change(table: str, item_id: int, action: str) -> None:
+    """Наблюдатель database.CHANGE_HOOKS: новая версия изменившейся таблицы текущего тенанта."""
+    global _epoch
+    if action == "init":
+        _epoch += 1
+    else:
+        key = (database.current_tenant(), table)
+        _table_versions[key] = _table_versions.get(key, 0) + 1
+
+
+database.CHANGE_HOOKS.append(_on_change)
+
+
+def table_version(*tables: str) -> tuple:
+    """
+    Текущая версия данных таблиц (входит в ключ кеша клавиатур).
+
+    Данные у каждого тенанта свои, поэтому тенант тоже входит в версию,
+    а версии таблиц считаются по тенантам.
+    """
+    tenant_id = database.current_tenant()
+    return (database.DB_PATH, _epoch, tenant_id) + tuple(
+        _table_versions.get((tenant_id, table), 0) for table in tables
+    )
+
+
+def keyboard_factory(*tables: str, maxsize: int = KEYBOARD_CACHE_SIZE) -> Callable:
+    """
+    Декоратор фабрики клавиатур: результат запоминается по аргументам.
+
+    Args:
+        *tables: Таблицы базы, от которых зависит клавиатура. Их изменение
+                 (database.CHANGE_HOOKS) делает запомненные варианты устаревшими
+        maxsize: Сколько вариантов помнить (LRU)
+
+    У фабрики есть cache_info() и cache_clear() как у functools.lru_cache.
+    Аргументы должны быть хешируемыми.
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.lru_cache(maxsize=maxsize)
+        def build(version: tuple, *args, **kwargs):
+            markup = func(*args, **kwargs)
+            return markup, callbacks.payloads(markup)
+
+        def serve(version: tuple, *args, **kwargs):
+            markup, payloads = build(version, *args, **kwargs)
+            # Значения кнопок не должны вытесняться из PAYLOADS, пока клавиатуру показывают
+            callbacks.keep(payloads)
+            return markup
+
+        if tables:
+            @functools.wraps(func)
+            def factory(*args, **kwargs):
+                return serve(table_version(*tables), *args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def factory(*args, **kwargs):
+                return serve((), *args, **kwargs)
+
+        factory.cache_info = build.cache_info
+        factory.cache_clear = build.cache_clear
+        return factory
+    return decorator
 
 
 # Список всех разделов бота
@@ -22,6 +113,7 @@ SECTIONS = [
 ]
 
 
+@keyboard_factory()
 def main_menu_reply_keyboard() -> ReplyKeyboardMarkup:
     """
     Создает главное меню - Reply Keyboard (постоянная клавиатура).
@@ -39,6 +131,7 @@ def main_menu_reply_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
+@keyboard_factory()
 def main_menu_inline_keyboard() -> InlineKeyboardMarkup:
     """
     Создает главное меню - Inline Keyboard (для callback queries).
@@ -50,29 +143,33 @@ def main_menu_inline_keyboard() -> InlineKeyboardMarkup:
     # Размещаем по 2 кнопки в ряд
     for i in range(0, len(SECTIONS), 2):
         row = []
-        row.append(InlineKeyboardButton(SECTIONS[i], callback_data=f"section_{SECTIONS[i]}"))
+        # Раздел передается номером в SECTIONS - кириллица в кнопке заняла бы вдвое больше байт
+        row.append(InlineKeyboardButton(SECTIONS[i], callback_data=callbacks.encode("section", i)))
         if i + 1 < len(SECTIONS):
-            row.append(InlineKeyboardButton(SECTIONS[i + 1], callback_data=f"section_{SECTIONS[i + 1]}"))
+            row.append(InlineKeyboardButton(SECTIONS[i + 1], callback_data=callbacks.encode("section", i + 1)))
         buttons.append(row)
     
     return InlineKeyboardMarkup(buttons)
 
 
-def back_button(callback_data: str) -> InlineKeyboardMarkup:
+@keyboard_factory()
+def back_button(route: str, *args: Any) -> InlineKeyboardMarkup:
     """
     Создает клавиатуру с одной кнопкой "Назад".
     
     Args:
-        callback_data: callback_data для кнопки "Назад"
+        route: Маршрут кнопки "Назад" (например, "movies_menu")
+        *args: Аргументы маршрута
         
     Returns:
         InlineKeyboardMarkup с кнопкой "Назад"
     """
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("◀️ Назад", callback_data=callback_data)]
+        [InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode(route, *args))]
     ])
 
 
+@keyboard_factory()
 def main_menu_button() -> InlineKeyboardMarkup:
     """
     Создает клавиатуру с кнопкой "Главное меню".
@@ -81,7 +178,7 @@ def main_menu_button() -> InlineKeyboardMarkup:
         InlineKeyboardMarkup с кнопкой "Главное меню"
     """
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=callbacks.encode("main_menu"))]
     ])
 
 
@@ -89,8 +186,8 @@ def list_keyboard(
     items: List[Any],
     page: int,
     items_per_page: int,
-    callback_prefix: str,
-    back_callback: str,
+    item_route: str,
+    back_route: str,
     custom_back_text: Optional[str] = None
 ) -> InlineKeyboardMarkup:
     """
@@ -100,8 +197,9 @@ def list_keyboard(
         items: Список элементов для отображения
         page: Номер текущей страницы (начиная с 0)
         items_per_page: Количество элементов на странице (обычно 10)
-        callback_prefix: Префикс для callback_data (например, "movie_")
-        back_callback: callback_data для кнопки "Назад"
+        item_route: Маршрут кнопки элемента (например, "movie"), аргумент - id;
+                    пагинация - маршрут item_route + "_page"
+        back_route: Маршрут кнопки "Назад"
         custom_back_text: Текст для кнопки "Назад" (по умолчанию "◀️ Назад")
         
     Returns:
@@ -132,7 +230,7 @@ def list_keyboard(
         buttons.append([
             InlineKeyboardButton(
                 button_text,
-                callback_data=f"{callback_prefix}{item_id}"
+                callback_data=callbacks.encode(item_route, item_id)
             )
         ])
     
@@ -141,14 +239,14 @@ def list_keyboard(
     
     # Кнопка "Назад" (влево)
     back_text = custom_back_text if custom_back_text else "◀️ Назад"
-    nav_buttons.append(InlineKeyboardButton(back_text, callback_data=back_callback))
+    nav_buttons.append(InlineKeyboardButton(back_text, callback_data=callbacks.encode(back_route)))
     
     # Кнопки пагинации (если нужно)
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton("◀️", callback_data=f"{callback_prefix}page_{page - 1}"))
+        nav_buttons.append(InlineKeyboardButton("◀️", callback_data=callbacks.encode(f"{item_route}_page", page - 1)))
     
     if end_idx < len(items):
-        nav_buttons.append(InlineKeyboardButton("▶️", callback_data=f"{callback_prefix}page_{page + 1}"))
+        nav_buttons.append(InlineKeyboardButton("▶️", callback_data=callbacks.encode(f"{item_route}_page", page + 1)))
     
     if nav_buttons:
         buttons.append(nav_buttons)
@@ -156,14 +254,18 @@ def list_keyboard(
     return InlineKeyboardMarkup(buttons)
 
 
-def rating_keyboard(callback_prefix: str, item_id: int, user_num: int) -> InlineKeyboardMarkup:
+@keyboard_factory()
+def rating_keyboard(route: str, item_id: int, user_num: int, version: Optional[int] = None) -> InlineKeyboardMarkup:
     """
     Создает клавиатуру для оценки (1-10).
     
     Args:
-        callback_prefix: Префикс для callback_data (например, "rate_movie_")
+        route: Маршрут оценки (например, "rate_movie"), аргументы - id,
+               номер пользователя, оценка и версия; отмена - маршрут route + "_cancel"
         item_id: ID элемента для оценки
-        user_num: Номер пользователя (1 или 2)
+        user_num: Номер пользователя (1, 2, ... - порядок в config.json)
+        version: Версия записи (database.VERSIONED_TABLES), при которой
+                 оценивают: оценка не запишется, если запись уже изменили
         
     Returns:
         InlineKeyboardMarkup с кнопками от 1 до 10 и "Отмена"
@@ -176,48 +278,50 @@ def rating_keyboard(callback_prefix: str, item_id: int, user_num: int) -> Inline
         for j in range(i + 1, min(i + 6, 11)):
             row.append(InlineKeyboardButton(
                 str(j),
-                callback_data=f"{callback_prefix}{item_id}_user{user_num}_{j}"
+                callback_data=callbacks.encode(route, item_id, user_num, j, *(() if version is None else (version,)))
             ))
         buttons.append(row)
     
     # Кнопка "Отмена"
     buttons.append([
-        InlineKeyboardButton("❌ Отмена", callback_data=f"{callback_prefix}cancel_{item_id}")
+        InlineKeyboardButton("❌ Отмена", callback_data=callbacks.encode(f"{route}_cancel", item_id))
     ])
     
     return InlineKeyboardMarkup(buttons)
 
 
-def yes_no_keyboard(yes_callback: str, no_callback: str) -> InlineKeyboardMarkup:
+@keyboard_factory()
+def yes_no_keyboard(yes_route: str, no_route: str) -> InlineKeyboardMarkup:
     """
     Создает клавиатуру с кнопками "Да" и "Нет".
     
     Args:
-        yes_callback: callback_data для "Да"
-        no_callback: callback_data для "Нет"
+        yes_route: Маршрут кнопки "Да"
+        no_route: Маршрут кнопки "Нет"
         
     Returns:
         InlineKeyboardMarkup с кнопками "Да" и "Нет"
     """
     return InlineKeyboardMarkup([
         [
-            InlineKeyboardButton("✅ Да", callback_data=yes_callback),
-            InlineKeyboardButton("❌ Нет", callback_data=no_callback)
+            InlineKeyboardButton("✅ Да", callback_data=callbacks.encode(yes_route)),
+            InlineKeyboardButton("❌ Нет", callback_data=callbacks.encode(no_route))
         ]
     ])
 
 
-def cancel_button(callback_data: str = "cancel") -> InlineKeyboardMarkup:
+@keyboard_factory()
+def cancel_button(route: str = "cancel") -> InlineKeyboardMarkup:
     """
     Создает клавиатуру с кнопкой "Отмена".
     
     Args:
-        callback_data: callback_data для кнопки "Отмена"
+        route: Маршрут кнопки "Отмена"
         
     Returns:
         InlineKeyboardMarkup с кнопкой "Отмена"
     """
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("❌ Отмена", callback_data=callback_data)]
+        [InlineKeyboardButton("❌ Отмена", callback_data=callbacks.encode(route))]
     ])
 
@@ -0,0 +1,286 @@
+"""
+Метрики бота в формате Prometheus.
+
+Включаются переменной окружения METRICS_PORT. HTTP-эндпоинт /metrics
+обслуживается прямо из event loop бота (asyncio.start_server), без
+отдельных потоков и сторонних библиотек.
+
+Метрики:
+- forus_updates_total{type} - входящие апдейты по типу
+- forus_handler_duration_seconds{route} - время обработки апдейта по префиксу callback
+- forus_db_statement_duration_seconds{function} - SQL-запросы из database.py
+- forus_telegram_api_duration_seconds{method} - вызовы Bot API
+- forus_telegram_api_errors_total{method} - неудачные вызовы Bot API
+- forus_errors_total{route} - исключения в обработчиках
+- forus_event_loop_lag_seconds - задержка event loop
+
+API:
+- install(pipeline) - подключает сбор метрик к конвейеру, БД и Bot API
+- start(port) / stop() - запуск и остановка HTTP-эндпоинта и замера задержки
+- render() - текст всех метрик в формате Prometheus
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram import Update
+
+import database
+import instrumentation
+import middleware
+
+logger = logging.getLogger(__name__)
+
+# Порт эндпоинта /metrics (не задан - метрики выключены)
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+# Как часто замерять задержку event loop (секунды)
+LOOP_LAG_INTERVAL = 0.5
+
+# Не больше стольких значений одной метки - защита от взрыва числа рядов
+MAX_LABEL_VALUES = 200
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, одна метка с ограничением числа значений."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._label_values = set()
+
+    def _key(self, value: Optional[str]) -> Optional[str]:
+        if self.label is None:
+            return None
+        if value in self._label_values:
+            return value
+        if len(self._label_values) >= MAX_LABEL_VALUES:
+            return "other"
+        self._label_values.add(value)
+        return value
+
+    def _labels(self, value: Optional[str], extra: str = "") -> str:
+        parts = []
+        if self.label is not None:
+            escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            parts.append(f'{self.label}="{escaped}"')
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        super().__init__(name, documentation, label)
+        self._values: Dict[Optional[str], float] = {}
+
+    def inc(self, label_value: Optional[str] = None, amount: float = 1) -> None:
+        key = self._key(label_value)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self) -> Iterable[str]:
+        yield from self.header()
+        for key, value in self._values.items():
+            yield f"{self.name}{self._labels(key)} {value}"
+
+
+class Gauge(_Metric):
+    """Текущее значение (без меток)."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def lines(self) -> Iterable[str]:
+        yield from self.header()
+        yield f"{self.name} {self.value}"
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label)
+        self.buckets = buckets
+        # значение метки -> [счетчики корзин..., сумма, количество]
+        self._values: Dict[Optional[str], List[float]] = {}
+
+    def observe(self, seconds: float, label_value: Optional[str] = None) -> None:
+        key = self._key(label_value)
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+    def lines(self) -> Iterable[str]:
+        yield from self.header()
+        for key, values in self._values.items():
+            for i, bound in enumerate(self.buckets):
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{self._labels(key, le)} {values[i]}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{self._labels(key, le)} {values[-1]}"
+            yield f"{self.name}_sum{self._labels(key)} {values[-2]}"
+            yield f"{self.name}_count{self._labels(key)} {values[-1]}"
+
+
+UPDATES = Counter("forus_updates_total", "Incoming updates by type", "type")
+HANDLER_DURATION = Histogram("forus_handler_duration_seconds", "Update handling time by route", "route")
+DB_DURATION = Histogram(
+    "forus_db_statement_duration_seconds", "SQL statement time by database.py function", "function",
+    buckets=DB_BUCKETS
+)
+API_DURATION = Histogram("forus_telegram_api_duration_seconds", "Telegram Bot API call time by method", "method")
+API_ERRORS = Counter("forus_telegram_api_errors_total", "Failed Telegram Bot API calls by method", "method")
+ERRORS = Counter("forus_errors_total", "Exceptions raised by handlers by route", "route")
+LOOP_LAG = Histogram("forus_event_loop_lag_seconds", "Event loop scheduling lag", buckets=DB_BUCKETS)
+LOOP_LAG_LAST = Gauge("forus_event_loop_lag_last_seconds", "Last measured event loop lag")
+
+ALL_METRICS = (UPDATES, HANDLER_DURATION, DB_DURATION, API_DURATION, API_ERRORS, ERRORS, LOOP_LAG, LOOP_LAG_LAST)
+
+
+def render() -> str:
+    """Возвращает все метрики в текстовом формате Prometheus."""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.lines())
+    return "\n".join(lines) + "\n"
+
+
+def update_type(update: Update) -> str:
+    """Тип апдейта: message, callback_query, inline_query..."""
+    for name in Update.ALL_TYPES:
+        if getattr(update, name, None) is not None:
+            return name
+    return "unknown"
+
+
+class MetricsMiddleware(middleware.Middleware):
+    """Стадия конвейера: счетчик апдейтов, время обработки, ошибки."""
+
+    def check(self, update: Update) -> bool:
+        UPDATES.inc(update_type(update))
+        return True
+
+    async def after(self, update: Update, context) -> None:
+        state = middleware.current()
+        if state is not None:
+            HANDLER_DURATION.observe(time.perf_counter() - state.started, state.route)
+
+    async def on_error(self, update: Optional[Update], context) -> None:
+        state = middleware.current()
+        ERRORS.inc(state.route if state else "unknown")
+
+
+def _observe_statement(function_name: str, seconds: float) -> None:
+    DB_DURATION.observe(seconds, function_name)
+
+
+def _observe_api_call(method: str, seconds: float, ok: bool) -> None:
+    API_DURATION.observe(seconds, method)
+    if not ok:
+        API_ERRORS.inc(method)
+
+
+def install(pipeline: middleware.Pipeline) -> None:
+    """
+    Подключает сбор метрик.
+
+    Стадия метрик ставится первой в конвейер, чтобы считать и отклоненные апдейты.
+    """
+    pipeline.middlewares.insert(0, MetricsMiddleware())
+    database.STATEMENT_HOOKS.append(_observe_statement)
+    instrumentation.API_HOOKS.append(_observe_api_call)
+
+
+# ============================================
+# HTTP-ЭНДПОИНТ И ЗАМЕР ЗАДЕРЖКИ EVENT LOOP
+# ============================================
+
+_server: Optional[asyncio.AbstractServer] = None
+_lag_task: Optional[asyncio.Task] = None
+
+
+async def _measure_loop_lag() -> None:
+    """Раз в LOOP_LAG_INTERVAL проверяет, насколько позже запланированного проснулся loop."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Минимальный HTTP/1.0 обработчик: GET /metrics."""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки не нужны - дочитываем до пустой строки
+        while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.0 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Ошибка запроса к /metrics: {e}")
+    finally:
+        writer.close()
+
+
+async def start(port: int, host: str = "0.0.0.0") -> None:
+    """Запускает эндпоинт /metrics и замер задержки event loop в текущем loop."""
+    global _server, _lag_task
+    _server = await asyncio.start_server(_handle_http, host, port)
+    _lag_task = asyncio.create_task(_measure_loop_lag())
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+
+
+async def stop() -> None:
+    """Останавливает эндпоинт и замер задержки."""
+    global _server, _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,320 @@
+"""
+Конвейер middleware - общие проверки и замеры, выполняемые один раз на апдейт.
+
+Конвейер регистрируется в двух группах обработчиков:
+- PRE_GROUP (-1) - до любых обработчиков разделов. Здесь апдейт проходит
+  синхронные проверки (авторизация, дубликаты) еще ДО создания context,
+  поэтому отклоненный апдейт не доходит ни до regex обработчиков, ни до БД
+- POST_GROUP (101) - после всех обработчиков и сброса экранов (render)
+
+Ошибки обработчиков попадают в error handler конвейера.
+
+Стадии по умолчанию (default_pipeline):
+- AuthMiddleware - доступ только участникам тенантов (tenants.py); тенант
+  автора выставляется в database.set_tenant на время апдейта
+- DedupMiddleware - повторно доставленные апдейты и двойные нажатия
+- TracingMiddleware - trace_id апдейта в каждой строке лога
+- TimingMiddleware - длительность обработки апдейта
+- ErrorCaptureMiddleware - логирование ошибок и ответ пользователю
+
+API:
+- current() - состояние текущего апдейта (UpdateState) или None
+- default_pipeline() - конвейер со стадиями по умолчанию
+- Pipeline.register(application) - подключает конвейер к приложению
+"""
+
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, TypeHandler
+
+import callbacks
+import database
+import tenants
+
+logger = logging.getLogger(__name__)
+
+# Группы обработчиков конвейера
+PRE_GROUP = -1
+POST_GROUP = 101
+
+# Апдейт дольше этого времени попадает в лог как медленный (секунды)
+SLOW_UPDATE_SECONDS = 1.0
+
+
+class UpdateState:
+    """Состояние апдейта, которое видят все стадии и обработчики."""
+
+    __slots__ = ("update_id", "user_id", "tenant_id", "trace_id", "started", "route")
+
+    def __init__(self, update: Update):
+        self.update_id = update.update_id
+        self.user_id = update.effective_user.id if update.effective_user else None
+        self.tenant_id: Optional[int] = None
+        self.trace_id = ""
+        self.started = time.perf_counter()
+        self.route = route_label(update)
+
+
+_current: ContextVar[Optional[UpdateState]] = ContextVar("update_state", default=None)
+
+
+def current() -> Optional[UpdateState]:
+    """
+    Возвращает состояние апдейта, который сейчас обрабатывается.
+
+    Returns:
+        UpdateState или None, если код выполняется вне обработки апдейта
+    """
+    return _current.get()
+
+
+def route_label(update: Update) -> str:
+    """
+    Короткое имя маршрута апдейта для логов и метрик.
+
+    Для callback query это маршрут кнопки без аргументов (movie, rate_movie;
+    устаревшая кнопка - callback), для команд - сама команда,
+    для остальных - тип апдейта.
+    """
+    if update.callback_query and update.callback_query.data:
+        return callbacks.route_of(update.callback_query.data) or "callback"
+    if update.message and update.message.text and update.message.text.startswith("/"):
+        return update.message.text.split()[0].split("@")[0]
+    if update.message:
+        return "message"
+    if update.inline_query:
+        return "inline_query"
+    return "other"
+
+
+class Middleware:
+    """
+    Базовая стадия конвейера. Все методы необязательны.
+
+    - check(update) - синхронная проверка до создания context;
+      False - апдейт отбрасывается, вызывается rejected()
+    - rejected(update) - реакция на отброшенный апдейт
+    - before(update, context) - перед обработчиками разделов
+    - after(update, context) - после обработчиков разделов
+    - on_error(update, context) - обработчик упал с исключением
+    """
+
+    def check(self, update: Update) -> bool:
+        return True
+
+    async def rejected(self, update: Update) -> None:
+        pass
+
+    async def before(self, update: Update, context) -> None:
+        pass
+
+    async def after(self, update: Update, context) -> None:
+        pass
+
+    async def on_error(self, update: Optional[Update], context) -> None:
+        pass
+
+
+class AuthMiddleware(Middleware):
+    """
+    Пропускает только участников тенантов и выставляет тенант автора.
+
+    Чужой пользователь проходит только с приглашением (/start join_<код>) -
+    с тенантом NO_TENANT, в котором нет данных.
+    """
+
+    def check(self, update: Update) -> bool:
+        # config.json перечитывается без перезапуска, tenant_members - запоминаются (tenants.py)
+        user = update.effective_user
+        if user is None:
+            return False
+        tenant_id = tenants.tenant_of(user.id)
+        if tenant_id is None:
+            if not tenants.is_join_request(update):
+                return False
+            tenant_id = database.NO_TENANT
+        state = current()
+        if state is not None:
+            state.tenant_id = tenant_id
+        database.set_tenant(tenant_id)
+        return True
+
+    async def rejected(self, update: Update) -> None:
+        if update.effective_user is None:
+            return
+        if update.callback_query:
+            await update.callback_query.answer("❌ У вас нет доступа к этому боту.")
+        elif update.inline_query:
+            await update.inline_query.answer([], cache_time=0, is_personal=True)
+        elif update.message:
+            await update.message.reply_text("❌ У вас нет доступа к этому боту.")
+
+
+class DedupMiddleware(Middleware):
+    """
+    Отбрасывает повторы:
+    - апдейты с уже обработанным update_id (повторная доставка после перезапуска)
+    - одинаковые нажатия одной кнопки одним пользователем в течение DOUBLE_TAP_SECONDS
+    """
+
+    SEEN_LIMIT = 1000
+    DOUBLE_TAP_SECONDS = 0.7
+
+    def __init__(self):
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        # (user_id, chat_id, message_id, data) -> время последнего нажатия
+        self._taps: Dict[Tuple, float] = {}
+
+    def check(self, update: Update) -> bool:
+        if update.update_id in self._seen:
+            return False
+        self._seen[update.update_id] = None
+        if len(self._seen) > self.SEEN_LIMIT:
+            self._seen.popitem(last=False)
+
+        query = update.callback_query
+        if query is None or query.message is None:
+            return True
+
+        now = time.monotonic()
+        key = (query.from_user.id, query.message.chat_id, query.message.message_id, query.data)
+        last = self._taps.get(key)
+        self._taps[key] = now
+        if len(self._taps) > self.SEEN_LIMIT:
+            self._taps = {k: t for k, t in self._taps.items() if now - t < self.DOUBLE_TAP_SECONDS}
+        return last is None or now - last >= self.DOUBLE_TAP_SECONDS
+
+    async def rejected(self, update: Update) -> None:
+        # Убираем "часики" на кнопке, сам экран уже отрисован первым нажатием
+        if update.callback_query:
+            await update.callback_query.answer()
+
+
+class TracingMiddleware(Middleware):
+    """Присваивает апдейту trace_id, который попадает в каждую строку лога."""
+
+    def check(self, update: Update) -> bool:
+        state = current()
+        if state is not None:
+            state.trace_id = uuid.uuid4().hex[:12]
+        return True
+
+
+class TimingMiddleware(Middleware):
+    """Замеряет время обработки апдейта и логирует медленные апдейты."""
+
+    async def after(self, update: Update, context) -> None:
+        state = current()
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state.started
+        if elapsed >= SLOW_UPDATE_SECONDS:
+            logger.warning(f"Медленный апдейт {state.update_id} ({state.route}): {elapsed:.3f} с")
+        else:
+            logger.debug(f"Апдейт {state.update_id} ({state.route}): {elapsed:.3f} с")
+
+
+class ErrorCaptureMiddleware(Middleware):
+    """Логирует ошибки обработчиков и сообщает пользователю, что что-то пошло не так."""
+
+    async def on_error(self, update: Optional[Update], context) -> None:
+        state = current()
+        route = state.route if state else "-"
+        logger.error(f"Ошибка при обработке апдейта ({route}): {context.error}", exc_info=context.error)
+
+        if not isinstance(update, Update):
+            return
+        try:
+            if update.callback_query:
+                await update.callback_query.answer("⚠️ Произошла ошибка, попробуйте еще раз")
+            elif update.message:
+                await update.message.reply_text("⚠️ Произошла ошибка, попробуйте еще раз")
+        except Exception as e:
+            logger.debug(f"Не удалось сообщить об ошибке пользователю: {e}")
+
+
+class _PreHandler(TypeHandler):
+    """
+    TypeHandler, который выполняет синхронные проверки в check_update.
+
+    check_update вызывается до создания context, поэтому отклоненный апдейт
+    не доходит ни до context.refresh_data(), ни до обработчиков разделов.
+    """
+
+    def __init__(self, pipeline: "Pipeline"):
+        super().__init__(Update, pipeline._before)
+        self.pipeline = pipeline
+
+    def check_update(self, update: object) -> bool:
+        if not isinstance(update, Update):
+            return False
+        self.pipeline._check(update)
+        return True
+
+
+class Pipeline:
+    """Упорядоченный набор стадий middleware."""
+
+    def __init__(self, middlewares: List[Middleware]):
+        self.middlewares = list(middlewares)
+        self.application: Optional[Application] = None
+
+    def _check(self, update: Update) -> None:
+        _current.set(UpdateState(update))
+        for middleware in self.middlewares:
+            if not middleware.check(update):
+                _current.set(None)
+                if self.application is not None:
+                    self.application.create_task(middleware.rejected(update), update=update)
+                raise ApplicationHandlerStop
+
+    async def _before(self, update: Update, context) -> None:
+        for middleware in self.middlewares:
+            await middleware.before(update, context)
+
+    async def _after(self, update: Update, context) -> None:
+        for middleware in reversed(self.middlewares):
+            await middleware.after(update, context)
+
+    async def _error(self, update: object, context) -> None:
+        for middleware in self.middlewares:
+            await middleware.on_error(update if isinstance(update, Update) else None, context)
+
+    def register(self, application: Application) -> None:
+        """Подключает конвейер к приложению."""
+        self.application = application
+        application.add_handler(_PreHandler(self), group=PRE_GROUP)
+        application.add_handler(TypeHandler(Update, self._after), group=POST_GROUP)
+        application.add_error_handler(self._error)
+
+
+def _record_factory_with_trace(factory):
+    """Оборачивает фабрику записей лога, добавляя в каждую запись trace_id."""
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        state = _current.get()
+        record.trace_id = state.trace_id if state and state.trace_id else "-"
+        return record
+    return record_factory
+
+
+def install_log_trace_id() -> None:
+    """Добавляет атрибут trace_id во все записи лога (для %(trace_id)s в формате)."""
+    logging.setLogRecordFactory(_record_factory_with_trace(logging.getLogRecordFactory()))
+
+
+def default_pipeline() -> Pipeline:
+    """Создает конвейер со стадиями по умолчанию."""
+    return Pipeline([
+        AuthMiddleware(),
+        DedupMiddleware(),
+        TracingMiddleware(),
+        TimingMiddleware(),
+        ErrorCaptureMiddleware(),
+    ])
@@ -0,0 +1,181 @@
+"""
+Уведомления партнеру об изменениях в списках.
+
+Изменения записей приходят через database.CHANGE_HOOKS. Автор изменения -
+пользователь текущего апдейта (middleware.current()): изменения вне
+апдейтов (засев базы, задачи планировщика) не уведомляются. Событие
+попадает в корзину каждого другого участника тенанта автора (tenants.py).
+
+Корзина получателя (Debouncer) копит события NOTIFY_WINDOW секунд с первого
+события и отправляет одно сообщение-сводку:
+"🔔 Аня: +3 фильма, 1 поездка посещена". Запись, созданная и удаленная
+внутри окна, в сводку не попадает. Правки и оценки ("update") не уведомляются.
+
+Сводки уходят через sender.RateLimitedSender: массовое добавление не
+заваливает чат партнера сообщениями.
+
+Настройки (переменные окружения):
+- NOTIFY_WINDOW - окно сбора событий в секундах (по умолчанию 60, 0 - выключить)
+
+API:
+- NOTIFY_WINDOW - окно сбора событий
+- SECTIONS - уведомляемые таблицы и их слова
+- Debouncer(window, flush) - сбор событий по получателям
+- summary(events) - текст сводки
+- start(application) - подписаться на изменения в базе
+- stop() - отправить накопленное и отписаться
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+from telegram.ext import Application
+
+import database
+import middleware
+import screens
+import tenants
+from sender import RateLimitedSender
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_WINDOW = float(os.getenv('NOTIFY_WINDOW', '60'))
+
+
+class Section(NamedTuple):
+    """Слова раздела для сводки."""
+    noun: Tuple[str, str, str]
+    # Отметка "сделано" (None - у раздела ее нет)
+    done: Optional[Tuple[str, str, str]] = None
+
+
+SECTIONS: Dict[str, Section] = {
+    "movies": Section(("фильм", "фильма", "фильмов"), ("просмотрен", "просмотрено", "просмотрено")),
+    "activities": Section(("активность", "активности", "активностей"), ("выполнена", "выполнено", "выполнено")),
+    "trips": Section(("поездка", "поездки", "поездок"), ("посещена", "посещено", "посещено")),
+    "tiktok_trends": Section(("тренд", "тренда", "трендов"), ("снят", "снято", "снято")),
+    "games": Section(("игра", "игры", "игр"), ("пройдена", "пройдено", "пройдено")),
+    "photos": Section(("фото", "фото", "фото")),
+    "sexual": Section(("идея", "идеи", "идей")),
+}
+
+# Действия, о которых уведомляем, в порядке сводки
+ACTIONS = ("create", "done", "delete")
+
+# (таблица, действие) -> id записей
+Events = Dict[Tuple[str, str], Set[int]]
+
+SUMMARY = screens.Template("🔔 {name}: {changes}")
+
+
+def _phrase(table: str, action: str, count: int) -> str:
+    section = SECTIONS[table]
+    noun = screens.plural(count, section.noun)
+    if action == "create":
+        return f"+{count} {noun}"
+    if action == "delete":
+        return f"-{count} {noun}"
+    return f"{count} {noun} {screens.plural(count, section.done)}"
+
+
+def summary(events: Events) -> str:
+    """Изменения одной строкой: "+3 фильма, 1 поездка посещена" (разделы - в порядке SECTIONS)."""
+    phrases = [
+        _phrase(table, action, len(events[(table, action)]))
+        for table in SECTIONS for action in ACTIONS
+        if events.get((table, action))
+    ]
+    return ", ".join(phrases)
+
+
+class Debouncer:
+    """
+    Сбор событий по получателям: одно сообщение на окно.
+
+    Окно отсчитывается от первого события получателя, поэтому сводка
+    приходит не позже чем через window секунд даже при непрерывных изменениях.
+    """
+
+    def __init__(self, window: float, flush: Callable[[int, int, Events], Awaitable[None]]):
+        self.window = window
+        self._flush = flush
+        # (получатель, автор) -> события
+        self._pending: Dict[Tuple[int, int], Events] = {}
+        self._timers: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    def add(self, recipient: int, actor: int, table: str, item_id: int, action: str) -> None:
+        key = (recipient, actor)
+        events = self._pending.setdefault(key, {})
+        created = events.get((table, "create"), set())
+        if action == "delete" and item_id in created:
+            # Создана и удалена в одном окне - партнеру не о чем сообщать
+            created.discard(item_id)
+            events.get((table, "done"), set()).discard(item_id)
+        else:
+            events.setdefault((table, action), set()).add(item_id)
+        if key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().create_task(self._wait(key))
+
+    async def _wait(self, key: Tuple[int, int]) -> None:
+        await asyncio.sleep(self.window)
+        await self._send(key)
+
+    async def _send(self, key: Tuple[int, int]) -> None:
+        self._timers.pop(key, None)
+        events = self._pending.pop(key, None)
+        if events and any(events.values()):
+            recipient, actor = key
+            await self._flush(recipient, actor, events)
+
+    async def flush_all(self) -> None:
+        """Отправляет все накопленное, не дожидаясь окон."""
+        for key, timer in list(self._timers.items()):
+            timer.cancel()
+            await self._send(key)
+
+
+_sender: Optional[RateLimitedSender] = None
+_debouncer: Optional[Debouncer] = None
+
+
+async def _notify(recipient: int, actor: int, events: Events) -> None:
+    # Сводка отправляется вне апдейта автора - тенант берем по автору
+    tenant_id = tenants.tenant_of(actor)
+    name = (tenant_id is not None and tenants.member_name(actor, tenant_id)) or "Партнер"
+    text = SUMMARY.render(name=name, changes=summary(events))
+    await _sender.send_message(recipient, text, parse_mode=screens.PARSE_MODE)
+    logger.info(f"Уведомление для {recipient}: {len(events)} видов изменений")
+
+
+def _on_change(table: str, item_id: int, action: str) -> None:
+    """Наблюдатель database.CHANGE_HOOKS: событие - в корзины остальных участников тенанта."""
+    if table not in SECTIONS or action not in ACTIONS:
+        return
+    state = middleware.current()
+    if state is None or state.user_id is None:
+        return
+    for member in tenants.members():
+        if member.user_id != state.user_id:
+            _debouncer.add(member.user_id, state.user_id, table, item_id, action)
+
+
+def start(application: Application) -> None:
+    """Подписывает уведомления на изменения в базе (NOTIFY_WINDOW=0 - выключены)."""
+    global _sender, _debouncer
+    if NOTIFY_WINDOW <= 0:
+        logger.info("Уведомления партнеру выключены (NOTIFY_WINDOW=0)")
+        return
+    _sender = RateLimitedSender(application.bot)
+    _debouncer = Debouncer(NOTIFY_WINDOW, _notify)
+    if _on_change not in database.CHANGE_HOOKS:
+        database.CHANGE_HOOKS.append(_on_change)
+
+
+async def stop() -> None:
+    """Отписывается от изменений и отправляет накопленные сводки."""
+    if _on_change in database.CHANGE_HOOKS:
+        database.CHANGE_HOOKS.remove(_on_change)
+    if _debouncer is not None:
+        await _debouncer.flush_all()
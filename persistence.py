@@ -0,0 +1,265 @@
+"""
+Хранение состояния бота в SQLite (data/multilists.db).
+
+SQLitePersistence - реализация BasePersistence из python-telegram-bot.
+Сохраняет context.user_data, chat_data, bot_data и состояния
+ConversationHandler, чтобы перезапуск посреди диалога (например, между
+вводом названия фильма и выбором категории) не терял введенные данные.
+
+Особенности:
+- Отложенная запись: update_* только запоминают изменения в памяти,
+  а все накопленные изменения записываются одной транзакцией. Приложение
+  вызывает update_* раз в UPDATE_INTERVAL секунд, а не на каждый апдейт
+- Неудавшаяся запись (база занята) не теряет изменения: они возвращаются
+  в очередь (более новые не перезаписываются) и запись повторяется через
+  RETRY_DELAY секунд
+- Ленивая загрузка: при старте user_data/chat_data не читаются целиком,
+  данные пользователя загружаются при его первом апдейте (refresh_user_data),
+  поэтому время запуска не зависит от объема истории
+- user_data, chat_data и bot_data хранятся в pickle, как в PicklePersistence:
+  после перезапуска обработчик читает те же типы (числовые ключи, datetime,
+  set), а несериализуемое значение - ошибка при сохранении, а не молча
+  записанная строка. Данные, сохраненные прежними версиями в JSON, читаются
+
+Таблицы создаются в database.init_database().
+"""
+
+import asyncio
+import json
+import logging
+import pickle
+from typing import Any, Dict, Optional, Set, Tuple, Union
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Как часто приложение передает изменения в persistence (секунды)
+UPDATE_INTERVAL = 10
+# Через сколько повторить неудавшуюся запись (например, database is locked)
+RETRY_DELAY = 1.0
+
+# Маркер удаления записи в очереди на запись
+_DELETED = object()
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence с отложенной пакетной записью и ленивой загрузкой."""
+
+    def __init__(self, update_interval: float = UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        # Изменения, ожидающие записи: id -> pickle или _DELETED
+        self._pending_users: Dict[int, Any] = {}
+        self._pending_chats: Dict[int, Any] = {}
+        self._pending_bot_data: Optional[bytes] = None
+        self._saved_bot_data: Optional[Union[bytes, str]] = None
+        # (name, key) -> JSON состояния или _DELETED
+        self._pending_conversations: Dict[Tuple[str, str], Any] = {}
+        self._commit_scheduled = False
+
+        # Чьи данные уже загружены из БД
+        self._loaded_users: Set[int] = set()
+        self._loaded_chats: Set[int] = set()
+
+    # ============================================
+    # ЗАГРУЗКА
+    # ============================================
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        # Загружаются лениво в refresh_user_data
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        # Загружаются лениво в refresh_chat_data
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        row = self._fetch_one("SELECT data FROM ptb_bot_data WHERE id = 1", ())
+        self._saved_bot_data = row['data'] if row else self._dump({})
+        return self._load(self._saved_bot_data)
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        conn = database.get_main_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT key, state FROM ptb_conversations WHERE name = ?", (name,))
+        rows = cursor.fetchall()
+        conn.close()
+        return {tuple(json.loads(row['key'])): json.loads(row['state']) for row in rows}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        row = self._fetch_one("SELECT data FROM ptb_user_data WHERE user_id = ?", (user_id,))
+        if row:
+            user_data.update(self._load(row['data']))
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        if chat_id in self._loaded_chats:
+            return
+        self._loaded_chats.add(chat_id)
+        row = self._fetch_one("SELECT data FROM ptb_chat_data WHERE chat_id = ?", (chat_id,))
+        if row:
+            chat_data.update(self._load(row['data']))
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        # bot_data целиком загружается при старте и живет только в памяти
+        pass
+
+    # ============================================
+    # ЗАПИСЬ (ОТЛОЖЕННАЯ)
+    # ============================================
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._loaded_users.add(user_id)
+        self._pending_users[user_id] = self._dump(data)
+        self._schedule_commit()
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        self._loaded_chats.add(chat_id)
+        self._pending_chats[chat_id] = self._dump(data)
+        self._schedule_commit()
+
+    async def update_bot_data(self, data: Dict) -> None:
+        # Приложение передает bot_data при каждом сохранении - пишем только изменения
+        dumped = self._dump(data)
+        if dumped == self._saved_bot_data:
+            return
+        self._saved_bot_data = dumped
+        self._pending_bot_data = dumped
+        self._schedule_commit()
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        state = _DELETED if new_state is None else json.dumps(new_state)
+        self._pending_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_commit()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending_users[user_id] = _DELETED
+        self._schedule_commit()
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._pending_chats[chat_id] = _DELETED
+        self._schedule_commit()
+
+    async def flush(self) -> None:
+        """Записывает все накопленные изменения (вызывается при остановке бота)."""
+        self._commit()
+
+    def _schedule_commit(self) -> None:
+        """
+        Планирует запись накопленных изменений.
+
+        Приложение вызывает update_* для всех измененных данных одновременно
+        (asyncio.gather), поэтому запись, запланированная через call_soon,
+        выполняется один раз после всех вызовов - одной транзакцией.
+        """
+        if self._commit_scheduled:
+            return
+        self._commit_scheduled = True
+        try:
+            asyncio.get_running_loop().call_soon(self._commit)
+        except RuntimeError:
+            # Нет запущенного event loop - пишем сразу
+            self._commit()
+
+    def _commit(self) -> None:
+        """Записывает все накопленные изменения одной транзакцией."""
+        self._commit_scheduled = False
+        users, self._pending_users = self._pending_users, {}
+        chats, self._pending_chats = self._pending_chats, {}
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        bot_data, self._pending_bot_data = self._pending_bot_data, None
+
+        if not (users or chats or conversations or bot_data is not None):
+            return
+
+        conn = database.get_main_connection()
+        cursor = conn.cursor()
+        try:
+            self._write(cursor, "ptb_user_data", "user_id", users)
+            self._write(cursor, "ptb_chat_data", "chat_id", chats)
+            if bot_data is not None:
+                cursor.execute("INSERT OR REPLACE INTO ptb_bot_data (id, data) VALUES (1, ?)", (bot_data,))
+
+            deleted = [key for key, state in conversations.items() if state is _DELETED]
+            cursor.executemany("DELETE FROM ptb_conversations WHERE name = ? AND key = ?", deleted)
+            cursor.executemany(
+                "INSERT OR REPLACE INTO ptb_conversations (name, key, state) VALUES (?, ?, ?)",
+                [(name, key, state) for (name, key), state in conversations.items() if state is not _DELETED]
+            )
+            conn.commit()
+            logger.debug(
+                f"Состояние сохранено: пользователей {len(users)}, чатов {len(chats)}, "
+                f"диалогов {len(conversations)}"
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка при сохранении состояния бота: {e}")
+            conn.rollback()
+            self._requeue(users, chats, conversations, bot_data)
+        finally:
+            conn.close()
+
+    def _requeue(self, users: Dict[int, Any], chats: Dict[int, Any],
+                 conversations: Dict[Tuple[str, str], Any], bot_data: Optional[bytes]) -> None:
+        """Возвращает незаписанные изменения в очередь и планирует повтор записи."""
+        # Изменения, пришедшие после неудачной записи, новее - их не трогаем
+        for pending, failed in ((self._pending_users, users), (self._pending_chats, chats),
+                                (self._pending_conversations, conversations)):
+            for key, value in failed.items():
+                pending.setdefault(key, value)
+        if bot_data is not None and self._pending_bot_data is None:
+            self._pending_bot_data = bot_data
+        if self._commit_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Нет event loop (остановка) - изменения запишет следующий flush()
+            return
+        self._commit_scheduled = True
+        loop.call_later(RETRY_DELAY, self._commit)
+
+    @staticmethod
+    def _write(cursor, table: str, id_column: str, pending: Dict[int, Any]) -> None:
+        """Применяет накопленные изменения к таблице user/chat данных."""
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE {id_column} = ?",
+            [(item_id,) for item_id, data in pending.items() if data is _DELETED]
+        )
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {table} ({id_column}, data) VALUES (?, ?)",
+            [(item_id, data) for item_id, data in pending.items() if data is not _DELETED]
+        )
+
+    @staticmethod
+    def _dump(data: Dict) -> bytes:
+        """Сериализует данные (pickle): несериализуемое значение - исключение."""
+        return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(data: Union[bytes, str]) -> Dict:
+        """Загружает данные: pickle или JSON прежних версий (строка)."""
+        if isinstance(data, str):
+            return json.loads(data)
+        return pickle.loads(data)
+
+    @staticmethod
+    def _fetch_one(query: str, params: tuple):
+        conn = database.get_main_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        conn.close()
+        return row
@@ -0,0 +1,225 @@
+"""
+Профилирование работающего бота командой /profile.
+
+/profile 100 - профилировать следующие 100 апдейтов
+/profile 30s - профилировать 30 секунд
+
+Профилирование идет через cProfile внутри event loop бота, поэтому
+в отчет попадает все: обработчики handlers/*, SQL из database.py и
+внутренности python-telegram-bot. Отчет приходит документом: топ функций
+по суммарному (cumulative) времени по группам и полный вывод pstats.
+
+Пока профилирование не запущено, стадия конвейера не установлена и
+ничего не стоит: она добавляется командой и убирается по завершении.
+
+API:
+- register(application, pipeline) - регистрирует команду /profile
+"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+
+import config
+import middleware
+
+logger = logging.getLogger(__name__)
+
+MAX_UPDATES = 10000
+MAX_SECONDS = 600
+# Сколько функций показывать в каждой группе отчета
+TOP_FUNCTIONS = 25
+
+USAGE = (
+    "Использование:\n"
+    "/profile 100 - профилировать следующие 100 апдейтов\n"
+    "/profile 30s - профилировать 30 секунд"
+)
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_HANDLERS_DIR = os.path.join(_ROOT, "handlers") + os.sep
+_DATABASE_FILE = os.path.join(_ROOT, "database.py")
+
+
+def parse_limit(arg: str) -> Optional[Tuple[str, int]]:
+    """
+    Разбирает аргумент команды.
+
+    Returns:
+        ("updates", N), ("seconds", N) или None, если аргумент некорректен
+    """
+    arg = arg.strip().lower()
+    kind = "updates"
+    if arg.endswith("s"):
+        kind, arg = "seconds", arg[:-1]
+    if not arg.isdigit() or int(arg) <= 0:
+        return None
+    limit = min(int(arg), MAX_SECONDS if kind == "seconds" else MAX_UPDATES)
+    return kind, limit
+
+
+def classify(filename: str) -> str:
+    """Группа функции в отчете по файлу, где она определена."""
+    if filename.startswith(_HANDLERS_DIR):
+        return "handlers"
+    if filename == _DATABASE_FILE or "sqlite3" in filename:
+        return "database"
+    if f"{os.sep}telegram{os.sep}" in filename:
+        return "ptb"
+    return "other"
+
+
+GROUP_TITLES = {
+    "handlers": "Обработчики (handlers/*)",
+    "database": "База данных (database.py, sqlite3)",
+    "ptb": "python-telegram-bot",
+    "other": "Прочее (bot.py, middleware, стандартная библиотека)",
+}
+
+
+def build_report(profile: cProfile.Profile, description: str) -> str:
+    """Текст отчета: топ функций по cumulative-времени в каждой группе + pstats."""
+    stats = pstats.Stats(profile)
+    groups: Dict[str, List[tuple]] = {name: [] for name in GROUP_TITLES}
+    for (filename, lineno, funcname), (cc, nc, tt, ct, callers) in stats.stats.items():
+        if filename == "~":
+            # Встроенные функции (C) - в группу вызывающего кода они не относятся
+            group = "other"
+            location = funcname
+        else:
+            group = classify(filename)
+            location = f"{os.path.relpath(filename, _ROOT) if filename.startswith(_ROOT) else filename}:{lineno}({funcname})"
+        groups[group].append((ct, tt, nc, location))
+
+    lines = [f"Профиль: {description}", f"Всего вызовов: {stats.total_calls}, время: {stats.total_tt:.3f} с", ""]
+    for group, title in GROUP_TITLES.items():
+        rows = sorted(groups[group], reverse=True)[:TOP_FUNCTIONS]
+        lines.append(f"=== {title} ===")
+        lines.append(f"{'cumtime':>10} {'tottime':>10} {'calls':>8}  функция")
+        for ct, tt, nc, location in rows:
+            lines.append(f"{ct:10.4f} {tt:10.4f} {nc:8d}  {location}")
+        lines.append("")
+
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(60)
+    lines.append("=== pstats (cumulative) ===")
+    lines.append(buffer.getvalue())
+    return "\n".join(lines)
+
+
+class ProfileSession(middleware.Middleware):
+    """
+    Активная сессия профилирования.
+
+    Стадия конвейера считает обработанные апдейты (режим N апдейтов);
+    фоновая задача завершает сессию по времени (в режиме N апдейтов -
+    через MAX_SECONDS, если апдейтов так и не набралось).
+    """
+
+    def __init__(self, application: Application, pipeline: middleware.Pipeline,
+                 chat_id: int, kind: str, limit: int, skip_update_id: int):
+        self.application = application
+        self.pipeline = pipeline
+        self.chat_id = chat_id
+        self.kind = kind
+        self.limit = limit
+        self.skip_update_id = skip_update_id
+        self.updates = 0
+        self.started = time.perf_counter()
+        self.profile = cProfile.Profile()
+        self.finished = False
+
+    def start(self) -> None:
+        self.pipeline.middlewares.append(self)
+        timeout = self.limit if self.kind == "seconds" else MAX_SECONDS
+        self.application.create_task(self._finish_later(timeout))
+        self.profile.enable()
+
+    async def _finish_later(self, timeout: float) -> None:
+        await asyncio.sleep(timeout)
+        await self.finish()
+
+    async def after(self, update: Update, context) -> None:
+        # Сам апдейт с командой /profile не считаем
+        if self.finished or update.update_id == self.skip_update_id:
+            return
+        self.updates += 1
+        if self.kind == "updates" and self.updates >= self.limit:
+            await self.finish()
+
+    async def finish(self) -> None:
+        """Останавливает профилирование и отправляет отчет."""
+        global _session
+        if self.finished:
+            return
+        self.finished = True
+        self.profile.disable()
+        if self in self.pipeline.middlewares:
+            self.pipeline.middlewares.remove(self)
+        _session = None
+
+        elapsed = time.perf_counter() - self.started
+        description = f"{self.updates} апдейтов за {elapsed:.1f} с"
+        report = build_report(self.profile, description)
+        filename = f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt"
+        try:
+            await self.application.bot.send_document(
+                chat_id=self.chat_id,
+                document=io.BytesIO(report.encode("utf-8")),
+                filename=filename,
+                caption=f"📊 Профиль: {description}",
+            )
+        except Exception as e:
+            logger.error(f"❌ Не удалось отправить отчет профилирования: {e}")
+        logger.info(f"Профилирование завершено: {description}")
+
+
+# Текущая сессия (одновременно может идти только одна - cProfile один на поток)
+_session: Optional[ProfileSession] = None
+# Конвейер, в который сессия добавляет свою стадию
+_pipeline: Optional[middleware.Pipeline] = None
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /profile."""
+    global _session
+    if not config.is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Команда доступна только администраторам")
+        return
+
+    if _session is not None:
+        await update.message.reply_text(
+            f"⏳ Профилирование уже идет: {_session.updates} апдейтов обработано"
+        )
+        return
+
+    parsed = parse_limit(context.args[0]) if context.args else None
+    if parsed is None:
+        await update.message.reply_text(USAGE)
+        return
+
+    kind, limit = parsed
+    _session = ProfileSession(
+        context.application, _pipeline, update.effective_chat.id, kind, limit, update.update_id
+    )
+    _session.start()
+    target = f"{limit} апдейтов" if kind == "updates" else f"{limit} с"
+    logger.info(f"Профилирование запущено: {target}")
+    await update.message.reply_text(f"📊 Профилирование запущено: {target}. Отчет придет документом.")
+
+
+def register(application: Application, pipeline: middleware.Pipeline) -> None:
+    """Регистрирует команду /profile."""
+    global _pipeline
+    _pipeline = pipeline
+    application.add_handler(CommandHandler("profile", profile_command), group=0)
@@ -0,0 +1,183 @@
+"""
+Запись входящих апдейтов для последующего воспроизведения (tools/replay.py).
+
+Включается переменной окружения RECORD_UPDATES=1. Каждый апдейт пишется
+строкой JSON в data/recordings/updates.jsonl (файл ротируется по размеру)
+в отдельном потоке, обработку апдейта запись не задерживает.
+
+Запись обезличена:
+- id пользователей из config.json заменяются на 100000 + номер пользователя
+  (порядок сохраняется - от него зависят оценки user1/user2), остальные - на хеш
+- имена, username, названия чатов удаляются
+- свободный текст (названия, заметки, подписи) заменяется стабильным хешем
+  той же длины; кнопки главного меню и команды сохраняются как есть
+- file_id медиа заменяются хешем
+
+Формат строки: {"t": время в секундах (epoch), "u": апдейт}
+
+API:
+- enabled() - включена ли запись
+- install(pipeline) - подключает запись к конвейеру
+- start() / stop() - запуск и остановка записи в файл
+- anonymize(update_dict) - обезличенная копия апдейта
+"""
+
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from telegram import Update
+
+import config
+import middleware
+from keyboards import SECTIONS
+
+logger = logging.getLogger(__name__)
+
+RECORD_UPDATES = os.getenv('RECORD_UPDATES', '') not in ('', '0')
+
+RECORDINGS_DIR = Path('data/recordings')
+RECORDING_FILE_MAX_BYTES = 50 * 1024 * 1024
+RECORDING_FILE_BACKUPS = 10
+
+# id, под которыми пользователи из config.json попадают в запись
+PSEUDO_USER_BASE = 100000
+
+_record_log = logging.getLogger("forus.recordings")
+_record_log.propagate = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Текст, который сохраняется как есть: кнопки главного меню
+_KEEP_TEXT = frozenset(SECTIONS)
+
+
+def enabled() -> bool:
+    """Включена ли запись апдейтов."""
+    return RECORD_UPDATES
+
+
+def _digest(value: str, length: int = 8) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:length]
+
+
+def _pseudo_id(real_id: int) -> int:
+    """Обезличенный id пользователя или чата."""
+    slot = config.user_slot(real_id)
+    if slot is not None:
+        return PSEUDO_USER_BASE + slot - 1
+    sign = -1 if real_id < 0 else 1
+    return sign * (900000000 + int(_digest(str(real_id)), 16) % 100000000)
+
+
+def _anonymize_text(text: str) -> str:
+    """Свободный текст -> стабильный хеш той же длины (одинаковый текст - одинаковый хеш)."""
+    if text in _KEEP_TEXT:
+        return text
+    if text.startswith("/"):
+        # Команда без аргументов
+        return text.split()[0]
+    token = f"t{_digest(text)}"
+    return token.ljust(len(text), "_") if len(text) > len(token) else token
+
+
+def _anonymize_person(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Пользователь или чат: только id, тип и признак бота."""
+    result = {"id": _pseudo_id(data["id"])}
+    for key in ("type", "is_bot"):
+        if key in data:
+            result[key] = data[key]
+    if "first_name" in data or data.get("type") == "private":
+        result["first_name"] = f"User{result['id']}"
+    return result
+
+
+def anonymize(data: Any) -> Any:
+    """Возвращает обезличенную копию апдейта (dict из Update.to_dict())."""
+    if isinstance(data, list):
+        return [anonymize(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+
+    result = {}
+    for key, value in data.items():
+        if key in ("from", "user", "chat", "sender_chat") and isinstance(value, dict):
+            result[key] = _anonymize_person(value)
+        elif key in ("text", "caption", "query") and isinstance(value, str):
+            result[key] = _anonymize_text(value)
+        elif key in ("entities", "caption_entities"):
+            # Смещения сущностей не совпадут с обезличенным текстом - оставляем только команды
+            kept = [entity for entity in value if entity.get("type") == "bot_command" and entity.get("offset") == 0]
+            if kept:
+                result[key] = kept
+        elif key in ("file_id", "file_unique_id") and isinstance(value, str):
+            result[key] = f"f{_digest(value, 16)}"
+        elif key in ("reply_markup", "contact", "location", "venue"):
+            continue
+        else:
+            result[key] = anonymize(value)
+
+    # Текст, в котором была команда, должен сохранить сущность bot_command
+    if "entities" in data and "entities" not in result and result.get("text", "").startswith("/"):
+        result["entities"] = [{"type": "bot_command", "offset": 0, "length": len(result["text"])}]
+    return result
+
+
+class RecorderMiddleware(middleware.Middleware):
+    """Стадия конвейера: пишет каждый входящий апдейт."""
+
+    def check(self, update: Update) -> bool:
+        try:
+            line = json.dumps(
+                {"t": round(time.time(), 3), "u": anonymize(update.to_dict())},
+                ensure_ascii=False, separators=(",", ":")
+            )
+            _record_log.info(line)
+        except Exception as e:
+            logger.debug(f"Не удалось записать апдейт {update.update_id}: {e}")
+        return True
+
+
+def install(pipeline: middleware.Pipeline) -> None:
+    """
+    Подключает запись апдейтов.
+
+    Стадия ставится первой, чтобы в запись попадали и отклоненные апдейты -
+    при воспроизведении они должны отклоняться так же.
+    """
+    pipeline.middlewares.insert(0, RecorderMiddleware())
+
+
+def start() -> None:
+    """Запускает запись апдейтов в файл в отдельном потоке."""
+    global _listener
+    RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        RECORDINGS_DIR / "updates.jsonl",
+        maxBytes=RECORDING_FILE_MAX_BYTES,
+        backupCount=RECORDING_FILE_BACKUPS,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    record_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    _record_log.addHandler(logging.handlers.QueueHandler(record_queue))
+    _record_log.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(record_queue, file_handler)
+    _listener.start()
+    logger.info(f"Запись апдейтов включена: {RECORDINGS_DIR / 'updates.jsonl'}")
+
+
+def stop() -> None:
+    """Дописывает оставшиеся апдейты и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(_record_log.handlers):
+        _record_log.removeHandler(handler)
@@ -0,0 +1,280 @@
+"""
+Слой отрисовки экранов бота.
+
+Обработчики не редактируют сообщения напрямую, а ставят экран в очередь
+через edit_screen(). Очередь сбрасывается один раз в конце обработки апдейта:
+- несколько редактирований подряд внутри одного апдейта сливаются в одно
+  (отправляется только последний экран)
+- редактирование, которое не меняет ни текст, ни клавиатуру, не отправляется
+  вовсе (Telegram ответил бы ошибкой "message is not modified")
+- текст длиннее лимита Telegram делится на страницы (screens.split_pages):
+  первая заменяет текущий экран, остальные отправляются продолжением,
+  клавиатура остается под последней
+
+Видео и фотографии отправляются после экрана (очередь сбрасывается перед
+отправкой), один и тот же файл в рамках апдейта - только один раз, а
+несколько файлов - альбомами (sendMediaGroup) по MEDIA_GROUP_SIZE. Экран
+под альбомом (например, кнопки листания) отправляется новым сообщением
+через send_screen().
+
+API:
+- edit_screen(update, text, reply_markup) - поставить экран в очередь
+- flush(update) - отправить отложенный экран немедленно
+- send_video(update, file_id, file_unique_id, caption) - отправить видео
+- send_videos(update, videos) - отправить видео альбомами
+- send_photos(update, photos) - отправить фотографии альбомами
+- send_screen(update, text, reply_markup) - новый экран под отправленным
+- register(application) - регистрирует сброс очереди в конце апдейта
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Type, Union
+
+from telegram import CallbackQuery, Chat, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo, Update
+from telegram.constants import MediaGroupLimit
+from telegram.error import BadRequest
+from telegram.ext import Application, TypeHandler
+
+import screens
+
+logger = logging.getLogger(__name__)
+
+# Группа обработчиков, в которой сбрасывается очередь.
+# Выполняется после всех обработчиков разделов (они в группе 0)
+FLUSH_GROUP = 100
+
+# Сколько последних экранов помнить (по одному на сообщение)
+LAST_SENT_LIMIT = 1024
+
+# Файлов в одном альбоме (ограничение Telegram)
+MEDIA_GROUP_SIZE = MediaGroupLimit.MAX_MEDIA_LENGTH
+
+MessageKey = Tuple[Union[int, str], Union[int, str]]
+Screen = Tuple[str, Optional[InlineKeyboardMarkup]]
+# (file_id, file_unique_id или None, подпись или None)
+Media = Tuple[str, Optional[str], Optional[str]]
+
+# (chat_id, message_id) -> последний отправленный (text, reply_markup)
+_last_sent: "OrderedDict[MessageKey, Screen]" = OrderedDict()
+
+# update_id -> (query, text, reply_markup), ожидающие отправки
+_pending: Dict[int, Tuple[CallbackQuery, str, Optional[InlineKeyboardMarkup]]] = {}
+
+# update_id -> ключи файлов, уже отправленных в этом апдейте
+_sent_media: Dict[int, Set[str]] = {}
+
+
+def _message_key(query: CallbackQuery) -> MessageKey:
+    """Ключ сообщения, к которому привязан callback query."""
+    if query.message is None:
+        return ("inline", query.inline_message_id)
+    return (query.message.chat_id, query.message.message_id)
+
+
+def _remember(key: MessageKey, text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> None:
+    """Запоминает последний экран сообщения, вытесняя самые старые."""
+    _last_sent[key] = (text, reply_markup)
+    _last_sent.move_to_end(key)
+    while len(_last_sent) > LAST_SENT_LIMIT:
+        _last_sent.popitem(last=False)
+
+
+def _is_unchanged(query: CallbackQuery, text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> bool:
+    """
+    Проверяет, совпадает ли новый экран с тем, что уже показан.
+
+    Сначала сверяемся с запомненным экраном, а если его нет (например, после
+    перезапуска) - с сообщением, которое пришло вместе с callback query.
+    """
+    key = _message_key(query)
+    if key in _last_sent:
+        return _last_sent[key] == (text, reply_markup)
+    if query.message is None:
+        return False
+    return query.message.text == text and query.message.reply_markup == reply_markup
+
+
+async def edit_screen(
+    update: Update,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+) -> None:
+    """
+    Ставит в очередь редактирование сообщения, на котором нажата кнопка.
+
+    Args:
+        update: Текущий апдейт (должен содержать callback_query)
+        text: Новый текст сообщения
+        reply_markup: Новая inline клавиатура (None - убрать клавиатуру)
+
+    Повторный вызов в рамках того же апдейта заменяет предыдущий экран.
+    """
+    _pending[update.update_id] = (update.callback_query, text, reply_markup)
+
+
+async def flush(update: Update) -> None:
+    """
+    Отправляет отложенный экран апдейта, если он есть.
+
+    Вызывается автоматически в конце апдейта. Обработчик должен вызвать её сам,
+    если после экрана отправляет другие сообщения (видео и т.п.), чтобы
+    сохранить порядок сообщений в чате.
+    """
+    pending = _pending.pop(update.update_id, None)
+    if pending is None:
+        return
+
+    query, text, reply_markup = pending
+    if _is_unchanged(query, text, reply_markup):
+        return
+
+    key = _message_key(query)
+    if query.message is None:
+        # Inline-сообщение нельзя продолжить другими сообщениями - обрезаем
+        pages = [screens.truncate(text, screens.MAX_MESSAGE_LENGTH)]
+    else:
+        pages = screens.split_pages(text)
+    first_markup = reply_markup if len(pages) == 1 else None
+    try:
+        await query.edit_message_text(pages[0], reply_markup=first_markup, parse_mode=screens.PARSE_MODE)
+        _remember(key, pages[0], first_markup)
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            _remember(key, pages[0], first_markup)
+        elif query.message is None:
+            raise
+        else:
+            # Сообщение нельзя отредактировать (например, это видео) - отправляем новое
+            logger.debug(f"Редактирование не удалось ({e}), отправляем новое сообщение")
+            message = await query.message.reply_text(pages[0], reply_markup=first_markup, parse_mode=screens.PARSE_MODE)
+            _remember((message.chat_id, message.message_id), pages[0], first_markup)
+
+    if len(pages) > 1:
+        await _send_pages(query.message.chat, pages[1:], reply_markup)
+
+
+async def _send_pages(
+    chat: Chat,
+    pages: List[str],
+    reply_markup: Optional[InlineKeyboardMarkup]
+) -> None:
+    """Отправляет страницы экрана новыми сообщениями; клавиатура - под последней страницей."""
+    for number, page in enumerate(pages, 1):
+        markup = reply_markup if number == len(pages) else None
+        message = await chat.send_message(page, reply_markup=markup, parse_mode=screens.PARSE_MODE)
+    _remember((message.chat_id, message.message_id), page, markup)
+
+
+async def send_screen(
+    update: Update,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+) -> None:
+    """
+    Отправляет экран новым сообщением в чат апдейта (после отложенного экрана).
+
+    Нужен, когда кнопки должны оказаться под только что отправленными
+    файлами: альбом нельзя отредактировать и к нему нельзя прикрепить клавиатуру.
+    """
+    await flush(update)
+    await _send_pages(update.effective_chat, screens.split_pages(text), reply_markup)
+
+
+def _claim_media(update: Update, file_id: str, file_unique_id: Optional[str]) -> bool:
+    """Отмечает файл отправленным в этом апдейте; False - уже был отправлен."""
+    sent = _sent_media.setdefault(update.update_id, set())
+    key = file_unique_id or file_id
+    if key in sent:
+        logger.debug(f"Файл {key} уже отправлен в апдейте {update.update_id}")
+        return False
+    sent.add(key)
+    return True
+
+
+async def send_video(
+    update: Update,
+    file_id: str,
+    file_unique_id: Optional[str] = None,
+    caption: Optional[str] = None
+) -> bool:
+    """
+    Отправляет видео в чат апдейта после отложенного экрана.
+
+    Args:
+        file_id: ID файла в Telegram
+        file_unique_id: Постоянный ID файла - по нему узнается повтор
+                        (без него повтор узнается по file_id)
+        caption: Подпись
+
+    Returns:
+        False, если это видео уже отправлено в рамках апдейта
+    """
+    if not _claim_media(update, file_id, file_unique_id):
+        return False
+    await flush(update)
+    await update.effective_chat.send_video(file_id, caption=caption)
+    return True
+
+
+async def _send_album(
+    update: Update,
+    items: Sequence[Media],
+    input_media: Type[Union[InputMediaPhoto, InputMediaVideo]],
+    send_single: Callable[[Chat], Callable]
+) -> int:
+    """
+    Отправляет файлы альбомами по MEDIA_GROUP_SIZE (повторы пропускаются).
+
+    Альбом из одного файла Telegram не принимает - такой файл
+    отправляется обычным сообщением (send_single(chat)).
+    """
+    unique = [item for item in items if _claim_media(update, item[0], item[1])]
+    if not unique:
+        return 0
+    await flush(update)
+    chat = update.effective_chat
+    for start in range(0, len(unique), MEDIA_GROUP_SIZE):
+        batch = unique[start:start + MEDIA_GROUP_SIZE]
+        if len(batch) == 1:
+            file_id, _, caption = batch[0]
+            await send_single(chat)(file_id, caption=caption)
+        else:
+            await chat.send_media_group([
+                input_media(file_id, caption=caption) for file_id, _, caption in batch
+            ])
+    logger.debug(f"Отправлено файлов: {len(unique)} ({(len(unique) - 1) // MEDIA_GROUP_SIZE + 1} сообщений)")
+    return len(unique)
+
+
+async def send_videos(update: Update, videos: Sequence[Media]) -> int:
+    """
+    Отправляет видео альбомами по MEDIA_GROUP_SIZE (повторы пропускаются).
+
+    Returns:
+        Сколько видео отправлено
+    """
+    return await _send_album(update, videos, InputMediaVideo, lambda chat: chat.send_video)
+
+
+async def send_photos(update: Update, photos: Sequence[Media]) -> int:
+    """
+    Отправляет фотографии альбомами по MEDIA_GROUP_SIZE (повторы пропускаются).
+
+    Фотографии отправляются по file_id - байты заново не загружаются.
+
+    Returns:
+        Сколько фотографий отправлено
+    """
+    return await _send_album(update, photos, InputMediaPhoto, lambda chat: chat.send_photo)
+
+
+async def _flush_handler(update: Update, context) -> None:
+    """Обработчик последней группы - сбрасывает очередь апдейта."""
+    _sent_media.pop(update.update_id, None)
+    await flush(update)
+
+
+def register(application: Application) -> None:
+    """Регистрирует сброс очереди экранов в конце обработки каждого апдейта."""
+    application.add_handler(TypeHandler(Update, _flush_handler), group=FLUSH_GROUP)
@@ -0,0 +1,296 @@
+"""
+Статистика, экспорт и импорт списков - задачи пула процессов (jobs.py).
+
+Обработчик собирает данные тенанта (collect_lists) в словари и отправляет
+их задаче; сама задача базу не читает и выполняется в процессе пула:
+- stats - текст статистики: сколько записей сделано по разделам и
+  категориям, оценки участников, распределение оценок, совпадение вкусов
+- export_csv - CSV всех записей фильмов, игр, активностей и поездок
+- import_csv - разбор и проверка загруженного CSV того же формата;
+  записи добавляет обработчик (database.import_items)
+
+Формат CSV (UTF-8 с BOM - открывается в Excel): Раздел, Название, Заметка,
+Категория (жанр для игр), Готово ("да" - просмотрено/пройдено/выполнено/
+посещено), затем по колонке оценки на участника в порядке номеров.
+Импорт принимает и разделитель ";" (так сохраняет русский Excel), и
+кодировку cp1251; строки с названием, которое уже есть в разделе,
+пропускаются.
+
+API:
+- EXPORT_SECTIONS, SECTION_TITLES - разделы и их названия в CSV
+- collect_lists() - данные текущего тенанта для stats и export_csv
+- build_stats(payload), export_csv(payload), parse_import(payload) - задачи
+"""
+
+import csv
+import io
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import database
+import jobs
+import screens
+import tenants
+
+EXPORT_SECTIONS = ("movies", "games", "activities", "trips")
+SECTION_TITLES = {"movies": "Фильмы", "games": "Игры", "activities": "Активности", "trips": "Поездки"}
+SECTION_ICONS = {"movies": "🎬", "games": "🎮", "activities": "📝", "trips": "✈️"}
+DONE_WORDS = {"movies": "просмотрено", "games": "пройдено", "activities": "выполнено", "trips": "посещено"}
+TRUE_VALUES = {"да", "yes", "y", "1", "true", "+", "✅"}
+HEADER = ["Раздел", "Название", "Заметка", "Категория", "Готово"]
+# Как часто задача сообщает прогресс (строк)
+PROGRESS_STEP = 500
+MAX_TITLE_LENGTH = 200
+# Сколько ошибок разбора возвращать (остальные только считаются)
+MAX_ERRORS = 20
+
+
+# ============================================
+# ДАННЫЕ (в процессе бота)
+# ============================================
+
+def _item(title: str, note: Optional[str], group: Optional[str], done: bool,
+          ratings: Optional[Dict[int, int]] = None) -> Dict[str, Any]:
+    return {"title": title, "note": note, "group": group, "done": done, "ratings": ratings or {}}
+
+
+def collect_lists() -> Dict[str, Any]:
+    """
+    Записи разделов текущего тенанта для задач stats и export_csv.
+
+    Returns:
+        {"members": [имена по номерам], "sections": {таблица: [запись]}};
+        запись - title, note, group, done, ratings ({номер участника: оценка})
+    """
+    slots = {member.user_id: slot for slot, member in enumerate(tenants.members(), 1)}
+    ratings: Dict[str, Dict[int, Dict[int, int]]] = {}
+    for table in database.RATED_TABLES:
+        by_item: Dict[int, Dict[int, int]] = {}
+        for row in database.get_all_ratings(table):
+            slot = slots.get(row['user_id'])
+            if slot is not None:
+                by_item.setdefault(row['item_id'], {})[slot] = row['score']
+        ratings[table] = by_item
+
+    sections = {
+        "movies": [
+            _item(row['title'], row['note'], row['category_title'], bool(row['watched']),
+                  ratings["movies"].get(row['id']))
+            for row in database.get_movies()
+        ],
+        "games": [
+            _item(row['title'], row['note'], row['genre'], row['status'] == 'done', ratings["games"].get(row['id']))
+            for row in database.get_games()
+        ],
+        "activities": [
+            _item(row['title'], row['note'], None, row['status'] == 'done') for row in database.get_activities()
+        ],
+        "trips": [
+            _item(row['title'], row['note'], row['category_title'], bool(row['visited']))
+            for row in database.get_trips()
+        ],
+    }
+    return {"members": list(tenants.names()), "sections": sections}
+
+
+# ============================================
+# СТАТИСТИКА
+# ============================================
+
+def _percent(part: int, whole: int) -> str:
+    return f"{part * 100 // whole}%" if whole else "0%"
+
+
+def _correlation(pairs: List[Tuple[int, int]]) -> Optional[float]:
+    """Коэффициент корреляции Пирсона оценок двух участников (None - не определен)."""
+    if len(pairs) < 3:
+        return None
+    n = len(pairs)
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    var_x = sum((x - mean_x) ** 2 for x, _ in pairs)
+    var_y = sum((y - mean_y) ** 2 for _, y in pairs)
+    if not var_x or not var_y:
+        return None
+    return cov / math.sqrt(var_x * var_y)
+
+
+def _section_lines(table: str, items: List[Dict[str, Any]]) -> List[str]:
+    done = sum(1 for item in items if item['done'])
+    lines = [f"{SECTION_ICONS[table]} {SECTION_TITLES[table]}: {len(items)} "
+             f"({DONE_WORDS[table]} {done}, {_percent(done, len(items))})"]
+    groups: Dict[str, List[int]] = {}
+    for item in items:
+        if item['group']:
+            counts = groups.setdefault(item['group'], [0, 0])
+            counts[0] += 1
+            counts[1] += 1 if item['done'] else 0
+    for group, (total, group_done) in sorted(groups.items(), key=lambda entry: -entry[1][0])[:5]:
+        lines.append(f"   {group}: {total} ({DONE_WORDS[table]} {group_done})")
+    return lines
+
+
+def _rating_lines(members: List[str], rated: List[Dict[str, Any]]) -> List[str]:
+    if not rated:
+        return []
+    lines = ["", "⭐ Оценки"]
+    histogram = [0] * 11
+    for slot, name in enumerate(members, 1):
+        scores = [item['ratings'][slot] for item in rated if slot in item['ratings']]
+        if scores:
+            lines.append(f"{name}: {len(scores)} {screens.plural(len(scores), ('оценка', 'оценки', 'оценок'))}, "
+                         f"средняя {sum(scores) / len(scores):.1f}")
+    for item in rated:
+        for score in item['ratings'].values():
+            if 1 <= score <= 10:
+                histogram[score] += 1
+    widest = max(histogram) or 1
+    lines.append("Распределение:")
+    for score in range(1, 11):
+        bar = "█" * math.ceil(histogram[score] * 12 / widest) if histogram[score] else ""
+        lines.append(f"{score:>2} {bar} {histogram[score] or ''}".rstrip())
+
+    if len(members) >= 2:
+        both = [item for item in rated if 1 in item['ratings'] and 2 in item['ratings']]
+        if both:
+            pairs = [(item['ratings'][1], item['ratings'][2]) for item in both]
+            difference = sum(abs(x - y) for x, y in pairs) / len(pairs)
+            correlation = _correlation(pairs)
+            text = f"\n🤝 {members[0]} и {members[1]}: {len(pairs)} общих оценок, средняя разница {difference:.1f}"
+            if correlation is not None:
+                text += f", корреляция {correlation:.2f}"
+            lines.append(text)
+            disputed = sorted(both, key=lambda item: -abs(item['ratings'][1] - item['ratings'][2]))[:3]
+            if abs(disputed[0]['ratings'][1] - disputed[0]['ratings'][2]) >= 3:
+                lines.append("Самые спорные: " + ", ".join(
+                    f"{item['title']} ({item['ratings'][1]}/{item['ratings'][2]})" for item in disputed
+                    if abs(item['ratings'][1] - item['ratings'][2]) >= 3
+                ))
+            best = sorted(both, key=lambda item: -(item['ratings'][1] + item['ratings'][2]))[:3]
+            lines.append("Лучшее для обоих: " + ", ".join(
+                f"{item['title']} ({(item['ratings'][1] + item['ratings'][2]) / 2:g})" for item in best
+            ))
+    return lines
+
+
+@jobs.task("stats")
+def build_stats(payload: Dict[str, Any]) -> str:
+    """Текст статистики по данным collect_lists()."""
+    sections = payload["sections"]
+    lines = ["📊 Статистика", ""]
+    for step, table in enumerate(EXPORT_SECTIONS):
+        jobs.progress(step, len(EXPORT_SECTIONS) + 1, SECTION_TITLES[table])
+        lines.extend(_section_lines(table, sections.get(table, [])))
+    jobs.progress(len(EXPORT_SECTIONS), len(EXPORT_SECTIONS) + 1, "Оценки")
+    rated = [item for table in database.RATED_TABLES for item in sections.get(table, []) if item['ratings']]
+    lines.extend(_rating_lines(payload["members"], rated))
+    return "\n".join(lines)
+
+
+# ============================================
+# ЭКСПОРТ И ИМПОРТ
+# ============================================
+
+@jobs.task("export_csv")
+def export_csv(payload: Dict[str, Any]) -> bytes:
+    """CSV записей по данным collect_lists() (UTF-8 с BOM)."""
+    members = payload["members"]
+    sections = payload["sections"]
+    total = sum(len(items) for items in sections.values())
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HEADER + [f"Оценка: {name}" for name in members])
+    written = 0
+    for table in EXPORT_SECTIONS:
+        for item in sections.get(table, []):
+            ratings = item['ratings']
+            writer.writerow(
+                [SECTION_TITLES[table], item['title'], item['note'] or "", item['group'] or "",
+                 "да" if item['done'] else ""]
+                + [ratings.get(slot, "") for slot in range(1, len(members) + 1)]
+            )
+            written += 1
+            if written % PROGRESS_STEP == 0:
+                jobs.progress(written, total)
+    return out.getvalue().encode("utf-8-sig")
+
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1251")
+
+
+def _dialect(text: str) -> Any:
+    try:
+        return csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        return csv.excel
+
+
+@jobs.task("import_csv")
+def parse_import(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Разбирает CSV импорта.
+
+    payload: data (bytes файла), members (число участников - колонок оценок),
+    existing ({таблица: [названия]} - такие записи пропускаются).
+
+    Returns:
+        items - записи для database.import_items (ratings - {номер участника: оценка}),
+        errors - [(номер строки, ошибка)] (не больше MAX_ERRORS), error_count, skipped
+    """
+    text = _decode(payload["data"])
+    rows = list(csv.reader(io.StringIO(text), _dialect(text)))
+    tables = {title.casefold(): table for table, title in SECTION_TITLES.items()}
+    tables.update({table: table for table in EXPORT_SECTIONS})
+    seen = {(table, title.casefold()) for table, titles in payload["existing"].items() for title in titles}
+    members = payload["members"]
+
+    items: List[Dict[str, Any]] = []
+    errors: List[Tuple[int, str]] = []
+    error_count = skipped = 0
+    for line, row in enumerate(rows, 1):
+        if line % PROGRESS_STEP == 0:
+            jobs.progress(line, len(rows))
+        if not any(cell.strip() for cell in row):
+            continue
+        if line == 1 and row[0].strip() == HEADER[0]:
+            continue
+        cells = [cell.strip() for cell in row] + [""] * (len(HEADER) - len(row))
+        section, title, note, group, done = cells[:len(HEADER)]
+        table = tables.get(section.casefold())
+        problem = None
+        ratings: Dict[int, int] = {}
+        if table is None:
+            problem = f"неизвестный раздел «{section}»"
+        elif not title:
+            problem = "пустое название"
+        elif len(title) > MAX_TITLE_LENGTH:
+            problem = f"название длиннее {MAX_TITLE_LENGTH} символов"
+        else:
+            for slot, value in enumerate(cells[len(HEADER):len(HEADER) + members], 1):
+                if not value:
+                    continue
+                if not value.isdigit() or not 1 <= int(value) <= 10:
+                    problem = f"оценка «{value}» - нужно число от 1 до 10"
+                    break
+                ratings[slot] = int(value)
+        if problem:
+            error_count += 1
+            if len(errors) < MAX_ERRORS:
+                errors.append((line, problem))
+            continue
+        key = (table, title.casefold())
+        if key in seen:
+            skipped += 1
+            continue
+        seen.add(key)
+        items.append({
+            "table": table, "title": title, "note": note or None, "group": group or None,
+            "done": done.casefold() in TRUE_VALUES,
+            "ratings": ratings if table in database.RATED_TABLES else {},
+        })
+    return {"items": items, "errors": errors, "error_count": error_count, "skipped": skipped}
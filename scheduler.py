@@ -0,0 +1,273 @@
+"""
+Напоминания и дайджесты по расписанию (JobQueue python-telegram-bot).
+
+Расписания хранятся в таблице schedules и переживают перезапуск: при
+запуске бота (start) они загружаются в JobQueue. Таймер заводится не на
+каждое расписание, а на корзину - интервал в BUCKET_SECONDS, в который
+попадает время срабатывания. Сработавший таймер одним запросом выбирает
+все наступившие расписания (get_due_schedules) и отправляет их, поэтому
+сотня напоминаний на одно время - один таймер APScheduler.
+
+Виды расписаний:
+- digest - дайджест всем пользователям (по умолчанию раз в неделю):
+  случайные несделанные записи разделов, по одному запросу на раздел.
+  Расписание одно на все тенанты: каждый тенант получает дайджест своих списков
+- reminder - напоминание о записи (например, об активности) в чат
+
+Планировщик общий для всех тенантов: расписание выполняется от имени
+тенанта, которому принадлежит (database.tenant_scope).
+
+Без APScheduler (python-telegram-bot без [job-queue]) у приложения нет
+JobQueue: планировщик не запускается, расписания ждут в базе.
+
+В режиме нескольких процессов (workers.py) таймеры есть только у первого
+рабочего; остальные лишь сохраняют расписания в базу, а первый раз в
+FOLLOW_SECONDS заводит таймеры появившихся корзин.
+
+Настройки (переменные окружения):
+- DIGEST_WEEKDAY - день недели дайджеста, 0 - понедельник (по умолчанию 6)
+- DIGEST_TIME - время дайджеста ЧЧ:ММ, местное (по умолчанию 19:00)
+
+API:
+- DIGEST_SECTIONS - разделы дайджеста
+- bucket_of(due_at) - корзина времени срабатывания
+- build_digest() - текст дайджеста
+- next_digest_at(now) - время ближайшего дайджеста
+- schedule(job_queue, due_at) - завести таймер корзины (если его еще нет)
+- add_reminder(job_queue, chat_id, table, item_id, due_at) - напоминание о записи
+- sync(job_queue) - завести таймеры всех корзин из базы
+- start(application) - загрузить расписания в JobQueue
+- register(application) - регистрирует команду /digest
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import TelegramError
+from telegram.ext import Application, CommandHandler, ContextTypes, JobQueue
+
+import callbacks
+import database
+import screens
+import tenants
+
+logger = logging.getLogger(__name__)
+
+# Ширина корзины: расписания, попавшие в одну минуту, отправляет один таймер
+BUCKET_SECONDS = 60
+WEEK_SECONDS = 7 * 24 * 3600
+
+# Раз во сколько секунд start() заводит таймеры корзин, созданных
+# другими процессами (None - только свои; задает workers.py)
+FOLLOW_SECONDS: Optional[float] = None
+
+DIGEST_WEEKDAY = int(os.getenv('DIGEST_WEEKDAY', '6'))
+DIGEST_TIME = os.getenv('DIGEST_TIME', '19:00')
+
+# (заголовок, таблица, сколько записей показать)
+DIGEST_SECTIONS = [
+    ("🎬 Фильмы", "movies", 5),
+    ("📝 Активности", "activities", 3),
+    ("🎮 Игры", "games", 3),
+    ("✈️ Поездки", "trips", 3),
+]
+
+# Таблица -> (загрузка записи, маршрут кнопки записи)
+REMINDER_ITEMS: Dict[str, Tuple[Callable[[int], object], str]] = {
+    "movies": (database.get_movie_by_id, "movie"),
+    "activities": (database.get_activity_by_id, "activity"),
+    "games": (database.get_game_by_id, "game"),
+    "trips": (database.get_trip_by_id, "trip"),
+}
+
+DIGEST_HEADER = "🗓 Дайджест недели"
+DIGEST_SECTION = screens.Template("\n\n{title} - еще {total}:")
+DIGEST_LINE = screens.Template("• {title}")
+REMINDER_TEXT = screens.Template("⏰ Напоминание: {title}")
+
+
+def bucket_of(due_at: int) -> int:
+    """Корзина времени срабатывания: due_at, округленное вверх до BUCKET_SECONDS."""
+    return -(-due_at // BUCKET_SECONDS) * BUCKET_SECONDS
+
+
+def build_digest() -> str:
+    """Текст дайджеста: по одному запросу на раздел, разделы без несделанных пропускаются."""
+    parts = [screens.escape(DIGEST_HEADER, screens.PARSE_MODE)]
+    for title, table, limit in DIGEST_SECTIONS:
+        rows = database.get_digest_section(table, limit)
+        if not rows:
+            continue
+        parts.append(DIGEST_SECTION.render(title=title, total=rows[0]['total']))
+        parts.extend("\n" + line for line in DIGEST_LINE.render_lines(rows))
+    if len(parts) == 1:
+        parts.append(screens.escape("\n\n🎉 Все списки пройдены!", screens.PARSE_MODE))
+    return "".join(parts)
+
+
+def next_digest_at(now: Optional[float] = None) -> int:
+    """Unix-время ближайшего дайджеста (DIGEST_WEEKDAY, DIGEST_TIME по местному времени)."""
+    current = datetime.fromtimestamp(time.time() if now is None else now)
+    hour, minute = map(int, DIGEST_TIME.split(":"))
+    moment = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    moment += timedelta(days=(DIGEST_WEEKDAY - moment.weekday()) % 7)
+    if moment <= current:
+        moment += timedelta(days=7)
+    return int(moment.timestamp())
+
+
+def _next_due(due_at: int, repeat_seconds: int, now: int) -> int:
+    """Следующее срабатывание повторяющегося расписания после now (пропущенные - не догоняем)."""
+    missed = (now - due_at) // repeat_seconds + 1
+    return due_at + missed * repeat_seconds
+
+
+async def _send_reminder(bot: Bot, row) -> None:
+    load, route = REMINDER_ITEMS[row['item_table']]
+    item = load(row['item_id'])
+    if item is None:
+        logger.info(f"Напоминание {row['id']}: запись {row['item_table']}/{row['item_id']} удалена")
+        return
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📂 Открыть", callback_data=callbacks.encode(route, row['item_id']))]
+    ])
+    await bot.send_message(
+        row['chat_id'], REMINDER_TEXT.render(item), reply_markup=keyboard, parse_mode=screens.PARSE_MODE
+    )
+
+
+async def _send_digest(bot: Bot, row, digests: Dict[int, str]) -> None:
+    """
+    Дайджест: в чат расписания или (chat_id NULL) участникам всех тенантов.
+
+    Текст у каждого тенанта свой и строится один раз на корзину (digests).
+    Ошибка отправки одному участнику не мешает остальным.
+    """
+    if row['chat_id']:
+        targets = [(row['tenant_id'], row['chat_id'])]
+    else:
+        targets = [
+            (tenant_id, member.user_id)
+            for tenant_id in database.get_tenant_ids() for member in tenants.members(tenant_id)
+        ]
+    for tenant_id, chat_id in targets:
+        if tenant_id not in digests:
+            with database.tenant_scope(tenant_id):
+                digests[tenant_id] = build_digest()
+        try:
+            await bot.send_message(chat_id, digests[tenant_id], parse_mode=screens.PARSE_MODE)
+        except TelegramError as e:
+            logger.error(f"❌ Дайджест {row['id']} не отправлен в чат {chat_id}: {e}")
+
+
+async def _run_bucket(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Таймер корзины: отправляет все наступившие расписания и переносит повторяющиеся."""
+    now = int(time.time())
+    due = database.get_due_schedules(now)
+    digests: Dict[int, str] = {}
+    for row in due:
+        try:
+            if row['kind'] == 'digest':
+                await _send_digest(context.bot, row, digests)
+            else:
+                # Запись напоминания - в данных тенанта, создавшего напоминание
+                with database.tenant_scope(row['tenant_id']):
+                    await _send_reminder(context.bot, row)
+        except TelegramError as e:
+            logger.error(f"❌ Расписание {row['id']} ({row['kind']}) не отправлено: {e}")
+        except Exception:
+            # Ошибка базы (шард тенанта) или сборки текста - расписание все равно
+            # переносится или удаляется, остальные отправляются
+            logger.exception(f"❌ Ошибка расписания {row['id']} ({row['kind']})")
+
+        if row['repeat_seconds']:
+            due_at = _next_due(row['due_at'], row['repeat_seconds'], now)
+            database.reschedule(row['id'], due_at)
+            schedule(context.job_queue, due_at)
+        else:
+            database.delete_schedule(row['id'])
+    logger.info(f"Расписания отправлены: {len(due)}")
+
+
+def schedule(job_queue: JobQueue, due_at: int) -> None:
+    """Заводит таймер корзины, в которую попадает due_at (если его еще нет)."""
+    bucket = bucket_of(due_at)
+    name = f"schedule:{bucket}"
+    if job_queue.get_jobs_by_name(name):
+        return
+    job_queue.run_once(_run_bucket, when=max(bucket - time.time(), 0), name=name)
+
+
+def add_reminder(job_queue: Optional[JobQueue], chat_id: int, table: str, item_id: int, due_at: int) -> int:
+    """
+    Создает напоминание о записи и заводит его таймер.
+
+    Args:
+        job_queue: JobQueue приложения (None - только сохранить, таймер заведет start())
+        table: Таблица записи (ключ REMINDER_ITEMS)
+
+    Returns:
+        ID расписания
+    """
+    if table not in REMINDER_ITEMS:
+        raise KeyError(f"Напоминания для таблицы {table} не поддерживаются")
+    schedule_id = database.create_schedule("reminder", due_at, chat_id, table, item_id)
+    if job_queue is not None:
+        schedule(job_queue, due_at)
+    return schedule_id
+
+
+def ensure_digest() -> None:
+    """Создает еженедельный дайджест всех тенантов, если его еще нет."""
+    with database.tenant_scope(database.DEFAULT_TENANT):
+        if not database.get_schedules("digest"):
+            database.create_schedule("digest", next_digest_at(), repeat_seconds=WEEK_SECONDS)
+            logger.info("Создано расписание еженедельного дайджеста")
+
+
+def sync(job_queue: JobQueue) -> int:
+    """Заводит таймеры всех корзин из базы (уже заведенные пропускаются). Возвращает число корзин."""
+    buckets = database.get_schedule_buckets(BUCKET_SECONDS)
+    for bucket in buckets:
+        schedule(job_queue, bucket)
+    return len(buckets)
+
+
+async def _follow(context: ContextTypes.DEFAULT_TYPE) -> None:
+    sync(context.job_queue)
+
+
+def start(application: Application) -> None:
+    """Загружает расписания из базы в JobQueue: по таймеру на корзину."""
+    if application.job_queue is None:
+        logger.warning(
+            "JobQueue нет (нужен python-telegram-bot[job-queue] или это не первый рабочий workers.py) - "
+            "расписания не запущены"
+        )
+        return
+    ensure_digest()
+    count = sync(application.job_queue)
+    if FOLLOW_SECONDS:
+        application.job_queue.run_repeating(_follow, interval=FOLLOW_SECONDS, name="schedule:follow")
+    logger.info(f"Планировщик запущен: {count} таймеров")
+
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /digest: дайджест сейчас и время следующего."""
+    # Расписание дайджеста одно на все тенанты и принадлежит DEFAULT_TENANT
+    with database.tenant_scope(database.DEFAULT_TENANT):
+        digests = database.get_schedules("digest")
+    text = build_digest()
+    if digests:
+        next_at = datetime.fromtimestamp(digests[0]['due_at'])
+        text += screens.escape(f"\n\n⏭ Следующий дайджест: {next_at:%d.%m %H:%M}", screens.PARSE_MODE)
+    await update.message.reply_text(text, parse_mode=screens.PARSE_MODE)
+
+
+def register(application: Application) -> None:
+    """Регистрирует команду /digest."""
+    application.add_handler(CommandHandler("digest", digest_command), group=0)
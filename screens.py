@@ -0,0 +1,275 @@
+"""
+Сборка текста экранов: списков и карточек.
+
+Обработчики не склеивают текст через += в циклах, а описывают экран
+шаблонами и собирают его функциями модуля:
+- шаблон (Template) разбирается при импорте обработчика и компилируется
+  в f-строку, строки списка склеиваются одним "".join()
+- значения из базы экранируются под режим разметки (PARSE_MODE):
+  HTML, Markdown, MarkdownV2 или обычный текст
+- текст длиннее лимита Telegram (4096 символов) режется на страницы
+  по границам строк (render.flush отправляет их продолжением),
+  одно поле можно обрезать с многоточием (truncate)
+
+API:
+- PARSE_MODE - режим разметки сообщений бота (None - обычный текст)
+- Template(source) - шаблон в синтаксисе str.format: "{n}. {title}"
+  (render() - одна строка, render_lines() - строки по списку записей)
+- escape(value, parse_mode) - экранирование значения
+- render_list(header, items, line, empty_text, limit, show_count) - текст списка
+- render_detail(parts) - текст карточки из частей (None пропускаются)
+- truncate(text, limit) - обрезка с многоточием
+- split_pages(text, limit) - разбиение на страницы
+- plural(n, forms) - форма слова для числа ("3 фильма")
+"""
+
+import html
+import logging
+import string
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from telegram.constants import MessageLimit, ParseMode
+from telegram.helpers import escape_markdown
+
+logger = logging.getLogger(__name__)
+
+# Режим разметки сообщений бота. Сейчас бот шлет обычный текст
+PARSE_MODE: Optional[str] = None
+
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+
+# Сколько элементов показывать в тексте списка (остальные - "... и еще N")
+LIST_PREVIEW = 10
+
+ELLIPSIS = "…"
+
+# (текст до поля, имя поля или None, спецификация формата)
+_Part = Tuple[str, Optional[str], str]
+
+
+_ESCAPERS: Dict[Optional[str], Callable[[str], str]] = {
+    None: str,
+    ParseMode.HTML: lambda text: html.escape(text, quote=False),
+    ParseMode.MARKDOWN: lambda text: escape_markdown(text, version=1),
+    ParseMode.MARKDOWN_V2: lambda text: escape_markdown(text, version=2),
+}
+
+
+def escape(value: Any, parse_mode: Optional[str] = None) -> str:
+    """Экранирует значение для подстановки в текст с разметкой parse_mode."""
+    return _ESCAPERS[parse_mode](str(value))
+
+
+class Template:
+    """
+    Предварительно скомпилированный шаблон строки.
+
+    Синтаксис str.format ("{n}. {title} - {rating:.1f}/10"). Шаблон один раз
+    разбирается и при первой отрисовке в режиме разметки компилируется
+    в функцию с f-строкой (текст шаблона экранируется при компиляции).
+    Для списков компилируется comprehension по всем записям сразу.
+    """
+
+    __slots__ = ("source", "_parts", "_compiled")
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: List[_Part] = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if conversion:
+                raise ValueError(f"Преобразования !{conversion} в шаблонах не поддерживаются: {source!r}")
+            if field is not None and not field.isidentifier():
+                raise ValueError(f"Поле шаблона должно быть именем: {field!r} в {source!r}")
+            if "{" in (spec or ""):
+                raise ValueError(f"Вложенные поля в формате не поддерживаются: {source!r}")
+            self._parts.append((literal, field, spec or ""))
+        # (вид функции, режим разметки) -> скомпилированная функция
+        self._compiled: Dict[Tuple[str, Optional[str]], Callable] = {}
+
+    def _expression(self, parse_mode: Optional[str], lookup: Callable[[str], str]) -> str:
+        """Выражение с f-строкой; lookup(field) - выражение для значения поля."""
+        pieces = []
+        for literal, field, spec in self._parts:
+            if literal:
+                pieces.append(repr(escape(literal, parse_mode)))
+            if field is None:
+                continue
+            value = lookup(field)
+            if parse_mode is None:
+                pieces.append(f'f"{{{value}{":" + spec if spec else ""}}}"')
+            else:
+                formatted = f"format({value}, {spec!r})" if spec else f"str({value})"
+                pieces.append(f'f"{{escape({formatted})}}"')
+        return " ".join(pieces) or "''"
+
+    def _compile(self, source: str, parse_mode: Optional[str]) -> Callable:
+        code = compile(source, f"<template {self.source!r}>", "eval")
+        return eval(code, {"escape": _ESCAPERS[parse_mode], "format": format, "str": str})
+
+    def _render_func(self, parse_mode: Optional[str]) -> Callable[[Any, Dict[str, Any]], str]:
+        """Функция (row, values) -> str для режима разметки."""
+        key = ("one", parse_mode)
+        func = self._compiled.get(key)
+        if func is None:
+            body = self._expression(
+                parse_mode, lambda field: f"(values[{field!r}] if {field!r} in values else row[{field!r}])"
+            )
+            func = self._compiled[key] = self._compile(f"lambda row, values: {body}", parse_mode)
+        return func
+
+    def _lines_func(self, parse_mode: Optional[str]) -> Callable[[Sequence[Any], int], List[str]]:
+        """Функция (rows, start) -> строки: весь цикл по записям внутри одной comprehension."""
+        key = ("lines", parse_mode)
+        func = self._compiled.get(key)
+        if func is None:
+            body = self._expression(parse_mode, lambda field: "n" if field == "n" else f"row[{field!r}]")
+            func = self._compiled[key] = self._compile(
+                f"lambda rows, start: [{body} for n, row in enumerate(rows, start)]", parse_mode
+            )
+        return func
+
+    def render(self, row: Any = None, parse_mode: Optional[str] = None, **values: Any) -> str:
+        """
+        Подставляет значения в шаблон.
+
+        Args:
+            row: Запись из базы (sqlite3.Row или dict) - источник полей,
+                которых нет в values
+            parse_mode: Режим разметки (по умолчанию PARSE_MODE)
+            **values: Значения полей
+        """
+        return self._render_func(PARSE_MODE if parse_mode is None else parse_mode)(row, values)
+
+    def render_lines(self, rows: Sequence[Any], start: int = 1, parse_mode: Optional[str] = None) -> List[str]:
+        """Строки по записям: поле n - номер (с start), остальные поля - из записи."""
+        return self._lines_func(PARSE_MODE if parse_mode is None else parse_mode)(rows, start)
+
+    def __repr__(self) -> str:
+        return f"Template({self.source!r})"
+
+
+Line = Union[Template, Callable[[int, Any], str]]
+
+# Общие шаблоны разделов
+NUMBERED_TITLE = Template("{n}. {title}")
+RATING_LINE = Template("⭐ {name}: {rating}/10\n")
+
+_LIST_HEADER = Template("{header} ({count}):")
+_LIST_MORE = Template("\n... и еще {rest}")
+
+
+def render_list(
+    header: str,
+    items: Sequence[Any],
+    line: Line,
+    empty_text: str = "📋 Список пуст",
+    limit: Optional[int] = LIST_PREVIEW,
+    show_count: bool = True
+) -> str:
+    """
+    Текст списка: заголовок с числом элементов, строки первых limit элементов
+    и "... и еще N".
+
+    Args:
+        header: Заголовок ("📋 Ожидающие просмотра")
+        items: Записи из базы
+        line: Шаблон строки (поля n - номер и поля записи) или функция (n, запись) -> строка
+        empty_text: Текст для пустого списка
+        limit: Сколько элементов показать (None - все)
+        show_count: Показывать ли число элементов в заголовке
+    """
+    if not items:
+        return empty_text
+
+    shown = items if limit is None else items[:limit]
+    if show_count:
+        out = [_LIST_HEADER.render(header=header, count=len(items)), "\n\n"]
+    else:
+        out = [escape(header, PARSE_MODE), "\n\n"]
+    if isinstance(line, Template):
+        lines = line.render_lines(shown)
+        if lines:
+            out.append("\n".join(lines))
+            out.append("\n")
+    else:
+        for n, item in enumerate(shown, 1):
+            out.append(line(n, item))
+            out.append("\n")
+    rest = len(items) - len(shown)
+    if rest > 0:
+        out.append(_LIST_MORE.render(rest=rest))
+    return "".join(out)
+
+
+def render_detail(parts: Iterable[Optional[str]]) -> str:
+    """Текст карточки: части склеиваются как есть, None и пустые пропускаются."""
+    return "".join(part for part in parts if part)
+
+
+def _safe_cut(text: str, cut: int, parse_mode: Optional[str]) -> int:
+    """Сдвигает место разреза так, чтобы не разрезать экранированный символ."""
+    if parse_mode == ParseMode.HTML:
+        amp = text.rfind("&", max(0, cut - 8), cut)
+        if amp != -1 and text.find(";", amp, cut) == -1:
+            return amp if amp > 0 else cut
+    elif parse_mode in (ParseMode.MARKDOWN, ParseMode.MARKDOWN_V2):
+        backslashes = 0
+        while cut - backslashes > 0 and text[cut - backslashes - 1] == "\\":
+            backslashes += 1
+        if backslashes % 2 and cut > 1:
+            return cut - 1
+    return cut
+
+
+def truncate(text: str, limit: int, parse_mode: Optional[str] = None) -> str:
+    """Обрезает текст до limit символов (включая многоточие)."""
+    if len(text) <= limit:
+        return text
+    cut = _safe_cut(text, limit - len(ELLIPSIS), PARSE_MODE if parse_mode is None else parse_mode)
+    return text[:cut].rstrip() + ELLIPSIS
+
+
+def split_pages(text: str, limit: int = MAX_MESSAGE_LENGTH, parse_mode: Optional[str] = None) -> List[str]:
+    """
+    Делит текст на страницы не длиннее limit.
+
+    Режет по переводам строк; строка длиннее лимита режется по пробелу,
+    а если пробела нет - посимвольно (не разрезая экранированные символы).
+    """
+    if len(text) <= limit:
+        return [text]
+
+    mode = PARSE_MODE if parse_mode is None else parse_mode
+    pages = []
+    rest = text
+    while len(rest) > limit:
+        cut = rest.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = rest.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = _safe_cut(rest, limit, mode)
+        page = rest[:cut].rstrip()
+        if page:
+            pages.append(page)
+        rest = rest[cut:].lstrip("\n ")
+    if rest:
+        pages.append(rest)
+    logger.debug(f"Текст длиной {len(text)} разбит на {len(pages)} страниц")
+    return pages
+
+
+def plural(n: int, forms: Tuple[str, str, str]) -> str:
+    """
+    Форма слова для числа n.
+
+    Args:
+        forms: (1 фильм, 2 фильма, 5 фильмов)
+    """
+    n = abs(n) % 100
+    if 11 <= n <= 19:
+        return forms[2]
+    if n % 10 == 1:
+        return forms[0]
+    if 2 <= n % 10 <= 4:
+        return forms[1]
+    return forms[2]
@@ -0,0 +1,294 @@
+"""
+Поисковый индекс по названиям в памяти (для inline-режима).
+
+Индексируются фильмы, игры, поездки и активности. У каждого тенанта свой
+индекс: он строится из базы при первом поиске тенанта (build) и
+обновляется при каждом изменении записи через database.CHANGE_HOOKS,
+поэтому повторные поиски не обращаются к SQLite вовсе. В памяти - индексы
+INDEX_CACHE_SIZE последних тенантов (LRU):
+- префиксы слов (до PREFIX_MAX_LENGTH символов) -> ключи записей
+- триграммы названий -> ключи записей, для поиска подстроки внутри слова
+
+Нормализация: регистр не важен, "ё" = "е".
+
+Ранжирование: название начинается с запроса, затем все слова запроса -
+начала слов названия, затем совпадения по подстроке; внутри - по разделам
+и названию.
+
+API:
+- SECTIONS - индексируемые разделы (таблица -> загрузка записей)
+- SearchIndex - индекс (add, remove, search)
+- index() - индекс текущего тенанта
+- build() - построить индекс текущего тенанта из базы
+- clear() - забыть индексы всех тенантов
+- install() - подписать индексы на изменения в базе
+"""
+
+import heapq
+import logging
+import re
+import time
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Длиннее этого префиксы не хранятся: длинное слово запроса ищется
+# по своему префиксу этой длины и проверяется целиком
+PREFIX_MAX_LENGTH = 12
+# Сколько последних запросов помнить (сбрасываются при изменении индекса)
+RESULT_CACHE_SIZE = 256
+# Индексы скольких тенантов держать в памяти (остальные строятся при поиске)
+INDEX_CACHE_SIZE = 64
+
+_WORD_RE = re.compile(r"\w+")
+
+# (таблица, id записи)
+Key = Tuple[str, int]
+
+
+class Section:
+    """Индексируемый раздел: как загрузить все записи и одну запись."""
+
+    def __init__(self, table: str, order: int, load_all: Callable[[], list], load_one: Callable[[int], object]):
+        self.table = table
+        self.order = order
+        self.load_all = load_all
+        self.load_one = load_one
+
+
+SECTIONS: Dict[str, Section] = {
+    section.table: section for section in (
+        Section("movies", 0, database.get_movies, database.get_movie_by_id),
+        Section("games", 1, database.get_games, database.get_game_by_id),
+        Section("trips", 2, database.get_trips, database.get_trip_by_id),
+        Section("activities", 3, database.get_activities, database.get_activity_by_id),
+    )
+}
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace("ё", "е")
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class Entry:
+    """Запись в индексе: строка из базы и нормализованное название."""
+
+    __slots__ = ("table", "item_id", "row", "title", "words", "order", "sort_key", "recent_key")
+
+    def __init__(self, table: str, row):
+        self.table = table
+        self.item_id = row['id']
+        self.row = row
+        self.title = normalize(row['title'])
+        self.words = _WORD_RE.findall(self.title)
+        self.order = SECTIONS[table].order if table in SECTIONS else len(SECTIONS)
+        # Порядок внутри одной степени совпадения и порядок для пустого запроса
+        self.sort_key = (self.order, self.title, self.item_id)
+        self.recent_key = (self.order, -self.item_id)
+
+    @property
+    def key(self) -> Key:
+        return (self.table, self.item_id)
+
+
+class SearchIndex:
+    """Префиксный и триграммный индекс названий."""
+
+    def __init__(self):
+        self._entries: Dict[Key, Entry] = {}
+        self._prefixes: Dict[str, Set[Key]] = {}
+        self._trigrams: Dict[str, Set[Key]] = {}
+        # запрос -> (подходящие записи, совпавшие по началам слов)
+        self._results: "OrderedDict[str, Tuple[Set[Key], Set[Key]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _keys_of(self, entry: Entry):
+        prefixes = {word[:length] for word in entry.words
+                    for length in range(1, min(len(word), PREFIX_MAX_LENGTH) + 1)}
+        return prefixes, _trigrams(entry.title)
+
+    def add(self, table: str, row) -> None:
+        """Добавляет или обновляет запись."""
+        entry = Entry(table, row)
+        key = entry.key
+        if key in self._entries:
+            self.remove(table, entry.item_id)
+        self._entries[key] = entry
+        prefixes, trigrams = self._keys_of(entry)
+        for prefix in prefixes:
+            self._prefixes.setdefault(prefix, set()).add(key)
+        for trigram in trigrams:
+            self._trigrams.setdefault(trigram, set()).add(key)
+        self._results.clear()
+
+    def remove(self, table: str, item_id: int) -> None:
+        """Удаляет запись (если она есть)."""
+        entry = self._entries.pop((table, item_id), None)
+        if entry is None:
+            return
+        prefixes, trigrams = self._keys_of(entry)
+        for index, tokens in ((self._prefixes, prefixes), (self._trigrams, trigrams)):
+            for token in tokens:
+                keys = index.get(token)
+                if keys is not None:
+                    keys.discard(entry.key)
+                    if not keys:
+                        del index[token]
+        self._results.clear()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._prefixes.clear()
+        self._trigrams.clear()
+        self._results.clear()
+
+    def _prefix_matches(self, word: str) -> Set[Key]:
+        keys = self._prefixes.get(word[:PREFIX_MAX_LENGTH], set())
+        if len(word) <= PREFIX_MAX_LENGTH:
+            return keys
+        return {key for key in keys if any(w.startswith(word) for w in self._entries[key].words)}
+
+    def _substring_matches(self, word: str) -> Set[Key]:
+        if len(word) < 3:
+            return set()
+        candidates: Optional[Set[Key]] = None
+        for trigram in _trigrams(word):
+            keys = self._trigrams.get(trigram)
+            if not keys:
+                return set()
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                return set()
+        return {key for key in candidates if word in self._entries[key].title}
+
+    def _match(self, query: str) -> Tuple[Set[Key], Set[Key]]:
+        """(подходящие записи, записи, где все слова запроса - начала слов названия)."""
+        cached = self._results.get(query)
+        if cached is not None:
+            self._results.move_to_end(query)
+            return cached
+
+        words = _WORD_RE.findall(query)
+        if not words:
+            result = (set(self._entries), set())
+        else:
+            prefix_keys: Optional[Set[Key]] = None
+            matched: Optional[Set[Key]] = None
+            for word in words:
+                by_prefix = self._prefix_matches(word)
+                found = by_prefix | self._substring_matches(word)
+                prefix_keys = set(by_prefix) if prefix_keys is None else prefix_keys & by_prefix
+                matched = found if matched is None else matched & found
+                if not matched:
+                    break
+            result = (matched or set(), prefix_keys or set())
+
+        self._results[query] = result
+        if len(self._results) > RESULT_CACHE_SIZE:
+            self._results.popitem(last=False)
+        return result
+
+    def search(self, query: str, limit: Optional[int] = None) -> Tuple[List[Entry], int]:
+        """
+        Записи, подходящие под запрос, в порядке релевантности.
+
+        Args:
+            query: Текст запроса (пустой - все записи, новые первыми)
+            limit: Сколько первых записей вернуть (None - все). Ранжируются
+                только они, поэтому первая страница быстрая даже на тысячах совпадений
+
+        Returns:
+            (записи, общее число совпадений)
+        """
+        query = normalize(query.strip())
+        matched, prefix_keys = self._match(query)
+        entries = (self._entries[key] for key in matched)
+
+        if not query:
+            rank = attrgetter("recent_key")
+        else:
+            def rank(entry: Entry) -> Tuple:
+                if entry.title.startswith(query):
+                    return (0, entry.sort_key)
+                return (1 if entry.key in prefix_keys else 2, entry.sort_key)
+
+        if limit is None:
+            return sorted(entries, key=rank), len(matched)
+        return heapq.nsmallest(limit, entries, key=rank), len(matched)
+
+
+# Тенант -> индекс (LRU): индекс строится при первом поиске тенанта
+_indexes: "OrderedDict[int, SearchIndex]" = OrderedDict()
+
+
+def build() -> SearchIndex:
+    """Строит индекс текущего тенанта заново из базы."""
+    started = time.perf_counter()
+    tenant_id = database.current_tenant()
+    result = SearchIndex()
+    for table, section in SECTIONS.items():
+        for row in section.load_all():
+            result.add(table, row)
+    _indexes[tenant_id] = result
+    _indexes.move_to_end(tenant_id)
+    while len(_indexes) > INDEX_CACHE_SIZE:
+        _indexes.popitem(last=False)
+    elapsed = (time.perf_counter() - started) * 1000
+    logger.info(f"Поисковый индекс тенанта {tenant_id} построен: {len(result)} записей за {elapsed:.0f} мс")
+    return result
+
+
+def index() -> SearchIndex:
+    """Индекс текущего тенанта (строится при первом обращении)."""
+    tenant_id = database.current_tenant()
+    result = _indexes.get(tenant_id)
+    if result is None:
+        return build()
+    _indexes.move_to_end(tenant_id)
+    return result
+
+
+def clear() -> None:
+    """Забывает индексы всех тенантов."""
+    _indexes.clear()
+
+
+def _on_change(table: str, item_id: int, action: str) -> None:
+    """Наблюдатель database.CHANGE_HOOKS: обновляет запись в индексе текущего тенанта."""
+    if table == "database":
+        # База сменилась - индексы построятся заново при поиске
+        clear()
+        return
+    section = SECTIONS.get(table)
+    if section is not None and action == "import":
+        # Массовая загрузка - индекс тенанта построится заново при поиске
+        _indexes.pop(database.current_tenant(), None)
+        return
+    current = _indexes.get(database.current_tenant())
+    if section is None or current is None:
+        # Индекс тенанта еще не построен - он прочитает запись из базы сам
+        return
+    if action == "delete":
+        current.remove(table, item_id)
+        return
+    row = section.load_one(item_id)
+    if row is None:
+        current.remove(table, item_id)
+    else:
+        current.add(table, row)
+
+
+def install() -> None:
+    """Подписывает индексы на изменения в базе (повторный вызов ничего не делает)."""
+    if _on_change not in database.CHANGE_HOOKS:
+        database.CHANGE_HOOKS.append(_on_change)
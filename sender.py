@@ -0,0 +1,80 @@
+"""
+Отправка сообщений, инициированных ботом, с ограничением частоты.
+
+Ответы на нажатия идут напрямую: их темп задает пользователь. Сообщения,
+которые бот шлет сам (уведомления партнеру), проходят через
+RateLimitedSender, чтобы пачка изменений не превратилась в пачку
+сообщений и не упиралась в ограничения Telegram:
+- в один чат - не чаще одного сообщения в per_chat_interval секунд
+- всего - не больше global_rate сообщений в секунду
+- RetryAfter (flood control) - ждем, сколько сказал Telegram, и повторяем
+
+API:
+- RateLimitedSender(bot, per_chat_interval, global_rate) - отправитель
+- RateLimitedSender.send_message(chat_id, text, **kwargs) - отправить
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from telegram import Bot, Message
+from telegram.error import RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Telegram: около 1 сообщения в секунду в один чат и 30 в секунду всего
+PER_CHAT_INTERVAL = 1.0
+GLOBAL_RATE = 25
+# Сколько раз повторять после RetryAfter
+MAX_RETRIES = 3
+
+
+class RateLimitedSender:
+    """Отправитель сообщений с паузами между сообщениями в чат и всего."""
+
+    def __init__(self, bot: Bot, per_chat_interval: float = PER_CHAT_INTERVAL, global_rate: float = GLOBAL_RATE):
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1.0 / global_rate
+        # chat_id -> время (monotonic), раньше которого в чат не отправляем
+        self._chat_ready: Dict[int, float] = {}
+        self._global_ready = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _wait_turn(self, chat_id: int) -> None:
+        """Ждет своей очереди: паузы между сообщениями в чат и между всеми сообщениями."""
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._global_ready, self._chat_ready.get(chat_id, 0.0))
+            self._global_ready = start + self.global_interval
+            self._chat_ready[chat_id] = start + self.per_chat_interval
+        delay = start - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any) -> Optional[Message]:
+        """
+        Отправляет сообщение в свою очередь.
+
+        Returns:
+            Отправленное сообщение или None, если отправить не удалось
+            (ошибка записывается в лог, вызывающий не падает)
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            await self._wait_turn(chat_id)
+            try:
+                return await self.bot.send_message(chat_id, text, **kwargs)
+            except RetryAfter as e:
+                retry_after = float(e.retry_after)
+                logger.warning(f"Flood control для чата {chat_id}: повтор через {retry_after} с")
+                async with self._lock:
+                    self._chat_ready[chat_id] = time.monotonic() + retry_after
+                if attempt == MAX_RETRIES:
+                    break
+            except TelegramError as e:
+                logger.error(f"❌ Сообщение в чат {chat_id} не отправлено: {e}")
+                return None
+        logger.error(f"❌ Сообщение в чат {chat_id} не отправлено: flood control")
+        return None
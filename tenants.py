@@ -0,0 +1,212 @@
+"""
+Тенанты: пары и группы со своими списками в одном развертывании бота.
+
+Тенант автора апдейта находит AuthMiddleware (tenant_of) и выставляет его
+в database.set_tenant: все запросы обработчиков видят только данные этого
+тенанта. Тенант 1 (database.DEFAULT_TENANT) - пользователи из config.json;
+остальные участники приходят по приглашениям:
+- /invite - ссылка t.me/<бот>?start=join_<код> в свой тенант (для партнера)
+- /invite new - (админы) ссылка на новый тенант: перешедший по ней станет
+  его первым участником и пригласит партнера сам
+Код одноразовый и действует INVITE_TTL секунд.
+
+Тенант пользователя и состав тенанта запоминаются (LRU на
+MEMBERS_CACHE_SIZE записей): апдейт не ходит в базу за своим тенантом,
+а память не растет с числом тенантов.
+
+Номера участников (кнопки оценок и топов) - как в config.py: для тенанта 1
+порядок config.json, для остальных - порядок вступления.
+
+Настройки (переменные окружения):
+- INVITE_TTL - срок действия приглашения в секундах (по умолчанию 7 дней)
+
+API:
+- Member - участник (user_id, name)
+- tenant_of(user_id) - тенант пользователя или None
+- members(tenant_id=None) - участники тенанта (по умолчанию текущего)
+- names(), member_name(user_id, tenant_id=None), slot_name(slot), slot_user(slot) - как в config.py
+- forget() - забыть запомненные составы (вступление в другом процессе)
+- is_join_request(update) - апдейт - переход по приглашению
+- create_invite(tenant_id, created_by) - код приглашения
+- invite_link(bot_username, code) - ссылка приглашения
+- register(application) - команды /invite и /start join_<код>
+"""
+
+import functools
+import logging
+import os
+import secrets
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes, filters
+
+import config
+import database
+import keyboards
+
+logger = logging.getLogger(__name__)
+
+INVITE_TTL = int(os.getenv('INVITE_TTL', str(7 * 24 * 3600)))
+# Сколько пользователей и тенантов помнить
+MEMBERS_CACHE_SIZE = 4096
+
+JOIN_PREFIX = "join_"
+JOIN_PATTERN = rf"^/start {JOIN_PREFIX}"
+
+
+class Member(NamedTuple):
+    """Участник тенанта."""
+    user_id: int
+    name: str
+
+
+@functools.lru_cache(maxsize=MEMBERS_CACHE_SIZE)
+def _member_tenant(user_id: int) -> Optional[int]:
+    return database.get_member_tenant(user_id)
+
+
+@functools.lru_cache(maxsize=MEMBERS_CACHE_SIZE)
+def _db_members(tenant_id: int) -> Tuple[Member, ...]:
+    return tuple(Member(row['user_id'], row['name']) for row in database.get_tenant_members(tenant_id))
+
+
+def forget() -> None:
+    """Сбрасывает запомненные составы (после вступления и смены базы)."""
+    _member_tenant.cache_clear()
+    _db_members.cache_clear()
+
+
+def _on_change(table: str, item_id: int, action: str) -> None:
+    """Наблюдатель database.CHANGE_HOOKS: состав тенантов изменился или база сменилась."""
+    if table in ("tenant_members", "database"):
+        forget()
+
+
+database.CHANGE_HOOKS.append(_on_change)
+
+
+def tenant_of(user_id: int) -> Optional[int]:
+    """Тенант пользователя: DEFAULT_TENANT для config.json, иначе по tenant_members; None - чужой."""
+    if config.is_authorized_user(user_id):
+        return database.DEFAULT_TENANT
+    return _member_tenant(user_id)
+
+
+def members(tenant_id: Optional[int] = None) -> Tuple[Member, ...]:
+    """Участники тенанта (по умолчанию текущего) в порядке номеров."""
+    if tenant_id is None:
+        tenant_id = database.current_tenant()
+    if tenant_id == database.NO_TENANT:
+        return ()
+    result = _db_members(tenant_id)
+    if tenant_id == database.DEFAULT_TENANT:
+        result = tuple(Member(user_id, name) for user_id, name in config.snapshot().users.items()) + result
+    return result
+
+
+def names() -> Tuple[str, ...]:
+    """Имена участников текущего тенанта по номерам (names()[0] - участник 1)."""
+    return tuple(member.name for member in members())
+
+
+def member_name(user_id: int, tenant_id: Optional[int] = None) -> Optional[str]:
+    """Имя участника тенанта (по умолчанию текущего) или None."""
+    for member in members(tenant_id):
+        if member.user_id == user_id:
+            return member.name
+    return None
+
+
+def slot_name(slot: int) -> str:
+    """Имя участника текущего тенанта с номером slot."""
+    current = members()
+    if 1 <= slot <= len(current):
+        return current[slot - 1].name
+    return f"Пользователь {slot}"
+
+
+def slot_user(slot: int) -> Optional[int]:
+    """Telegram ID участника текущего тенанта с номером slot или None (номер из кнопки устарел)."""
+    current = members()
+    if 1 <= slot <= len(current):
+        return current[slot - 1].user_id
+    return None
+
+
+def is_join_request(update: Update) -> bool:
+    """Апдейт - переход по ссылке приглашения (/start join_<код>)."""
+    message = update.message
+    return bool(message and message.text and message.text.startswith(f"/start {JOIN_PREFIX}"))
+
+
+def create_invite(tenant_id: Optional[int], created_by: int) -> str:
+    """
+    Создает одноразовое приглашение на INVITE_TTL секунд.
+
+    Args:
+        tenant_id: Тенант, в который приглашают (None - новый тенант)
+
+    Returns:
+        Код для ссылки (символы, допустимые в параметре start)
+    """
+    code = secrets.token_urlsafe(12)
+    database.create_invite(code, tenant_id, created_by, int(time.time()) + INVITE_TTL)
+    return code
+
+
+def invite_link(bot_username: str, code: str) -> str:
+    """Ссылка приглашения: открывает бота и отправляет /start join_<код>."""
+    return f"https://t.me/{bot_username}?start={JOIN_PREFIX}{code}"
+
+
+async def invite_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /invite: ссылка в свой тенант, /invite new - на новый (админы)."""
+    user = update.effective_user
+    tenant_id: Optional[int] = database.current_tenant()
+    if context.args and context.args[0] == "new":
+        if not config.is_admin(user.id):
+            await update.message.reply_text("❌ Создавать новые списки может только администратор.")
+            return
+        tenant_id = None
+
+    code = create_invite(tenant_id, user.id)
+    hours = INVITE_TTL // 3600
+    if tenant_id is None:
+        text = "🆕 Ссылка на новый список - перешедший по ней станет его первым участником"
+    else:
+        text = "💌 Ссылка-приглашение в ваши списки"
+    await update.message.reply_text(
+        f"{text}:\n{invite_link(context.bot.username, code)}\n\n"
+        f"Ссылка одноразовая и действует {hours} ч."
+    )
+    logger.info(f"Приглашение от {user.id} в тенант {tenant_id or 'новый'}")
+
+
+async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик /start join_<код>: вступление в тенант по приглашению."""
+    user = update.effective_user
+    if tenant_of(user.id) is not None:
+        await update.message.reply_text("ℹ️ Вы уже участник списков.", reply_markup=keyboards.main_menu_reply_keyboard())
+        return
+
+    code = context.args[0][len(JOIN_PREFIX):]
+    tenant_id = database.accept_invite(code, user.id, user.first_name or str(user.id), int(time.time()))
+    if tenant_id is None:
+        await update.message.reply_text("❌ Приглашение недействительно или устарело. Попросите новую ссылку.")
+        return
+
+    database.set_tenant(tenant_id)
+    current = members(tenant_id)
+    text = f"✅ Добро пожаловать! Участники: {', '.join(member.name for member in current)}"
+    if len(current) == 1:
+        text += "\n\nПригласите партнера командой /invite"
+    await update.message.reply_text(text, reply_markup=keyboards.main_menu_reply_keyboard())
+    logger.info(f"Пользователь {user.id} вступил в тенант {tenant_id}")
+
+
+def register(application: Application) -> None:
+    """Регистрирует /invite и /start join_<код> (до обычного /start)."""
+    application.add_handler(CommandHandler("start", join_command, filters.Regex(JOIN_PATTERN)), group=0)
+    application.add_handler(CommandHandler("invite", invite_command), group=0)
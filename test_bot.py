@@ -2,7 +2,10 @@
 Простой тест для проверки основных функций бота.
 """
 
+import contextlib
 import sys
+import tempfile
+from pathlib import Path
 import database
 from database import (
     get_movie_categories, create_movie_category, create_movie, get_movies,
@@ -13,11 +16,30 @@ from database import (
     create_game, get_games, create_sexual_item, get_sexual_items
 )
 
+
+@contextlib.contextmanager
+def temp_database():
+    """Тест на временной базе: data/multilists.db не меняется, повторный запуск видит пустую базу."""
+    saved = (database.DB_PATH, database.SHARDED)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = Path(tmp) / "test.db"
+        database.SHARDED = False
+        try:
+            database.init_database()
+            yield database.DB_PATH
+        finally:
+            database.close_shards()
+            database.DB_PATH, database.SHARDED = saved
+    database.init_database()
+
+
 def test_database():
     """Тест основных функций базы данных."""
     print("[TEST] Тестирование базы данных...")
     
     try:
+        import time
+        
         # Инициализация
         database.init_database()
         print("[OK] База данных инициализирована")
@@ -70,7 +92,8 @@ def test_database():
         print(f"[OK] Категории фотографий: {len(photo_categories)}")
         assert len(photo_categories) >= 2, "Должно быть минимум 2 категории фотографий"
         
-        photo_cat_id = create_photo_category("Тестовая категория фото", "http://test.com", "Тестовое описание")
+        # Название уникально: повторный запуск не упирается в UNIQUE(tenant_id, title)
+        photo_cat_id = create_photo_category(f"Тестовая категория фото {time.time_ns()}", "http://test.com", "Тестовое описание")
         print(f"[OK] Категория фотографий создана: ID={photo_cat_id}")
         
         all_photo_cats = get_photo_categories()
@@ -108,6 +131,7 @@ def test_keyboards():
     print("\n[TEST] Тестирование клавиатур...")
     
     try:
+        import callbacks
         import keyboards
         
         # Главное меню
@@ -120,7 +144,7 @@ def test_keyboards():
         print("[OK] Главное меню (inline): OK")
         
         # Кнопка назад
-        back_kb = keyboards.back_button("test_callback")
+        back_kb = keyboards.back_button("movies_menu")
         assert len(back_kb.inline_keyboard) == 1, "Должна быть одна кнопка"
         print("[OK] Кнопка назад: OK")
         
@@ -130,15 +154,40 @@ def test_keyboards():
             {'id': 2, 'title': 'Тест 2'},
             {'id': 3, 'title': 'Тест 3'},
         ]
-        list_kb = keyboards.list_keyboard(test_items, 0, 10, "test_", "back")
+        list_kb = keyboards.list_keyboard(test_items, 0, 10, "movie", "movies_pending")
         assert len(list_kb.inline_keyboard) > 0, "Должна быть клавиатура"
         print("[OK] Пагинация: OK")
         
         # Клавиатура оценки
-        rating_kb = keyboards.rating_keyboard("rate_", 1, 1)
+        rating_kb = keyboards.rating_keyboard("rate_movie", 1, 1)
         assert len(rating_kb.inline_keyboard) >= 2, "Должно быть минимум 2 ряда"
         print("[OK] Клавиатура оценки: OK")
-        
+
+        # Кеш фабрик: одинаковые аргументы - тот же объект
+        assert keyboards.rating_keyboard("rate_movie", 1, 1) is rating_kb, "Клавиатура должна браться из кеша"
+        assert keyboards.back_button("games_menu") is not back_kb
+        assert keyboards.rating_keyboard.cache_info().hits >= 1
+
+        # Меню с категориями перестраивается после изменения таблицы
+        from handlers import movies
+        with temp_database():
+            pending_kb = movies.movies_pending_keyboard()
+            assert movies.movies_pending_keyboard() is pending_kb
+            category_id = create_movie_category("Тестовая категория клавиатур")
+            new_kb = movies.movies_pending_keyboard()
+            assert new_kb is not pending_kb, "Версия таблицы должна сбросить кеш"
+            buttons = [row[0].callback_data for row in new_kb.inline_keyboard]
+            assert callbacks.encode("movies_pending_cat", category_id) in buttons, "Новая категория должна быть в меню"
+            
+            # Изменение у другого тенанта не сбрасывает клавиатуры этого
+            import time
+            database.create_invite("keyboards_test", None, 1, int(time.time()) + 60)
+            other_tenant = database.accept_invite("keyboards_test", 9101, "Другой", int(time.time()))
+            with database.tenant_scope(other_tenant):
+                create_movie_category("Категория другого тенанта")
+            assert movies.movies_pending_keyboard() is new_kb, "Версии таблиц - по тенантам"
+        print("[OK] Кеш клавиатур и сброс по версии таблицы: OK")
+
         print("\n[OK] Все тесты клавиатур пройдены успешно!")
         return True
         
@@ -149,6 +198,1308 @@ def test_keyboards():
         return False
 
 
+def test_callbacks():
+    """Тест кодека callback_data."""
+    print("\n[TEST] Тестирование callback_data...")
+    
+    try:
+        from types import SimpleNamespace
+        import callbacks
+        import middleware
+        
+        data = callbacks.encode("rate_movie", 125, 2, 10)
+        assert callbacks.decode(data) == ("rate_movie", (125, 2, 10)), f"Разбор: {callbacks.decode(data)}"
+        assert len(data) < len("rate_movie_125_user2_10"), "Код должен быть короче прежней строки"
+        print(f"[OK] Маршрут и числа: {data}")
+        
+        genre = "Пошаговые тактические ролевые игры с открытым миром и крафтом"
+        data = callbacks.encode("games_pending_genre", genre)
+        assert len(data.encode()) <= 64, "callback_data не длиннее 64 байт"
+        assert callbacks.decode(data).args == (genre,), "Жанр берется из таблицы на сервере"
+        assert callbacks.encode("games_pending_genre", genre) == data, "Ключ значения не меняется"
+        print("[OK] Длинный кириллический аргумент: OK")
+        
+        check = callbacks.pattern("movie")
+        assert check(callbacks.encode("movie", 7))
+        assert not check(callbacks.encode("movie_watched", 7))
+        assert callbacks.is_stale("movie_7"), "Прежний формат - устаревшая кнопка"
+        assert not callbacks.is_stale(callbacks.encode("main_menu"))
+        try:
+            callbacks.pattern("no_such_route")
+            assert False, "Неизвестный маршрут должен давать ошибку"
+        except KeyError:
+            pass
+        print("[OK] Проверка маршрутов и устаревшие кнопки: OK")
+        
+        update = SimpleNamespace(callback_query=SimpleNamespace(data=callbacks.encode("rate_game", 3, 1, 9)))
+        assert middleware.route_label(update) == "rate_game"
+        print("[OK] Имя маршрута для метрик: OK")
+        
+        import keyboards
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+        
+        @keyboards.keyboard_factory()
+        def genre_keyboard(genre):
+            return InlineKeyboardMarkup([[InlineKeyboardButton(genre, callback_data=callbacks.encode(
+                "games_pending_genre", genre))]])
+        
+        shown = genre_keyboard("Жанр запомненной клавиатуры")
+        # Чужой трафик вытесняет значение из таблицы
+        for i in range(callbacks.PAYLOAD_TABLE_SIZE):
+            callbacks.encode("games_pending_genre", f"Чужой жанр {i}")
+        assert genre_keyboard("Жанр запомненной клавиатуры") is shown, "Клавиатура из кеша"
+        data = shown.inline_keyboard[0][0].callback_data
+        assert callbacks.decode(data).args == ("Жанр запомненной клавиатуры",), "Выдача клавиатуры возвращает значения"
+        print("[OK] Значения кнопок запомненной клавиатуры не вытесняются: OK")
+        
+        print("\n[OK] Все тесты callback_data пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах callback_data: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_middleware():
+    """Тест конвейера middleware на настоящем Application: доступ, повторы, ошибки."""
+    print("\n[TEST] Тестирование конвейера middleware...")
+    
+    import asyncio
+    import itertools
+    import time
+    from types import SimpleNamespace
+    from telegram import Update
+    from telegram.ext import CommandHandler
+    import bot
+    import config
+    import middleware
+    import tenants
+    from tools.fake_bot_api import FakeBotApi
+    from tools.loadgen import VirtualUser
+    
+    update_ids = itertools.count(1)
+    member = VirtualUser(7001, update_ids)
+    stranger = VirtualUser(424242, update_ids)
+    
+    async def scenario():
+        api = FakeBotApi()
+        await api.start()
+        application = bot.build_application("123456:MIDDLEWARE", base_url=api.base_url, job_queue=False)
+        
+        async def boom(update, context):
+            raise RuntimeError("сбой обработчика")
+        
+        application.add_handler(CommandHandler("boom", boom))
+        
+        async def process(data):
+            """Апдейт через конвейер; возвращает вызовы Bot API, сделанные при его обработке."""
+            start = len(api.calls)
+            await application.process_update(Update.de_json(data, application.bot))
+            # Ответ отклоненному апдейту уходит отдельной задачей
+            await asyncio.sleep(0.05)
+            return [(method, params.get("text")) for method, params, _ in api.calls[start:]]
+        
+        try:
+            async with application:
+                # Чужой: ни один обработчик групп 0+ не проверяет апдейт, в базу никто не ходит
+                assert tenants.tenant_of(stranger.user_id) is None  # состав тенантов запоминается
+                section_handlers = [
+                    handler for group, handlers in application.handlers.items() if group != middleware.PRE_GROUP
+                    for handler in handlers
+                ]
+                checked = []
+                saved_checks = {cls: cls.check_update for cls in {type(handler) for handler in section_handlers}}
+                
+                def spy(original):
+                    def check_update(handler, update):
+                        checked.append(type(handler).__name__)
+                        return original(handler, update)
+                    return check_update
+                
+                connections = []
+                saved = (database.get_connection, database.get_main_connection)
+                for cls, original in saved_checks.items():
+                    cls.check_update = spy(original)
+                database.get_connection = lambda: connections.append("tenant") or saved[0]()
+                database.get_main_connection = lambda: connections.append("main") or saved[1]()
+                try:
+                    for data in (stranger.message("Фильмы"), stranger.message("/start"),
+                                 stranger.callback("section", 0)):
+                        calls = await process(data)
+                        assert calls and all("нет доступа" in (text or "") or method == "answerCallbackQuery"
+                                              for method, text in calls), calls
+                finally:
+                    database.get_connection, database.get_main_connection = saved
+                    for cls, original in saved_checks.items():
+                        cls.check_update = original
+                assert not checked, f"Обработчики разделов видели чужой апдейт: {checked[:3]}"
+                assert not connections, f"Чужой апдейт дошел до базы: {connections}"
+                print("[OK] Чужой отброшен до обработчиков и базы: OK")
+                
+                calls = await process(stranger.message("/start join_nocode"))
+                assert calls == [("sendMessage", "❌ Приглашение недействительно или устарело. Попросите новую ссылку.")], \
+                    calls
+                code = tenants.create_invite(None, member.user_id)
+                calls = await process(stranger.message(f"/start join_{code}"))
+                assert calls and calls[0][1].startswith("✅ Добро пожаловать"), calls
+                assert tenants.tenant_of(stranger.user_id) not in (None, database.DEFAULT_TENANT)
+                print("[OK] Чужой проходит только по приглашению: OK")
+                
+                data = member.message("Фильмы")
+                assert await process(data), "Первая доставка обработана"
+                assert await process(data) == [], "Повторный update_id отброшен"
+                tap = member.callback("main_menu")
+                first = await process(tap)
+                assert ("editMessageText", "🏠 Главное меню\n\nВыберите раздел:") in first, first
+                tap["update_id"] = next(update_ids)
+                calls = await process(tap)
+                assert calls == [("answerCallbackQuery", None)], f"Двойное нажатие отброшено: {calls}"
+                print("[OK] Повторы и двойные нажатия: OK")
+                
+                calls = await process(member.message("/boom"))
+                assert calls == [("sendMessage", "⚠️ Произошла ошибка, попробуйте еще раз")], calls
+                print("[OK] Ошибка обработчика - ответ пользователю: OK")
+        finally:
+            await api.stop()
+    
+    with temp_database():
+        saved_config = config.swap(config.make_snapshot({7001: "Первый", 7002: "Второй"}))
+        try:
+            asyncio.run(scenario())
+        finally:
+            config.swap(saved_config)
+    
+    # Двойное нажатие - только в пределах DOUBLE_TAP_SECONDS
+    dedup = middleware.DedupMiddleware()
+    dedup.DOUBLE_TAP_SECONDS = 0.05
+    tap = member.callback("main_menu")
+    assert dedup.check(Update.de_json(tap, None))
+    tap["update_id"] = next(update_ids)
+    assert not dedup.check(Update.de_json(tap, None)), "Нажатие сразу после первого отброшено"
+    time.sleep(0.06)
+    tap["update_id"] = next(update_ids)
+    assert dedup.check(Update.de_json(tap, None)), "Нажатие после DOUBLE_TAP_SECONDS проходит"
+    
+    # Проверка в самих обработчиках - на случай запуска без конвейера
+    replies = []
+    
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+    
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=424242, first_name="Чужой"),
+                             message=SimpleNamespace(text="Фильмы", reply_text=reply_text))
+    asyncio.run(bot.start(update, None))
+    asyncio.run(bot.main_menu_handler(update, None))
+    assert replies == ["❌ У вас нет доступа к этому боту."] * 2, replies
+    print("[OK] Двойные нажатия по времени и проверка в обработчиках: OK")
+    
+    print("\n[OK] Все тесты конвейера middleware пройдены успешно!")
+
+
+def test_render():
+    """Тест слоя отрисовки экранов (слияние и подавление редактирований)."""
+    print("\n[TEST] Тестирование отрисовки экранов...")
+    
+    try:
+        import asyncio
+        from types import SimpleNamespace
+        import render
+        import keyboards
+        
+        calls = []
+        
+        sent = []
+        
+        async def edit_message_text(text, reply_markup=None, parse_mode=None):
+            calls.append(text)
+        
+        async def send_message(text, reply_markup=None, parse_mode=None):
+            sent.append((text, reply_markup))
+            return SimpleNamespace(chat_id=1, message_id=100 + len(sent))
+        
+        chat = SimpleNamespace(send_message=send_message)
+        message = SimpleNamespace(chat_id=1, message_id=100, text="Старый текст", reply_markup=None, chat=chat)
+        query = SimpleNamespace(message=message, inline_message_id=None, edit_message_text=edit_message_text)
+        
+        async def scenario():
+            # Два экрана подряд в одном апдейте - одно редактирование
+            update = SimpleNamespace(update_id=1, callback_query=query)
+            await render.edit_screen(update, "✅ Оценка сохранена!")
+            await render.edit_screen(update, "🎬 Фильм", reply_markup=keyboards.back_button("movies_pending"))
+            await render.flush(update)
+            
+            # Тот же экран повторно - редактирование не отправляется
+            update = SimpleNamespace(update_id=2, callback_query=query)
+            await render.edit_screen(update, "🎬 Фильм", reply_markup=keyboards.back_button("movies_pending"))
+            await render.flush(update)
+        
+        asyncio.run(scenario())
+        assert calls == ["🎬 Фильм"], f"Ожидалось одно редактирование, получено: {calls}"
+        print("[OK] Слияние и подавление редактирований: OK")
+        
+        async def long_screen():
+            update = SimpleNamespace(update_id=3, callback_query=query)
+            long_text = "\n".join(f"Строка {i} " + "x" * 90 for i in range(100))
+            await render.edit_screen(update, long_text, reply_markup=keyboards.back_button("movies_pending"))
+            await render.flush(update)
+            return long_text
+        
+        long_text = asyncio.run(long_screen())
+        pages = [calls[-1]] + [text for text, _ in sent]
+        assert len(pages) > 1 and all(len(page) <= 4096 for page in pages), "Длинный экран делится на страницы"
+        assert "\n".join(pages) == long_text, "Страницы складываются в исходный текст"
+        assert sent[-1][1] is not None and all(markup is None for _, markup in sent[:-1]), \
+            "Клавиатура только под последней страницей"
+        print(f"[OK] Длинный экран разбит на {len(pages)} сообщения: OK")
+        
+        print("\n[OK] Все тесты отрисовки пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах отрисовки: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_media():
+    """Тест отправки видео: альбомы по 10, повторы в апдейте, кеш file_id."""
+    print("\n[TEST] Тестирование отправки видео...")
+    
+    try:
+        import asyncio
+        from types import SimpleNamespace
+        import render
+        
+        sent = []
+        
+        async def send_video(file_id, caption=None):
+            sent.append(("video", [file_id]))
+        
+        async def send_media_group(media):
+            sent.append(("group", [item.media for item in media]))
+        
+        chat = SimpleNamespace(send_video=send_video, send_media_group=send_media_group)
+        
+        async def scenario():
+            update = SimpleNamespace(update_id=501, callback_query=None, effective_chat=chat)
+            videos = [(f"file{i}", f"unique{i}", f"Тренд {i}") for i in range(21)]
+            videos.append(("file0_again", "unique0", "Тот же файл"))
+            count = await render.send_videos(update, videos)
+            repeated = await render.send_video(update, "file5", "unique5")
+            await render._flush_handler(update, None)
+            return count, repeated
+        
+        count, repeated = asyncio.run(scenario())
+        assert count == 21, f"Повтор по file_unique_id не отправляется: {count}"
+        assert not repeated, "Видео уже отправлено в этом апдейте"
+        assert [kind for kind, _ in sent] == ["group", "group", "video"], f"Альбомы по 10: {sent}"
+        assert len(sent[0][1]) == 10 and sent[2][1] == ["file20"]
+        assert 501 not in render._sent_media, "Учет отправленного очищается в конце апдейта"
+        print("[OK] Альбомы по 10 и повторы в апдейте: OK")
+        
+        database.init_database()
+        database.cache_media("uniq-a", "file-a", duration=12, file_size=1000)
+        database.cache_media("uniq-a", "file-a2")
+        cached = database.get_cached_media("uniq-a")
+        assert cached['file_id'] == "file-a2" and cached['duration'] == 12, "Новый file_id, прежние размеры"
+        trend_id = database.create_tiktok_trend("Тренд с видео", "file-a", "uniq-a")
+        assert database.get_tiktok_trend_by_video("uniq-a")['id'] == trend_id, "Повтор видно при добавлении"
+        videos = {row['id']: row for row in database.get_tiktok_videos('todo')}
+        assert videos[trend_id]['file_id'] == "file-a2", "file_id берется из кеша"
+        database.delete_tiktok_trend(trend_id)
+        print("[OK] Кеш file_id: OK")
+        
+        print("\n[OK] Все тесты отправки видео пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах отправки видео: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_photos():
+    """Тест фотографий в категориях: повторы, keyset-страницы, альбомы."""
+    print("\n[TEST] Тестирование фотографий...")
+    
+    try:
+        import asyncio
+        from types import SimpleNamespace
+        import render
+        
+        database.init_database()
+        category_id = database.create_photo_category("Тестовый альбом")
+        ids = [database.add_photo(category_id, f"photo{i}", f"uphoto{i}") for i in range(25)]
+        assert None not in ids, "Все фото новые"
+        assert database.add_photo(category_id, "photo0_again", "uphoto0") is None, "Повтор по file_unique_id"
+        assert database.count_photos(category_id) == 25
+        print("[OK] Добавление и повторы: OK")
+        
+        first = database.get_photos(category_id, limit=10)
+        second = database.get_photos(category_id, after_id=first[-1]['id'], limit=10)
+        last = database.get_photos(category_id, after_id=second[-1]['id'], limit=10)
+        assert [p['id'] for p in first + second + last] == ids, "Страницы вперед по порядку добавления"
+        back = database.get_photos(category_id, before_id=second[0]['id'], limit=10)
+        assert [p['id'] for p in back] == [p['id'] for p in first], "Страница назад по возрастанию id"
+        assert len(last) == 5
+        print("[OK] Keyset-страницы: OK")
+        
+        sent = []
+        
+        async def send_photo(file_id, caption=None):
+            sent.append(("photo", [file_id]))
+        
+        async def send_media_group(media):
+            sent.append(("group", [item.media for item in media]))
+        
+        chat = SimpleNamespace(send_photo=send_photo, send_media_group=send_media_group)
+        
+        async def scenario():
+            update = SimpleNamespace(update_id=601, callback_query=None, effective_chat=chat)
+            photos = [(p['file_id'], p['file_unique_id'], None) for p in first + second[:1]]
+            count = await render.send_photos(update, photos)
+            await render._flush_handler(update, None)
+            return count
+        
+        assert asyncio.run(scenario()) == 11
+        assert [kind for kind, _ in sent] == ["group", "photo"], f"Альбом по 10 и одно фото: {sent}"
+        print("[OK] Альбомы фотографий: OK")
+        
+        from telegram import Chat, Document, Message, Update, User
+        from telegram.ext import Application, ConversationHandler
+        from handlers import photos
+        from persistence import SQLitePersistence
+        # Диалоги раздела сохраняются (persistent=True) - нужен persistence
+        application = Application.builder().token("123456:TEST").persistence(SQLitePersistence()).build()
+        photos.register_handlers(application)
+        upload_conv = next(
+            handler for handler in application.handlers[0]
+            if isinstance(handler, ConversationHandler) and handler.name == "photos_upload"
+        )
+        document = Message(
+            1, None, Chat(1, "private"), from_user=User(1, "Тест", False),
+            document=Document("doc_id", "doc_unique", mime_type="image/jpeg")
+        )
+        matched = [
+            handler.callback for handler in upload_conv.states[photos.PHOTO_UPLOAD]
+            if handler.check_update(Update(1, message=document))
+        ]
+        assert matched == [photos.photo_upload_document], "Изображение-файл в альбом не сохраняется"
+        print("[OK] Изображение файлом не попадает в альбом: OK")
+        
+        database.delete_photo_category(category_id)
+        assert database.count_photos(category_id) == 0, "Фото удаляются вместе с категорией"
+        
+        print("\n[OK] Все тесты фотографий пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах фотографий: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_ratings():
+    """Тест оценок: таблица ratings, агрегаты, топы, перенос прежних колонок."""
+    print("\n[TEST] Тестирование оценок...")
+    
+    import sqlite3
+    import config
+    
+    saved_path = database.DB_PATH
+    saved_config = config.swap(config.make_snapshot({501: "Аня", 502: "Боря"}))
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = Path(tmp) / "ratings.db"
+        try:
+            database.init_database()
+            category_id = get_movie_categories()[0]['id']
+            movie_ids = [create_movie(f"Оценка {i}", None, category_id) for i in range(3)]
+            for movie_id in movie_ids:
+                database.mark_movie_watched(movie_id)
+            # Три пользователя: группа больше двух
+            database.set_movie_rating(movie_ids[0], 11, 9)
+            database.set_movie_rating(movie_ids[0], 12, 7)
+            database.set_movie_rating(movie_ids[0], 13, 8)
+            database.set_movie_rating(movie_ids[1], 11, 4)
+            database.set_movie_rating(movie_ids[1], 11, 10)  # повторная оценка заменяет прежнюю
+            movie = database.get_movie_by_id(movie_ids[1])
+            assert (movie['rating_sum'], movie['rating_count'], movie['rating_avg']) == (10, 1, 10.0), tuple(movie)
+            assert [r['score'] for r in database.get_ratings("movies", movie_ids[0])] == [9, 7, 8]
+            print("[OK] Оценки и агрегаты: OK")
+            
+            top = database.get_movies_top(min_votes=1)
+            assert [m['id'] for m in top] == [movie_ids[1], movie_ids[0]], "Топ по средней оценке"
+            assert [m['id'] for m in database.get_movies_top(min_votes=3)] == [movie_ids[0]], "Оценили все трое"
+            assert top[1]['avg_rating'] == 8.0
+            personal = database.get_movies_top(user_id=12)
+            assert [(m['id'], m['rating']) for m in personal] == [(movie_ids[0], 7)], "Личный топ"
+            print("[OK] Топы: OK")
+            
+            game_id = create_game("Оценка игры")
+            database.mark_game_done(game_id)
+            database.set_game_rating(game_id, 11, 6)
+            assert database.get_games_top(user_id=11)[0]['rating'] == 6
+            database.delete_game(game_id)
+            assert database.get_ratings("games", game_id) == [], "Оценки удаляются вместе с записью"
+            print("[OK] Оценки игр: OK")
+            
+            # Пересчет агрегатов - только записей текущего тенанта
+            import time
+            database.create_invite("ratings_test", None, 1, int(time.time()) + 60)
+            other_tenant = database.accept_invite("ratings_test", 9201, "Другой", int(time.time()))
+            with database.tenant_scope(other_tenant):
+                other_movie = create_movie("Оценка другого тенанта", None, get_movie_categories()[0]['id'])
+                database.set_movie_rating(other_movie, 9201, 5)
+            conn = database.get_connection()
+            conn.execute("UPDATE movies SET rating_sum = 0, rating_count = 0, rating_avg = NULL")
+            conn.commit()
+            conn.close()
+            database.rebuild_ratings()
+            assert database.get_movie_by_id(movie_ids[1])['rating_sum'] == 10, "Свои агрегаты пересчитаны"
+            with database.tenant_scope(other_tenant):
+                assert database.get_movie_by_id(other_movie)['rating_count'] == 0, "Чужие записи не пересчитываются"
+                database.rebuild_ratings()
+                assert database.get_movie_by_id(other_movie)['rating_count'] == 1
+            print("[OK] Пересчет оценок тенанта: OK")
+            
+            # Перенос оценок из колонок user1_rating/user2_rating прежней версии
+            database.DB_PATH = Path(tmp) / "legacy.db"
+            conn = sqlite3.connect(database.DB_PATH)
+            conn.execute("CREATE TABLE movie_categories (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT UNIQUE NOT NULL)")
+            conn.execute("INSERT INTO movie_categories (title) VALUES ('Фильм')")
+            conn.execute("CREATE TABLE movies (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, note TEXT, "
+                         "category_id INTEGER NOT NULL, user1_rating INTEGER, user2_rating INTEGER, "
+                         "watched INTEGER DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+            conn.execute("INSERT INTO movies (title, category_id, user1_rating, user2_rating, watched) "
+                         "VALUES ('Старый', 1, 8, 5, 1), ('Без оценок', 1, NULL, NULL, 1), ('Одна', 1, NULL, 9, 1)")
+            conn.commit()
+            conn.close()
+            
+            database.init_database()
+            database.init_database()  # повторный запуск ничего не переносит дважды
+            old = database.get_movies_top(min_votes=1)
+            assert [(m['title'], m['rating_count'], m['avg_rating']) for m in old] == [
+                ("Одна", 1, 9.0), ("Старый", 2, 6.5)
+            ], [tuple(m) for m in old]
+            assert [(r['user_id'], r['score']) for r in database.get_ratings("movies", 1)] == [(501, 8), (502, 5)]
+            assert 'user1_rating' not in database.get_movie_by_id(1).keys(), "Прежние колонки удалены"
+            assert database.get_movie_by_id(1)['tenant_id'] == database.DEFAULT_TENANT, "Прежние данные - тенанту 1"
+            assert [c['title'] for c in get_movie_categories()] == sorted(database.DEFAULT_MOVIE_CATEGORIES)
+        finally:
+            database.DB_PATH = saved_path
+            config.swap(saved_config)
+    database.init_database()
+    print("[OK] Перенос прежних оценок: OK")
+    
+    print("\n[OK] Все тесты оценок пройдены успешно!")
+
+
+def test_tenants():
+    """Тест тенантов: изоляция данных, приглашения, доступ через middleware."""
+    print("\n[TEST] Тестирование тенантов...")
+    
+    import contextvars
+    import time
+    from types import SimpleNamespace
+    import middleware
+    import tenants
+    
+    with temp_database():
+        now = int(time.time())
+        database.create_invite("new-tenant", None, 1, now + 60)
+        tenant_id = database.accept_invite("new-tenant", 9001, "Вера", now)
+        assert tenant_id not in (None, database.DEFAULT_TENANT), "Приглашение без тенанта создает новый"
+        assert database.accept_invite("new-tenant", 9002, "Гоша", now) is None, "Код одноразовый"
+        database.create_invite("partner", tenant_id, 9001, now - 1)
+        assert database.accept_invite("partner", 9002, "Гоша", now) is None, "Просроченный код"
+        database.create_invite("partner2", tenant_id, 9001, now + 60)
+        assert database.accept_invite("partner2", 9002, "Гоша", now) == tenant_id
+        assert tenants.tenant_of(9002) == tenant_id, "Состав тенанта перечитан после вступления"
+        assert [m.name for m in tenants.members(tenant_id)] == ["Вера", "Гоша"], "Номера - порядок вступления"
+        assert tenants.tenant_of(424242) is None
+        print("[OK] Приглашения: OK")
+        
+        default_movie = create_movie("Фильм основного тенанта", None, get_movie_categories()[0]['id'])
+        with database.tenant_scope(tenant_id):
+            categories = [c['title'] for c in get_movie_categories()]
+            assert categories == sorted(database.DEFAULT_MOVIE_CATEGORIES), "Свои категории с теми же названиями"
+            assert get_movies() == [] and database.get_movie_by_id(default_movie) is None, "Чужие записи не видны"
+            own_movie = create_movie("Фильм второго тенанта", None, get_movie_categories()[0]['id'])
+            database.delete_movie(default_movie)
+            assert tenants.slot_user(2) == 9002 and tenants.slot_name(1) == "Вера"
+        assert database.get_movie_by_id(default_movie) is not None, "Удаление чужой записи ничего не делает"
+        assert database.get_movie_by_id(own_movie) is None
+        assert own_movie not in [m['id'] for m in get_movies()]
+        print("[OK] Изоляция данных: OK")
+        
+        def update(user_id, text="Фильмы"):
+            return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=SimpleNamespace(text=text))
+        
+        def check(upd):
+            # Отдельный контекст, как у апдейта: тенант не утекает в тест
+            context = contextvars.copy_context()
+            allowed = context.run(middleware.AuthMiddleware().check, upd)
+            return allowed, context.run(database.current_tenant)
+        
+        assert check(update(9002)) == (True, tenant_id), "Тенант автора выставлен на время апдейта"
+        assert check(update(424242))[0] is False, "Чужой пользователь не проходит"
+        assert check(update(424242, "/start join_abc")) == (True, database.NO_TENANT), "Переход по приглашению"
+        assert database.current_tenant() == database.DEFAULT_TENANT
+    print("[OK] Доступ через middleware: OK")
+    
+    print("\n[OK] Все тесты тенантов пройдены успешно!")
+
+
+def test_shards():
+    """Тест режима шардов: файл на тенанта, LRU соединений, миграция при открытии, tools/shards."""
+    print("\n[TEST] Тестирование шардов...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        import time
+        from pathlib import Path
+        from tools import shards
+        
+        saved = (database.DB_PATH, database.SHARDED, database.SHARD_CONNECTIONS)
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_PATH = Path(tmp) / "main.db"
+            database.SHARDED = True
+            database.SHARD_CONNECTIONS = 1
+            try:
+                database.init_database()
+                now = int(time.time())
+                tenant_ids = []
+                for i in range(2):
+                    database.create_invite(f"shard{i}", None, 1, now + 60)
+                    tenant_ids.append(database.accept_invite(f"shard{i}", 8000 + i, f"Шард {i}", now))
+                for tenant_id in tenant_ids:
+                    with database.tenant_scope(tenant_id):
+                        categories = get_movie_categories()
+                        assert len(categories) == len(database.DEFAULT_MOVIE_CATEGORIES), "Категории создает шард"
+                        create_movie(f"Фильм тенанта {tenant_id}", None, categories[0]['id'])
+                assert len(database._shards) == 1, "Открытых шардов не больше SHARD_CONNECTIONS"
+                for tenant_id in tenant_ids:
+                    path = database.shard_path(tenant_id)
+                    conn = sqlite3.connect(path)
+                    titles = [row[0] for row in conn.execute("SELECT title FROM movies")]
+                    conn.close()
+                    assert titles == [f"Фильм тенанта {tenant_id}"], f"Данные тенанта - в его файле: {titles}"
+                main_conn = sqlite3.connect(database.DB_PATH)
+                assert main_conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0] == 0, "Основная база не тронута"
+                main_conn.close()
+                print("[OK] Файл на тенанта и LRU соединений: OK")
+                
+                with database.tenant_scope(tenant_ids[0]):
+                    category_id = database.create_photo_category("Альбом шарда")
+                    database.add_photo(category_id, "old-file", "shard-photo")
+                    database.cache_media("shard-photo", "fresh-file")
+                    assert database.get_cached_media("shard-photo")['file_id'] == "fresh-file"
+                    assert database.get_photos(category_id)[0]['file_id'] == "fresh-file", "Кеш медиа - в шарде"
+                print("[OK] Кеш медиа в шарде: OK")
+                
+                database.close_shards()
+                path = database.shard_path(tenant_ids[0])
+                conn = sqlite3.connect(path)
+                conn.execute("PRAGMA user_version = 0")
+                conn.close()
+                with database.tenant_scope(tenant_ids[0]):
+                    assert [m['title'] for m in get_movies()] == [f"Фильм тенанта {tenant_ids[0]}"]
+                conn = sqlite3.connect(path)
+                assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+                conn.close()
+                print("[OK] Миграция шарда при открытии: OK")
+                
+                found = shards.find_shards(database.DB_PATH)
+                assert [tenant_id for tenant_id, _ in found] == sorted(tenant_ids)
+                results, errors = shards.run_parallel(shards.shard_info, found, jobs=2)
+                assert not errors and [r['schema'] for r in results] == [database.SCHEMA_VERSION] * 2
+                backup_dir = Path(tmp) / "backup"
+                assert shards.main(["--db", str(database.DB_PATH), "backup", str(backup_dir)]) == 0
+                assert shards.main(["--db", str(database.DB_PATH), "vacuum"]) == 0
+                conn = sqlite3.connect(backup_dir / f"{tenant_ids[1]}.db")
+                assert conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0] == 1, "Копия согласована"
+                conn.close()
+                print("[OK] Обслуживание шардов: OK")
+            finally:
+                database.close_shards()
+                database.DB_PATH, database.SHARDED, database.SHARD_CONNECTIONS = saved
+        database.init_database()
+        
+        print("\n[OK] Все тесты шардов пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах шардов: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_scheduler():
+    """Тест расписаний: хранение, корзины таймеров, отправка, дайджест."""
+    print("\n[TEST] Тестирование расписаний...")
+    
+    try:
+        import asyncio
+        import time
+        from types import SimpleNamespace
+        import scheduler
+        
+        with temp_database():
+            category_id = database.get_movie_categories()[0]['id']
+            for i in range(7):
+                database.create_movie(f"Фильм дайджеста {i}", None, category_id)
+            # Одна несделанная активность - дайджест показывает ее при любой выборке
+            activity_id = database.create_activity("Активность с напоминанием", None)
+            
+            rows = database.get_digest_section("movies", 5)
+            assert len(rows) == 5, "Не больше limit записей"
+            total = len(database.get_movies(watched=0))
+            assert rows[0]['total'] == total, "total - все несделанные, а не только выбранные"
+            digest = scheduler.build_digest()
+            assert f"🎬 Фильмы - еще {total}:" in digest and "Активность с напоминанием" in digest
+            print("[OK] Дайджест: OK")
+            
+            jobs = []
+            
+            def run_once(callback, when, name):
+                jobs.append(SimpleNamespace(callback=callback, when=when, name=name))
+            
+            job_queue = SimpleNamespace(
+                run_once=run_once,
+                get_jobs_by_name=lambda name: [job for job in jobs if job.name == name]
+            )
+            
+            now = int(time.time())
+            base = scheduler.bucket_of(now) - scheduler.BUCKET_SECONDS
+            # Три напоминания в одной минуте (в прошлом) - один таймер
+            for offset in (1, 20, 59):
+                scheduler.add_reminder(job_queue, 1001, "activities", activity_id, base - scheduler.BUCKET_SECONDS + offset)
+            digest_id = database.create_schedule("digest", base, chat_id=1002, repeat_seconds=scheduler.WEEK_SECONDS)
+            scheduler.schedule(job_queue, base)
+            far = scheduler.add_reminder(job_queue, 1001, "activities", activity_id, now + 3600)
+            assert len(jobs) == 2, f"Таймер на корзину, а не на расписание: {[job.name for job in jobs]}"
+            assert database.get_schedule_buckets(scheduler.BUCKET_SECONDS) == [base, scheduler.bucket_of(now + 3600)]
+            print("[OK] Корзины таймеров: OK")
+            
+            sent = []
+            
+            async def send_message(chat_id, text, reply_markup=None, parse_mode=None):
+                sent.append((chat_id, text))
+            
+            context = SimpleNamespace(bot=SimpleNamespace(send_message=send_message), job_queue=job_queue)
+            asyncio.run(jobs[0].callback(context))
+            assert [chat_id for chat_id, _ in sent] == [1001, 1001, 1001, 1002], f"Все наступившие расписания: {sent}"
+            assert "Активность с напоминанием" in sent[0][1]
+            remaining = {schedule['id']: schedule for schedule in database.get_schedules()}
+            assert len(remaining) == 2 and far in remaining, "Разовые удалены, дальние остались"
+            digest_schedule = database.get_schedules("digest")[0]
+            assert digest_schedule['due_at'] == base + scheduler.WEEK_SECONDS, "Повторяющееся перенесено на период"
+            assert job_queue.get_jobs_by_name(f"schedule:{base + scheduler.WEEK_SECONDS}"), "Таймер новой корзины"
+            print("[OK] Отправка и перенос: OK")
+            
+            for schedule_id in (far, digest_id):
+                database.delete_schedule(schedule_id)
+            
+            # Не-Telegram ошибка одного расписания не оставляет остальные просроченными
+            jobs.clear()
+            sent.clear()
+            for chat_id in (1003, 1004):
+                scheduler.add_reminder(job_queue, chat_id, "activities", activity_id, base - 30)
+            
+            async def failing_send(chat_id, text, reply_markup=None, parse_mode=None):
+                if chat_id == 1003:
+                    raise RuntimeError("сбой")
+                sent.append((chat_id, text))
+            
+            context = SimpleNamespace(bot=SimpleNamespace(send_message=failing_send), job_queue=job_queue)
+            asyncio.run(jobs[0].callback(context))
+            assert [chat_id for chat_id, _ in sent] == [1004] and not database.get_schedules()
+        print("[OK] Ошибка одного расписания: OK")
+        
+        print("\n[OK] Все тесты расписаний пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах расписаний: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_notifications():
+    """Тест уведомлений партнеру: сводка, окно сбора, ограничение частоты."""
+    print("\n[TEST] Тестирование уведомлений...")
+    
+    try:
+        import asyncio
+        import time
+        from types import SimpleNamespace
+        from telegram.error import RetryAfter
+        import config
+        import middleware
+        import notifications
+        import screens
+        from sender import RateLimitedSender
+        
+        assert [screens.plural(n, ("фильм", "фильма", "фильмов")) for n in (1, 3, 5, 11, 21, 112)] == \
+            ["фильм", "фильма", "фильмов", "фильмов", "фильм", "фильмов"]
+        assert notifications.summary({("trips", "done"): {1}, ("movies", "create"): {1, 2, 3}}) == \
+            "+3 фильма, 1 поездка посещена"
+        print("[OK] Текст сводки: OK")
+        
+        database.init_database()
+        trip_category = database.get_trip_categories()[0]['id']
+        trip_id = database.create_trip("Поездка для уведомления", None, trip_category)
+        
+        sent = []
+        
+        async def flush(recipient, actor, events):
+            sent.append((recipient, actor, notifications.summary(events)))
+        
+        saved_config = config.swap(config.make_snapshot({555: "Аня", 777: "Петя"}))
+        
+        async def scenario():
+            notifications._debouncer = notifications.Debouncer(0.05, flush)
+            database.CHANGE_HOOKS.append(notifications._on_change)
+            token = middleware._current.set(SimpleNamespace(user_id=555))
+            try:
+                category_id = database.get_movie_categories()[0]['id']
+                for i in range(3):
+                    database.create_movie(f"Фильм для партнера {i}", None, category_id)
+                database.mark_trip_visited(trip_id)
+                game_id = database.create_game("Передумали")
+                database.delete_game(game_id)
+                assert not sent, "До конца окна ничего не отправляется"
+                await asyncio.sleep(0.1)
+            finally:
+                middleware._current.reset(token)
+                database.CHANGE_HOOKS.remove(notifications._on_change)
+        
+        try:
+            asyncio.run(scenario())
+        finally:
+            config.swap(saved_config)
+        assert sent == [(777, 555, "+3 фильма, 1 поездка посещена")], f"Одна сводка партнеру: {sent}"
+        print("[OK] Сбор событий в окне: OK")
+        
+        calls = []
+        
+        async def send_message(chat_id, text, **kwargs):
+            calls.append((chat_id, time.monotonic()))
+            if len(calls) == 1:
+                raise RetryAfter(0)
+        
+        async def send_all():
+            sender = RateLimitedSender(SimpleNamespace(send_message=send_message), per_chat_interval=0.05)
+            await asyncio.gather(sender.send_message(1, "a"), sender.send_message(1, "b"), sender.send_message(2, "c"))
+        
+        asyncio.run(send_all())
+        assert len(calls) == 4, "Повтор после RetryAfter"
+        chat_times = [moment for chat_id, moment in calls if chat_id == 1]
+        assert all(b - a >= 0.04 for a, b in zip(chat_times, chat_times[1:])), "Пауза между сообщениями в чат"
+        print("[OK] Ограничение частоты: OK")
+        
+        print("\n[OK] Все тесты уведомлений пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах уведомлений: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_config():
+    """Тест снимка конфигурации: индекс номеров, перечитывание config.json."""
+    print("\n[TEST] Тестирование конфигурации...")
+    
+    try:
+        import json
+        import os
+        import tempfile
+        from pathlib import Path
+        import config
+        
+        saved_path, saved_config = config.CONFIG_PATH, config.snapshot()
+        with tempfile.TemporaryDirectory() as tmp:
+            config.CONFIG_PATH = Path(tmp) / "config.json"
+            
+            def write(data, mtime):
+                config.CONFIG_PATH.write_text(json.dumps(data), encoding="utf-8")
+                os.utime(config.CONFIG_PATH, (mtime, mtime))
+            
+            try:
+                write({"users": [{"id": 555, "name": "Аня", "admin": True}, {"id": 777, "name": "Петя"}]}, 1000)
+                assert config.reload_if_changed(), "Первое чтение применяется"
+                assert not config.reload_if_changed(), "Файл не менялся"
+                assert config.user_slot(777) == 2 and config.slot_name(1) == "Аня"
+                assert config.slot_name(3) == "Пользователь 3" and config.user_slot(1) is None
+                assert config.is_admin(555) and not config.is_admin(777)
+                try:
+                    config.snapshot().users[555] = "Кто-то"
+                    raise AssertionError("Снимок должен быть неизменяемым")
+                except TypeError:
+                    pass
+                print("[OK] Индекс номеров и имен: OK")
+                
+                write({"users": [{"id": 555, "name": "Анна"}, {"id": 777, "name": "Петя"}, {"id": 999, "name": "Гость"}]}, 2000)
+                assert config.reload_if_changed(), "Изменение применяется без перезапуска"
+                assert config.slot_name(1) == "Анна" and config.is_authorized_user(999)
+                assert config.is_admin(777), "Без admin: true админы все"
+                
+                before = config.snapshot()
+                write({"users": [{"id": 555, "name": "Один"}]}, 3000)
+                assert not config.reload_if_changed(), "Некорректный файл не применяется"
+                config.CONFIG_PATH.write_text("{ не json", encoding="utf-8")
+                os.utime(config.CONFIG_PATH, (4000, 4000))
+                assert not config.reload_if_changed()
+                assert config.snapshot() is before, "Остается прежний снимок"
+                print("[OK] Перечитывание config.json: OK")
+            finally:
+                config.CONFIG_PATH = saved_path
+                config.swap(saved_config)
+        
+        print("\n[OK] Все тесты конфигурации пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах конфигурации: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_screens():
+    """Тест сборки текста экранов."""
+    print("\n[TEST] Тестирование шаблонов экранов...")
+    
+    try:
+        import screens
+        from telegram.constants import ParseMode
+        
+        items = [{"title": f"Фильм {i}"} for i in range(1, 13)]
+        expected = "📋 Ожидающие просмотра (12):\n\n"
+        for i, item in enumerate(items[:10], 1):
+            expected += f"{i}. {item['title']}\n"
+        expected += "\n... и еще 2"
+        text = screens.render_list("📋 Ожидающие просмотра", items, screens.NUMBERED_TITLE)
+        assert text == expected, f"Неверный текст списка: {text!r}"
+        assert screens.render_list("📋 Заголовок", [], screens.NUMBERED_TITLE) == "📋 Список пуст"
+        print("[OK] Текст списка: OK")
+        
+        top = screens.Template("{n}. {title} - {rating:.1f}/10")
+        assert top.render({"title": "A"}, n=1, rating=8.25) == "1. A - 8.2/10"
+        detail = screens.render_detail([screens.Template("🎬 {title}\n\n").render({"title": "A"}), None, "✅\n"])
+        assert detail == "🎬 A\n\n✅\n"
+        print("[OK] Шаблоны и карточки: OK")
+        
+        title = screens.Template("<{title}>")
+        assert title.render(title="a & <b>", parse_mode=ParseMode.HTML) == "&lt;a &amp; &lt;b&gt;&gt;"
+        assert screens.Template("{n}. {title}!").render(n=1, title="a_b", parse_mode=ParseMode.MARKDOWN_V2) == "1\\. a\\_b\\!"
+        assert title.render(title="a & <b>") == "<a & <b>>", "Без разметки текст не экранируется"
+        print("[OK] Экранирование HTML/MarkdownV2: OK")
+        
+        long_text = "\n".join(f"{i}. " + "слово " * 30 for i in range(300))
+        pages = screens.split_pages(long_text)
+        assert len(pages) > 1 and all(len(page) <= screens.MAX_MESSAGE_LENGTH for page in pages)
+        assert all(page.split("\n", 1)[0].split(".")[0].isdigit() for page in pages), "Разрез по границам строк"
+        
+        escaped = screens.escape("&" * 3000, ParseMode.HTML)
+        pages = screens.split_pages(escaped, parse_mode=ParseMode.HTML)
+        assert all(page.endswith(";") for page in pages), "Экранированные символы не разрезаются"
+        assert "".join(pages) == escaped
+        
+        truncated = screens.truncate("x" * 5000, 100)
+        assert len(truncated) == 100 and truncated.endswith(screens.ELLIPSIS)
+        print("[OK] Разбиение и обрезка по лимиту: OK")
+        
+        print("\n[OK] Все тесты шаблонов экранов пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах шаблонов экранов: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_search_index():
+    """Тест поискового индекса и inline-режима."""
+    print("\n[TEST] Тестирование inline-поиска...")
+    
+    import asyncio
+    from types import SimpleNamespace
+    import search_index
+    from handlers import inline
+    
+    with temp_database():
+        category_id = database.get_movie_categories()[0]['id']
+        star_id = database.create_movie("Звёздные войны", "Эпизод IV", category_id)
+        database.create_game("Звездная пыль", None, "RPG")
+        trip_id = database.create_trip("Побережье Черногории", None, database.get_trip_categories()[0]['id'])
+        
+        search_index.build()
+        search_index.install()
+        try:
+            titles = [entry.row['title'] for entry in search_index.index().search("звезд")[0]]
+            assert set(titles) == {"Звездная пыль", "Звёздные войны"}, f"Поиск по началу слова (ё = е): {titles}"
+            assert [e.item_id for e in search_index.index().search("войн")[0]] == [star_id]
+            assert [e.item_id for e in search_index.index().search("режье")[0]] == [trip_id], "Поиск по части слова"
+            assert search_index.index().search("звезд кино") == ([], 0)
+            print("[OK] Поиск по префиксу и подстроке: OK")
+            
+            database.update_movie(star_id, title="Новая надежда")
+            assert [e.item_id for e in search_index.index().search("надежда")[0]] == [star_id], "Индекс обновляется при записи"
+            assert not [e for e in search_index.index().search("войн")[0] if e.table == "movies"]
+            database.delete_trip(trip_id)
+            assert search_index.index().search("побережье") == ([], 0), "Удаленная запись пропадает из индекса"
+            print("[OK] Индекс обновляется при изменениях в базе: OK")
+            
+            for i in range(25):
+                database.create_activity(f"Прогулка {i}", None)
+            answers = []
+            
+            async def answer(results, **kwargs):
+                answers.append((results, kwargs))
+            
+            async def scenario(offset):
+                query = SimpleNamespace(query="прогулка", offset=offset, answer=answer)
+                await inline.inline_search(SimpleNamespace(inline_query=query), None)
+            
+            asyncio.run(scenario(""))
+            asyncio.run(scenario(answers[0][1]["next_offset"]))
+            first, second = answers
+            assert len(first[0]) == inline.RESULTS_PER_PAGE and first[1]["next_offset"] == str(inline.RESULTS_PER_PAGE)
+            assert len(second[0]) == 5 and second[1]["next_offset"] == ""
+            assert first[1]["is_personal"] and first[1]["cache_time"] == inline.CACHE_TIME
+            assert "Прогулка" in first[0][0].input_message_content.message_text
+            print("[OK] Страницы inline-результатов и карточки: OK")
+        finally:
+            database.CHANGE_HOOKS.remove(search_index._on_change)
+            search_index.clear()
+    
+    print("\n[OK] Все тесты inline-поиска пройдены успешно!")
+
+
+def test_persistence():
+    """Тест сохранения состояния бота в SQLite."""
+    print("\n[TEST] Тестирование persistence...")
+    
+    try:
+        import asyncio
+        from persistence import SQLitePersistence
+        
+        database.init_database()
+        
+        async def scenario():
+            persistence = SQLitePersistence()
+            await persistence.update_user_data(42, {'movie_title': 'Тестовый фильм'})
+            await persistence.update_conversation("movies_add", (42, 42), 1)
+            await persistence.flush()
+            
+            # Новый экземпляр - как после перезапуска бота
+            restored = SQLitePersistence()
+            user_data = {}
+            await restored.refresh_user_data(42, user_data)
+            conversations = await restored.get_conversations("movies_add")
+            return user_data, conversations
+        
+        user_data, conversations = asyncio.run(scenario())
+        assert user_data.get('movie_title') == 'Тестовый фильм', "user_data должны восстановиться"
+        assert conversations.get((42, 42)) == 1, "Состояние диалога должно восстановиться"
+        print("[OK] user_data и состояния диалогов восстановлены: OK")
+        
+        import datetime
+        import threading
+        
+        async def types_scenario():
+            persistence = SQLitePersistence()
+            await persistence.update_user_data(45, {1: datetime.date(2026, 10, 19), 'tags': {"кино"}})
+            await persistence.flush()
+            restored = {}
+            await SQLitePersistence().refresh_user_data(45, restored)
+            return restored
+        
+        restored = asyncio.run(types_scenario())
+        assert restored == {1: datetime.date(2026, 10, 19), 'tags': {"кино"}}, f"Типы после перезапуска: {restored}"
+        conn = database.get_main_connection()
+        conn.execute("INSERT OR REPLACE INTO ptb_user_data (user_id, data) VALUES (46, ?)", ('{"step": "json"}',))
+        conn.commit()
+        conn.close()
+        legacy = {}
+        asyncio.run(SQLitePersistence().refresh_user_data(46, legacy))
+        assert legacy == {"step": "json"}, "Данные прежних версий (JSON) читаются"
+        try:
+            asyncio.run(SQLitePersistence().update_user_data(47, {'lock': threading.Lock()}))
+            raise AssertionError("Несериализуемое значение не должно сохраняться строкой")
+        except TypeError:
+            pass
+        print("[OK] Типы данных переживают перезапуск: OK")
+        
+        import sqlite3
+        import persistence as persistence_module
+        
+        async def locked_scenario():
+            persistence = SQLitePersistence()
+            original_write = SQLitePersistence._write
+            
+            def locked_write(cursor, table, id_column, pending):
+                raise sqlite3.OperationalError("database is locked")
+            
+            persistence._write = locked_write
+            await persistence.update_user_data(43, {'step': 'старое'})
+            await persistence.update_user_data(44, {'step': 'название'})
+            await persistence.update_conversation("movies_add", (44, 44), 2)
+            await asyncio.sleep(0)
+            assert 44 in persistence._pending_users, "Изменения вернулись в очередь"
+            # Изменение после неудачной записи новее - оно и записывается
+            await persistence.update_user_data(43, {'step': 'новое'})
+            persistence._write = original_write
+            await asyncio.sleep(persistence_module.RETRY_DELAY + 0.2)
+            assert not persistence._pending_users, "Повторная запись прошла"
+            
+            restored = SQLitePersistence()
+            first, second = {}, {}
+            await restored.refresh_user_data(43, first)
+            await restored.refresh_user_data(44, second)
+            return first, second, await restored.get_conversations("movies_add")
+        
+        saved_delay = persistence_module.RETRY_DELAY
+        persistence_module.RETRY_DELAY = 0.1
+        try:
+            first, second, conversations = asyncio.run(locked_scenario())
+        finally:
+            persistence_module.RETRY_DELAY = saved_delay
+        assert first == {'step': 'новое'} and second == {'step': 'название'}, (first, second)
+        assert conversations.get((44, 44)) == 2
+        print("[OK] Запись после database is locked повторяется без потерь: OK")
+        
+        print("\n[OK] Все тесты persistence пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах persistence: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_tracing():
+    """Тест трассировки апдейтов."""
+    print("\n[TEST] Тестирование трассировки...")
+    
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from pathlib import Path
+        from types import SimpleNamespace
+        from telegram import Update
+        import instrumentation
+        import middleware
+        import tracing
+        
+        database.init_database()
+        tracing.TRACE_SAMPLE_RATE = 1.0
+        tracing.TRACES_DIR = Path(tempfile.mkdtemp())
+        
+        async def handler(update, context):
+            database.get_movie_categories()
+        
+        handler_obj = SimpleNamespace(callback=handler)
+        pipeline = middleware.Pipeline([middleware.TracingMiddleware()])
+        tracing.install(pipeline, SimpleNamespace(handlers={0: [handler_obj]}))
+        tracing.start()
+        
+        async def scenario():
+            update = Update(update_id=1)
+            pipeline._check(update)
+            await handler_obj.callback(update, None)
+            await pipeline._after(update, None)
+        
+        try:
+            asyncio.run(scenario())
+        finally:
+            tracing.stop()
+            database.STATEMENT_HOOKS.remove(tracing._observe_statement)
+            instrumentation.API_HOOKS.remove(tracing._observe_api_call)
+            tracing.TRACE_SAMPLE_RATE = 0.0
+        
+        lines = (tracing.TRACES_DIR / "traces.jsonl").read_text(encoding="utf-8").splitlines()
+        spans = [json.loads(line) for line in lines]
+        kinds = [span["kind"] for span in spans]
+        assert kinds == ["update", "handler", "db"], f"Неожиданные span'ы: {kinds}"
+        assert spans[2]["parent_id"] == spans[1]["span_id"], "SQL-запрос должен быть внутри обработчика"
+        assert spans[2]["name"] == "get_movie_categories"
+        print("[OK] Span'ы апдейта, обработчика и SQL-запроса записаны: OK")
+        
+        # Ошибка Telegram приходит ответом (PTB поднимает исключение позже)
+        from telegram.request import HTTPXRequest
+        calls = []
+        
+        async def fake_request(self, url, method, request_data=None, *args, **kwargs):
+            return (400 if url.endswith("sendMessage") else 200), b"{}"
+        
+        saved_request = HTTPXRequest.do_request
+        HTTPXRequest.do_request = fake_request
+        
+        def observe(name, seconds, ok):
+            calls.append((name, ok))
+        
+        instrumentation.API_HOOKS.append(observe)
+        try:
+            request = instrumentation.InstrumentedRequest()
+            asyncio.run(request.do_request("https://api/bot1/sendMessage", "POST"))
+            asyncio.run(request.do_request("https://api/bot1/getMe", "POST"))
+        finally:
+            HTTPXRequest.do_request = saved_request
+            instrumentation.API_HOOKS.remove(observe)
+        assert calls == [("sendMessage", False), ("getMe", True)], calls
+        print("[OK] Ответ Telegram с ошибкой считается ошибкой вызова: OK")
+        
+        assert instrumentation.api_method("https://api/file/bot1/photos/file_7.jpg") == instrumentation.FILE_METHOD
+        assert instrumentation.api_method("http://127.0.0.1:8081/file/bot1/videos/a.mp4") == instrumentation.FILE_METHOD
+        assert instrumentation.api_method("https://api/bot1/sendMediaGroup") == "sendMediaGroup"
+        print("[OK] Загрузки файлов - одна метка метрики: OK")
+        
+        print("\n[OK] Все тесты трассировки пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах трассировки: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_profiler():
+    """Тест отчета профилирования /profile."""
+    print("\n[TEST] Тестирование профилирования...")
+    
+    try:
+        import cProfile
+        import profiler
+        
+        assert profiler.parse_limit("100") == ("updates", 100)
+        assert profiler.parse_limit("30s") == ("seconds", 30)
+        assert profiler.parse_limit("abc") is None
+        assert profiler.parse_limit("0") is None
+        print("[OK] Разбор аргумента /profile: OK")
+        
+        database.init_database()
+        profile = cProfile.Profile()
+        profile.enable()
+        database.get_movie_categories()
+        profile.disable()
+        
+        report = profiler.build_report(profile, "тест")
+        database_section = report.split("=== База данных")[1].split("===", 2)[1]
+        assert "database.py" in database_section and "get_movie_categories" in database_section, \
+            "Функция БД должна попасть в группу базы данных"
+        print("[OK] Отчет с разбивкой по группам: OK")
+        
+        print("\n[OK] Все тесты профилирования пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах профилирования: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_benchmarks():
+    """Бенчмарк database.py покрывает все публичные функции и проходит на малом масштабе."""
+    print("\n[TEST] Тестирование бенчмарков...")
+    
+    try:
+        import inspect
+        from benchmarks import bench_database
+        
+        public = {
+            name for name, func in inspect.getmembers(database, inspect.isfunction)
+            if not name.startswith('_') and func.__module__ == 'database'
+            and name not in (
+                'get_connection', 'get_main_connection', 'init_database', 'current_tenant', 'set_tenant',
+                'tenant_scope', 'shard_path', 'close_shards',
+            )
+        }
+        covered = {case.name.split('(')[0] for case in bench_database.CASES}
+        missing = public - covered
+        assert not missing, f"Функции без замера: {sorted(missing)}"
+        print(f"[OK] Замеры есть для всех {len(public)} публичных функций: OK")
+        
+        report = bench_database.run(scale=100, repeat=1)
+        assert len(report['results']) == len(bench_database.CASES)
+        assert bench_database.compare(report, report, 1.5) == [], "Прогон не может быть регрессией сам себе"
+        print("[OK] Прогон на масштабе 100: OK")
+        
+        print("\n[OK] Все тесты бенчмарков пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах бенчмарков: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_recorder():
+    """Тест обезличивания записанных апдейтов."""
+    print("\n[TEST] Тестирование записи апдейтов...")
+    
+    try:
+        import config
+        import recorder
+        from tools import replay
+        
+        saved_config = config.swap(config.make_snapshot({555: "Аня", 777: "Петя"}))
+        try:
+            person = {"id": 777, "is_bot": False, "first_name": "Петя", "username": "petya"}
+            update = {
+                "update_id": 1,
+                "message": {
+                    "message_id": 10, "date": 0,
+                    "chat": {"id": 777, "type": "private", "first_name": "Петя"},
+                    "from": person,
+                    "text": "Секретное название",
+                },
+            }
+            anonymized = recorder.anonymize(update)
+            sections = recorder.anonymize({"text": "Фильмы"})
+            command = recorder.anonymize({"text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}]})
+        finally:
+            config.swap(saved_config)
+        
+        dumped = str(anonymized)
+        assert "Петя" not in dumped and "petya" not in dumped, "Имена должны быть удалены"
+        assert "Секретное" not in dumped, "Свободный текст должен быть обезличен"
+        assert anonymized["message"]["from"]["id"] == recorder.PSEUDO_USER_BASE + 1, "Порядок пользователей сохраняется"
+        assert sections["text"] == "Фильмы" and command["text"] == "/start", "Кнопки меню и команды сохраняются"
+        assert command["entities"][0]["type"] == "bot_command"
+        print("[OK] Обезличивание апдейта: OK")
+        
+        users = replay.recorded_users([{"t": 0, "u": anonymized}])
+        assert list(users) == [recorder.PSEUDO_USER_BASE, recorder.PSEUDO_USER_BASE + 1]
+        print("[OK] Пользователи для воспроизведения: OK")
+        
+        print("\n[OK] Все тесты записи апдейтов пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах записи апдейтов: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def test_handlers():
     """Тест импорта обработчиков."""
     print("\n[TEST] Тестирование обработчиков...")
@@ -178,6 +1529,382 @@ def test_handlers():
         return False
 
 
+def test_loadgen():
+    """Прогон сценариев через настоящий Application на фейковом Bot API."""
+    print("\n[TEST] Тестирование обработчиков на фейковом Bot API...")
+    
+    try:
+        import asyncio
+        import logging
+        from tools import loadgen
+        
+        errors = []
+        
+        class ErrorCollector(logging.Handler):
+            def emit(self, record):
+                errors.append(record.getMessage())
+        
+        collector = ErrorCollector(level=logging.ERROR)
+        logging.getLogger().addHandler(collector)
+        try:
+            report = asyncio.run(loadgen.run(total=90, rate=0, users=2))
+        finally:
+            logging.getLogger().removeHandler(collector)
+        
+        assert report['updates_processed'] == report['updates_sent'], "Все апдейты должны быть обработаны"
+        assert not errors, f"Ошибки в обработчиках: {errors[:3]}"
+        for method in ('sendMessage', 'editMessageText', 'answerCallbackQuery'):
+            assert method in report['api_calls_by_method'], f"Нет вызовов {method}"
+        print(f"[OK] Сценарии меню, добавления и оценок: {report['updates_processed']} апдейтов без ошибок")
+        
+        print("\n[OK] Все тесты сценариев пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах сценариев: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_workers():
+    """Тест режима нескольких процессов: выбор рабочего и прогон через WorkerPool."""
+    print("\n[TEST] Тестирование рабочих процессов...")
+    
+    import asyncio
+    import time
+    from telegram import Update
+    import config
+    import workers
+    from benchmarks import bench_workers
+    
+    with temp_database():
+        saved = config.swap(config.make_snapshot({7001: "Первый", 7002: "Второй"}))
+        try:
+            now = int(time.time())
+            database.create_invite("workers_test", None, 7001, now + 60)
+            tenant_id = database.accept_invite("workers_test", 7101, "Участник", now)
+            
+            def message(user_id, chat_id, text="Фильмы"):
+                return Update.de_json({"update_id": 1, "message": {
+                    "message_id": 1, "date": now, "text": text,
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+                }}, None)
+            
+            assert workers.route(message(7001, 7001), 4) == workers.route(message(7002, 7002), 4), \
+                "Пользователи config.json - один рабочий"
+            assert workers.route(message(7101, 7101), 1000) == tenant_id % 1000, "Участник - по тенанту"
+            assert workers.route(message(7101, 555), 1000) == tenant_id % 1000, "Чаты тенанта - у одного рабочего"
+            assert workers.route(message(7301, 7301), 1000) == 7301 % 1000, "Чужой - по chat id"
+            print("[OK] Выбор рабочего по тенанту и chat id: OK")
+            
+            workers._member_tenants.clear()
+            assert workers._cached_route_key(message(7101, 7101)) is None, "Незнакомый участник - поиск в базе"
+            assert asyncio.run(workers.route_key(message(7101, 7101))) == tenant_id
+            assert workers._cached_route_key(message(7101, 7101)) == tenant_id, "Найденный тенант запомнен"
+            assert workers._cached_route_key(message(7001, 7001)) == database.DEFAULT_TENANT
+            print("[OK] Поиск тенанта фронтом вне event loop: OK")
+            
+            database.create_invite("workers_join", tenant_id, 7101, now + 60)
+            database.create_invite("workers_new", None, 7001, now + 60)
+            join = message(7201, 7201, "/start join_workers_join")
+            assert workers.route(join, 1000) == tenant_id % 1000, "Вступление - у рабочего тенанта"
+            assert workers.route(message(7202, 7202, "/start join_workers_new"), 1000) == 7202 % 1000, \
+                "Новый тенант - по chat id"
+            
+            pool = workers.WorkerPool(3)
+            try:
+                index = pool.submit(join)
+                assert pool.channels[index].get(timeout=5)['message']['text'] == "/start join_workers_join"
+                for other in set(range(3)) - {index}:
+                    assert pool.channels[other].get(timeout=5) == workers.FORGET_MEMBERS, \
+                        "Остальные рабочие забывают составы"
+            finally:
+                for channel in pool.channels:
+                    channel.close()
+            print("[OK] Переход по приглашению - к рабочему тенанта: OK")
+            
+            saved_size = workers.MEMBER_TENANTS_SIZE
+            workers.MEMBER_TENANTS_SIZE = 1
+            try:
+                database.accept_invite("workers_join", 7201, "Второй участник", now)
+                workers.route(message(7101, 7101), 4)
+                workers.route(message(7201, 7201), 4)
+                assert list(workers._member_tenants) == [7201], "Фронт помнит не больше MEMBER_TENANTS_SIZE"
+            finally:
+                workers.MEMBER_TENANTS_SIZE = saved_size
+            print("[OK] Ограничение памяти фронта: OK")
+        finally:
+            config.swap(saved)
+            workers._member_tenants.clear()
+    
+    report = bench_workers.run([2], total=60, tenants=2)
+    result = report['runs'][0]
+    assert result['updates'] == 60 and sum(result['per_worker']) == 60, "Все апдейты переданы рабочим"
+    assert all(result['per_worker']), f"Тенанты разошлись по рабочим: {result['per_worker']}"
+    print(f"[OK] Прогон на 2 рабочих: {result['updates_per_s']} апдейтов/с")
+    database.init_database()
+    
+    print("\n[OK] Все тесты рабочих процессов пройдены успешно!")
+
+
+def _slow_job(steps):
+    """Задача пула для теста отмены: steps шагов по 50 мс с прогрессом."""
+    import time
+    import jobs
+    for step in range(steps):
+        jobs.progress(step, steps)
+        time.sleep(0.05)
+    return steps
+
+
+def test_jobs():
+    """Тест пула задач: статистика, экспорт и импорт CSV, прогресс, отмена, ограничение очереди."""
+    print("\n[TEST] Тестирование пула задач...")
+    
+    import asyncio
+    import config
+    import jobs
+    import reports
+    import search_index
+    
+    with temp_database():
+        saved = config.swap(config.make_snapshot({7001: "Первый", 7002: "Второй"}))
+        saved_interval = jobs.PROGRESS_INTERVAL
+        jobs.PROGRESS_INTERVAL = 0
+        jobs.task("test_slow")(_slow_job)
+        
+        async def scenario():
+            category_id = get_movie_categories()[0]['id']
+            movie_id = create_movie("Статистика фильм", None, category_id)
+            database.set_movie_rating(movie_id, 7001, 9)
+            database.set_movie_rating(movie_id, 7002, 4)
+            payload = reports.collect_lists()
+            
+            text = await jobs.submit_job("stats", payload)
+            assert "📊 Статистика" in text and "Первый и Второй" in text, text
+            print("[OK] Статистика в пуле: OK")
+            
+            data = await jobs.submit_job("export_csv", payload)
+            csv_text = data.decode("utf-8-sig")
+            assert csv_text.startswith("Раздел,Название") and "Статистика фильм" in csv_text
+            
+            source = (
+                "Раздел;Название;Заметка;Категория;Готово;Оценка 1;Оценка 2\n"
+                "Фильмы;Импортный фильм;Заметка;Новая категория;да;8;\n"
+                "Игры;Импортная игра;;Roguelike;;;6\n"
+                "Фильмы;Статистика фильм;;;;;\n"
+                "Книги;Что-то;;;;;\n"
+                "Игры;Плохая оценка;;;;11;\n"
+            ).encode("cp1251")
+            existing = {table: [item['title'] for item in items] for table, items in payload["sections"].items()}
+            parsed = await jobs.submit_job("import_csv", {"data": source, "members": 2, "existing": existing})
+            assert [item['title'] for item in parsed['items']] == ["Импортный фильм", "Импортная игра"], parsed
+            assert parsed['skipped'] == 1 and parsed['error_count'] == 2, parsed
+            print("[OK] Экспорт и разбор импорта (';', cp1251, дубликаты, ошибки): OK")
+            
+            # Индекс подписан на изменения, как у бота (inline.register)
+            search_index.install()
+            search_index.index()
+            for item in parsed['items']:
+                item['ratings'] = {config.slot_user(slot): score for slot, score in item['ratings'].items()}
+            counts = database.import_items(parsed['items'])
+            assert counts == {"movies": 1, "games": 1}, counts
+            movie = [m for m in get_movies(watched=1) if m['title'] == "Импортный фильм"][0]
+            assert movie['category_title'] == "Новая категория" and movie['rating_count'] == 1
+            assert [g['genre'] for g in get_games() if g['title'] == "Импортная игра"] == ["Roguelike"]
+            assert search_index.index().search("Импортный")[0], "Индекс перестроен после импорта"
+            print("[OK] import_items одной транзакцией: OK")
+            
+            progress = []
+            
+            async def on_progress(done, total, text):
+                progress.append(done)
+            
+            job = jobs.submit_job("test_slow", 200, on_progress=on_progress, owner=7001)
+            assert jobs.get_job(job.id) is job and job.owner == 7001
+            for _ in range(200):
+                if progress:
+                    break
+                await asyncio.sleep(0.05)
+            assert progress, "Прогресс должен приходить из процесса пула"
+            assert job.cancel()
+            try:
+                await asyncio.wait_for(job, 5)
+                raise AssertionError("Отмененная задача не должна завершиться")
+            except jobs.JobCancelled:
+                pass
+            assert jobs.get_job(job.id) is None
+            print("[OK] Прогресс и отмена выполняющейся задачи: OK")
+            
+            free = jobs._shared.free_slots
+            jobs._shared.free_slots = []
+            try:
+                jobs.submit_job("stats", payload)
+                raise AssertionError("Переполненная очередь должна отказать")
+            except jobs.JobQueueFull:
+                pass
+            finally:
+                jobs._shared.free_slots = free
+            assert await jobs.submit_job("test_slow", 1) == 1, "После отказа пул работает"
+            print("[OK] Ограничение очереди: OK")
+        
+        async def run():
+            try:
+                await scenario()
+            finally:
+                await jobs.stop()
+        
+        try:
+            asyncio.run(run())
+        finally:
+            config.swap(saved)
+            jobs.PROGRESS_INTERVAL = saved_interval
+    
+    print("\n[OK] Все тесты пула задач пройдены успешно!")
+
+
+def test_detail_cache():
+    """Тест кеша карточек: версии записей, повторные открытия без SQL, сброс при изменениях."""
+    print("\n[TEST] Тестирование кеша карточек...")
+    
+    try:
+        import config
+        import details
+        from handlers.games import game_card
+        from handlers.movies import movie_card
+        
+        database.init_database()
+        saved = config.swap(config.make_snapshot({7101: "Первый", 7102: "Второй"}))
+        loads = []
+        
+        def load_movie(movie_id):
+            loads.append(movie_id)
+            return database.get_movie_by_id(movie_id)
+        
+        try:
+            category_id = get_movie_categories()[0]['id']
+            movie_id = create_movie("Карточка фильм", None, category_id)
+            assert database.get_movie_by_id(movie_id)['version'] == 0
+            
+            first = details.card("movies", movie_id, load_movie, movie_card)
+            again = details.card("movies", movie_id, load_movie, movie_card)
+            assert again is first and loads == [movie_id], "Повторное открытие - без запроса"
+            print("[OK] Повторное открытие без SQL и сборки: OK")
+            
+            database.mark_movie_watched(movie_id)
+            database.set_movie_rating(movie_id, 7101, 8)
+            assert database.get_movie_by_id(movie_id)['version'] == 2
+            card = details.card("movies", movie_id, load_movie, movie_card)
+            assert card is not first and "Первый" in card.text and "8" in card.text, card.text
+            assert "Просмотрен" not in str(card.reply_markup.to_dict()), "Кнопка отметки исчезла"
+            database.update_movie(movie_id, note="Заметка")
+            assert "Заметка" in details.card("movies", movie_id, load_movie, movie_card).text
+            print("[OK] mark_*, оценка и update_* увеличивают версию и обновляют карточку: OK")
+            
+            # Массовое изменение помечает все карточки, но версия записи прежняя
+            builds = details.cache_info().builds
+            database._notify_change("movies", 0, "import")
+            details.card("movies", movie_id, load_movie, movie_card)
+            info = details.cache_info()
+            assert info.builds == builds and info.checks >= 1, info
+            print("[OK] Та же версия - карточка без сборки: OK")
+            
+            game_id = create_game("Карточка игра", None, "RPG")
+            assert details.card("games", game_id, database.get_game_by_id, game_card) is not None
+            database.delete_game(game_id)
+            assert details.card("games", game_id, database.get_game_by_id, game_card) is None
+            with database.tenant_scope(database.NO_TENANT):
+                assert details.card("movies", movie_id, database.get_movie_by_id, movie_card) is None, \
+                    "Карточка чужого тенанта не отдается"
+            print("[OK] Удаление и другой тенант: OK")
+        finally:
+            config.swap(saved)
+        
+        print("\n[OK] Все тесты кеша карточек пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах кеша карточек: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_versions():
+    """Тест версий записей: compare-and-swap в database и конфликты одновременных нажатий."""
+    print("\n[TEST] Тестирование одновременных изменений...")
+    
+    try:
+        import asyncio
+        import itertools
+        import details
+        from tools.harness import BotHarness
+        from tools.loadgen import VirtualUser
+        
+        database.init_database()
+        category_id = get_movie_categories()[0]['id']
+        movie_id = create_movie("Версии фильм", None, category_id)
+        assert database.update_movie(movie_id, note="Первая", version=0)
+        assert not database.update_movie(movie_id, note="Поверх", version=0), "Устаревшая версия не записывается"
+        assert database.get_movie_by_id(movie_id)['note'] == "Первая"
+        assert not database.mark_movie_watched(movie_id, 0) and database.mark_movie_watched(movie_id, 1)
+        assert database.set_movie_rating(movie_id, 8101, 7, 2)
+        assert not database.set_movie_rating(movie_id, 8102, 3, 2), "Оценка по устаревшей версии"
+        assert database.get_ratings("movies", movie_id)[0]['score'] == 7 and len(database.get_ratings("movies", movie_id)) == 1
+        assert database.update_movie(movie_id, title="Без проверки"), "version=None - как раньше"
+        assert not database.delete_movie(movie_id, 0) and database.delete_movie(movie_id, 4)
+        assert not database.mark_movie_watched(movie_id), "Удаленная запись"
+        print("[OK] update_*, mark_*, set_*_rating, delete_* с версией: OK")
+        
+        async def scenario():
+            users = {8101: "Первый", 8102: "Второй"}
+            async with BotHarness(users) as harness:
+                game_id = create_game("Версии игра", None, "RPG")
+                update_ids = itertools.count(1)
+                first, second = (VirtualUser(user_id, update_ids) for user_id in users)
+                # Оба открыли карточку версии 0 и нажали "Пройдено"
+                harness.push(first.callback("game_done", game_id, 0))
+                harness.push(second.callback("game_done", game_id, 0))
+                # Первый оценивает (версия 1), второй - по старой клавиатуре
+                harness.push(first.callback("rate_game", game_id, 1, 9, 1))
+                harness.push(second.callback("rate_game", game_id, 1, 2, 1))
+                assert await harness.wait(4, timeout=30)
+                answers = [params for method, params, _ in harness.api.calls if method == "answerCallbackQuery"]
+                scores = [row['score'] for row in database.get_ratings("games", game_id)]
+                assert scores == [9], f"Оценка первого не затерта: {scores}"
+                return game_id, [params.get("text") for params in answers]
+        
+        game_id, answers = asyncio.run(scenario())
+        assert answers.count(details.CONFLICT_NOTICE) == 2, answers
+        print("[OK] Второе нажатие по устаревшей карточке - конфликт и свежая карточка: OK")
+        
+        print("\n[OK] Все тесты одновременных изменений пройдены успешно!")
+        return True
+        
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в тестах одновременных изменений: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def run_test(test) -> bool:
+    """
+    Запуск теста из main(): провал - исключение (assert) или False.
+
+    Тесты на assert без try/except падают и под pytest.
+    """
+    try:
+        return test() is not False
+    except Exception as e:
+        print(f"\n[ERROR] Ошибка в {test.__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def main():
     """Главная функция тестирования."""
     print("=" * 50)
@@ -187,13 +1914,82 @@ def main():
     results = []
     
     # Тесты базы данных
-    results.append(test_database())
+    results.append(run_test(test_database))
     
     # Тесты клавиатур
-    results.append(test_keyboards())
+    results.append(run_test(test_keyboards))
+    
+    # Тесты кодека callback_data
+    results.append(run_test(test_callbacks))
+    
+    # Тесты конвейера middleware
+    results.append(run_test(test_middleware))
+    
+    # Тесты отрисовки экранов
+    results.append(run_test(test_render))
+    
+    # Тесты отправки видео
+    results.append(run_test(test_media))
+    
+    # Тесты фотографий
+    results.append(run_test(test_photos))
+    
+    # Тесты оценок
+    results.append(run_test(test_ratings))
+    
+    # Тесты тенантов
+    results.append(run_test(test_tenants))
+    
+    # Тесты шардов тенантов
+    results.append(run_test(test_shards))
+    
+    # Тесты расписаний
+    results.append(run_test(test_scheduler))
+    
+    # Тесты уведомлений партнеру
+    results.append(run_test(test_notifications))
+    
+    # Тесты конфигурации
+    results.append(run_test(test_config))
+    
+    # Тесты шаблонов экранов
+    results.append(run_test(test_screens))
+    
+    # Тесты inline-поиска
+    results.append(run_test(test_search_index))
+    
+    # Тесты persistence
+    results.append(run_test(test_persistence))
+    
+    # Тесты трассировки
+    results.append(run_test(test_tracing))
+    
+    # Тесты профилирования
+    results.append(run_test(test_profiler))
+    
+    # Тесты бенчмарков
+    results.append(run_test(test_benchmarks))
+    
+    # Тесты записи апдейтов
+    results.append(run_test(test_recorder))
     
     # Тесты обработчиков
-    results.append(test_handlers())
+    results.append(run_test(test_handlers))
+    
+    # Сценарии через настоящий Application
+    results.append(run_test(test_loadgen))
+    
+    # Режим нескольких процессов
+    results.append(run_test(test_workers))
+    
+    # Пул задач: статистика, экспорт, импорт
+    results.append(run_test(test_jobs))
+    
+    # Кеш карточек записей
+    results.append(run_test(test_detail_cache))
+    
+    # Одновременные изменения записей
+    results.append(run_test(test_versions))
     
     # Итоги
     print("\n" + "=" * 50)
@@ -0,0 +1,198 @@
+"""
+Локальный фейковый сервер Telegram Bot API для нагрузочного стенда.
+
+Принимает запросы python-telegram-bot так же, как api.telegram.org:
+POST /bot<token>/<method>. Поддерживает getMe, getUpdates (long polling),
+sendMessage, editMessageText, answerCallbackQuery, sendVideo, sendDocument,
+sendPhoto, sendMediaGroup; остальные методы отвечают true. Все вызовы
+(кроме getUpdates) записываются в calls.
+
+API:
+- FakeBotApi(host, port) - сервер; start() / stop()
+- push_update(update_dict) - поставить апдейт в очередь getUpdates
+- calls - записанные вызовы: (method, params, время)
+- base_url - адрес для Application.builder().base_url(...)
+"""
+
+import asyncio
+import json
+import logging
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "ForUs", "username": "ForUsBot"}
+
+# Методы, которые не относятся к обработке апдейтов и не учитываются в calls
+SERVICE_METHODS = {"getUpdates", "getMe", "deleteWebhook", "setWebhook", "close", "logOut"}
+
+
+class FakeBotApi:
+    """Фейковый Bot API на asyncio (HTTP/1.1 keep-alive)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.calls: List[Tuple[str, Dict[str, Any], float]] = []
+        self._updates: List[Dict[str, Any]] = []
+        self._updates_event = asyncio.Event()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._message_id = 0
+        self._closing = False
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Фейковый Bot API запущен на {self.base_url}")
+
+    async def stop(self) -> None:
+        self._closing = True
+        self._updates_event.set()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        """Ставит апдейт в очередь, которую бот заберет через getUpdates."""
+        self._updates.append(update)
+        self._updates_event.set()
+
+    # ============================================
+    # HTTP
+    # ============================================
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while not self._closing:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                path = request_line.decode("latin-1").split()[1]
+                method = path.rsplit("/", 1)[-1]
+                params = self._parse_body(headers.get("content-type", ""), body)
+                result = await self._dispatch(method, params)
+
+                payload = json.dumps({"ok": True, "result": result}, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_body(content_type: str, body: bytes) -> Dict[str, Any]:
+        """Разбирает параметры запроса (urlencoded, multipart или JSON)."""
+        if not body:
+            return {}
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        if content_type.startswith("multipart/form-data"):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+            )
+            params = {}
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                if part.get_filename():
+                    params[name] = f"<file {part.get_filename()}>"
+                else:
+                    params[name] = part.get_content()
+            return params
+        return dict(parse_qsl(body.decode("utf-8")))
+
+    # ============================================
+    # МЕТОДЫ BOT API
+    # ============================================
+
+    async def _dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method not in SERVICE_METHODS:
+            self.calls.append((method, params, time.perf_counter()))
+
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendVideo":
+            return self._message(params, video=self._file(params.get("video"), "video"))
+        if method == "sendPhoto":
+            return self._message(params, photo=[self._file(params.get("photo"), "photo")])
+        if method == "sendDocument":
+            return self._message(params, document=self._file(params.get("document"), "document"))
+        if method == "sendMediaGroup":
+            messages = []
+            for item in json.loads(params.get("media", "[]")):
+                media = self._file(item["media"], item["type"])
+                messages.append(self._message(params, **{item["type"]: [media] if item["type"] == "photo" else media}))
+            return messages
+        return True
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Long polling: отдает апдейты с update_id >= offset, ждет до timeout секунд."""
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and not self._closing:
+            self._updates_event.clear()
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), timeout=float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    def _message(self, params: Dict[str, Any], **content) -> Dict[str, Any]:
+        """Сообщение, которое вернул бы Telegram (message_id из params при редактировании)."""
+        if params.get("message_id"):
+            message_id = int(params["message_id"])
+        else:
+            self._message_id += 1
+            message_id = self._message_id
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "from": BOT_USER,
+        }
+        if params.get("reply_markup"):
+            # В сообщении Telegram возвращает только inline-клавиатуру
+            markup = json.loads(params["reply_markup"])
+            if "inline_keyboard" in markup:
+                message["reply_markup"] = markup
+        message.update(content)
+        return message
+
+    @staticmethod
+    def _file(file_id: Optional[str], kind: str) -> Dict[str, Any]:
+        """Описание файла (video, photo, document) в ответе Bot API."""
+        file_id = file_id or "file"
+        data = {"file_id": file_id, "file_unique_id": f"u{abs(hash(file_id)) % 10 ** 10}"}
+        if kind == "video":
+            data.update({"width": 720, "height": 1280, "duration": 15})
+        elif kind == "photo":
+            data.update({"width": 1280, "height": 720})
+        return data
@@ -0,0 +1,172 @@
+"""
+Стенд для прогона апдейтов через настоящий Application.
+
+Общая часть нагрузочного прогона (tools/loadgen.py) и воспроизведения
+записей (tools/replay.py): временная база (пустая или копия), фейковый
+Bot API, бот из bot.build_application() и учет каждого апдейта -
+когда поставлен в очередь, когда начал и закончил обрабатываться,
+сколько вызовов Bot API сделал.
+
+API:
+- BotHarness(users, db_path) - async with BotHarness(...) as harness
+- harness.push(update_dict) - отправить апдейт боту
+- harness.wait(total, timeout) - дождаться обработки
+- harness.records - UpdateRecord по update_id
+- percentile(values, fraction)
+"""
+
+import asyncio
+import logging
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import bot
+import config
+import database
+import instrumentation
+import middleware
+from tools.fake_bot_api import FakeBotApi
+
+logger = logging.getLogger(__name__)
+
+# Группа после конвейера middleware: здесь фиксируется окончание обработки
+DONE_GROUP = middleware.POST_GROUP + 1
+
+
+class UpdateRecord:
+    """Учет одного апдейта на стенде."""
+
+    __slots__ = ("route", "pushed", "started", "done", "api_calls")
+
+    def __init__(self):
+        self.route = ""
+        self.pushed = 0.0
+        self.started = 0.0
+        self.done = 0.0
+        self.api_calls = 0
+
+    @property
+    def latency_ms(self) -> float:
+        """От постановки в очередь до конца обработки."""
+        return (self.done - self.pushed) * 1000
+
+    @property
+    def handling_ms(self) -> float:
+        """Только обработка: от входа в конвейер до конца."""
+        return (self.done - self.started) * 1000
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class BotHarness:
+    """
+    Бот на фейковом Bot API и временной базе.
+
+    На время работы подменяет database.DB_PATH и пользователей config,
+    при выходе все возвращает и удаляет временную базу.
+    """
+
+    def __init__(self, users: Dict[int, str], db_path: Optional[Path] = None):
+        self.users = users
+        self.db_path = db_path
+        self.api = FakeBotApi()
+        self.application = None
+        self.records: Dict[int, UpdateRecord] = {}
+        self._done_count = 0
+        self._target = 0
+        self._all_done = asyncio.Event()
+        self._workdir: Optional[Path] = None
+        self._saved: Dict[str, Any] = {}
+
+    def _record(self, update_id: int) -> UpdateRecord:
+        record = self.records.get(update_id)
+        if record is None:
+            record = self.records[update_id] = UpdateRecord()
+        return record
+
+    async def __aenter__(self) -> "BotHarness":
+        self._workdir = Path(tempfile.mkdtemp(prefix="forus_harness_"))
+        self._saved = {
+            "db_path": database.DB_PATH,
+            "config": config.snapshot(),
+            "double_tap": middleware.DedupMiddleware.DOUBLE_TAP_SECONDS,
+        }
+        database.DB_PATH = self._workdir / "multilists.db"
+        if self.db_path is not None:
+            shutil.copy(self.db_path, database.DB_PATH)
+        config.swap(config.make_snapshot(self.users))
+        # Стенд сжимает время: одна и та же кнопка на одном экране может
+        # нажиматься чаще, чем человек успел бы, - это не случайный двойной тап
+        middleware.DedupMiddleware.DOUBLE_TAP_SECONDS = 0
+        database.init_database()
+
+        await self.api.start()
+        self.application = bot.build_application("123456:HARNESS", base_url=self.api.base_url)
+        self.application.add_handler(TypeHandler(Update, self._mark_done), group=DONE_GROUP)
+        instrumentation.API_HOOKS.append(self._count_api_call)
+
+        await self.application.initialize()
+        await self.application.updater.start_polling(poll_interval=0.0, timeout=5)
+        await self.application.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        try:
+            if self.application is not None:
+                await self.application.updater.stop()
+                await self.application.stop()
+                await self.application.shutdown()
+        finally:
+            if self._count_api_call in instrumentation.API_HOOKS:
+                instrumentation.API_HOOKS.remove(self._count_api_call)
+            await self.api.stop()
+            database.DB_PATH = self._saved["db_path"]
+            config.swap(self._saved["config"])
+            middleware.DedupMiddleware.DOUBLE_TAP_SECONDS = self._saved["double_tap"]
+            shutil.rmtree(self._workdir, ignore_errors=True)
+
+    async def _mark_done(self, update: Update, context) -> None:
+        record = self._record(update.update_id)
+        record.done = time.perf_counter()
+        state = middleware.current()
+        record.started = state.started if state else record.pushed
+        record.route = state.route if state else middleware.route_label(update)
+        self._done_count += 1
+        if self._target and self._done_count >= self._target:
+            self._all_done.set()
+
+    def _count_api_call(self, method: str, seconds: float, ok: bool) -> None:
+        state = middleware.current()
+        if state is not None:
+            self._record(state.update_id).api_calls += 1
+
+    def push(self, update: Dict[str, Any]) -> None:
+        """Ставит апдейт в очередь getUpdates."""
+        self._record(update["update_id"]).pushed = time.perf_counter()
+        self.api.push_update(update)
+
+    async def wait(self, total: int, timeout: float) -> bool:
+        """Ждет, пока обработается total апдейтов. False - не дождались."""
+        self._target = total
+        if self._done_count >= total:
+            return True
+        try:
+            await asyncio.wait_for(self._all_done.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Обработаны не все апдейты: {self._done_count} из {total}")
+            return False
+
+    def processed(self) -> List[UpdateRecord]:
+        return [record for record in self.records.values() if record.done]
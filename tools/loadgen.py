@@ -0,0 +1,276 @@
+"""
+Нагрузочный стенд: сценарии апдейтов против настоящего Application.
+
+Поднимает бота на фейковом Bot API и временной базе (tools/harness.py)
+и проигрывает сценарии (навигация по меню, добавление фильмов и игр,
+оценки) с заданной частотой.
+Апдейты идут по настоящему пути: getUpdates -> обработчики -> вызовы API.
+
+Отчет: обработано апдейтов в секунду, задержка p50/p99 (от постановки
+апдейта в очередь до окончания его обработки), вызовы API на апдейт.
+
+Использование:
+    python -m tools.loadgen --updates 1000 --rate 100 --users 4
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import callbacks
+import database
+from keyboards import SECTIONS
+from tools.harness import BotHarness, percentile
+
+logger = logging.getLogger(__name__)
+
+SEED_MOVIES = 50
+SEED_GAMES = 30
+
+
+# ============================================
+# СЦЕНАРИИ
+# ============================================
+
+class VirtualUser:
+    """Пользователь стенда: формирует апдейты от своего имени."""
+
+    def __init__(self, user_id: int, update_ids: Iterator[int]):
+        self.user_id = user_id
+        self._update_ids = update_ids
+        self._screen_ids = itertools.count(1)
+        self.screen_id = next(self._screen_ids)
+
+    def _base(self) -> Dict[str, Any]:
+        return {"update_id": next(self._update_ids)}
+
+    def _user(self) -> Dict[str, Any]:
+        return {"id": self.user_id, "is_bot": False, "first_name": f"Load{self.user_id}"}
+
+    def message(self, text: str) -> Dict[str, Any]:
+        update = self._base()
+        message = {
+            "message_id": update["update_id"],
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self._user(),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        update["message"] = message
+        # Новое сообщение - новый "экран" для последующих нажатий
+        self.screen_id = next(self._screen_ids) * 1000 + self.user_id % 1000
+        return update
+
+    def callback(self, route: str, *args: Any) -> Dict[str, Any]:
+        update = self._base()
+        update["callback_query"] = {
+            "id": str(update["update_id"]),
+            "from": self._user(),
+            "chat_instance": str(self.user_id),
+            "data": callbacks.encode(route, *args),
+            "message": {
+                "message_id": self.screen_id,
+                "date": int(time.time()),
+                "chat": {"id": self.user_id, "type": "private"},
+                "text": "...",
+            },
+        }
+        return update
+
+
+def menu_flow(user: VirtualUser, seed: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+    """Навигация по меню: разделы, списки, карточки."""
+    movie_id = seed["movies"][user.user_id % len(seed["movies"])]
+    game_id = seed["games"][user.user_id % len(seed["games"])]
+    return [
+        user.message("/start"),
+        user.message("Фильмы"),
+        user.callback("movies_pending"),
+        user.callback("movies_pending_all"),
+        user.callback("movie", movie_id),
+        user.callback("movies_menu"),
+        user.callback("movies_top"),
+        user.callback("movies_top_all"),
+        user.callback("main_menu"),
+        user.callback("section", SECTIONS.index("Игры")),
+        user.callback("games_pending"),
+        user.callback("games_pending_all"),
+        user.callback("game", game_id),
+        user.callback("main_menu"),
+    ]
+
+
+def add_flow(user: VirtualUser, seed: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+    """Добавление фильма (с выбором категории) и игры."""
+    category_id = seed["movie_categories"][user.user_id % len(seed["movie_categories"])]
+    return [
+        user.message("Фильмы"),
+        user.callback("movies_add"),
+        user.message(f"Нагрузочный фильм {user.user_id}"),
+        user.message("Заметка"),
+        user.callback("movie_cat", category_id),
+        user.message("Игры"),
+        user.callback("games_add"),
+        user.message(f"Нагрузочная игра {user.user_id}"),
+        user.message("Заметка"),
+        user.message("RPG"),
+    ]
+
+
+def rating_flow(user: VirtualUser, seed: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+    """Отметка просмотренным и оценки обоих пользователей."""
+    movie_id = seed["movies"][user.user_id % len(seed["movies"])]
+    game_id = seed["games"][user.user_id % len(seed["games"])]
+    return [
+        user.message("Фильмы"),
+        user.callback("movie", movie_id),
+        user.callback("movie_watched", movie_id),
+        user.callback("rate_movie", movie_id, 1, 8),
+        user.callback("rate_movie", movie_id, 2, 7),
+        user.message("Игры"),
+        user.callback("game", game_id),
+        user.callback("game_done", game_id),
+        user.callback("rate_game", game_id, 1, 9),
+        user.callback("rate_game", game_id, 2, 6),
+    ]
+
+
+FLOWS: Dict[str, Callable[[VirtualUser, Dict[str, List[int]]], List[Dict[str, Any]]]] = {
+    "menu": menu_flow,
+    "add": add_flow,
+    "rating": rating_flow,
+}
+
+
+def seed_database() -> Dict[str, List[int]]:
+    """Наполняет пустую базу данными, на которые ссылаются сценарии."""
+    categories = [database.create_movie_category(f"Категория {i}") for i in range(1, 4)]
+    movies = [
+        database.create_movie(f"Фильм {i}", None, categories[i % len(categories)])
+        for i in range(1, SEED_MOVIES + 1)
+    ]
+    games = [
+        database.create_game(f"Игра {i}", None, ("RPG", "Shooter", "Puzzle")[i % 3])
+        for i in range(1, SEED_GAMES + 1)
+    ]
+    return {"movie_categories": categories, "movies": movies, "games": games}
+
+
+def build_stream(users: List[VirtualUser], flows: List[str], seed: Dict[str, List[int]],
+                 total: int) -> List[Dict[str, Any]]:
+    """
+    Поток апдейтов: у каждого пользователя сценарии идут по кругу,
+    пользователи чередуются по одному сценарию.
+    """
+    stream: List[Dict[str, Any]] = []
+    flow_cycle = itertools.cycle(flows)
+    while len(stream) < total:
+        for user in users:
+            stream.extend(FLOWS[next(flow_cycle)](user, seed))
+    # update_id должен расти в порядке доставки
+    stream = stream[:total]
+    for update_id, update in enumerate(stream, 1):
+        update["update_id"] = update_id
+        if "callback_query" in update:
+            update["callback_query"]["id"] = str(update_id)
+    return stream
+
+
+# ============================================
+# ЗАПУСК
+# ============================================
+
+async def run(total: int = 500, rate: float = 50.0, users: int = 2,
+              flows: Optional[List[str]] = None, db_path: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Прогоняет сценарии и возвращает отчет.
+
+    Args:
+        total: Сколько апдейтов отправить
+        rate: Целевая частота апдейтов в секунду (0 - без ограничения)
+        users: Число виртуальных пользователей (минимум 2 - нужны две оценки)
+        flows: Сценарии из FLOWS (по умолчанию все)
+        db_path: Копия базы для прогона (по умолчанию - пустая временная база)
+    """
+    flows = flows or list(FLOWS)
+    load_users = {100000 + i: f"Нагрузка {i + 1}" for i in range(max(2, users))}
+
+    async with BotHarness(load_users, db_path) as harness:
+        seed = seed_database()
+        virtual_users = [VirtualUser(user_id, itertools.count(1)) for user_id in load_users]
+        stream = build_stream(virtual_users, flows, seed, total)
+
+        started = time.perf_counter()
+        calls_before = len(harness.api.calls)
+        interval = 1.0 / rate if rate > 0 else 0.0
+        for i, update in enumerate(stream):
+            if interval:
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            harness.push(update)
+
+        await harness.wait(total, timeout=max(30.0, total / max(rate, 1) * 2))
+        finished = time.perf_counter()
+        calls = harness.api.calls[calls_before:]
+        processed = harness.processed()
+
+    latencies = [record.latency_ms for record in processed]
+    by_method: Dict[str, int] = {}
+    for method, _, _ in calls:
+        by_method[method] = by_method.get(method, 0) + 1
+
+    elapsed = finished - started
+    return {
+        "updates_sent": total,
+        "updates_processed": len(processed),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(processed) / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.50), 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99), 2),
+        "api_calls_per_update": round(len(calls) / len(processed), 2) if processed else 0.0,
+        "api_calls_by_method": dict(sorted(by_method.items(), key=lambda item: -item[1])),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Апдейтов: {report['updates_processed']}/{report['updates_sent']} за {report['elapsed_s']} с")
+    print(f"Пропускная способность: {report['updates_per_s']} апдейтов/с")
+    print(f"Задержка: p50 {report['latency_p50_ms']} мс, p99 {report['latency_p99_ms']} мс")
+    print(f"Вызовов API на апдейт: {report['api_calls_per_update']}")
+    for method, count in report["api_calls_by_method"].items():
+        print(f"  {method:<22} {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота на фейковом Bot API")
+    parser.add_argument("--updates", type=int, default=500, help="сколько апдейтов отправить")
+    parser.add_argument("--rate", type=float, default=50.0, help="апдейтов в секунду (0 - максимально быстро)")
+    parser.add_argument("--users", type=int, default=2, help="число виртуальных пользователей")
+    parser.add_argument("--flows", default=",".join(FLOWS), help=f"сценарии через запятую: {', '.join(FLOWS)}")
+    parser.add_argument("--db", type=Path, help="база для прогона (копируется, оригинал не меняется)")
+    parser.add_argument("--json", type=Path, help="сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    flows = [name.strip() for name in args.flows.split(",") if name.strip()]
+    unknown = [name for name in flows if name not in FLOWS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+
+    report = asyncio.run(run(args.updates, args.rate, args.users, flows, args.db))
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Воспроизведение записанных апдейтов (recorder.py) и сравнение прогонов.
+
+run - подает запись в свежий Application на копии базы и фейковом Bot API
+(tools/harness.py) и сохраняет по каждому маршруту (movie, movies_pending,
+rate_movie...) время обработки p50/p99 и число вызовов API на апдейт.
+
+compare - сравнивает два прогона (например, до и после изменения
+handlers/*) и выводит маршруты, которые стали медленнее порога или
+стали делать больше вызовов API (код выхода 1).
+
+Использование:
+    python -m tools.replay run data/recordings/updates.jsonl --db data/multilists.db --output before.json
+    git checkout feature && python -m tools.replay run ... --output after.json
+    python -m tools.replay compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import recorder
+from tools.harness import BotHarness, percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 1.2
+# Маршруты быстрее этого (мс) не сравниваются - в них больше шума, чем сигнала
+NOISE_FLOOR_MS = 0.5
+# Паузы длиннее этого при воспроизведении в реальном темпе сокращаются (секунды)
+MAX_GAP_SECONDS = 5.0
+
+
+def load_recording(paths: List[Path], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Читает записи (включая ротированные файлы) в порядке времени."""
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+    entries.sort(key=lambda entry: entry["t"])
+    return entries[:limit] if limit else entries
+
+
+def recorded_users(entries: List[Dict[str, Any]]) -> Dict[int, str]:
+    """Пользователи из config.json в записи (id вида 100000 + номер), минимум двое."""
+    slots = set()
+
+    def collect(data):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if key == "from" and isinstance(value, dict):
+                    user_id = value.get("id", 0)
+                    if recorder.PSEUDO_USER_BASE <= user_id < recorder.PSEUDO_USER_BASE + 1000:
+                        slots.add(user_id - recorder.PSEUDO_USER_BASE)
+                collect(value)
+        elif isinstance(data, list):
+            for item in data:
+                collect(item)
+
+    for entry in entries:
+        collect(entry["u"])
+    count = max(2, max(slots) + 1 if slots else 0)
+    return {recorder.PSEUDO_USER_BASE + i: f"User{i + 1}" for i in range(count)}
+
+
+async def replay(entries: List[Dict[str, Any]], db_path: Optional[Path], speed: float) -> Dict[str, Any]:
+    """
+    Подает записанные апдейты боту.
+
+    Args:
+        speed: 0 - без пауз; 1 - в записанном темпе; 10 - в 10 раз быстрее
+    """
+    async with BotHarness(recorded_users(entries), db_path) as harness:
+        started = time.perf_counter()
+        first_t = entries[0]["t"] if entries else 0.0
+        offset = 0.0
+        previous_t = first_t
+        for update_id, entry in enumerate(entries, 1):
+            if speed > 0:
+                offset += min(entry["t"] - previous_t, MAX_GAP_SECONDS) / speed
+                previous_t = entry["t"]
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = dict(entry["u"])
+            # Нумерация заново: запись могла пережить перезапуски бота
+            update["update_id"] = update_id
+            harness.push(update)
+
+        await harness.wait(len(entries), timeout=max(60.0, len(entries) * 0.1))
+        elapsed = time.perf_counter() - started
+        processed = harness.processed()
+
+    per_route: Dict[str, List] = defaultdict(list)
+    for record in processed:
+        per_route[record.route].append(record)
+
+    routes = {}
+    for route, records in sorted(per_route.items()):
+        handling = [record.handling_ms for record in records]
+        routes[route] = {
+            "count": len(records),
+            "p50_ms": round(percentile(handling, 0.50), 3),
+            "p99_ms": round(percentile(handling, 0.99), 3),
+            "api_calls_per_update": round(sum(record.api_calls for record in records) / len(records), 3),
+        }
+    return {
+        "updates_sent": len(entries),
+        "updates_processed": len(processed),
+        "elapsed_s": round(elapsed, 3),
+        "routes": routes,
+    }
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any], threshold: float) -> List[str]:
+    """Маршруты, ставшие медленнее в threshold раз или делающие больше вызовов API."""
+    problems = []
+    for route, new in after["routes"].items():
+        old = before["routes"].get(route)
+        if old is None:
+            continue
+        if max(old["p50_ms"], new["p50_ms"]) >= NOISE_FLOOR_MS:
+            ratio = new["p50_ms"] / max(old["p50_ms"], 1e-9)
+            if ratio > threshold:
+                problems.append(f"{route}: p50 {old['p50_ms']:.2f} мс -> {new['p50_ms']:.2f} мс (x{ratio:.2f})")
+        if new["api_calls_per_update"] > old["api_calls_per_update"] + 1e-9:
+            problems.append(
+                f"{route}: вызовов API на апдейт {old['api_calls_per_update']} -> {new['api_calls_per_update']}"
+            )
+    return problems
+
+
+def print_run(report: Dict[str, Any]) -> None:
+    print(f"Апдейтов: {report['updates_processed']}/{report['updates_sent']} за {report['elapsed_s']} с")
+    print(f"{'маршрут':<32} {'кол-во':>7} {'p50, мс':>9} {'p99, мс':>9} {'API/апдейт':>11}")
+    for route, stats in sorted(report["routes"].items(), key=lambda item: -item[1]["count"]):
+        print(f"{route:<32} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+              f"{stats['api_calls_per_update']:>11}")
+
+
+def print_comparison(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    print(f"{'маршрут':<32} {'p50 до':>9} {'p50 после':>10} {'API до':>7} {'API после':>10}")
+    for route in sorted(set(before["routes"]) | set(after["routes"])):
+        old = before["routes"].get(route, {})
+        new = after["routes"].get(route, {})
+        print(f"{route:<32} {old.get('p50_ms', '-'):>9} {new.get('p50_ms', '-'):>10} "
+              f"{old.get('api_calls_per_update', '-'):>7} {new.get('api_calls_per_update', '-'):>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="воспроизвести запись")
+    run_parser.add_argument("recordings", type=Path, nargs="+", help="файлы updates.jsonl*")
+    run_parser.add_argument("--db", type=Path, help="база для прогона (копируется, оригинал не меняется)")
+    run_parser.add_argument("--speed", type=float, default=0.0,
+                            help="темп: 0 - без пауз, 1 - как в записи, 10 - в 10 раз быстрее")
+    run_parser.add_argument("--limit", type=int, help="воспроизвести только первые N апдейтов")
+    run_parser.add_argument("--output", type=Path, help="сохранить результаты в JSON")
+
+    compare_parser = commands.add_parser("compare", help="сравнить два прогона")
+    compare_parser.add_argument("before", type=Path)
+    compare_parser.add_argument("after", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="допустимый рост p50 (1.2 = +20%%)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.command == "run":
+        entries = load_recording(args.recordings, args.limit)
+        if not entries:
+            print("Запись пуста")
+            return
+        report = asyncio.run(replay(entries, args.db, args.speed))
+        print_run(report)
+        if args.output:
+            args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        return
+
+    before = json.loads(args.before.read_text(encoding="utf-8"))
+    after = json.loads(args.after.read_text(encoding="utf-8"))
+    print_comparison(before, after)
+    problems = compare(before, after, args.threshold)
+    if problems:
+        print("\n❌ Замедления:")
+        for line in problems:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n✅ Замедлений нет")
+
+
+if __name__ == '__main__':
+    main()
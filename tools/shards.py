@@ -0,0 +1,159 @@
+"""
+Обслуживание шардов тенантов (режим DB_SHARDED=1, см. database.py).
+
+Шард - файл data/tenants/<id>.db рядом с основной базой. Команды идут по
+шардам параллельно (--jobs потоков: SQLite отпускает GIL на время работы с
+файлом); ошибка одного шарда не останавливает остальные (код выхода 1):
+- list - тенант, размер, версия схемы, доля свободных страниц
+- vacuum - VACUUM шарда (сжать файл после удалений; шард не должен быть
+  занят долгой транзакцией бота)
+- backup DIR - согласованная копия каждого шарда в DIR через backup API
+  SQLite; бот может продолжать работать (шарды в WAL)
+
+Использование:
+    python -m tools.shards list
+    python -m tools.shards --jobs 8 vacuum
+    python -m tools.shards backup backups/2024-06-01 --tenant 5 --tenant 7
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import database
+
+DEFAULT_JOBS = 4
+# Сколько ждать, пока бот отпустит блокировку шарда (секунды)
+BUSY_TIMEOUT = 30.0
+
+# (тенант, файл шарда)
+Shard = Tuple[int, Path]
+
+
+def find_shards(db_path: Path, tenants: Optional[Sequence[int]] = None) -> List[Shard]:
+    """Шарды рядом с основной базой db_path по возрастанию тенанта (tenants - только эти)."""
+    directory = db_path.parent / database.SHARDS_DIR
+    shards = [(int(path.stem), path) for path in directory.glob("*.db") if path.stem.isdigit()]
+    if tenants:
+        shards = [shard for shard in shards if shard[0] in tenants]
+    return sorted(shards)
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    return sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+
+
+def shard_info(shard: Shard) -> Dict[str, Any]:
+    """Размер, версия схемы и свободные страницы шарда."""
+    tenant_id, path = shard
+    conn = _connect(path)
+    try:
+        schema = conn.execute("PRAGMA user_version").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {"tenant": tenant_id, "size": path.stat().st_size, "schema": schema, "free": free / pages if pages else 0.0}
+
+
+def vacuum_shard(shard: Shard) -> Dict[str, Any]:
+    """VACUUM шарда; размер до и после (WAL сбрасывается в файл до замера)."""
+    tenant_id, path = shard
+    conn = _connect(path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        before = path.stat().st_size
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return {"tenant": tenant_id, "before": before, "after": path.stat().st_size}
+
+
+def backup_shard(shard: Shard, destination: Path) -> Dict[str, Any]:
+    """Согласованная копия шарда в destination/<id>.db (backup API, запись бота не блокируется)."""
+    tenant_id, path = shard
+    destination.mkdir(parents=True, exist_ok=True)
+    target = destination / path.name
+    source = _connect(path)
+    copy = sqlite3.connect(target)
+    try:
+        source.backup(copy)
+    finally:
+        copy.close()
+        source.close()
+    return {"tenant": tenant_id, "path": str(target), "size": target.stat().st_size}
+
+
+def run_parallel(
+    action: Callable[[Shard], Dict[str, Any]],
+    shards: Sequence[Shard],
+    jobs: int = DEFAULT_JOBS
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """
+    Выполняет action для каждого шарда в jobs потоках.
+
+    Returns:
+        (результаты по порядку шардов, [(тенант, ошибка)])
+    """
+    def safe(shard: Shard):
+        try:
+            return action(shard), None
+        except (sqlite3.Error, OSError) as e:
+            return None, (shard[0], str(e))
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        outcomes = list(pool.map(safe, shards))
+    results = [result for result, error in outcomes if error is None]
+    errors = [error for result, error in outcomes if error is not None]
+    return results, errors
+
+
+def _kb(size: int) -> str:
+    return f"{size / 1024:.0f} КБ"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Обслуживание шардов тенантов")
+    parser.add_argument("--db", type=Path, default=database.DB_PATH, help="основная база (шарды - рядом с ней)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="сколько шардов обрабатывать одновременно")
+    parser.add_argument("--tenant", type=int, action="append", help="только этот тенант (можно несколько раз)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="список шардов")
+    commands.add_parser("vacuum", help="сжать шарды")
+    backup = commands.add_parser("backup", help="резервные копии шардов")
+    backup.add_argument("destination", type=Path, help="каталог для копий")
+    args = parser.parse_args(argv)
+
+    shards = find_shards(args.db, args.tenant)
+    if not shards:
+        print("Шарды не найдены")
+        return 0
+
+    started = time.perf_counter()
+    if args.command == "list":
+        results, errors = run_parallel(shard_info, shards, args.jobs)
+        for info in results:
+            print(f"  {info['tenant']:>8}  {_kb(info['size']):>10}  схема {info['schema']}  свободно {info['free']:.0%}")
+    elif args.command == "vacuum":
+        results, errors = run_parallel(vacuum_shard, shards, args.jobs)
+        for info in results:
+            print(f"  {info['tenant']:>8}  {_kb(info['before'])} -> {_kb(info['after'])}")
+    else:
+        results, errors = run_parallel(lambda shard: backup_shard(shard, args.destination), shards, args.jobs)
+        for info in results:
+            print(f"  {info['tenant']:>8}  {_kb(info['size']):>10}  {info['path']}")
+
+    elapsed = time.perf_counter() - started
+    print(f"\nШардов: {len(results)} за {elapsed:.1f} с")
+    for tenant_id, error in errors:
+        print(f"❌ Тенант {tenant_id}: {error}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
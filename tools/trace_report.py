@@ -0,0 +1,126 @@
+"""
+Разбор трасс из data/traces/traces.jsonl (см. tracing.py).
+
+Показывает самые медленные апдейты и для каждого - критический путь:
+сколько времени ушло на обработчики, SQLite, Bot API и на остальное
+(маршрутизация, конвейер middleware, ожидание event loop).
+
+Использование:
+    python tools/trace_report.py [--dir data/traces] [--top 10] [--route movie_detail]
+"""
+
+import argparse
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+
+def load_traces(directory: Path) -> Dict[str, List[dict]]:
+    """Читает все файлы трасс (включая ротированные) и группирует span'ы по trace_id."""
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    for path in sorted(directory.glob("traces.jsonl*")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    # Недописанная строка при аварийной остановке
+                    continue
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def breakdown(spans: List[dict]) -> Dict[str, float]:
+    """
+    Раскладывает время апдейта по видам работы (мс).
+
+    Обработчики выполняются последовательно, поэтому критический путь -
+    это сумма span'ов: db и api считаются целиком, у handler берется
+    собственное время (без вложенных db/api), остаток корня - "other".
+    """
+    root = next((s for s in spans if s["kind"] == "update"), None)
+    if root is None:
+        return {}
+    children: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        if span["parent_id"] is not None:
+            children[span["parent_id"]] += span["duration_ms"]
+
+    result = {"handler": 0.0, "db": 0.0, "api": 0.0}
+    for span in spans:
+        if span["kind"] == "handler":
+            result["handler"] += max(0.0, span["duration_ms"] - children[span["span_id"]])
+        elif span["kind"] in ("db", "api"):
+            result[span["kind"]] += span["duration_ms"]
+    result["other"] = max(0.0, root["duration_ms"] - sum(result.values()))
+    result["total"] = root["duration_ms"]
+    return result
+
+
+def format_breakdown(parts: Dict[str, float]) -> str:
+    total = parts["total"] or 1.0
+    return "  ".join(
+        f"{kind} {parts[kind]:.1f}мс ({parts[kind] / total:.0%})"
+        for kind in ("handler", "db", "api", "other")
+    )
+
+
+def print_trace(spans: List[dict]) -> None:
+    """Печатает дерево span'ов одного апдейта."""
+    by_parent: Dict[str, List[dict]] = defaultdict(list)
+    for span in spans:
+        by_parent[span["parent_id"]].append(span)
+
+    def walk(parent_id, depth):
+        for span in sorted(by_parent.get(parent_id, []), key=lambda s: s["start"]):
+            mark = " ❌" if span["error"] else ""
+            print(f"    {'  ' * depth}{span['kind']:<7} {span['name']:<40} {span['duration_ms']:9.2f}мс{mark}")
+            walk(span["span_id"], depth + 1)
+
+    walk(None, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Отчет по трассам апдейтов")
+    parser.add_argument("--dir", default="data/traces", help="каталог с traces.jsonl")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых медленных апдейтов показать")
+    parser.add_argument("--route", help="только апдейты с этим маршрутом")
+    args = parser.parse_args()
+
+    traces = load_traces(Path(args.dir))
+    rows = []
+    for trace_id, spans in traces.items():
+        root = next((s for s in spans if s["kind"] == "update"), None)
+        if root is None or (args.route and root["name"] != args.route):
+            continue
+        rows.append((root["duration_ms"], root["name"], trace_id, spans))
+
+    if not rows:
+        print("Трассы не найдены")
+        return
+
+    rows.sort(key=lambda row: row[0], reverse=True)
+    print(f"Трасс: {len(rows)}\n")
+
+    # Сводка по маршрутам: где в среднем уходит время
+    per_route: Dict[str, List[Dict[str, float]]] = defaultdict(list)
+    for _, route, _, spans in rows:
+        per_route[route].append(breakdown(spans))
+    print("По маршрутам (среднее):")
+    for route, parts_list in sorted(per_route.items(), key=lambda item: -max(p["total"] for p in item[1])):
+        avg = {kind: sum(p[kind] for p in parts_list) / len(parts_list) for kind in parts_list[0]}
+        print(f"  {route:<30} n={len(parts_list):<5} {avg['total']:8.1f}мс  {format_breakdown(avg)}")
+
+    print(f"\nСамые медленные ({min(args.top, len(rows))}):")
+    for duration, route, trace_id, spans in rows[:args.top]:
+        print(f"\n  [{trace_id}] {route} - {duration:.1f}мс")
+        print(f"    {format_breakdown(breakdown(spans))}")
+        print_trace(spans)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Трассировка апдейтов: куда ушло время - обработчик, SQLite или Bot API.
+
+На каждый апдейт открывается корневой span "update", внутри него:
+- span "handler" на каждый вызов обработчика (callback)
+- span "db" на каждый SQL-запрос из database.py (STATEMENT_HOOKS)
+- span "api" на каждый вызов Bot API (instrumentation.API_HOOKS)
+
+Span'ы пишутся в data/traces/traces.jsonl (по строке JSON на span) в
+отдельном потоке через QueueHandler, файл ротируется по размеру.
+Разбор трасс - tools/trace_report.py.
+
+Настройка (переменные окружения):
+- TRACE_SAMPLE_RATE - доля сохраняемых апдейтов, от 0 до 1 (0 - выключено)
+- TRACE_SLOW_MS - всегда сохранять апдейты дольше этого времени (0 - выключено)
+
+API:
+- enabled() - включена ли трассировка
+- install(pipeline, application) - подключает трассировку
+- start() / stop() - запуск и остановка записи в файл
+"""
+
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import Application, ConversationHandler
+
+import database
+import instrumentation
+import middleware
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '0'))
+
+TRACES_DIR = Path('data/traces')
+TRACE_FILE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_FILE_BACKUPS = 5
+
+# Логгер, через который span'ы уходят в файл (не распространяется в общий лог)
+_trace_log = logging.getLogger("forus.traces")
+_trace_log.propagate = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class Span:
+    """Один замер внутри трассы."""
+
+    __slots__ = ("trace", "span_id", "parent_id", "kind", "name", "start", "duration", "error")
+
+    def __init__(self, trace: "Trace", kind: str, name: str, parent_id: Optional[str],
+                 start: Optional[float] = None):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.kind = kind
+        self.name = name
+        self.start = time.time() if start is None else start
+        self.duration = 0.0
+        self.error = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            "error": self.error,
+        }
+
+
+class Trace:
+    """Все span'ы одного апдейта."""
+
+    __slots__ = ("trace_id", "sampled", "root", "spans", "finished")
+
+    def __init__(self, trace_id: str, name: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Span] = []
+        self.finished = False
+        self.root = self.add("update", name, None)
+
+    def add(self, kind: str, name: str, parent_id: Optional[str], start: Optional[float] = None) -> Span:
+        span = Span(self, kind, name, parent_id, start)
+        self.spans.append(span)
+        return span
+
+
+# Span, внутри которого сейчас выполняется код (родитель для новых span'ов)
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def enabled() -> bool:
+    """Включена ли трассировка настройками окружения."""
+    return TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_MS > 0
+
+
+def _record_completed(kind: str, name: str, seconds: float, error: bool = False) -> None:
+    """Добавляет уже завершившийся замер (SQL-запрос, вызов API) в текущую трассу."""
+    parent = _current_span.get()
+    if parent is None or parent.trace.finished:
+        return
+    span = parent.trace.add(kind, name, parent.span_id, start=time.time() - seconds)
+    span.duration = seconds
+    span.error = error
+
+
+def _observe_statement(function_name: str, seconds: float) -> None:
+    _record_completed("db", function_name, seconds)
+
+
+def _observe_api_call(method: str, seconds: float, ok: bool) -> None:
+    _record_completed("api", method, seconds, error=not ok)
+
+
+def _wrap_callback(callback):
+    """Оборачивает callback обработчика в span "handler"."""
+    if getattr(callback, "__traced__", False):
+        return callback
+
+    @functools.wraps(callback)
+    async def traced(update, context):
+        parent = _current_span.get()
+        if parent is None or parent.trace.finished:
+            return await callback(update, context)
+        span = parent.trace.add("handler", callback.__qualname__, parent.span_id)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            span.error = True
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+
+    traced.__traced__ = True
+    return traced
+
+
+def _instrument_handler(handler) -> None:
+    """Оборачивает callback обработчика (и вложенных в ConversationHandler)."""
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for inner in nested:
+            _instrument_handler(inner)
+    elif hasattr(handler, "callback"):
+        handler.callback = _wrap_callback(handler.callback)
+
+
+class SpanMiddleware(middleware.Middleware):
+    """Стадия конвейера: открывает и закрывает корневой span апдейта."""
+
+    def check(self, update: Update) -> bool:
+        state = middleware.current()
+        if state is None:
+            return True
+        sampled = random.random() < TRACE_SAMPLE_RATE
+        if not sampled and TRACE_SLOW_MS <= 0:
+            _current_span.set(None)
+            return True
+        trace = Trace(state.trace_id or uuid.uuid4().hex[:12], state.route, sampled)
+        _current_span.set(trace.root)
+        return True
+
+    async def after(self, update: Update, context) -> None:
+        root = _current_span.get()
+        if root is None or root.kind != "update":
+            return
+        trace = root.trace
+        root.duration = time.time() - root.start
+        trace.finished = True
+        _current_span.set(None)
+
+        if trace.sampled or (TRACE_SLOW_MS > 0 and root.duration * 1000 >= TRACE_SLOW_MS):
+            for span in trace.spans:
+                _trace_log.info(json.dumps(span.to_dict(), ensure_ascii=False))
+
+    async def on_error(self, update: Optional[Update], context) -> None:
+        root = _current_span.get()
+        if root is not None:
+            root.trace.root.error = True
+
+
+def install(pipeline: middleware.Pipeline, application: Application) -> None:
+    """
+    Подключает трассировку к конвейеру, БД, Bot API и всем обработчикам.
+
+    Вызывается после регистрации всех обработчиков разделов.
+    """
+    position = next(
+        (i + 1 for i, mw in enumerate(pipeline.middlewares) if isinstance(mw, middleware.TracingMiddleware)),
+        len(pipeline.middlewares)
+    )
+    pipeline.middlewares.insert(position, SpanMiddleware())
+    database.STATEMENT_HOOKS.append(_observe_statement)
+    instrumentation.API_HOOKS.append(_observe_api_call)
+
+    for group, handlers in application.handlers.items():
+        if group in (middleware.PRE_GROUP, middleware.POST_GROUP):
+            continue
+        for handler in handlers:
+            _instrument_handler(handler)
+
+
+def start() -> None:
+    """Запускает запись span'ов в файл в отдельном потоке."""
+    global _listener
+    TRACES_DIR.mkdir(parents=True, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        TRACES_DIR / "traces.jsonl",
+        maxBytes=TRACE_FILE_MAX_BYTES,
+        backupCount=TRACE_FILE_BACKUPS,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    span_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    _trace_log.addHandler(logging.handlers.QueueHandler(span_queue))
+    _trace_log.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(span_queue, file_handler)
+    _listener.start()
+    logger.info(
+        f"Трассировка включена: sample_rate={TRACE_SAMPLE_RATE}, slow_ms={TRACE_SLOW_MS}, "
+        f"файл {TRACES_DIR / 'traces.jsonl'}"
+    )
+
+
+def stop() -> None:
+    """Дописывает оставшиеся span'ы и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(_trace_log.handlers):
+        _trace_log.removeHandler(handler)
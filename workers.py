@@ -0,0 +1,296 @@
+"""
+Режим нескольких процессов: фронт принимает апдейты, рабочие процессы их обрабатывают.
+
+Один процесс asyncio использует одно ядро. В этом режиме (python bot.py
+--workers N) фронт-процесс получает апдейты (long polling или webhook -
+Updater python-telegram-bot) и передает их JSON по локальному каналу
+(multiprocessing.Queue) одному из N рабочих процессов. Рабочий - обычный
+бот (bot.build_application) без Updater: апдейты из канала идут в его
+update_queue, дальше - тот же конвейер middleware и обработчики, свои
+соединения с базой.
+
+Рабочий выбирается (route) по тенанту автора апдейта, для пользователей
+без тенанта - по chat id. Все участники тенанта попадают в один процесс:
+кеши в памяти (поисковый индекс, клавиатуры, карточки, составы тенантов)
+сбрасываются наблюдателями database.CHANGE_HOOKS только в своем процессе,
+и по chat id партнеры пары видели бы устаревшие меню друг друга. Поэтому
+режим масштабирует развертывания с несколькими тенантами (бенчмарк -
+benchmarks/bench_workers, TENANTS тенантов), а одна пара из config.json
+(тенант 1) обслуживается одним рабочим. Тенант участника фронт помнит
+(LRU на MEMBER_TENANTS_SIZE), а в базу за ним ходит в потоке (route_key) -
+прием апдейтов не ждет SQLite.
+Переход по приглашению в существующий тенант (/start join_<код>) идет к
+рабочему этого тенанта - вступление видит его наблюдатель. Приглашение в
+новый тенант идет по chat id, а остальным рабочим после любого перехода
+по приглашению фронт посылает FORGET_MEMBERS - они забывают составы
+тенантов (tenants.forget). Рабочий обрабатывает апдейты по очереди -
+порядок апдейтов пользователя сохраняется.
+
+Фоновые службы рабочих:
+- таймеры расписаний - только у рабочего 0 (scheduler.FOLLOW_SECONDS: он
+  подхватывает напоминания, сохраненные другими рабочими)
+- метрики - порт METRICS_PORT + номер рабочего
+- трассы и записи апдейтов - в подкаталогах worker<номер>
+
+Запись разных тенантов из разных процессов не ждет общую блокировку
+SQLite, если включены шарды (DB_SHARDED=1).
+
+API:
+- route(update, workers) - номер рабочего для апдейта
+- route_key(update) - ключ рабочего без блокировки event loop (для фронта)
+- FORGET_MEMBERS - сообщение канала: забыть составы тенантов
+- WorkerPool(workers, report=None) - рабочие процессы и их каналы
+- run_worker(index, channel, report=None) - точка входа рабочего процесса
+- run_front(bot_token, workers, webhook_url=None, port=8443) - запуск фронта
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+from collections import OrderedDict
+from typing import Any, Optional
+
+from telegram import Bot, Update
+from telegram.ext import Updater
+
+import bot
+import config
+import database
+import metrics
+import recorder
+import scheduler
+import tenants
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать рабочих при остановке (секунды)
+STOP_TIMEOUT = 30.0
+
+# Сколько участников помнить фронту (LRU)
+MEMBER_TENANTS_SIZE = 4096
+# Сообщение канала вместо апдейта: забыть составы тенантов
+FORGET_MEMBERS = "forget_members"
+
+# user_id участника -> тенант. Тенант участника не меняется, поэтому
+# запоминаются только найденные: вступивший по приглашению в другом
+# процессе будет найден при следующем апдейте
+_member_tenants: "OrderedDict[int, int]" = OrderedDict()
+
+
+def _member_tenant(user_id: int) -> Optional[int]:
+    """Тенант участника из базы (найденный запоминается в LRU на MEMBER_TENANTS_SIZE) или None."""
+    tenant_id = database.get_member_tenant(user_id)
+    if tenant_id is not None:
+        _member_tenants[user_id] = tenant_id
+        if len(_member_tenants) > MEMBER_TENANTS_SIZE:
+            _member_tenants.popitem(last=False)
+    return tenant_id
+
+
+def _invite_tenant(update: Update) -> Optional[int]:
+    """Тенант приглашения из /start join_<код> или None (новый тенант, кода нет)."""
+    parts = update.message.text.split()
+    if len(parts) < 2:
+        return None
+    invite = database.get_invite(parts[1][len(tenants.JOIN_PREFIX):])
+    return invite['tenant_id'] if invite is not None else None
+
+
+def _chat_key(update: Update) -> int:
+    chat = update.effective_chat
+    if chat is not None:
+        return chat.id
+    user = update.effective_user
+    return user.id if user is not None else update.update_id
+
+
+def _cached_route_key(update: Update) -> Optional[int]:
+    """Ключ рабочего без запросов к базе или None - нужен поиск тенанта (_route_key)."""
+    user = update.effective_user
+    if user is None:
+        return _chat_key(update)
+    if config.is_authorized_user(user.id):
+        return database.DEFAULT_TENANT
+    tenant_id = _member_tenants.get(user.id)
+    if tenant_id is not None:
+        _member_tenants.move_to_end(user.id)
+    return tenant_id
+
+
+def _route_key(update: Update) -> int:
+    key = _cached_route_key(update)
+    if key is not None:
+        return key
+    tenant_id = _member_tenant(update.effective_user.id)
+    if tenant_id is None and tenants.is_join_request(update):
+        # Вступление должен увидеть рабочий тенанта
+        tenant_id = _invite_tenant(update)
+    return tenant_id if tenant_id is not None else _chat_key(update)
+
+
+def route(update: Update, workers: int) -> int:
+    """Номер рабочего (0..workers-1): по тенанту автора, без тенанта - по chat id."""
+    return _route_key(update) % workers
+
+
+async def route_key(update: Update) -> int:
+    """Ключ рабочего для фронта: поиск тенанта в базе - в потоке, прием апдейтов не ждет SQLite."""
+    key = _cached_route_key(update)
+    if key is None:
+        key = await asyncio.to_thread(_route_key, update)
+    return key
+
+
+class WorkerPool:
+    """
+    Рабочие процессы и их каналы.
+
+    Процессы запускаются через spawn: рабочий заново импортирует модули и
+    открывает свои соединения, ничего не наследуя от event loop фронта.
+    """
+
+    def __init__(self, workers: int, report: Optional[Any] = None):
+        """
+        Args:
+            workers: Число рабочих процессов
+            report: multiprocessing.Queue для бенчмарка: рабочий кладет 0,
+                    когда готов, и update_id каждого обработанного (в том
+                    числе отброшенного middleware) апдейта; None - не сообщать
+        """
+        self.workers = workers
+        context = multiprocessing.get_context("spawn")
+        self.channels = [context.Queue() for _ in range(workers)]
+        self.processes = [
+            context.Process(target=run_worker, args=(index, channel, report), name=f"forus-worker-{index}")
+            for index, channel in enumerate(self.channels)
+        ]
+        self.submitted = [0] * workers
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+        logger.info(f"Запущено рабочих процессов: {self.workers}")
+
+    def submit(self, update: Update, key: Optional[int] = None) -> int:
+        """
+        Передает апдейт своему рабочему. Возвращает номер рабочего.
+
+        Args:
+            update: Апдейт
+            key: Ключ рабочего (route_key); None - найти здесь (route)
+
+        После перехода по приглашению остальные рабочие получают
+        FORGET_MEMBERS: их наблюдатели вступления не видят.
+        """
+        index = (key if key is not None else _route_key(update)) % self.workers
+        self.channels[index].put(update.to_dict())
+        self.submitted[index] += 1
+        if tenants.is_join_request(update):
+            for other, channel in enumerate(self.channels):
+                if other != index:
+                    channel.put(FORGET_MEMBERS)
+        return index
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """Просит рабочих доработать очередь и выйти; не успевших - завершает."""
+        for channel in self.channels:
+            channel.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Рабочий {process.name} не остановился за {timeout} с - завершаем")
+                process.terminate()
+        logger.info(f"Рабочие остановлены, апдейтов по рабочим: {self.submitted}")
+
+
+def _configure(index: int) -> None:
+    """Настройки процесса рабочего index: фоновые службы не должны мешать друг другу."""
+    if index == 0:
+        scheduler.FOLLOW_SECONDS = scheduler.BUCKET_SECONDS
+    if metrics.METRICS_PORT:
+        metrics.METRICS_PORT = str(int(metrics.METRICS_PORT) + index)
+    tracing.TRACES_DIR = tracing.TRACES_DIR / f"worker{index}"
+    recorder.RECORDINGS_DIR = recorder.RECORDINGS_DIR / f"worker{index}"
+
+
+async def _serve(index: int, channel: Any, report: Optional[Any]) -> None:
+    application = bot.build_application(config.BOT_TOKEN, base_url=bot.BOT_API_URL, job_queue=index == 0)
+    loop = asyncio.get_running_loop()
+    # Рабочий запускается без run_polling, поэтому post_* вызываются здесь
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        logger.info(f"Рабочий {index} готов")
+        if report is not None:
+            report.put(0)
+        # Апдейты обрабатываются по одному, в порядке канала - как update_queue
+        # обычного бота без concurrent_updates
+        while True:
+            data = await loop.run_in_executor(None, channel.get)
+            if data is None:
+                break
+            if data == FORGET_MEMBERS:
+                tenants.forget()
+                continue
+            update = Update.de_json(data, application.bot)
+            await application.process_update(update)
+            if report is not None:
+                report.put(update.update_id)
+        await application.stop()
+        await application.post_stop(application)
+    await application.post_shutdown(application)
+
+
+def run_worker(index: int, channel: Any, report: Optional[Any] = None) -> None:
+    """Точка входа рабочего процесса: апдейты из channel до None."""
+    # Ctrl+C получает вся группа процессов - останавливает рабочих фронт
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config.load_config()
+    _configure(index)
+    asyncio.run(_serve(index, channel, report))
+
+
+async def _front(bot_token: str, pool: WorkerPool, webhook_url: Optional[str], port: int) -> None:
+    updates: "asyncio.Queue[object]" = asyncio.Queue()
+    if bot.BOT_API_URL:
+        telegram_bot = Bot(bot_token, base_url=f"{bot.BOT_API_URL}/bot", base_file_url=f"{bot.BOT_API_URL}/file/bot")
+    else:
+        telegram_bot = Bot(bot_token)
+    async with Updater(telegram_bot, updates) as updater:
+        if webhook_url:
+            await updater.start_webhook(
+                listen="0.0.0.0", port=port, url_path=bot_token, webhook_url=f"{webhook_url}/{bot_token}",
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        # Пользователи для выбора рабочего - из актуального config.json
+        config.start_watching()
+        logger.info(f"Фронт принимает апдейты ({'webhook' if webhook_url else 'polling'})")
+        try:
+            while True:
+                update = await updates.get()
+                if isinstance(update, Update):
+                    # Апдейты передаются по одному: порядок сохраняется и при поиске тенанта в потоке
+                    pool.submit(update, await route_key(update))
+        finally:
+            config.stop_watching()
+            await updater.stop()
+
+
+def run_front(bot_token: str, workers: int, webhook_url: Optional[str] = None, port: int = 8443) -> None:
+    """
+    Запускает рабочих и принимает апдейты до Ctrl+C.
+
+    База должна быть инициализирована до запуска (рабочие ее не мигрируют).
+    """
+    pool = WorkerPool(workers)
+    pool.start()
+    try:
+        asyncio.run(_front(bot_token, pool, webhook_url, port))
+    except KeyboardInterrupt:
+        logger.info("Остановка фронта")
+    finally:
+        pool.stop()